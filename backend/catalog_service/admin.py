@@ -64,7 +64,11 @@ class AuthorAdmin(admin.ModelAdmin):
         ('Autres informations', {
             'fields': ('nationality', 'photo', 'website')
         }),
+        ('Compte', {
+            'fields': ('user',)
+        }),
     )
+    raw_id_fields = ['user']
     
     def books_count(self, obj):
         """Nombre de livres de l'auteur"""
@@ -217,11 +221,11 @@ class BookAdmin(admin.ModelAdmin):
     
     def average_rating(self, obj):
         """Note moyenne"""
-        avg = obj.ratings.aggregate(avg=Avg('score'))['avg']
-        if avg:
-            return f"{avg:.1f}/5"
+        if obj.rating_count:
+            return f"{obj.rating_average:.1f}/5"
         return "Pas de note"
     average_rating.short_description = 'Note moyenne'
+    average_rating.admin_order_field = 'rating_average'
     
     def cover_image_preview(self, obj):
         """Aperçu de la couverture"""
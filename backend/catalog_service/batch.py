@@ -0,0 +1,114 @@
+"""
+Lecture groupée de livres pour les autres services
+
+Les services consommateurs (lecture, recommandations…) résolvent des
+centaines de références `book_uuid` à la fois. Plutôt qu'un appel par
+livre, `books/batch/` renvoie une projection compacte des champs demandés,
+chargée en une requête (plus une par relation multiple demandée).
+"""
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db.models import Prefetch
+
+from coko.counters import book_counters
+from .models import Author, Book, Category
+
+BATCH_MAX_BOOKS = getattr(settings, 'CATALOG_BATCH_MAX_BOOKS', 300)
+
+
+def _file_url(field_file) -> Optional[str]:
+    return field_file.url if field_file else None
+
+
+def _date(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+# Champ exposé -> (colonnes à charger, lecture sur l'instance)
+BATCH_FIELDS = {
+    'id': (['id'], lambda book: str(book.id)),
+    'title': (['title'], lambda book: book.title),
+    'subtitle': (['subtitle'], lambda book: book.subtitle),
+    'slug': (['slug'], lambda book: book.slug),
+    'isbn': (['isbn'], lambda book: book.isbn),
+    'language': (['language'], lambda book: book.language),
+    'page_count': (['page_count'], lambda book: book.page_count),
+    'publication_date': (['publication_date'], lambda book: _date(book.publication_date)),
+    'cover_image': (['cover_image'], lambda book: _file_url(book.cover_image)),
+    'status': (['status'], lambda book: book.status),
+    'is_free': (['is_free'], lambda book: book.is_free),
+    'is_premium_only': (['is_premium_only'], lambda book: book.is_premium_only),
+    'rating_average': (['rating_average'], lambda book: book.rating_average),
+    'rating_count': (['rating_count'], lambda book: book.rating_count),
+    'view_count': (['view_count'], lambda book: book.view_count),
+    'download_count': (['download_count'], lambda book: book.download_count),
+    'publisher': (
+        ['publisher__id', 'publisher__name'],
+        lambda book: {'id': str(book.publisher.id), 'name': book.publisher.name} if book.publisher else None
+    ),
+    'series': (
+        ['series__id', 'series__title', 'series_number'],
+        lambda book: {
+            'id': str(book.series.id), 'title': book.series.title, 'number': book.series_number
+        } if book.series else None
+    ),
+    'authors': (
+        [],
+        lambda book: [{'id': str(author.id), 'name': author.full_name} for author in book.authors.all()]
+    ),
+    'categories': (
+        [],
+        lambda book: [
+            {'id': str(category.id), 'name': category.name, 'slug': category.slug}
+            for category in book.categories.all()
+        ]
+    ),
+}
+
+DEFAULT_BATCH_FIELDS = (
+    'id', 'title', 'slug', 'cover_image', 'language', 'page_count',
+    'authors', 'categories', 'rating_average', 'is_free', 'is_premium_only',
+)
+
+COUNTER_FIELDS = {'view_count', 'download_count'}
+
+
+def fetch_books_batch(book_uuids: Iterable, fields: Optional[List[str]] = None,
+                      published_only: bool = True) -> Dict[str, Dict]:
+    """
+    Projection `{uuid: {champ: valeur}}` des livres trouvés parmi `book_uuids`
+
+    Seules les colonnes nécessaires aux champs demandés sont lues ; les
+    auteurs et catégories sont préchargés avec leurs seules colonnes utiles.
+    """
+    fields = [field for field in (fields or DEFAULT_BATCH_FIELDS) if field in BATCH_FIELDS]
+    columns = {'id'}
+    for field in fields:
+        columns.update(BATCH_FIELDS[field][0])
+
+    queryset = Book.objects.filter(id__in=list(book_uuids)).order_by()
+    if published_only:
+        queryset = queryset.filter(status='published')
+
+    related = [name for name in ('publisher', 'series') if name in fields]
+    if related:
+        queryset = queryset.select_related(*related)
+    if 'authors' in fields:
+        queryset = queryset.prefetch_related(
+            Prefetch('authors', queryset=Author.objects.only('id', 'first_name', 'last_name'))
+        )
+    if 'categories' in fields:
+        queryset = queryset.prefetch_related(
+            Prefetch('categories', queryset=Category.objects.only('id', 'name', 'slug'))
+        )
+
+    books = list(queryset.only(*columns))
+    if COUNTER_FIELDS.intersection(fields):
+        book_counters.apply_pending('book', books, [field for field in fields if field in COUNTER_FIELDS])
+
+    getters = [(field, BATCH_FIELDS[field][1]) for field in fields]
+    return {
+        str(book.id): {field: getter(book) for field, getter in getters}
+        for book in books
+    }
@@ -0,0 +1,206 @@
+"""
+Livraison des fichiers de livres (EPUB, PDF…)
+
+Les téléchargements peuvent reprendre après une coupure (requêtes `Range`,
+validées par `If-Range`) et sont identifiés par un ETag fort tiré de
+l'empreinte SHA-256 du fichier.
+
+Lorsqu'un proxy frontal est configuré (`CATALOG_FILE_OFFLOAD_HEADER`),
+l'envoi lui est délégué (`X-Accel-Redirect` pour nginx, `X-Sendfile`
+pour Apache/lighttpd) et Django ne lit pas le fichier. Sinon le fichier
+complet passe par `FileResponse` (sendfile via `wsgi.file_wrapper`
+lorsque le serveur le propose) et une plage par un itérateur de blocs.
+
+Le compteur de téléchargements passe par les compteurs à écriture
+différée : il n'ajoute aucune écriture en base avant l'envoi.
+"""
+import logging
+import mimetypes
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from coko.counters import book_counters
+
+logger = logging.getLogger(__name__)
+
+FILE_CHUNK_SIZE = getattr(settings, 'CATALOG_FILE_CHUNK_SIZE', 64 * 1024)
+FILE_OFFLOAD_HEADER = getattr(settings, 'CATALOG_FILE_OFFLOAD_HEADER', '')
+FILE_OFFLOAD_PREFIX = getattr(settings, 'CATALOG_FILE_OFFLOAD_PREFIX', '/protected/media/')
+FILE_CACHE_CONTROL = 'private, max-age=86400'
+
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'epub': 'application/epub+zip',
+    'mobi': 'application/x-mobipocket-ebook',
+    'azw3': 'application/vnd.amazon.ebook',
+    'txt': 'text/plain; charset=utf-8',
+    'html': 'text/html; charset=utf-8',
+}
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """Plage demandée hors du fichier"""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Plage (début, fin incluse) demandée par un en-tête `Range`.
+
+    Retourne None pour servir le fichier entier (pas d'en-tête, syntaxe
+    inconnue ou plages multiples, que la RFC 9110 permet d'ignorer).
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffixe : les N derniers octets
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def if_range_matches(request, etag: Optional[str], last_modified: Optional[int]) -> bool:
+    """`If-Range` absent ou toujours valide (ETag fort ou date exacte)"""
+    condition = request.META.get('HTTP_IF_RANGE')
+    if not condition:
+        return True
+    if condition.startswith('"') or condition.startswith('W/'):
+        return etag is not None and condition == etag
+    return last_modified is not None and parse_http_date_safe(condition) == last_modified
+
+
+def not_modified(request, etag: Optional[str]) -> bool:
+    """`If-None-Match` correspond à l'ETag courant"""
+    condition = request.META.get('HTTP_IF_NONE_MATCH')
+    if not condition or etag is None:
+        return False
+    return '*' in condition or etag in parse_etags(condition)
+
+
+def iter_file_range(file, start: int, length: int, chunk_size: int = FILE_CHUNK_SIZE):
+    """Lire `length` octets à partir de `start`, par blocs, puis fermer le fichier"""
+    try:
+        file.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def serve_book_file(request, book_file):
+    """Réponse HTTP complète, partielle ou conditionnelle pour un `BookFile`"""
+    size = book_file.file_size or book_file.file.size
+    etag = book_file.etag
+    last_modified = int(book_file.updated_at.timestamp())
+
+    if not_modified(request, etag):
+        response = HttpResponse(status=304)
+        _set_common_headers(response, book_file, etag, last_modified)
+        return response
+
+    byte_range = None
+    if if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            _set_common_headers(response, book_file, etag, last_modified)
+            return response
+
+    # Un téléchargement compte une fois : à son début, pas à chaque reprise
+    if request.method == 'GET' and (byte_range is None or byte_range[0] == 0):
+        try:
+            book_counters.incr('book', book_file.book_id, 'download_count')
+        except Exception as e:
+            logger.warning(f"Comptage du téléchargement impossible: {str(e)}")
+
+    offload = _offload(book_file) if FILE_OFFLOAD_HEADER else None
+    if offload is not None:
+        response = offload
+    elif request.method == 'HEAD':
+        response = HttpResponse()
+    elif byte_range is None:
+        response = FileResponse(book_file.file.open('rb'), content_type=_content_type(book_file))
+        response.block_size = FILE_CHUNK_SIZE
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_file_range(book_file.file.open('rb'), start, end - start + 1),
+            status=206,
+            content_type=_content_type(book_file)
+        )
+
+    if offload is None:
+        # Le proxy calcule lui-même longueur et plage du fichier délégué
+        if byte_range is None:
+            response['Content-Length'] = str(size)
+        else:
+            start, end = byte_range
+            response.status_code = 206
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Type'] = _content_type(book_file)
+    _set_common_headers(response, book_file, etag, last_modified)
+    return response
+
+
+def _offload(book_file) -> Optional[HttpResponse]:
+    """
+    Déléguer l'envoi au proxy frontal (zéro copie côté Django)
+
+    `X-Accel-Redirect` vise une location interne de nginx, qui peut servir
+    le disque ou relayer le stockage objet ; `X-Sendfile` exige un chemin
+    local, sinon le fichier est envoyé par Django.
+    """
+    response = HttpResponse()
+    if FILE_OFFLOAD_HEADER.lower() == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = quote(f"{FILE_OFFLOAD_PREFIX.rstrip('/')}/{book_file.file.name}")
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    try:
+        response[FILE_OFFLOAD_HEADER] = book_file.file.path
+    except NotImplementedError:
+        return None
+    return response
+
+
+def _content_type(book_file) -> str:
+    return (CONTENT_TYPES.get(book_file.format)
+            or mimetypes.guess_type(book_file.file.name)[0]
+            or 'application/octet-stream')
+
+
+def _set_common_headers(response, book_file, etag, last_modified):
+    filename = f"{book_file.book.slug}.{book_file.format}"
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = FILE_CACHE_CONTROL
+    response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    if etag:
+        response['ETag'] = etag
@@ -1,6 +1,8 @@
 import django_filters
 from django.db.models import Q
 from .models import Book, Author, Publisher, Category, Series
+from rest_framework.filters import OrderingFilter
+from .search import relevance_ordering, search_index
 
 
 class BookFilter(django_filters.FilterSet):
@@ -75,21 +77,19 @@ class BookFilter(django_filters.FilterSet):
         ]
     
     def filter_search(self, queryset, name, value):
-        """Filtre de recherche globale"""
+        """
+        Filtre de recherche globale (index plein texte, sans jointures)
+        
+        Comme `BookSearchView`, seuls les `CATALOG_SEARCH_MAX_RESULTS`
+        résultats les plus pertinents sont retenus, dans l'ordre de l'index.
+        """
         if not value:
             return queryset
         
-        return queryset.filter(
-            Q(title__icontains=value) |
-            Q(subtitle__icontains=value) |
-            Q(description__icontains=value) |
-            Q(summary__icontains=value) |
-            Q(authors__first_name__icontains=value) |
-            Q(authors__last_name__icontains=value) |
-            Q(publisher__name__icontains=value) |
-            Q(categories__name__icontains=value) |
-            Q(series__title__icontains=value)
-        ).distinct()
+        ranked_ids = search_index.search(value)
+        if not ranked_ids:
+            return queryset.none()
+        return queryset.filter(id__in=ranked_ids).order_by(relevance_ordering(ranked_ids))
     
     def filter_tags(self, queryset, name, value):
         """Filtre par tags"""
@@ -108,6 +108,25 @@ class BookFilter(django_filters.FilterSet):
         return queryset.distinct()
 
 
+class BookOrderingFilter(OrderingFilter):
+    """Tri des livres : l'ordre de pertinence de `search` prime sur le tri par défaut"""
+    
+    # Anciens noms de tri toujours acceptés par l'API
+    ordering_aliases = {'average_rating': 'rating_average'}
+    
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        fields = [
+            ('-' if term.startswith('-') else '') + self.ordering_aliases.get(term.lstrip('-'), term.lstrip('-'))
+            for term in fields
+        ]
+        return super().remove_invalid_fields(queryset, fields, view, request)
+    
+    def get_default_ordering(self, view):
+        if view.request.query_params.get('search'):
+            return None
+        return super().get_default_ordering(view)
+
+
 class AuthorFilter(django_filters.FilterSet):
     """Filtres pour les auteurs"""
     
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+import logging
+import time
+
+from catalog_service.models import Book
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Recalculer en masse les agrégats d\'évaluation stockés sur les livres'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Nombre de livres mis à jour par écriture groupée (défaut: 1000)'
+        )
+    
+    def handle(self, *args, **options):
+        self.verbosity = options.get('verbosity', 1)
+        start_time = time.monotonic()
+        
+        try:
+            updated = Book.rebuild_rating_aggregates(batch_size=options['batch_size'])
+        except Exception as e:
+            logger.error(f"Erreur lors du recalcul des agrégats d'évaluation: {str(e)}")
+            raise CommandError(f"Erreur: {str(e)}")
+        
+        self._log_success(
+            f"✓ Agrégats recalculés pour {updated} livres en {time.monotonic() - start_time:.2f}s"
+        )
+    
+    def _log_success(self, message: str):
+        """Logger un message de succès"""
+        if self.verbosity >= 1:
+            self.stdout.write(self.style.SUCCESS(message))
+        
+        logger.info(message)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+import logging
+import time
+
+from catalog_service.search import search_index
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Reconstruire les documents de recherche plein texte du catalogue'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Nombre de livres indexés par lot (défaut: 500)'
+        )
+    
+    def handle(self, *args, **options):
+        self.verbosity = options.get('verbosity', 1)
+        start_time = time.monotonic()
+        
+        try:
+            indexed = search_index.rebuild(chunk_size=options['chunk_size'])
+        except Exception as e:
+            logger.error(f"Erreur lors de la reconstruction de l'index de recherche: {str(e)}")
+            raise CommandError(f"Erreur: {str(e)}")
+        
+        backend = 'PostgreSQL (tsvector)' if search_index.is_postgresql else 'index inversé en mémoire'
+        self._log_success(
+            f"✓ {indexed} livres indexés ({backend}) en {time.monotonic() - start_time:.2f}s"
+        )
+    
+    def _log_success(self, message: str):
+        """Logger un message de succès"""
+        if self.verbosity >= 1:
+            self.stdout.write(self.style.SUCCESS(message))
+        
+        logger.info(message)
@@ -0,0 +1,95 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+SEARCH_VECTOR_SQL = """
+ALTER TABLE catalog_service_booksearchdocument ADD COLUMN search_vector tsvector;
+
+CREATE INDEX catalog_booksearch_vector_gin
+    ON catalog_service_booksearchdocument USING gin (search_vector);
+
+CREATE FUNCTION catalog_booksearch_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.authors, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(NEW.categories, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(NEW.body, '')), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER catalog_booksearch_vector_trigger
+    BEFORE INSERT OR UPDATE ON catalog_service_booksearchdocument
+    FOR EACH ROW EXECUTE FUNCTION catalog_booksearch_vector_update();
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP TRIGGER IF EXISTS catalog_booksearch_vector_trigger ON catalog_service_booksearchdocument;
+DROP FUNCTION IF EXISTS catalog_booksearch_vector_update();
+DROP INDEX IF EXISTS catalog_booksearch_vector_gin;
+ALTER TABLE catalog_service_booksearchdocument DROP COLUMN IF EXISTS search_vector;
+"""
+
+
+def add_search_vector(apps, schema_editor):
+    """Colonne tsvector pondérée et index GIN (PostgreSQL uniquement)"""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SEARCH_VECTOR_SQL)
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_VECTOR_SQL)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalog_service", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookSearchDocument",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="catalog_service.book",
+                        verbose_name="Livre",
+                    ),
+                ),
+                ("title", models.TextField(verbose_name="Titre et sous-titre")),
+                ("authors", models.TextField(blank=True, verbose_name="Auteurs")),
+                (
+                    "categories",
+                    models.TextField(
+                        blank=True, verbose_name="Catégories, série et éditeur"
+                    ),
+                ),
+                (
+                    "body",
+                    models.TextField(blank=True, verbose_name="Description et résumé"),
+                ),
+                (
+                    "popularity",
+                    models.PositiveIntegerField(default=0, verbose_name="Popularité"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Modifié le"),
+                ),
+            ],
+            options={
+                "verbose_name": "Document de recherche",
+                "verbose_name_plural": "Documents de recherche",
+            },
+        ),
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
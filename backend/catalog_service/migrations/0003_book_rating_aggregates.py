@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:26
+
+import catalog_service.models
+from django.db import migrations, models
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    """Initialiser les agrégats à partir des évaluations existantes"""
+    Book = apps.get_model("catalog_service", "Book")
+    BookRating = apps.get_model("catalog_service", "BookRating")
+    db_alias = schema_editor.connection.alias
+
+    counts = {}
+    for book_id, score, total in (
+        BookRating.objects.using(db_alias).order_by()
+        .values_list("book_id", "score").annotate(total=models.Count("id"))
+    ):
+        counts.setdefault(book_id, {})[score] = total
+
+    books = []
+    for book_id, book_counts in counts.items():
+        aggregates = catalog_service.models.rating_aggregates(book_counts)
+        books.append(Book(id=book_id, **aggregates))
+    Book.objects.using(db_alias).bulk_update(
+        books,
+        ["rating_sum", "rating_count", "rating_average", "rating_histogram"],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalog_service", "0002_booksearchdocument"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="rating_average",
+            field=models.FloatField(default=0.0, verbose_name="Note moyenne"),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Nombre d'évaluations"
+            ),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_histogram",
+            field=models.JSONField(
+                default=catalog_service.models.empty_rating_histogram,
+                verbose_name="Répartition des notes",
+            ),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_sum",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Somme des notes"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["status", "rating_average"],
+                name="catalog_ser_status_c8ada3_idx",
+            ),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("catalog_service", "0003_book_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookfile",
+            name="checksum",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=64,
+                verbose_name="Empreinte SHA-256",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-16 21:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("catalog_service", "0004_bookfile_checksum"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="author",
+            name="user",
+            field=models.OneToOneField(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="author_profile",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Compte utilisateur",
+            ),
+        ),
+    ]
@@ -1,11 +1,14 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.urls import reverse
+import hashlib
 import uuid
 import os
 
+from coko.counters import book_counters
+
 User = get_user_model()
 
 
@@ -16,6 +19,27 @@ def book_cover_upload_path(instance, filename):
     return os.path.join('books', 'covers', filename)
 
 
+def empty_rating_histogram():
+    """Répartition vide des notes de 1 à 5"""
+    return {str(score): 0 for score in range(1, 6)}
+
+
+def rating_aggregates(counts):
+    """Calculer les agrégats d'évaluation à partir de {note: nombre}"""
+    histogram = empty_rating_histogram()
+    for score, total in counts.items():
+        histogram[str(score)] = total
+    
+    rating_count = sum(counts.values())
+    rating_sum = sum(score * total for score, total in counts.items())
+    return {
+        'rating_sum': rating_sum,
+        'rating_count': rating_count,
+        'rating_average': rating_sum / rating_count if rating_count else 0.0,
+        'rating_histogram': histogram,
+    }
+
+
 def book_file_upload_path(instance, filename):
     """Génère le chemin de téléchargement pour les fichiers de livres"""
     ext = filename.split('.')[-1]
@@ -91,6 +115,15 @@ class Author(models.Model):
         verbose_name="Photo"
     )
     website = models.URLField(blank=True, verbose_name="Site web")
+    # Compte de l'auteur, rattaché par l'équipe éditoriale après vérification
+    user = models.OneToOneField(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='author_profile',
+        verbose_name="Compte utilisateur"
+    )
     
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Créé le")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Modifié le")
@@ -301,6 +334,15 @@ class Book(models.Model):
     view_count = models.PositiveIntegerField(default=0, verbose_name="Nombre de vues")
     download_count = models.PositiveIntegerField(default=0, verbose_name="Nombre de téléchargements")
     
+    # Agrégats des évaluations (maintenus par les signaux de BookRating)
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name="Somme des notes")
+    rating_count = models.PositiveIntegerField(default=0, verbose_name="Nombre d'évaluations")
+    rating_average = models.FloatField(default=0.0, verbose_name="Note moyenne")
+    rating_histogram = models.JSONField(
+        default=empty_rating_histogram,
+        verbose_name="Répartition des notes"
+    )
+    
     # Dates
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Créé le")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Modifié le")
@@ -314,6 +356,7 @@ class Book(models.Model):
             models.Index(fields=['status', 'is_featured']),
             models.Index(fields=['publication_date']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'rating_average']),
         ]
     
     def __str__(self):
@@ -337,15 +380,12 @@ class Book(models.Model):
     @property
     def average_rating(self):
         """Retourne la note moyenne du livre"""
-        ratings = self.ratings.all()
-        if ratings:
-            return sum(rating.score for rating in ratings) / len(ratings)
-        return 0
+        return self.rating_average
     
     @property
     def ratings_count(self):
         """Retourne le nombre d'évaluations"""
-        return self.ratings.count()
+        return self.rating_count
     
     @property
     def is_available(self):
@@ -353,14 +393,56 @@ class Book(models.Model):
         return self.status == 'published' and self.book_files.exists()
     
     def increment_view_count(self):
-        """Incrémente le compteur de vues"""
+        """Incrémente le compteur de vues (écriture différée, voir coko.counters)"""
+        book_counters.incr('book', self.id, 'view_count')
         self.view_count += 1
-        self.save(update_fields=['view_count'])
     
     def increment_download_count(self):
-        """Incrémente le compteur de téléchargements"""
+        """Incrémente le compteur de téléchargements (écriture différée)"""
+        book_counters.incr('book', self.id, 'download_count')
         self.download_count += 1
-        self.save(update_fields=['download_count'])
+    
+    @classmethod
+    def refresh_rating_aggregates(cls, book_id):
+        """Recalculer les agrégats d'évaluation d'un livre sous verrou de ligne"""
+        using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            locked = cls.objects.using(using).select_for_update().filter(pk=book_id)
+            if not locked.exists():
+                return None
+            
+            counts = dict(
+                BookRating.objects.using(using).filter(book_id=book_id)
+                .order_by().values_list('score').annotate(total=models.Count('id'))
+            )
+            aggregates = rating_aggregates(counts)
+            locked.update(**aggregates)
+        return aggregates
+    
+    @classmethod
+    def rebuild_rating_aggregates(cls, batch_size=1000):
+        """Recalculer les agrégats de tous les livres (une agrégation, écritures groupées)"""
+        counts = {}
+        for book_id, score, total in BookRating.objects.order_by().values_list(
+            'book_id', 'score'
+        ).annotate(total=models.Count('id')):
+            counts.setdefault(book_id, {})[score] = total
+        
+        fields = ['rating_sum', 'rating_count', 'rating_average', 'rating_histogram']
+        updated = 0
+        batch = []
+        for book in cls.objects.only('id', *fields).iterator(chunk_size=batch_size):
+            for field, value in rating_aggregates(counts.get(book.id, {})).items():
+                setattr(book, field, value)
+            batch.append(book)
+            if len(batch) >= batch_size:
+                cls.objects.bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+        if batch:
+            cls.objects.bulk_update(batch, fields)
+            updated += len(batch)
+        return updated
 
 
 class BookFile(models.Model):
@@ -396,6 +478,12 @@ class BookFile(models.Model):
         blank=True, 
         verbose_name="Taille du fichier (bytes)"
     )
+    checksum = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        verbose_name="Empreinte SHA-256"
+    )
     is_active = models.BooleanField(default=True, verbose_name="Actif")
     
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Créé le")
@@ -417,10 +505,32 @@ class BookFile(models.Model):
             return round(self.file_size / (1024 * 1024), 2)
         return 0
     
+    @property
+    def etag(self):
+        """ETag fort dérivé du contenu du fichier"""
+        return f'"{self.checksum}"' if self.checksum else None
+    
+    def compute_checksum(self):
+        """Empreinte SHA-256 du fichier, lue par blocs"""
+        digest = hashlib.sha256()
+        for chunk in self.file.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+    
+    def ensure_checksum(self):
+        """Calculer et enregistrer l'empreinte des fichiers antérieurs à son ajout"""
+        if self.file and not self.checksum:
+            self.checksum = self.compute_checksum()
+            BookFile.objects.filter(pk=self.pk).update(checksum=self.checksum)
+        return self.checksum
+    
     def save(self, *args, **kwargs):
-        """Sauvegarde avec calcul automatique de la taille"""
-        if self.file and not self.file_size:
+        """Sauvegarde avec calcul automatique de la taille et de l'empreinte"""
+        new_upload = self.file and not getattr(self.file, '_committed', True)
+        if self.file and (not self.file_size or new_upload):
             self.file_size = self.file.size
+        if self.file and (not self.checksum or new_upload):
+            self.checksum = self.compute_checksum()
         super().save(*args, **kwargs)
 
 
@@ -559,4 +669,36 @@ class BookCollection(models.Model):
     @property
     def books_count(self):
         """Retourne le nombre de livres dans la collection"""
-        return self.books.count()
\ No newline at end of file
+        return self.books.count()
+
+class BookSearchDocument(models.Model):
+    """
+    Document de recherche dénormalisé d'un livre.
+
+    Le texte est stocké déjà normalisé (minuscules, sans accents), réparti
+    par champ selon son poids : titre > auteurs > catégories > description.
+    Sous PostgreSQL, une colonne `search_vector` indexée en GIN est tenue à
+    jour par trigger (voir la migration).
+    """
+    
+    book = models.OneToOneField(
+        Book,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        verbose_name="Livre"
+    )
+    title = models.TextField(verbose_name="Titre et sous-titre")
+    authors = models.TextField(blank=True, verbose_name="Auteurs")
+    categories = models.TextField(blank=True, verbose_name="Catégories, série et éditeur")
+    body = models.TextField(blank=True, verbose_name="Description et résumé")
+    popularity = models.PositiveIntegerField(default=0, verbose_name="Popularité")
+    
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Modifié le")
+    
+    class Meta:
+        verbose_name = "Document de recherche"
+        verbose_name_plural = "Documents de recherche"
+    
+    def __str__(self):
+        return self.title
@@ -0,0 +1,316 @@
+"""
+Recherche plein texte du catalogue
+
+Chaque livre possède un `BookSearchDocument` dénormalisé et pondéré
+(titre > auteurs > catégories > description), tenu à jour par les signaux
+du catalogue. Deux moteurs répondent aux requêtes :
+
+- PostgreSQL : colonne `tsvector` pondérée, index GIN, requêtes préfixes
+  `terme:*` classées par `ts_rank` ;
+- SQLite (développement) : index inversé en mémoire, en pur Python.
+
+Le texte est normalisé sans accents ni diacritiques, y compris pour les
+lettres des orthographes africaines (ɛ, ɔ, ŋ, ɓ, ɗ…), afin qu'une
+recherche « eleve » trouve « Élève » et « nyɔnu » trouve « nyonu ».
+"""
+import bisect
+import logging
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import Case, IntegerField, When
+
+from .models import Book, BookSearchDocument
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MAX_RESULTS = getattr(settings, 'CATALOG_SEARCH_MAX_RESULTS', 1000)
+SEARCH_VERSION_CACHE_KEY = 'catalog_search_index_version'
+
+# Poids par champ (valeurs par défaut de ts_rank pour A, B, C, D)
+FIELD_WEIGHTS = {
+    'title': 1.0,
+    'authors': 0.4,
+    'categories': 0.2,
+    'body': 0.1,
+}
+# Un terme trouvé uniquement par préfixe compte un peu moins qu'un terme exact
+PREFIX_MATCH_FACTOR = 0.8
+
+# Lettres des alphabets africains sans décomposition Unicode
+_SPECIAL_LETTERS = str.maketrans({
+    'ɛ': 'e', 'ə': 'e', 'ǝ': 'e', 'ɔ': 'o', 'ŋ': 'n', 'ɲ': 'n',
+    'ɓ': 'b', 'ɗ': 'd', 'ɖ': 'd', 'ƙ': 'k', 'ƴ': 'y', 'ɣ': 'g',
+    'ƒ': 'f', 'ʋ': 'v', 'ɩ': 'i', 'ɨ': 'i', 'ʊ': 'u', 'ʉ': 'u',
+    'œ': 'oe', 'æ': 'ae', 'ß': 'ss', 'ø': 'o', 'đ': 'd', 'ł': 'l',
+    'ʼ': "'", '’': "'",
+})
+_TOKEN_RE = re.compile(r'[^\W_]+')
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Mettre un texte en minuscules, sans accents ni diacritiques"""
+    if not text:
+        return ''
+    text = text.casefold().translate(_SPECIAL_LETTERS)
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Découper un texte normalisé en termes"""
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+def build_document(book: Book) -> BookSearchDocument:
+    """
+    Construire le document de recherche d'un livre.
+
+    Les auteurs et catégories doivent avoir été préchargés
+    (`prefetch_related`) pour éviter une requête par livre.
+    """
+    return BookSearchDocument(
+        book=book,
+        title=' '.join(tokenize(f"{book.title} {book.subtitle}")),
+        authors=' '.join(tokenize(' '.join(author.full_name for author in book.authors.all()))),
+        categories=' '.join(tokenize(' '.join(
+            [category.name for category in book.categories.all()]
+            + [book.series.title if book.series else '', book.publisher.name if book.publisher else '']
+        ))),
+        body=' '.join(tokenize(f"{book.description} {book.summary}")),
+        popularity=book.view_count,
+    )
+
+
+class InvertedIndexBackend:
+    """Index inversé en mémoire (mode SQLite / développement)"""
+
+    vendor = 'python'
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.vocabulary: List[str] = []
+        self.popularity: Dict[str, int] = {}
+        self.document_terms: Dict[str, set] = {}
+
+    def load(self, documents: Iterable):
+        """Charger des tuples (book_id, title, authors, categories, body, popularity)"""
+        for document in documents:
+            self._add(*document)
+        self.vocabulary = sorted(self.postings)
+
+    def add(self, book_id, title, authors, categories, body, popularity):
+        self.remove(book_id)
+        for term in self._add(book_id, title, authors, categories, body, popularity):
+            position = bisect.bisect_left(self.vocabulary, term)
+            if position == len(self.vocabulary) or self.vocabulary[position] != term:
+                self.vocabulary.insert(position, term)
+
+    def remove(self, book_id):
+        book_id = str(book_id)
+        for term in self.document_terms.pop(book_id, ()):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(book_id, None)
+            if not postings:
+                del self.postings[term]
+                position = bisect.bisect_left(self.vocabulary, term)
+                if position < len(self.vocabulary) and self.vocabulary[position] == term:
+                    del self.vocabulary[position]
+        self.popularity.pop(book_id, None)
+
+    def _add(self, book_id, title, authors, categories, body, popularity) -> set:
+        book_id = str(book_id)
+        terms = set()
+        for field, text in (('title', title), ('authors', authors),
+                            ('categories', categories), ('body', body)):
+            weight = FIELD_WEIGHTS[field]
+            for term in text.split():
+                postings = self.postings[term]
+                if postings.get(book_id, 0.0) < weight:
+                    postings[book_id] = weight
+                terms.add(term)
+        self.document_terms[book_id] = terms
+        self.popularity[book_id] = popularity or 0
+        return terms
+
+    def _match(self, term: str) -> Dict[str, float]:
+        """Scores des livres pour un terme, correspondances exactes et préfixes"""
+        scores = dict(self.postings.get(term, {}))
+        position = bisect.bisect_left(self.vocabulary, term)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(term):
+            candidate = self.vocabulary[position]
+            if candidate != term:
+                for book_id, weight in self.postings[candidate].items():
+                    weight *= PREFIX_MATCH_FACTOR
+                    if scores.get(book_id, 0.0) < weight:
+                        scores[book_id] = weight
+            position += 1
+        return scores
+
+    def search(self, terms: List[str], limit: int, offset: int = 0) -> List[str]:
+        """Tous les termes doivent correspondre ; tri par score puis popularité"""
+        totals = None
+        for term in sorted(set(terms), key=lambda t: -len(t)):
+            scores = self._match(term)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {
+                    book_id: total + scores[book_id]
+                    for book_id, total in totals.items() if book_id in scores
+                }
+            if not totals:
+                return []
+
+        ranked = sorted(
+            totals.items(),
+            key=lambda item: (-item[1], -self.popularity.get(item[0], 0), item[0])
+        )
+        return [book_id for book_id, _ in ranked[offset:offset + limit]]
+
+
+class PostgresSearchBackend:
+    """Recherche via la colonne tsvector pondérée et son index GIN"""
+
+    vendor = 'postgresql'
+
+    def __init__(self, using: str):
+        self.using = using
+
+    def search(self, terms: List[str], limit: int, offset: int = 0) -> List[str]:
+        tsquery = ' & '.join(f"{term}:*" for term in terms)
+        table = BookSearchDocument._meta.db_table
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT book_id FROM {table}
+                WHERE search_vector @@ to_tsquery('simple', %s)
+                ORDER BY ts_rank(search_vector, to_tsquery('simple', %s)) DESC,
+                         popularity DESC, book_id
+                LIMIT %s OFFSET %s
+                """,
+                [tsquery, tsquery, limit, offset]
+            )
+            return [str(row[0]) for row in cursor.fetchall()]
+
+
+def relevance_ordering(ranked_ids: List[str]) -> Case:
+    """Expression de tri conservant l'ordre de pertinence de l'index"""
+    return Case(
+        *[When(id=book_id, then=position) for position, book_id in enumerate(ranked_ids)],
+        output_field=IntegerField()
+    )
+
+
+class BookSearchIndex:
+    """Point d'entrée de la recherche et de l'indexation des livres"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local: Optional[InvertedIndexBackend] = None
+        self._local_version = None
+
+    @property
+    def using(self) -> str:
+        return router.db_for_write(BookSearchDocument) or 'default'
+
+    @property
+    def is_postgresql(self) -> bool:
+        return connections[self.using].vendor == 'postgresql'
+
+    def search(self, query: str, limit: int = None, offset: int = 0) -> List[str]:
+        """Identifiants des livres correspondant à la requête, par pertinence"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        limit = limit or SEARCH_MAX_RESULTS
+        if self.is_postgresql:
+            return PostgresSearchBackend(self.using).search(terms, limit, offset)
+        return self._get_local().search(terms, limit, offset)
+
+    def index_books(self, book_ids: Iterable) -> int:
+        """(Ré)indexer des livres : une requête pour les livres, une écriture groupée"""
+        books = Book.objects.filter(id__in=list(book_ids)).select_related(
+            'publisher', 'series'
+        ).prefetch_related('authors', 'categories')
+        documents = [build_document(book) for book in books]
+        if not documents:
+            return 0
+
+        BookSearchDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=['book'],
+            update_fields=['title', 'authors', 'categories', 'body', 'popularity', 'updated_at']
+        )
+        self._apply_locally(lambda index: [
+            index.add(doc.book_id, doc.title, doc.authors, doc.categories,
+                      doc.body, doc.popularity)
+            for doc in documents
+        ])
+        return len(documents)
+
+    def remove_books(self, book_ids: Iterable):
+        """Retirer des livres de l'index (la suppression en base est en cascade)"""
+        book_ids = list(book_ids)
+        self._apply_locally(lambda index: [index.remove(book_id) for book_id in book_ids])
+
+    def rebuild(self, chunk_size: int = 500) -> int:
+        """Réindexer tout le catalogue par lots"""
+        book_ids = list(Book.objects.values_list('id', flat=True))
+        indexed = 0
+        for start in range(0, len(book_ids), chunk_size):
+            indexed += self.index_books(book_ids[start:start + chunk_size])
+
+        BookSearchDocument.objects.exclude(book_id__in=book_ids).delete()
+        with self._lock:
+            self._local = None
+        self._bump_version()
+        return indexed
+
+    def _get_local(self) -> InvertedIndexBackend:
+        """Index en mémoire, rechargé lorsqu'un autre processus l'a modifié"""
+        version = cache.get(SEARCH_VERSION_CACHE_KEY)
+        with self._lock:
+            if self._local is None or version != self._local_version:
+                local = InvertedIndexBackend()
+                local.load(BookSearchDocument.objects.values_list(
+                    'book_id', 'title', 'authors', 'categories', 'body', 'popularity'
+                ).iterator(chunk_size=2000))
+                self._local = local
+                self._local_version = version
+            return self._local
+
+    def _apply_locally(self, update):
+        """Appliquer une modification à l'index local et prévenir les autres processus"""
+        if self.is_postgresql:
+            return
+        version = self._bump_version()
+        with self._lock:
+            if self._local is None:
+                return
+            if self._local_version is not None and version == self._local_version + 1:
+                update(self._local)
+                self._local_version = version
+            else:
+                # Modifications concurrentes manquées : recharger à la prochaine requête
+                self._local = None
+
+    def _bump_version(self):
+        try:
+            return cache.incr(SEARCH_VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(SEARCH_VERSION_CACHE_KEY, 1, None)
+            return 1
+
+
+search_index = BookSearchIndex()
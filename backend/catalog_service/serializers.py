@@ -1,9 +1,11 @@
 from rest_framework import serializers
+from django.urls import reverse
 from django.db.models import Avg, Count
 from .models import (
     Book, Author, Publisher, Category, Series, BookFile, 
-    BookRating, BookTag, BookTagAssignment, BookCollection
+    BookRating, BookTag, BookTagAssignment, BookCollection, empty_rating_histogram
 )
+from .batch import BATCH_FIELDS, BATCH_MAX_BOOKS
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -78,14 +80,21 @@ class BookFileSerializer(serializers.ModelSerializer):
     """Serializer pour les fichiers de livres"""
     
     file_size_mb = serializers.ReadOnlyField()
+    download_url = serializers.SerializerMethodField()
     
     class Meta:
         model = BookFile
         fields = [
-            'id', 'format', 'file', 'file_size', 'file_size_mb', 'is_active',
-            'created_at', 'updated_at'
+            'id', 'format', 'file', 'file_size', 'file_size_mb', 'checksum',
+            'download_url', 'is_active', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'file_size', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'file_size', 'checksum', 'created_at', 'updated_at']
+    
+    def get_download_url(self, obj):
+        """URL de téléchargement avec reprise (voir BookFileDownloadView)"""
+        url = reverse('catalog:book-download', kwargs={'slug': obj.book.slug, 'file_format': obj.format})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
 
 class BookRatingSerializer(serializers.ModelSerializer):
@@ -188,12 +197,8 @@ class BookDetailSerializer(serializers.ModelSerializer):
         return BookTagSerializer([ta.tag for ta in tag_assignments], many=True).data
     
     def get_rating_distribution(self, obj):
-        """Retourne la distribution des notes"""
-        ratings = obj.ratings.values('score').annotate(count=Count('score')).order_by('score')
-        distribution = {str(i): 0 for i in range(1, 6)}
-        for rating in ratings:
-            distribution[str(rating['score'])] = rating['count']
-        return distribution
+        """Retourne la distribution des notes (agrégat stocké sur le livre)"""
+        return {**empty_rating_histogram(), **(obj.rating_histogram or {})}
 
 
 class BookCreateUpdateSerializer(serializers.ModelSerializer):
@@ -344,11 +349,10 @@ class BookSearchSerializer(serializers.Serializer):
         choices=[
             'title', '-title', 'publication_date', '-publication_date',
             'created_at', '-created_at', 'view_count', '-view_count',
-            'average_rating', '-average_rating'
+            'average_rating', '-average_rating', 'relevance'
         ],
         required=False,
-        default='-created_at',
-        help_text="Ordre de tri"
+        help_text="Ordre de tri (par défaut : pertinence si `q` est fourni, sinon -created_at)"
     )
 
 
@@ -368,4 +372,24 @@ class BookStatsSerializer(serializers.Serializer):
     average_rating = serializers.FloatField()
     most_popular_books = BookListSerializer(many=True)
     recent_books = BookListSerializer(many=True)
-    top_rated_books = BookListSerializer(many=True)
\ No newline at end of file
+    top_rated_books = BookListSerializer(many=True)
+
+class BookBatchRequestSerializer(serializers.Serializer):
+    """Serializer pour la lecture groupée de livres par UUID"""
+    
+    book_uuids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=BATCH_MAX_BOOKS,
+        help_text="UUID des livres à récupérer"
+    )
+    fields = serializers.ListField(
+        child=serializers.ChoiceField(choices=sorted(BATCH_FIELDS)),
+        required=False,
+        allow_empty=False,
+        help_text="Champs à renvoyer (projection par défaut si absent)"
+    )
+    
+    def validate_book_uuids(self, value):
+        # Conserver l'ordre de la demande sans doublons
+        return list(dict.fromkeys(value))
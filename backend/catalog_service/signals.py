@@ -1,6 +1,5 @@
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
 from django.dispatch import receiver
-from django.core.cache import cache
 from django.utils.text import slugify
 from django.core.mail import send_mail
 from django.conf import settings
@@ -8,13 +7,32 @@ from django.template.loader import render_to_string
 import logging
 import os
 
+from coko.cache_tags import tagged_cache, book_tag, category_tag, CATALOG_TAG
 from .models import (
     Book, Author, Publisher, Category, Series, BookFile, 
     BookRating, BookTag, BookTagAssignment, BookCollection
 )
+from .search import search_index
+from .suggest import mark_suggestions_stale
 
 logger = logging.getLogger(__name__)
 
+# Sauvegardes qui ne touchent pas au texte indexé
+COUNTER_FIELDS = {'view_count', 'download_count'}
+
+
+def reindex_books(book_ids):
+    """Réindexer des livres sans faire échouer la sauvegarde d'origine"""
+    try:
+        search_index.index_books(book_ids)
+    except Exception as e:
+        logger.error(f"Erreur lors de l'indexation de recherche: {e}")
+
+
+def invalidate_book_caches(book_ids):
+    """Invalider les caches du catalogue (statistiques, listes) et des livres modifiés"""
+    tagged_cache.invalidate(CATALOG_TAG, *[book_tag(book_id) for book_id in book_ids])
+
 
 @receiver(pre_save, sender=Book)
 def book_pre_save(sender, instance, **kwargs):
@@ -39,8 +57,13 @@ def book_pre_save(sender, instance, **kwargs):
 @receiver(post_save, sender=Book)
 def book_post_save(sender, instance, created, **kwargs):
     """Signal après sauvegarde d'un livre"""
-    # Invalider le cache des statistiques
-    cache.delete('book_stats')
+    # Invalider le cache des statistiques et du livre
+    invalidate_book_caches([instance.pk])
+    
+    update_fields = kwargs.get('update_fields')
+    if not update_fields or not set(update_fields) <= COUNTER_FIELDS:
+        reindex_books([instance.pk])
+        mark_suggestions_stale()
     
     if created:
         logger.info(f"Nouveau livre créé: {instance.title} (ID: {instance.id})")
@@ -93,8 +116,10 @@ def book_post_save(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=Book)
 def book_post_delete(sender, instance, **kwargs):
     """Signal après suppression d'un livre"""
-    # Invalider le cache des statistiques
-    cache.delete('book_stats')
+    # Invalider le cache des statistiques et du livre
+    invalidate_book_caches([instance.pk])
+    search_index.remove_books([instance.pk])
+    mark_suggestions_stale()
     
     # Supprimer les fichiers associés
     if instance.cover_image:
@@ -107,6 +132,31 @@ def book_post_delete(sender, instance, **kwargs):
     logger.info(f"Livre supprimé: {instance.title} (ID: {instance.id})")
 
 
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.categories.through)
+def book_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Réindexer les livres dont les auteurs ou catégories ont changé"""
+    if reverse and action == 'pre_clear':
+        # pk_set n'est pas fourni pour un clear inverse : mémoriser les livres
+        instance._search_cleared_book_ids = list(instance.books.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    
+    if not reverse:
+        book_ids = [instance.pk]
+    elif action == 'post_clear':
+        book_ids = getattr(instance, '_search_cleared_book_ids', [])
+    else:
+        book_ids = pk_set or []
+    
+    reindex_books(book_ids)
+    invalidate_book_caches(book_ids)
+    if sender is Book.categories.through:
+        category_ids = [instance.pk] if reverse else (pk_set or [])
+        tagged_cache.invalidate(*[category_tag(category_id) for category_id in category_ids])
+
+
 @receiver(pre_save, sender=Author)
 def author_pre_save(sender, instance, **kwargs):
     """Signal avant sauvegarde d'un auteur"""
@@ -124,15 +174,22 @@ def author_pre_save(sender, instance, **kwargs):
 @receiver(post_save, sender=Author)
 def author_post_save(sender, instance, created, **kwargs):
     """Signal après sauvegarde d'un auteur"""
+    mark_suggestions_stale()
+    tagged_cache.invalidate(CATALOG_TAG)
+    
     if created:
         logger.info(f"Nouvel auteur créé: {instance.full_name} (ID: {instance.id})")
     else:
         logger.info(f"Auteur modifié: {instance.full_name} (ID: {instance.id})")
+        reindex_books(instance.books.values_list('id', flat=True))
 
 
 @receiver(post_delete, sender=Author)
 def author_post_delete(sender, instance, **kwargs):
     """Signal après suppression d'un auteur"""
+    mark_suggestions_stale()
+    tagged_cache.invalidate(CATALOG_TAG)
+    
     # Supprimer la photo si elle existe
     if instance.photo:
         try:
@@ -161,15 +218,20 @@ def publisher_pre_save(sender, instance, **kwargs):
 @receiver(post_save, sender=Publisher)
 def publisher_post_save(sender, instance, created, **kwargs):
     """Signal après sauvegarde d'un éditeur"""
+    tagged_cache.invalidate(CATALOG_TAG)
+    
     if created:
         logger.info(f"Nouvel éditeur créé: {instance.name} (ID: {instance.id})")
     else:
         logger.info(f"Éditeur modifié: {instance.name} (ID: {instance.id})")
+        reindex_books(instance.books.values_list('id', flat=True))
 
 
 @receiver(post_delete, sender=Publisher)
 def publisher_post_delete(sender, instance, **kwargs):
     """Signal après suppression d'un éditeur"""
+    tagged_cache.invalidate(CATALOG_TAG)
+    
     # Supprimer le logo si il existe
     if instance.logo:
         try:
@@ -198,10 +260,13 @@ def category_pre_save(sender, instance, **kwargs):
 @receiver(post_save, sender=Category)
 def category_post_save(sender, instance, created, **kwargs):
     """Signal après sauvegarde d'une catégorie"""
+    tagged_cache.invalidate(CATALOG_TAG, category_tag(instance.pk))
+    
     if created:
         logger.info(f"Nouvelle catégorie créée: {instance.name} (ID: {instance.id})")
     else:
         logger.info(f"Catégorie modifiée: {instance.name} (ID: {instance.id})")
+        reindex_books(instance.books.values_list('id', flat=True))
 
 
 @receiver(pre_save, sender=Series)
@@ -221,10 +286,14 @@ def series_pre_save(sender, instance, **kwargs):
 @receiver(post_save, sender=Series)
 def series_post_save(sender, instance, created, **kwargs):
     """Signal après sauvegarde d'une série"""
+    mark_suggestions_stale()
+    tagged_cache.invalidate(CATALOG_TAG)
+    
     if created:
         logger.info(f"Nouvelle série créée: {instance.title} (ID: {instance.id})")
     else:
         logger.info(f"Série modifiée: {instance.title} (ID: {instance.id})")
+        reindex_books(instance.books.values_list('id', flat=True))
 
 
 @receiver(post_save, sender=BookFile)
@@ -259,8 +328,9 @@ def book_file_post_delete(sender, instance, **kwargs):
 @receiver(post_save, sender=BookRating)
 def book_rating_post_save(sender, instance, created, **kwargs):
     """Signal après sauvegarde d'une évaluation"""
-    # Invalider le cache des statistiques
-    cache.delete('book_stats')
+    # Invalider le cache des statistiques et du livre
+    invalidate_book_caches([instance.book_id])
+    Book.refresh_rating_aggregates(instance.book_id)
     
     if created:
         logger.info(f"Nouvelle évaluation pour {instance.book.title} par {instance.user.username}: {instance.score}/5")
@@ -292,8 +362,9 @@ def book_rating_post_save(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=BookRating)
 def book_rating_post_delete(sender, instance, **kwargs):
     """Signal après suppression d'une évaluation"""
-    # Invalider le cache des statistiques
-    cache.delete('book_stats')
+    # Invalider le cache des statistiques et du livre
+    invalidate_book_caches([instance.book_id])
+    Book.refresh_rating_aggregates(instance.book_id)
     
     logger.info(f"Évaluation supprimée pour {instance.book.title} par {instance.user.username}")
 
@@ -0,0 +1,245 @@
+"""
+Suggestions de saisie (typeahead) pour le catalogue
+
+Les titres de livres, noms d'auteurs et titres de séries sont chargés dans
+un index en mémoire : un tableau trié de clés normalisées (une clé par
+début de mot) interrogé par recherche dichotomique. Les entrées sont
+numérotées par popularité décroissante, donc les meilleures suggestions
+d'un préfixe sont simplement les plus petits numéros de sa plage. Les
+préfixes très courts, qui couvrent de grandes plages, sont précalculés.
+
+L'index est partagé entre workers via un instantané en cache et reconstruit
+lorsque les signaux du catalogue le marquent comme périmé. Un index périmé
+reste servi pendant qu'un seul worker le reconstruit en arrière-plan ; seul
+un processus qui n'a encore aucun index le construit sur la requête, d'où
+le préchauffage au démarrage des workers web (`warm_suggestions`).
+"""
+import bisect
+import heapq
+import logging
+import threading
+import time
+import uuid
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Sum
+
+from .models import Author, Book, Series
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_MAX_RESULTS = 10
+# Longueur maximale des préfixes dont les résultats sont précalculés
+SUGGEST_HEAD_PREFIX_LENGTH = 2
+SUGGEST_REFRESH_INTERVAL = getattr(settings, 'CATALOG_SUGGEST_REFRESH_INTERVAL', 30)
+SUGGEST_MAX_AGE = getattr(settings, 'CATALOG_SUGGEST_MAX_AGE', 3600)
+SUGGEST_SNAPSHOT_CACHE_KEY = 'catalog_suggest_snapshot'
+SUGGEST_VERSION_CACHE_KEY = 'catalog_suggest_version'
+SUGGEST_LOCK_CACHE_KEY = 'catalog_suggest_rebuild_lock'
+SUGGEST_LOCK_TIMEOUT = 60
+SUGGEST_WARM_ON_START = getattr(settings, 'CATALOG_SUGGEST_WARM_ON_START', True)
+VERSION_CHECK_INTERVAL = 1.0
+
+KIND_BOOK = 'b'
+KIND_AUTHOR = 'a'
+KIND_SERIES = 's'
+
+
+class SuggestionIndex:
+    """Tableau trié de clés de préfixe vers des entrées classées"""
+
+    def __init__(self, entries: List[Tuple[str, str, str, float]], version=None):
+        # Rang 0 = entrée la plus populaire
+        entries = sorted(entries, key=lambda entry: -entry[3])
+        self.labels = [entry[0] for entry in entries]
+        self.kinds = [entry[1] for entry in entries]
+        self.slugs = [entry[2] for entry in entries]
+        self.version = version
+        self.built_at = time.time()
+
+        keyed = []
+        for rank, label in enumerate(self.labels):
+            words = tokenize(label)
+            for start in range(len(words)):
+                keyed.append((' '.join(words[start:]), rank))
+        keyed.sort()
+
+        self.keys = [key for key, _ in keyed]
+        self.ranks = array('i', (rank for _, rank in keyed))
+
+        self.head: Dict[str, List[int]] = {}
+        head_sets: Dict[str, set] = {}
+        for key, rank in keyed:
+            for length in range(1, min(SUGGEST_HEAD_PREFIX_LENGTH, len(key)) + 1):
+                head_sets.setdefault(key[:length], set()).add(rank)
+        for prefix, ranks in head_sets.items():
+            self.head[prefix] = heapq.nsmallest(SUGGEST_MAX_RESULTS * 2, ranks)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def lookup(self, query: str, limit: int = SUGGEST_MAX_RESULTS) -> List[Tuple[str, str, str]]:
+        """Meilleures suggestions (libellé, type, slug) pour un préfixe"""
+        prefix = ' '.join(tokenize(query))
+        if not prefix:
+            return []
+
+        if len(prefix) <= SUGGEST_HEAD_PREFIX_LENGTH:
+            ranks = self.head.get(prefix, [])[:limit]
+        else:
+            low = bisect.bisect_left(self.keys, prefix)
+            high = bisect.bisect_left(self.keys, prefix + '\uffff', lo=low)
+            ranks = heapq.nsmallest(limit, set(self.ranks[low:high]))
+
+        return [(self.labels[rank], self.kinds[rank], self.slugs[rank]) for rank in ranks]
+
+
+def load_entries() -> List[Tuple[str, str, str, float]]:
+    """Lire les libellés et leur popularité (vues pondérées par la note)"""
+    entries = []
+
+    books = Book.objects.filter(status='published').values_list(
+        'title', 'slug', 'view_count', 'rating_average'
+    )
+    for title, slug, view_count, rating in books:
+        entries.append((title, KIND_BOOK, slug, view_count * (1 + rating / 5)))
+
+    authors = Author.objects.annotate(
+        views=Sum('books__view_count')
+    ).values_list('first_name', 'last_name', 'slug', 'views')
+    for first_name, last_name, slug, views in authors:
+        entries.append((f"{first_name} {last_name}", KIND_AUTHOR, slug, views or 0))
+
+    series = Series.objects.annotate(
+        views=Sum('books__view_count')
+    ).values_list('title', 'slug', 'views')
+    for title, slug, views in series:
+        entries.append((title, KIND_SERIES, slug, views or 0))
+
+    return entries
+
+
+class SuggestionService:
+    """Index local au processus, synchronisé via le cache partagé"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index: Optional[SuggestionIndex] = None
+        self._checked_at = 0.0
+        self._rebuilding = False
+
+    def suggest(self, query: str, limit: int = SUGGEST_MAX_RESULTS) -> List[Tuple[str, str, str]]:
+        return self.get_index().lookup(query, min(limit, SUGGEST_MAX_RESULTS))
+
+    def get_index(self) -> SuggestionIndex:
+        now = time.monotonic()
+        index = self._index
+        if index is not None and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return index
+
+        with self._lock:
+            self._checked_at = now
+            version = cache.get(SUGGEST_VERSION_CACHE_KEY, 0)
+            index = self._index
+            if index is not None and not self._is_stale(index, version):
+                return index
+
+            snapshot = cache.get(SUGGEST_SNAPSHOT_CACHE_KEY)
+            if snapshot is not None and not self._is_stale(snapshot, version):
+                self._index = snapshot
+                return snapshot
+
+            # Un seul worker reconstruit ; les autres servent l'ancien index.
+            # Le jeton évite de libérer le verrou d'un autre worker (verrou
+            # expiré pendant une reconstruction lente, démarrage à froid)
+            if index is not None:
+                if not self._rebuilding:
+                    token = uuid.uuid4().hex
+                    if cache.add(SUGGEST_LOCK_CACHE_KEY, token, SUGGEST_LOCK_TIMEOUT):
+                        self._rebuilding = True
+                        threading.Thread(
+                            target=self._rebuild_in_background, args=(version, token),
+                            name='suggest-rebuild', daemon=True
+                        ).start()
+                return index
+
+            # Démarrage à froid : aucun index à servir, construction immédiate
+            token = uuid.uuid4().hex
+            claimed = cache.add(SUGGEST_LOCK_CACHE_KEY, token, SUGGEST_LOCK_TIMEOUT)
+            try:
+                self._index = self.rebuild(version)
+            finally:
+                if claimed:
+                    self._release_lock(token)
+            return self._index
+
+    def warm(self):
+        """Charger l'index avant la première requête (instantané ou reconstruction)"""
+        try:
+            self.get_index()
+        except Exception as e:
+            logger.warning(f"Préchauffage de l'index de suggestions impossible: {str(e)}")
+        finally:
+            close_old_connections()
+
+    def _rebuild_in_background(self, version, token: str):
+        try:
+            index = self.rebuild(version)
+            with self._lock:
+                self._index = index
+        except Exception as e:
+            logger.error(f"Erreur lors de la reconstruction de l'index de suggestions: {str(e)}")
+        finally:
+            self._rebuilding = False
+            self._release_lock(token)
+            close_old_connections()
+
+    def _release_lock(self, token: str):
+        if cache.get(SUGGEST_LOCK_CACHE_KEY) == token:
+            cache.delete(SUGGEST_LOCK_CACHE_KEY)
+
+    def rebuild(self, version=None) -> SuggestionIndex:
+        """Reconstruire l'index depuis la base et publier l'instantané"""
+        start_time = time.monotonic()
+        if version is None:
+            version = cache.get(SUGGEST_VERSION_CACHE_KEY, 0)
+        index = SuggestionIndex(load_entries(), version=version)
+        cache.set(SUGGEST_SNAPSHOT_CACHE_KEY, index, SUGGEST_MAX_AGE * 2)
+        logger.info(
+            f"Index de suggestions reconstruit: {len(index)} entrées "
+            f"en {time.monotonic() - start_time:.2f}s"
+        )
+        return index
+
+    def _is_stale(self, index: SuggestionIndex, version) -> bool:
+        age = time.time() - index.built_at
+        if age > SUGGEST_MAX_AGE:
+            return True
+        # Débounce : pas plus d'une reconstruction par intervalle
+        return index.version != version and age > SUGGEST_REFRESH_INTERVAL
+
+
+def mark_suggestions_stale():
+    """Signaler aux workers que les libellés ont changé"""
+    try:
+        cache.incr(SUGGEST_VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(SUGGEST_VERSION_CACHE_KEY, 1, None)
+
+
+def warm_suggestions():
+    """
+    Préchauffer l'index du processus en arrière-plan, au démarrage d'un
+    worker web (`coko.wsgi`, `coko.asgi`)
+    """
+    if not SUGGEST_WARM_ON_START:
+        return
+    threading.Thread(target=suggestion_service.warm, name='suggest-warm', daemon=True).start()
+
+
+suggestion_service = SuggestionService()
@@ -0,0 +1,22 @@
+from celery import shared_task
+import logging
+
+from coko.counters import book_counters
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def flush_buffered_counters():
+    """
+    Écrire en base les vues et téléchargements accumulés par les compteurs
+    à écriture différée (un UPDATE groupé par lot de livres)
+    """
+    try:
+        stats = book_counters.flush()
+        if stats:
+            logger.info(f"Compteurs différés écrits en base: {stats}")
+        return {'success': True, 'flushed': stats}
+    except Exception as e:
+        logger.error(f"Erreur lors du vidage des compteurs différés: {str(e)}")
+        return {'success': False, 'error': str(e)}
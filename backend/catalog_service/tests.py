@@ -1,18 +1,29 @@
 from django.test import TestCase
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.db import DatabaseError
+from django.db.models import QuerySet
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.utils import timezone
 from datetime import date
+from unittest import mock
+import hashlib
+import shutil
 import tempfile
+import uuid
 import os
 
 from .models import (
     Book, Author, Publisher, Category, Series, BookFile, 
     BookRating, BookTag, BookTagAssignment, BookCollection
 )
+from .search import search_index, normalize_text, tokenize
+from .suggest import SUGGEST_LOCK_CACHE_KEY, SUGGEST_MAX_AGE, SuggestionIndex, SuggestionService, suggestion_service
+from coko.counters import book_counters
 
 User = get_user_model()
 
@@ -197,6 +208,158 @@ class BookModelTest(TestCase):
         self.assertEqual(str(self.book), "Foundation")
 
 
+class BookSearchIndexTest(TestCase):
+    """Tests pour l'index de recherche plein texte"""
+    
+    def setUp(self):
+        # L'index en mémoire est rechargé lorsque la version en cache change
+        cache.clear()
+        
+        self.author = Author.objects.create(
+            first_name="Chinua",
+            last_name="Achébé"
+        )
+        self.category = Category.objects.create(name="Roman africain")
+        
+        self.book = Book.objects.create(
+            title="Le monde s'effondre",
+            description="Un classique de la littérature",
+            status="published",
+            view_count=5
+        )
+        self.book.authors.add(self.author)
+        self.book.categories.add(self.category)
+        
+        self.other_book = Book.objects.create(
+            title="Élève modèle",
+            description="Une histoire du monde",
+            status="published",
+            view_count=50
+        )
+    
+    def test_normalize_text_removes_accents(self):
+        """Les accents et lettres africaines sont ramenés à l'ASCII"""
+        self.assertEqual(normalize_text("Élève NYƆNU Ŋgɔ"), "eleve nyonu ngo")
+        self.assertEqual(tokenize("L'Œuvre, tome_2"), ["l", "oeuvre", "tome", "2"])
+    
+    def test_title_match_ranks_before_description_match(self):
+        """Un terme du titre pèse plus qu'un terme de la description"""
+        results = search_index.search("monde")
+        
+        self.assertEqual(results, [str(self.book.id), str(self.other_book.id)])
+    
+    def test_prefix_and_accent_insensitive_search(self):
+        """Recherche par préfixe, sans tenir compte des accents"""
+        self.assertEqual(search_index.search("eleve mod"), [str(self.other_book.id)])
+        self.assertEqual(search_index.search("ACHEB"), [str(self.book.id)])
+    
+    def test_signals_keep_documents_current(self):
+        """Les modifications d'auteur et de catégories sont réindexées"""
+        self.author.last_name = "Okonkwo"
+        self.author.save()
+        self.assertEqual(search_index.search("achebe"), [])
+        self.assertEqual(search_index.search("okonkwo"), [str(self.book.id)])
+        
+        self.book.categories.clear()
+        self.assertEqual(search_index.search("africain"), [])
+        
+        self.other_book.delete()
+        self.assertEqual(search_index.search("eleve"), [])
+    
+    def test_search_offset_skips_ranked_results(self):
+        """Le décalage parcourt les résultats dans l'ordre de pertinence"""
+        self.assertEqual(search_index.search("monde", limit=1), [str(self.book.id)])
+        self.assertEqual(search_index.search("monde", limit=1, offset=1), [str(self.other_book.id)])
+    
+    def test_book_list_search_is_capped(self):
+        """Le filtre `search` ne lit que les meilleurs résultats de l'index, en une requête"""
+        url = reverse('catalog:book-list')
+        with mock.patch('catalog_service.search.SEARCH_MAX_RESULTS', 1):
+            response = self.client.get(url, {'search': 'monde'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result['title'] for result in response.data['results']], [self.book.title])
+    
+    def test_book_list_search_keeps_relevance_order(self):
+        """Le filtre `search` de la liste conserve le classement de l'index"""
+        # Le livre le plus pertinent est aussi le plus ancien
+        url = reverse('catalog:book-list')
+        response = self.client.get(url, {'search': 'monde'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['title'] for result in response.data['results']],
+            [self.book.title, self.other_book.title]
+        )
+
+
+class SuggestionIndexTest(APITestCase):
+    """Tests pour les suggestions de saisie"""
+    
+    def setUp(self):
+        self.index = SuggestionIndex([
+            ("Le monde s'effondre", 'b', 'le-monde-s-effondre', 10),
+            ("Mondes perdus", 'b', 'mondes-perdus', 50),
+            ("Chinua Achebe", 'a', 'chinua-achebe', 30),
+            ("Monday Club", 's', 'monday-club', 1),
+        ])
+    
+    def test_prefix_matches_any_word_ranked_by_popularity(self):
+        """Un préfixe correspond au début de n'importe quel mot"""
+        slugs = [slug for _, _, slug in self.index.lookup("mond")]
+        
+        self.assertEqual(slugs, ['mondes-perdus', 'le-monde-s-effondre', 'monday-club'])
+    
+    def test_short_prefix_and_accents(self):
+        """Les préfixes courts sont précalculés et les accents ignorés"""
+        self.assertEqual(self.index.lookup("a")[0], ("Chinua Achebe", 'a', 'chinua-achebe'))
+        self.assertEqual(len(self.index.lookup("MÖ", limit=2)), 2)
+        self.assertEqual(self.index.lookup(""), [])
+    
+    def test_suggest_endpoint_returns_compact_payload(self):
+        """L'endpoint est public et renvoie des triplets [libellé, type, slug]"""
+        Book.objects.create(
+            title="Soundjata ou l'épopée mandingue",
+            description="Épopée",
+            status="published"
+        )
+        suggestion_service._index = suggestion_service.rebuild()
+        
+        response = self.client.get(reverse('catalog:suggest'), {'q': 'epop'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['s'][0][1], 'b')
+        self.assertEqual(response.data['s'][0][0], "Soundjata ou l'épopée mandingue")
+    
+    def test_rebuild_does_not_release_another_workers_lock(self):
+        """Un worker ne supprime que le verrou de reconstruction qu'il détient"""
+        cache.clear()
+        cache.set(SUGGEST_LOCK_CACHE_KEY, 'autre-worker', 60)
+        
+        SuggestionService().get_index()
+        
+        self.assertEqual(cache.get(SUGGEST_LOCK_CACHE_KEY), 'autre-worker')
+    
+    def test_stale_index_is_served_while_rebuilding(self):
+        """Un index périmé est servi pendant sa reconstruction en arrière-plan"""
+        cache.clear()
+        service = SuggestionService()
+        service._index = self.index
+        self.index.built_at -= SUGGEST_MAX_AGE + 1
+        
+        with mock.patch('catalog_service.suggest.threading.Thread') as thread:
+            self.assertIs(service.get_index(), self.index)
+        
+        thread.return_value.start.assert_called_once()
+        self.assertIsNotNone(cache.get(SUGGEST_LOCK_CACHE_KEY))
+        
+        # La reconstruction remplace l'index et libère le verrou
+        target = thread.call_args.kwargs['target']
+        target(*thread.call_args.kwargs['args'])
+        self.assertIsNot(service._index, self.index)
+        self.assertIsNone(cache.get(SUGGEST_LOCK_CACHE_KEY))
+
+
 class BookRatingModelTest(TestCase):
     """Tests pour le modèle BookRating"""
     
@@ -241,6 +404,223 @@ class BookRatingModelTest(TestCase):
         self.assertEqual(str(self.rating), expected_str)
 
 
+class BookRatingAggregatesTest(TestCase):
+    """Tests pour les agrégats d'évaluation stockés sur les livres"""
+    
+    def setUp(self):
+        self.book = Book.objects.create(
+            title="Une si longue lettre",
+            description="Roman épistolaire",
+            status="published"
+        )
+        self.users = [
+            User.objects.create(username=f"lecteur{i}", email=f"lecteur{i}@example.com")
+            for i in range(3)
+        ]
+    
+    def test_signals_keep_aggregates_consistent(self):
+        """Création, modification et suppression d'évaluations"""
+        ratings = [
+            BookRating.objects.create(book=self.book, user=user, score=score)
+            for user, score in zip(self.users, [5, 4, 4])
+        ]
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.rating_count, 3)
+        self.assertEqual(self.book.rating_sum, 13)
+        self.assertAlmostEqual(self.book.average_rating, 13 / 3)
+        self.assertEqual(self.book.rating_histogram['4'], 2)
+        
+        ratings[0].score = 1
+        ratings[0].save()
+        ratings[1].delete()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.rating_count, 2)
+        self.assertEqual(self.book.rating_sum, 5)
+        self.assertEqual(
+            self.book.rating_histogram,
+            {'1': 1, '2': 0, '3': 0, '4': 1, '5': 0}
+        )
+    
+    def test_rebuild_rating_aggregates(self):
+        """Le recalcul en masse corrige des agrégats désynchronisés"""
+        BookRating.objects.create(book=self.book, user=self.users[0], score=3)
+        Book.objects.filter(pk=self.book.pk).update(rating_sum=0, rating_count=0, rating_average=0)
+        
+        updated = Book.rebuild_rating_aggregates()
+        
+        self.book.refresh_from_db()
+        self.assertEqual(updated, 1)
+        self.assertEqual(self.book.rating_count, 1)
+        self.assertEqual(self.book.rating_average, 3.0)
+
+
+class BufferedCountersTest(APITestCase):
+    """Tests pour les compteurs de vues et téléchargements à écriture différée"""
+    
+    def setUp(self):
+        cache.clear()
+        book_counters.flush()
+        self.book = Book.objects.create(title="Compteurs", status="published")
+        self.other = Book.objects.create(title="Autre", status="published", view_count=10)
+    
+    def test_increments_are_buffered_until_flush(self):
+        """Les incréments ne touchent pas la base avant le vidage"""
+        for _ in range(3):
+            self.book.increment_view_count()
+        self.other.increment_download_count()
+        
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.view_count, 0)
+        self.assertEqual(book_counters.pending('book', [self.book.id], 'view_count'),
+                         {str(self.book.id): 3})
+        
+        stats = book_counters.flush()
+        self.assertEqual(stats, {'book.view_count': 1, 'book.download_count': 1})
+        
+        self.book.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.book.view_count, 3)
+        self.assertEqual(self.other.view_count, 10)
+        self.assertEqual(self.other.download_count, 1)
+        self.assertEqual(book_counters.pending('book', [self.book.id], 'view_count'), {})
+    
+    def test_flush_uses_one_update_per_field(self):
+        """Un seul UPDATE groupé par champ, quel que soit le nombre de livres"""
+        book_counters.incr('book', self.book.id, 'view_count', 2)
+        book_counters.incr('book', self.other.id, 'view_count', 5)
+        
+        # Dont la paire SAVEPOINT / RELEASE de la transaction du vidage
+        with self.assertNumQueries(3):
+            book_counters.flush()
+        
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.view_count, 15)
+    
+    def test_failed_batch_rolls_back_the_whole_flush(self):
+        """Un lot en échec annule les lots précédents : rien n'est compté deux fois"""
+        book_counters.incr('book', self.book.id, 'view_count', 2)
+        book_counters.incr('book', self.other.id, 'view_count', 5)
+        update = QuerySet.update
+        calls = []
+        
+        def fail_second_batch(queryset, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise DatabaseError('indisponible')
+            return update(queryset, **kwargs)
+        
+        with mock.patch('coko.counters.COUNTER_FLUSH_BATCH_SIZE', 1), \
+                mock.patch.object(QuerySet, 'update', autospec=True, side_effect=fail_second_batch):
+            self.assertEqual(book_counters.flush(), {})
+        
+        book_counters.flush()
+        self.book.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.book.view_count, self.other.view_count), (2, 15))
+    
+    def test_unknown_counter_is_rejected(self):
+        """Seuls les champs déclarés peuvent être incrémentés"""
+        with self.assertRaises(ValueError):
+            book_counters.incr('book', self.book.id, 'title')
+    
+    def test_detail_view_reads_its_own_writes(self):
+        """Le détail d'un livre inclut les vues en attente, une seule fois par IP"""
+        url = reverse('catalog:book-detail', kwargs={'slug': self.book.slug})
+        
+        self.client.get(url)
+        response = self.client.get(url)
+        
+        self.assertEqual(response.data['view_count'], 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.view_count, 0)
+
+
+class BookFileDownloadTest(APITestCase):
+    """Tests pour la livraison des fichiers de livres (reprise, ETag, délégation)"""
+    
+    def setUp(self):
+        cache.clear()
+        book_counters.flush()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage'
+        )
+        self.settings_override.enable()
+        
+        self.content = bytes(range(256)) * 40
+        self.book = Book.objects.create(title="Livre PDF", status="published", is_free=True)
+        self.book_file = BookFile.objects.create(
+            book=self.book,
+            format='pdf',
+            file=SimpleUploadedFile('livre.pdf', self.content, content_type='application/pdf')
+        )
+        self.url = reverse('catalog:book-download', kwargs={'slug': self.book.slug, 'file_format': 'pdf'})
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+    
+    def _pending_downloads(self):
+        return book_counters.pending('book', [self.book.id], 'download_count').get(str(self.book.id), 0)
+    
+    def test_full_download_has_strong_etag(self):
+        """Le fichier entier est servi avec un ETag tiré du SHA-256"""
+        response = self.client.get(self.url)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.content).hexdigest()}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(self._pending_downloads(), 1)
+    
+    def test_range_resume(self):
+        """Une reprise reçoit la plage demandée et ne compte pas un nouveau téléchargement"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-1999')
+        
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[1000:2000])
+        self.assertEqual(self._pending_downloads(), 0)
+        
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-24')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-24:])
+    
+    def test_if_range_mismatch_sends_whole_file(self):
+        """Un ETag périmé dans If-Range renvoie le fichier complet"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-', HTTP_IF_RANGE='"perime"')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+    
+    def test_conditional_and_unsatisfiable_requests(self):
+        """If-None-Match donne 304, une plage hors fichier 416"""
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.book_file.etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+    
+    def test_offload_to_front_proxy(self):
+        """Avec nginx, Django ne renvoie qu'un X-Accel-Redirect"""
+        with mock.patch('catalog_service.delivery.FILE_OFFLOAD_HEADER', 'X-Accel-Redirect'):
+            response = self.client.get(self.url)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/media/{self.book_file.file.name}')
+        self.assertEqual(response.content, b'')
+    
+    def test_non_free_book_requires_authentication(self):
+        """Les livres payants ne sont pas servis aux anonymes"""
+        Book.objects.filter(id=self.book.id).update(is_free=False)
+        
+        response = self.client.get(self.url)
+        
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
 class BookAPITest(APITestCase):
     """Tests pour l'API des livres"""
     
@@ -292,6 +672,21 @@ class BookAPITest(APITestCase):
         self.assertEqual(len(response.data['results']), 1)
         self.assertEqual(response.data['results'][0]['title'], "Test Book")
     
+    def test_book_list_accepts_average_rating_ordering(self):
+        """L'ancien nom de tri `average_rating` trie sur la note stockée"""
+        better = Book.objects.create(title="Meilleur livre", status="published")
+        Book.objects.filter(pk=better.pk).update(rating_average=4.5)
+        Book.objects.filter(pk=self.book.pk).update(rating_average=2.0)
+        
+        url = reverse('catalog:book-list')
+        response = self.client.get(url, {'ordering': 'average_rating'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['title'] for result in response.data['results']],
+            ["Test Book", "Meilleur livre"]
+        )
+    
     def test_book_detail_api(self):
         """Test de l'API de détail d'un livre"""
         url = reverse('catalog:book-detail', kwargs={'slug': self.book.slug})
@@ -514,6 +909,73 @@ class BookStatsAPITest(APITestCase):
         self.assertEqual(response.data['free_books'], 3)
 
 
+class BookBatchAPITest(APITestCase):
+    """Tests pour la lecture groupée de livres par UUID"""
+    
+    def setUp(self):
+        cache.clear()
+        book_counters.flush()
+        self.url = reverse('catalog:book-batch')
+        self.author = Author.objects.create(first_name="Victor", last_name="Hugo")
+        self.category = Category.objects.create(name="Roman")
+        self.books = []
+        for i in range(3):
+            book = Book.objects.create(title=f"Livre {i}", status="published", page_count=100 + i)
+            book.authors.add(self.author)
+            book.categories.add(self.category)
+            self.books.append(book)
+        self.draft = Book.objects.create(title="Brouillon", status="draft")
+    
+    def test_default_projection(self):
+        """Projection compacte par défaut, livres non publiés ou inconnus signalés"""
+        unknown = str(uuid.uuid4())
+        payload = {'book_uuids': [str(book.id) for book in self.books] + [str(self.draft.id), unknown]}
+        
+        response = self.client.post(self.url, payload, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['books']), 3)
+        self.assertEqual(response.data['missing'], [str(self.draft.id), unknown])
+        data = response.data['books'][str(self.books[1].id)]
+        self.assertEqual(data['title'], "Livre 1")
+        self.assertEqual(data['page_count'], 101)
+        self.assertEqual(data['authors'], [{'id': str(self.author.id), 'name': "Victor Hugo"}])
+        self.assertEqual(data['categories'][0]['slug'], self.category.slug)
+        self.assertNotIn('description', data)
+    
+    def test_selected_fields_in_one_query(self):
+        """Seuls les champs demandés sont renvoyés, en une requête sans relation multiple"""
+        payload = {'book_uuids': [str(book.id) for book in self.books], 'fields': ['title', 'view_count']}
+        book_counters.incr('book', self.books[0].id, 'view_count', 4)
+        
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, payload, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data['books'][str(self.books[0].id)],
+            {'title': "Livre 0", 'view_count': 4}
+        )
+    
+    def test_relations_are_prefetched(self):
+        """Auteurs et catégories chargés en une requête chacun, quel que soit le nombre de livres"""
+        payload = {'book_uuids': [str(book.id) for book in self.books], 'fields': ['id', 'authors', 'categories']}
+        
+        with self.assertNumQueries(3):
+            self.client.post(self.url, payload, format='json')
+    
+    def test_invalid_requests(self):
+        """Liste vide, lot trop grand ou champ inconnu refusés"""
+        too_many = [str(uuid.uuid4()) for _ in range(301)]
+        for payload in (
+            {'book_uuids': []},
+            {'book_uuids': too_many},
+            {'book_uuids': [str(self.books[0].id)], 'fields': ['description']},
+        ):
+            response = self.client.post(self.url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class HealthCheckAPITest(APITestCase):
     """Tests pour l'API de vérification de santé"""
     
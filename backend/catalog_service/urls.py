@@ -1,41 +1,50 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from coko.cache_tags import CATALOG_TAG
+from coko.response_cache import cache_response
 from . import views
 
 app_name = 'catalog'
 
+# Référentiels du catalogue : identiques pour tous les lecteurs, purgés par les signaux
+catalog_cache = cache_response(
+    timeout=600, tags=[CATALOG_TAG], scope='public', vary=('Accept', 'Accept-Language')
+)
+
 # URLs pour les livres
 book_patterns = [
     path('', views.BookListCreateView.as_view(), name='book-list'),
     path('search/', views.BookSearchView.as_view(), name='book-search'),
     path('stats/', views.book_stats, name='book-stats'),
+    path('batch/', views.books_batch, name='book-batch'),
     path('<slug:slug>/', views.BookDetailView.as_view(), name='book-detail'),
+    path('<slug:slug>/download/<str:file_format>/', views.BookFileDownloadView.as_view(), name='book-download'),
     path('<slug:book_slug>/ratings/', views.BookRatingListCreateView.as_view(), name='book-rating-list'),
     path('<slug:book_slug>/ratings/<int:pk>/', views.BookRatingDetailView.as_view(), name='book-rating-detail'),
 ]
 
 # URLs pour les auteurs
 author_patterns = [
-    path('', views.AuthorListCreateView.as_view(), name='author-list'),
-    path('<slug:slug>/', views.AuthorDetailView.as_view(), name='author-detail'),
+    path('', catalog_cache(views.AuthorListCreateView.as_view()), name='author-list'),
+    path('<slug:slug>/', catalog_cache(views.AuthorDetailView.as_view()), name='author-detail'),
 ]
 
 # URLs pour les éditeurs
 publisher_patterns = [
-    path('', views.PublisherListCreateView.as_view(), name='publisher-list'),
-    path('<slug:slug>/', views.PublisherDetailView.as_view(), name='publisher-detail'),
+    path('', catalog_cache(views.PublisherListCreateView.as_view()), name='publisher-list'),
+    path('<slug:slug>/', catalog_cache(views.PublisherDetailView.as_view()), name='publisher-detail'),
 ]
 
 # URLs pour les catégories
 category_patterns = [
-    path('', views.CategoryListCreateView.as_view(), name='category-list'),
-    path('<slug:slug>/', views.CategoryDetailView.as_view(), name='category-detail'),
+    path('', catalog_cache(views.CategoryListCreateView.as_view()), name='category-list'),
+    path('<slug:slug>/', catalog_cache(views.CategoryDetailView.as_view()), name='category-detail'),
 ]
 
 # URLs pour les séries
 series_patterns = [
-    path('', views.SeriesListCreateView.as_view(), name='series-list'),
-    path('<slug:slug>/', views.SeriesDetailView.as_view(), name='series-detail'),
+    path('', catalog_cache(views.SeriesListCreateView.as_view()), name='series-list'),
+    path('<slug:slug>/', catalog_cache(views.SeriesDetailView.as_view()), name='series-detail'),
 ]
 
 # URLs pour les collections
@@ -68,6 +77,9 @@ urlpatterns = [
     # Collections
     path('collections/', include(collection_patterns)),
     
+    # Suggestions de saisie
+    path('suggest/', views.suggest, name='suggest'),
+    
     # Santé du service
     path('health/', views.health_check, name='health-check'),
 ]
\ No newline at end of file
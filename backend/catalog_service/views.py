@@ -4,13 +4,18 @@ from django.utils import timezone
 from django.core.cache import cache
 from django.http import Http404
 from rest_framework import generics, status, filters
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.views import APIView
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.exceptions import NotAcceptable, NotAuthenticated, PermissionDenied
 from django_filters.rest_framework import DjangoFilterBackend
 import logging
 
+from coko.cache_tags import tagged_cache, CATALOG_TAG
+from coko.counters import book_counters
 from .models import (
     Book, Author, Publisher, Category, Series, BookFile, 
     BookRating, BookTag, BookTagAssignment, BookCollection
@@ -19,10 +24,15 @@ from .serializers import (
     BookListSerializer, BookDetailSerializer, BookCreateUpdateSerializer,
     AuthorSerializer, PublisherSerializer, CategorySerializer, SeriesSerializer,
     BookFileSerializer, BookRatingSerializer, BookTagSerializer,
-    BookCollectionSerializer, BookSearchSerializer, BookStatsSerializer
+    BookCollectionSerializer, BookSearchSerializer, BookStatsSerializer,
+    BookBatchRequestSerializer
 )
-from .filters import BookFilter
+from .filters import BookFilter, BookOrderingFilter
 from .permissions import IsOwnerOrReadOnly, IsAdminOrReadOnly
+from .batch import fetch_books_batch
+from .delivery import serve_book_file
+from .search import relevance_ordering, search_index
+from .suggest import suggestion_service, SUGGEST_MAX_RESULTS
 
 logger = logging.getLogger(__name__)
 
@@ -34,27 +44,33 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
-class BookListCreateView(generics.ListCreateAPIView):
+class PendingCountersMixin:
+    """Ajoute aux livres paginés les vues et téléchargements pas encore écrits en base"""
+    
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            book_counters.apply_pending('book', page)
+        return page
+
+
+class BookListCreateView(PendingCountersMixin, generics.ListCreateAPIView):
     """Vue pour lister et créer des livres"""
     
     permission_classes = [IsAuthenticatedOrReadOnly]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # Le paramètre `search` est traité par BookFilter via l'index plein texte
+    filter_backends = [DjangoFilterBackend, BookOrderingFilter]
     filterset_class = BookFilter
-    search_fields = ['title', 'subtitle', 'description', 'authors__first_name', 'authors__last_name']
-    ordering_fields = ['title', 'publication_date', 'created_at', 'view_count', 'average_rating']
+    ordering_fields = ['title', 'publication_date', 'created_at', 'view_count', 'rating_average']
     ordering = ['-created_at']
     
     def get_queryset(self):
-        """Retourne la queryset optimisée"""
+        """Retourne la queryset optimisée (notes lues depuis les agrégats stockés)"""
         return Book.objects.select_related(
             'publisher', 'series'
         ).prefetch_related(
-            'authors', 'categories', 'book_files',
-            Prefetch('ratings', queryset=BookRating.objects.select_related('user'))
-        ).annotate(
-            average_rating=Avg('ratings__score'),
-            ratings_count=Count('ratings')
+            'authors', 'categories', 'book_files'
         ).filter(status='published')
     
     def get_serializer_class(self):
@@ -83,9 +99,6 @@ class BookDetailView(generics.RetrieveUpdateDestroyAPIView):
             'authors', 'categories', 'book_files',
             Prefetch('ratings', queryset=BookRating.objects.select_related('user')),
             Prefetch('tag_assignments', queryset=BookTagAssignment.objects.select_related('tag'))
-        ).annotate(
-            average_rating=Avg('ratings__score'),
-            ratings_count=Count('ratings')
         )
     
     def get_serializer_class(self):
@@ -98,11 +111,11 @@ class BookDetailView(generics.RetrieveUpdateDestroyAPIView):
         """Récupère un livre et incrémente le compteur de vues"""
         instance = self.get_object()
         
-        # Incrémenter le compteur de vues (avec cache pour éviter les requêtes multiples)
+        # Incrémenter le compteur de vues une fois par IP (écriture différée)
         cache_key = f"book_view_{instance.id}_{request.META.get('REMOTE_ADDR', 'unknown')}"
-        if not cache.get(cache_key):
-            Book.objects.filter(id=instance.id).update(view_count=F('view_count') + 1)
-            cache.set(cache_key, True, 300)  # 5 minutes
+        if cache.add(cache_key, True, 300):  # 5 minutes
+            book_counters.incr('book', instance.id, 'view_count')
+        book_counters.apply_pending('book', [instance])
         
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
@@ -119,7 +132,7 @@ class BookDetailView(generics.RetrieveUpdateDestroyAPIView):
         logger.info(f"Livre supprimé: {title} par {self.request.user}")
 
 
-class BookSearchView(generics.ListAPIView):
+class BookSearchView(PendingCountersMixin, generics.ListAPIView):
     """Vue pour la recherche avancée de livres"""
     
     serializer_class = BookListSerializer
@@ -134,23 +147,15 @@ class BookSearchView(generics.ListAPIView):
             'publisher', 'series'
         ).prefetch_related(
             'authors', 'categories'
-        ).annotate(
-            average_rating=Avg('ratings__score'),
-            ratings_count=Count('ratings')
         ).filter(status='published')
         
         # Filtres de recherche
         filters = serializer.validated_data
         
+        ranked_ids = None
         if filters.get('q'):
-            query = filters['q']
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(subtitle__icontains=query) |
-                Q(description__icontains=query) |
-                Q(authors__first_name__icontains=query) |
-                Q(authors__last_name__icontains=query)
-            ).distinct()
+            ranked_ids = search_index.search(filters['q'])
+            queryset = queryset.filter(id__in=ranked_ids)
         
         if filters.get('category'):
             queryset = queryset.filter(categories=filters['category'])
@@ -174,18 +179,24 @@ class BookSearchView(generics.ListAPIView):
             queryset = queryset.filter(is_featured=filters['is_featured'])
         
         if filters.get('min_rating'):
-            queryset = queryset.filter(average_rating__gte=filters['min_rating'])
+            queryset = queryset.filter(rating_average__gte=filters['min_rating'])
         
         if filters.get('tags'):
             for tag in filters['tags']:
                 queryset = queryset.filter(tag_assignments__tag__name__icontains=tag)
         
-        # Tri
-        ordering = filters.get('ordering', '-created_at')
-        if ordering == 'average_rating':
-            queryset = queryset.order_by(F('average_rating').desc(nulls_last=True))
-        elif ordering == '-average_rating':
-            queryset = queryset.order_by(F('average_rating').asc(nulls_last=True))
+        # Tri (par pertinence par défaut lorsqu'un terme est recherché)
+        ordering = filters.get('ordering')
+        if not ordering:
+            ordering = 'relevance' if ranked_ids is not None else '-created_at'
+        
+        if ordering == 'relevance':
+            if ranked_ids:
+                queryset = queryset.order_by(relevance_ordering(ranked_ids))
+            else:
+                queryset = queryset.order_by('-created_at')
+        elif ordering in ('average_rating', '-average_rating'):
+            queryset = queryset.order_by(ordering.replace('average_rating', 'rating_average'))
         else:
             queryset = queryset.order_by(ordering)
         
@@ -431,11 +442,104 @@ def remove_book_from_collection(request, collection_slug, book_slug):
     )
 
 
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def suggest(request):
+    """
+    Suggestions de saisie (titres, auteurs, séries) servies depuis la mémoire.
+    
+    Réponse compacte : `s` est une liste de [libellé, type, slug] où le type
+    vaut `b` (livre), `a` (auteur) ou `s` (série).
+    """
+    query = request.query_params.get('q', '')[:100]
+    try:
+        limit = max(int(request.query_params.get('limit', SUGGEST_MAX_RESULTS)), 1)
+    except ValueError:
+        limit = SUGGEST_MAX_RESULTS
+    
+    suggestions = suggestion_service.suggest(query, limit)
+    
+    response = Response({'q': query, 's': [list(suggestion) for suggestion in suggestions]})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def books_batch(request):
+    """
+    Lecture groupée de livres par UUID pour les autres services.
+    
+    Corps : `{"book_uuids": [...], "fields": [...]}` (`fields` facultatif).
+    Réponse : `{"books": {uuid: {...}}, "missing": [...]}`. Seuls les livres
+    publiés sont renvoyés, sauf pour le personnel.
+    """
+    serializer = BookBatchRequestSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    book_uuids = [str(book_uuid) for book_uuid in serializer.validated_data['book_uuids']]
+    
+    books = fetch_books_batch(
+        book_uuids,
+        serializer.validated_data.get('fields'),
+        published_only=not request.user.is_staff
+    )
+    
+    return Response({
+        'books': books,
+        'missing': [book_uuid for book_uuid in book_uuids if book_uuid not in books]
+    })
+
+
+class FileContentNegotiation(DefaultContentNegotiation):
+    """Ne pas refuser (406) les clients qui n'acceptent que le type du fichier"""
+    
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+class BookFileDownloadView(APIView):
+    """
+    Téléchargement d'un fichier de livre, avec reprise (Range / If-Range)
+    
+    Les livres gratuits sont accessibles sans compte, les autres demandent
+    une authentification et les livres premium un abonnement actif.
+    """
+    
+    permission_classes = [AllowAny]
+    content_negotiation_class = FileContentNegotiation
+    
+    def get(self, request, slug, file_format):
+        book_file = get_object_or_404(
+            BookFile.objects.select_related('book'),
+            book__slug=slug,
+            book__status='published',
+            format=file_format,
+            is_active=True
+        )
+        book = book_file.book
+        
+        if not book.is_free and not request.user.is_authenticated:
+            raise NotAuthenticated()
+        if book.is_premium_only and not getattr(request.user, 'is_premium', False):
+            raise PermissionDenied("Ce livre est réservé aux abonnés premium.")
+        
+        try:
+            book_file.ensure_checksum()
+            return serve_book_file(request, book_file)
+        except FileNotFoundError:
+            logger.error(f"Fichier introuvable pour {book_file}: {book_file.file.name}")
+            raise Http404("Fichier introuvable")
+
+
 @api_view(['GET'])
 def book_stats(request):
     """Retourne les statistiques des livres"""
     cache_key = 'book_stats'
-    stats = cache.get(cache_key)
+    stats = tagged_cache.get(cache_key, [CATALOG_TAG])
     
     if not stats:
         # Calculer les statistiques
@@ -474,9 +578,7 @@ def book_stats(request):
         # Livres les mieux notés
         top_rated_books = Book.objects.filter(
             status='published'
-        ).annotate(
-            avg_rating=Avg('ratings__score')
-        ).order_by('-avg_rating')[:5]
+        ).order_by('-rating_average')[:5]
         
         stats = {
             'total_books': total_books,
@@ -496,7 +598,7 @@ def book_stats(request):
         }
         
         # Mettre en cache pour 1 heure
-        cache.set(cache_key, stats, 3600)
+        tagged_cache.set(cache_key, stats, 3600, [CATALOG_TAG])
     
     serializer = BookStatsSerializer(stats)
     return Response(serializer.data)
@@ -1,6 +1,7 @@
 # Système de géolocalisation et adaptation pour l'Afrique
 # Implémente les recommandations pour la détection régionale et l'adaptation du contenu
 
+import ipaddress
 import json
 import requests
 from django.core.cache import cache
@@ -9,6 +10,8 @@ from django.utils import timezone
 import logging
 from typing import Dict, Optional, Tuple
 
+from .geoip import geoip_database
+
 logger = logging.getLogger(__name__)
 
 class AfricanGeoLocation:
@@ -151,41 +154,65 @@ class AfricanGeoLocation:
     def __init__(self):
         self.cache_timeout = getattr(settings, 'GEO_CACHE_TIMEOUT', 3600)  # 1 heure
         self.ipinfo_token = getattr(settings, 'IPINFO_TOKEN', None)
+        # Services distants : enrichissement en tâche de fond, jamais sur le chemin de la requête
+        self.remote_enrichment = getattr(settings, 'GEOIP_REMOTE_ENRICHMENT', True)
     
     def get_location_from_ip(self, ip_address: str) -> Optional[Dict]:
         """
         Obtient la localisation depuis une adresse IP
+        
+        La base locale (projetée en mémoire) répond sans appel réseau ; une
+        adresse inconnue reçoit la localisation par défaut et, si activé,
+        un enrichissement distant est planifié pour les requêtes suivantes.
         """
         if not ip_address or ip_address in ['127.0.0.1', 'localhost']:
             return self._get_default_location()
         
-        # Vérifier le cache
+        if self._is_private_ip(ip_address):
+            return self._enrich_african_data(self._get_default_location())
+        
+        # 1. Base locale
+        location = geoip_database.lookup(ip_address)
+        if location:
+            if location['country_code'] in self.AFRICAN_COUNTRIES:
+                location['country_name'] = self.AFRICAN_COUNTRIES[location['country_code']]['name']
+            return self._enrich_african_data(location)
+        
+        # 2. Résultat d'un enrichissement distant précédent
         cache_key = f"geo_location_{ip_address}"
         cached_location = cache.get(cache_key)
         if cached_location:
             return cached_location
         
-        # Essayer différents services de géolocalisation
-        location = None
-        
-        # 1. Essayer ip-api.com (gratuit, fiable)
+        # 3. Localisation par défaut en attendant l'enrichissement
+        self._schedule_remote_enrichment(ip_address)
+        return self._enrich_african_data(self._get_default_location())
+    
+    def _schedule_remote_enrichment(self, ip_address: str):
+        """Planifie au plus un enrichissement distant par adresse et par période de cache"""
+        if not self.remote_enrichment:
+            return
+        if not cache.add(f"geo_enrichment_{ip_address}", True, self.cache_timeout):
+            return
+        try:
+            from shared_models.tasks import enrich_ip_location
+            enrich_ip_location.delay(ip_address)
+        except Exception as e:
+            logger.warning(f"Enrichissement de la géolocalisation non planifié pour {ip_address}: {e}")
+    
+    def fetch_remote_location(self, ip_address: str) -> Optional[Dict]:
+        """
+        Interroge les services distants (ip-api.com puis ipinfo.io) et met
+        le résultat en cache ; appelé uniquement depuis une tâche Celery
+        """
         location = self._get_location_ipapi(ip_address)
-        
-        # 2. Fallback vers ipinfo.io si configuré
         if not location and self.ipinfo_token:
             location = self._get_location_ipinfo(ip_address)
-        
-        # 3. Fallback vers une localisation par défaut
         if not location:
-            location = self._get_default_location()
-        
-        # Enrichir avec les données africaines
-        if location:
-            location = self._enrich_african_data(location)
-            
-            # Mettre en cache
-            cache.set(cache_key, location, self.cache_timeout)
+            return None
         
+        location = self._enrich_african_data(location)
+        cache.set(f"geo_location_{ip_address}", location, self.cache_timeout)
         return location
     
     def _get_location_ipapi(self, ip_address: str) -> Optional[Dict]:
@@ -345,13 +372,23 @@ class AfricanGeoLocation:
     
     def _is_valid_ip(self, ip: str) -> bool:
         """
-        Valide une adresse IP
+        Valide une adresse IP (IPv4 ou IPv6)
+        """
+        try:
+            ipaddress.ip_address(ip)
+            return True
+        except (ValueError, TypeError):
+            return False
+    
+    def _is_private_ip(self, ip: str) -> bool:
+        """
+        Adresse privée, locale ou réservée (jamais géolocalisable)
         """
         try:
-            parts = ip.split('.')
-            return len(parts) == 4 and all(0 <= int(part) <= 255 for part in parts)
-        except (ValueError, AttributeError):
+            address = ipaddress.ip_address(ip)
+        except (ValueError, TypeError):
             return False
+        return address.is_private or address.is_loopback or address.is_reserved
     
     def get_network_recommendations(self, location: Dict) -> Dict:
         """
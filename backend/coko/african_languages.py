@@ -2,17 +2,53 @@
 # Implémente les recommandations pour le support multilingue
 
 import json
+import hashlib
+import os
+from functools import lru_cache
+from types import MappingProxyType
 from django.conf import settings
 from django.utils import translation
 from django.utils.translation import gettext as _
 from django.http import JsonResponse
 from django.core.cache import cache
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_LANGUAGE = 'fr'
+ACCEPT_LANGUAGE_CACHE_SIZE = 1024
+LANGUAGE_RESOLUTION_CACHE_SIZE = 4096
+# Fichiers CSS par langue, relatifs à STATIC_ROOT/STATIC_URL
+LANGUAGE_CSS_DIRECTORY = 'css/languages'
+
+
+def _freeze(value: Any) -> Any:
+    """Copie en lecture seule (dictionnaires et listes imbriqués)"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@lru_cache(maxsize=ACCEPT_LANGUAGE_CACHE_SIZE)
+def parse_accept_language(accept_language: str) -> Tuple[str, ...]:
+    """
+    Codes de langue (2 lettres) d'un en-tête Accept-Language, dans l'ordre
+    et sans doublon ; les navigateurs envoient peu de valeurs distinctes
+    """
+    languages = []
+    if accept_language:
+        for lang in accept_language.split(','):
+            lang_code = lang.split(';')[0].strip().lower()
+            # Prendre seulement les 2 premiers caractères
+            lang_code = lang_code[:2]
+            if lang_code not in languages:
+                languages.append(lang_code)
+    return tuple(languages)
+
 class AfricanLanguageManager:
     """
     Gestionnaire des langues africaines avec support RTL et localisation
@@ -61,71 +97,104 @@ class AfricanLanguageManager:
             'ethiopic': '"Noto Sans Ethiopic", "Abyssinica SIL", system-ui, sans-serif',
             'default': 'system-ui, -apple-system, sans-serif'
         }
+        
+        self.compile_locales()
     
-    def get_user_language_preferences(self, request) -> Dict:
+    def compile_locales(self):
         """
-        Détermine les préférences linguistiques de l'utilisateur
+        Précalculer les tables de résolution en lecture seule : configuration
+        et données de localisation de chaque langue, langue principale de
+        chaque pays, CSS par langue et son empreinte
+        """
+        country_languages: Dict[str, List[str]] = {}
+        for lang_code, lang_info in self.african_languages.items():
+            for country_code in lang_info.get('countries', []):
+                country_languages.setdefault(country_code, []).append(lang_code)
+        
+        self.country_languages = _freeze(country_languages)
+        # Langue la plus parlée de chaque pays
+        self.country_primary_language = MappingProxyType({
+            country_code: max(languages, key=lambda x: self.african_languages[x]['speakers'])
+            for country_code, languages in country_languages.items()
+        })
+        
+        self.language_css = MappingProxyType({
+            lang_code: self._render_language_css(lang_code) for lang_code in self.african_languages
+        })
+        self.language_css_fingerprints = MappingProxyType({
+            lang_code: hashlib.blake2b(css.encode('utf-8'), digest_size=6).hexdigest()
+            for lang_code, css in self.language_css.items()
+        })
+        
+        self.language_configs = _freeze({
+            lang_code: {**self._build_language_config(lang_code), 'css_url': self.get_language_css_url(lang_code)}
+            for lang_code in self.african_languages
+        })
+        self.localizations = _freeze({
+            lang_code: self._build_localization_data(lang_code) for lang_code in self.african_languages
+        })
+        
+        self._resolve_cached = lru_cache(maxsize=LANGUAGE_RESOLUTION_CACHE_SIZE)(self._resolve)
+    
+    def resolve_language(self, request) -> str:
+        """
+        Code de la langue de l'utilisateur : choix explicite, sinon langue
+        principale du pays, sinon Accept-Language, sinon le français
         """
         from .african_geolocation import get_user_location
         
         # Langue explicitement choisie
-        chosen_lang = request.session.get('language')
-        if chosen_lang and chosen_lang in self.african_languages:
-            return self._get_language_config(chosen_lang)
+        session = getattr(request, 'session', None)
+        chosen_lang = session.get('language') if session is not None else None
+        if chosen_lang and chosen_lang in self.language_configs:
+            return chosen_lang
         
-        # Langue basée sur la géolocalisation
+        # Langue basée sur la géolocalisation puis sur Accept-Language
         location = get_user_location(request)
-        country_code = location.get('country_code')
-        
-        if country_code:
-            # Trouver les langues parlées dans ce pays
-            country_languages = self._get_country_languages(country_code)
-            if country_languages:
-                # Prendre la langue la plus parlée
-                primary_lang = max(country_languages, key=lambda x: self.african_languages[x]['speakers'])
-                return self._get_language_config(primary_lang)
-        
-        # Langue basée sur Accept-Language
-        accept_language = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
-        browser_langs = self._parse_accept_language(accept_language)
+        return self._resolve_cached(
+            location.get('country_code') or '', request.META.get('HTTP_ACCEPT_LANGUAGE', '')
+        )
+    
+    def _resolve(self, country_code: str, accept_language: str) -> str:
+        primary_lang = self.country_primary_language.get(country_code)
+        if primary_lang:
+            return primary_lang
         
-        for lang_code in browser_langs:
-            if lang_code in self.african_languages:
-                return self._get_language_config(lang_code)
+        for lang_code in parse_accept_language(accept_language):
+            if lang_code in self.language_configs:
+                return lang_code
         
         # Fallback vers le français (langue la plus parlée en Afrique)
-        return self._get_language_config('fr')
+        return DEFAULT_LANGUAGE
+    
+    def get_user_language_preferences(self, request) -> Dict:
+        """
+        Détermine les préférences linguistiques de l'utilisateur
+        """
+        return self._get_language_config(self.resolve_language(request))
     
     def _get_country_languages(self, country_code: str) -> List[str]:
         """
         Retourne les langues parlées dans un pays
         """
-        languages = []
-        for lang_code, lang_info in self.african_languages.items():
-            if country_code in lang_info.get('countries', []):
-                languages.append(lang_code)
-        return languages
+        return list(self.country_languages.get(country_code, ()))
     
     def _parse_accept_language(self, accept_language: str) -> List[str]:
         """
         Parse l'en-tête Accept-Language
         """
-        languages = []
-        if accept_language:
-            for lang in accept_language.split(','):
-                lang_code = lang.split(';')[0].strip().lower()
-                # Prendre seulement les 2 premiers caractères
-                lang_code = lang_code[:2]
-                if lang_code not in languages:
-                    languages.append(lang_code)
-        return languages
+        return list(parse_accept_language(accept_language))
     
     def _get_language_config(self, lang_code: str) -> Dict:
         """
-        Retourne la configuration complète d'une langue
+        Retourne la configuration complète d'une langue (copie modifiable)
         """
+        config = self.language_configs.get(lang_code) or self.language_configs[DEFAULT_LANGUAGE]
+        return {key: list(value) if isinstance(value, tuple) else value for key, value in config.items()}
+    
+    def _build_language_config(self, lang_code: str) -> Dict:
         if lang_code not in self.african_languages:
-            lang_code = 'fr'  # Fallback
+            lang_code = DEFAULT_LANGUAGE  # Fallback
         
         lang_info = self.african_languages[lang_code]
         
@@ -165,10 +234,44 @@ class AfricanLanguageManager:
         return languages
     
     def get_language_css(self, lang_code: str) -> str:
+        """
+        CSS spécifique à une langue (précalculé pour les langues supportées)
+        """
+        css = self.language_css.get(lang_code)
+        return css if css is not None else self._render_language_css(lang_code)
+    
+    def get_language_css_filename(self, lang_code: str) -> Optional[str]:
+        """Nom du fichier CSS à empreinte d'une langue, relatif à STATIC_ROOT"""
+        fingerprint = self.language_css_fingerprints.get(lang_code)
+        if fingerprint is None:
+            return None
+        return f"{LANGUAGE_CSS_DIRECTORY}/{lang_code}.{fingerprint}.css"
+    
+    def get_language_css_url(self, lang_code: str) -> Optional[str]:
+        """URL du CSS à empreinte (`build_language_css`), cachable indéfiniment"""
+        filename = self.get_language_css_filename(lang_code)
+        if filename is None:
+            return None
+        return f"{settings.STATIC_URL.rstrip('/')}/{filename}"
+    
+    def write_language_css(self, root: str) -> List[str]:
+        """Écrire le CSS à empreinte de chaque langue sous `root` ; renvoie les chemins écrits"""
+        written = []
+        for lang_code, css in self.language_css.items():
+            path = os.path.join(root, self.get_language_css_filename(lang_code))
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as handle:
+                handle.write(css)
+            written.append(path)
+        return written
+    
+    def _render_language_css(self, lang_code: str) -> str:
         """
         Génère le CSS spécifique à une langue
         """
-        config = self._get_language_config(lang_code)
+        config = self._build_language_config(lang_code)
         
         css = f"""
         /* CSS pour la langue {config['name']} ({lang_code}) */
@@ -266,11 +369,17 @@ class AfricanLanguageManager:
         # Pour l'instant, retourner le contenu original
         return content
     
-    def get_localization_data(self, lang_code: str) -> Dict:
+    def get_localization_data(self, lang_code: str) -> Mapping:
         """
-        Retourne les données de localisation pour une langue
+        Retourne les données de localisation pour une langue (lecture seule)
         """
-        config = self._get_language_config(lang_code)
+        localization = self.localizations.get(lang_code)
+        if localization is not None:
+            return localization
+        return _freeze(self._build_localization_data(lang_code))
+    
+    def _build_localization_data(self, lang_code: str) -> Dict:
+        config = self._build_language_config(lang_code)
         
         # Formats de date et nombre selon la région
         localization = {
@@ -358,9 +467,9 @@ class AfricanLanguageMiddleware:
         self.get_response = get_response
     
     def __call__(self, request):
-        # Détecter et configurer la langue
-        lang_prefs = language_manager.get_user_language_preferences(request)
-        lang_code = lang_prefs['code']
+        # Détecter et configurer la langue (tables précalculées, en lecture seule)
+        lang_code = language_manager.resolve_language(request)
+        lang_prefs = language_manager.language_configs[lang_code]
         
         # Activer la langue dans Django
         translation.activate(lang_code)
@@ -422,11 +531,20 @@ def language_css_view(request, lang_code):
     """
     Vue pour servir le CSS spécifique à une langue
     """
-    from django.http import HttpResponse
+    from django.http import HttpResponse, HttpResponseNotModified
     
     css_content = language_manager.get_language_css(lang_code)
+    fingerprint = language_manager.language_css_fingerprints.get(lang_code)
+    etag = f'"{fingerprint}"' if fingerprint else None
+    
+    if etag and request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(css_content, content_type='text/css')
     
-    response = HttpResponse(css_content, content_type='text/css')
+    if etag:
+        response['ETag'] = etag
+    # Préférer l'URL à empreinte (`css_url`), cachable indéfiniment
     response['Cache-Control'] = 'public, max-age=86400'  # Cache 24h
     
     return response
@@ -9,6 +9,8 @@ from django.conf import settings
 from django.core.cache import cache
 import logging
 
+from .request_metrics import request_metrics, record_request
+
 logger = logging.getLogger(__name__)
 
 class AfricanNetworkOptimizationMiddleware(MiddlewareMixin):
@@ -119,41 +121,24 @@ class AfricanPerformanceMonitoringMiddleware(MiddlewareMixin):
             response['X-Response-Time'] = f"{response_time:.2f}ms"
             
             # Métriques pour monitoring
-            self.record_african_metrics(request, response_time)
+            self.record_african_metrics(request, response_time, response)
         
         return response
     
-    def record_african_metrics(self, request, response_time):
+    def record_african_metrics(self, request, response_time, response=None):
         """
         Enregistre les métriques spécifiques à l'Afrique
+        
+        Aucun aller-retour vers le cache : l'échantillon rejoint le tampon du
+        processus, vidé périodiquement par pipeline Redis.
         """
         try:
-            # Utiliser le cache pour stocker les métriques temporairement
-            cache_key = f"african_metrics_{int(time.time() // 60)}"  # Par minute
-            metrics = cache.get(cache_key, {
-                'total_requests': 0,
-                'slow_requests': 0,
-                'avg_response_time': 0,
-                'network_quality_stats': {}
-            })
-            
-            metrics['total_requests'] += 1
-            if response_time > 500:
-                metrics['slow_requests'] += 1
-            
-            # Moyenne mobile du temps de réponse
-            current_avg = metrics['avg_response_time']
-            total = metrics['total_requests']
-            metrics['avg_response_time'] = ((current_avg * (total - 1)) + response_time) / total
-            
-            # Stats par qualité réseau
-            network_quality = getattr(request, 'network_quality', 'unknown')
-            if network_quality not in metrics['network_quality_stats']:
-                metrics['network_quality_stats'][network_quality] = 0
-            metrics['network_quality_stats'][network_quality] += 1
-            
-            cache.set(cache_key, metrics, 300)  # 5 minutes
-            
+            size, status_code = 0, 200
+            if response is not None:
+                status_code = response.status_code
+                if not getattr(response, 'streaming', False):
+                    size = len(response.content)
+            record_request(request, response_time, size, status_code)
         except Exception as e:
             logger.error(f"Error recording African metrics: {e}")
 
@@ -266,15 +251,21 @@ def get_african_metrics():
     """
     Récupère les métriques de performance africaines
     """
-    current_minute = int(time.time() // 60)
     metrics = {}
     
     # Récupérer les métriques des 10 dernières minutes
-    for i in range(10):
-        cache_key = f"african_metrics_{current_minute - i}"
-        minute_metrics = cache.get(cache_key)
-        if minute_metrics:
-            metrics[f"minute_{i}"] = minute_metrics
+    for i, (_, fields) in enumerate(request_metrics.minutes(10)):
+        if not fields.get('requests'):
+            continue
+        metrics[f"minute_{i}"] = {
+            'total_requests': fields['requests'],
+            'slow_requests': fields.get('slow', 0),
+            'avg_response_time': fields.get('time_us', 0) / 1000 / fields['requests'],
+            'network_quality_stats': {
+                field.split(':', 1)[1]: count
+                for field, count in fields.items() if field.startswith('network:')
+            }
+        }
     
     return metrics
 
@@ -297,6 +288,7 @@ def african_metrics_view(request):
         'total_requests_10min': total_requests,
         'slow_requests_10min': total_slow,
         'slow_percentage': (total_slow / total_requests * 100) if total_requests > 0 else 0,
+        'latency_percentiles': request_metrics.summary(10)['latency']['all'],
         'target_response_time_ms': 500,
         'african_optimizations_active': True,
         'detailed_metrics': metrics
@@ -13,6 +13,7 @@ from django.db import connection
 import logging
 from typing import Dict, List, Optional
 from .african_geolocation import get_user_location, is_african_user
+from .request_metrics import record_request, request_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -24,172 +25,56 @@ class AfricanMetricsCollector:
     def __init__(self):
         self.cache_prefix = 'african_metrics'
         self.retention_minutes = 60  # Garder 1 heure de métriques
+        self.african_target_ms = 500  # Objectif p95 pour l'Afrique
     
-    def record_request_metrics(self, request, response_time_ms: float, response_size_bytes: int = 0):
+    def record_request_metrics(self, request, response_time_ms: float, response_size_bytes: int = 0,
+                               status_code: Optional[int] = None):
         """
         Enregistre les métriques d'une requête
+        
+        L'échantillon rejoint le tampon du processus ; il est ajouté aux
+        compteurs partagés lors du prochain vidage (voir `coko.request_metrics`).
         """
         try:
-            location = get_user_location(request)
-            
-            # Métriques de base
-            metrics = {
-                'timestamp': time.time(),
-                'response_time_ms': response_time_ms,
-                'response_size_bytes': response_size_bytes,
-                'path': request.path,
-                'method': request.method,
-                'status_code': getattr(request, '_response_status', 200),
-                'user_agent': request.META.get('HTTP_USER_AGENT', '')[:200],
-                'is_african': location.get('is_african', False),
-                'country_code': location.get('country_code'),
-                'african_region': location.get('african_region'),
-                'network_quality': location.get('network_quality'),
-                'cdn_edge': location.get('cdn_edge')
-            }
-            
-            # Détection de la qualité réseau depuis les headers
-            connection_type = request.META.get('HTTP_CONNECTION_TYPE', '')
-            downlink = request.META.get('HTTP_DOWNLINK', '')
-            
-            if connection_type:
-                metrics['browser_connection_type'] = connection_type
-            if downlink:
-                try:
-                    metrics['browser_downlink_mbps'] = float(downlink)
-                except ValueError:
-                    pass
-            
-            # Stocker dans le cache avec clé temporelle
-            minute_key = int(time.time() // 60)
-            cache_key = f"{self.cache_prefix}_requests_{minute_key}"
-            
-            # Récupérer les métriques existantes pour cette minute
-            minute_metrics = cache.get(cache_key, [])
-            minute_metrics.append(metrics)
-            
-            # Limiter à 1000 requêtes par minute pour éviter la surcharge
-            if len(minute_metrics) > 1000:
-                minute_metrics = minute_metrics[-1000:]
-            
-            cache.set(cache_key, minute_metrics, 3600)  # 1 heure
-            
-            # Métriques agrégées par minute
-            self._update_aggregated_metrics(metrics, minute_key)
-            
+            if status_code is None:
+                status_code = getattr(request, '_response_status', 200)
+            record_request(request, response_time_ms, response_size_bytes, status_code)
         except Exception as e:
             logger.error(f"Error recording African metrics: {e}")
     
-    def _update_aggregated_metrics(self, metrics: Dict, minute_key: int):
-        """
-        Met à jour les métriques agrégées par minute
-        """
-        agg_key = f"{self.cache_prefix}_agg_{minute_key}"
-        agg_metrics = cache.get(agg_key, {
-            'total_requests': 0,
-            'african_requests': 0,
-            'slow_requests': 0,
-            'total_response_time': 0,
-            'total_response_size': 0,
-            'by_country': {},
-            'by_network_quality': {},
-            'by_status_code': {},
-            'errors': 0
-        })
-        
-        # Mise à jour des compteurs
-        agg_metrics['total_requests'] += 1
-        agg_metrics['total_response_time'] += metrics['response_time_ms']
-        agg_metrics['total_response_size'] += metrics['response_size_bytes']
-        
-        if metrics['is_african']:
-            agg_metrics['african_requests'] += 1
-        
-        # Requêtes lentes (>500ms pour l'Afrique, >200ms pour le reste)
-        slow_threshold = 500 if metrics['is_african'] else 200
-        if metrics['response_time_ms'] > slow_threshold:
-            agg_metrics['slow_requests'] += 1
-        
-        # Par pays
-        country = metrics.get('country_code', 'unknown')
-        agg_metrics['by_country'][country] = agg_metrics['by_country'].get(country, 0) + 1
-        
-        # Par qualité réseau
-        network = metrics.get('network_quality', 'unknown')
-        agg_metrics['by_network_quality'][network] = agg_metrics['by_network_quality'].get(network, 0) + 1
-        
-        # Par code de statut
-        status = str(metrics['status_code'])
-        agg_metrics['by_status_code'][status] = agg_metrics['by_status_code'].get(status, 0) + 1
-        
-        if metrics['status_code'] >= 400:
-            agg_metrics['errors'] += 1
-        
-        cache.set(agg_key, agg_metrics, 3600)
-    
     def get_african_performance_summary(self, minutes: int = 10) -> Dict:
         """
         Retourne un résumé des performances africaines
         """
-        current_minute = int(time.time() // 60)
+        data = request_metrics.summary(minutes)
+        total_requests = data['total_requests']
+        african_requests = data['african_requests']
+        
         summary = {
             'period_minutes': minutes,
-            'total_requests': 0,
-            'african_requests': 0,
-            'avg_response_time_ms': 0,
-            'african_avg_response_time_ms': 0,
-            'slow_requests': 0,
-            'error_rate': 0,
-            'by_country': {},
-            'by_network_quality': {},
+            'total_requests': total_requests,
+            'african_requests': african_requests,
+            'avg_response_time_ms': data['total_response_time_ms'] / total_requests if total_requests else 0,
+            'african_avg_response_time_ms': (
+                data['african_response_time_ms'] / african_requests if african_requests else 0
+            ),
+            'slow_requests': data['slow_requests'],
+            'error_rate': (data['errors'] / total_requests) * 100 if total_requests else 0,
+            'by_country': data['by_country'],
+            'by_network_quality': data['by_network_quality'],
+            # Percentiles exacts à la précision de l'histogramme près
+            'latency_percentiles': data['latency']['all'],
+            'african_latency_percentiles': data['latency']['african'],
+            'latency_by_country': data['latency_by_country'],
+            'latency_by_network_quality': data['latency_by_network_quality'],
             'performance_targets_met': False,
             'recommendations': []
         }
         
-        total_response_time = 0
-        african_response_time = 0
-        african_count = 0
-        
-        # Agréger les données des X dernières minutes
-        for i in range(minutes):
-            minute_key = current_minute - i
-            agg_key = f"{self.cache_prefix}_agg_{minute_key}"
-            minute_data = cache.get(agg_key)
-            
-            if minute_data:
-                summary['total_requests'] += minute_data['total_requests']
-                summary['african_requests'] += minute_data['african_requests']
-                summary['slow_requests'] += minute_data['slow_requests']
-                summary['error_rate'] += minute_data['errors']
-                
-                total_response_time += minute_data['total_response_time']
-                
-                # Calculer le temps de réponse africain
-                # (approximation basée sur la proportion de requêtes africaines)
-                if minute_data['african_requests'] > 0:
-                    african_ratio = minute_data['african_requests'] / minute_data['total_requests']
-                    african_response_time += minute_data['total_response_time'] * african_ratio
-                    african_count += minute_data['african_requests']
-                
-                # Agréger par pays
-                for country, count in minute_data['by_country'].items():
-                    summary['by_country'][country] = summary['by_country'].get(country, 0) + count
-                
-                # Agréger par qualité réseau
-                for network, count in minute_data['by_network_quality'].items():
-                    summary['by_network_quality'][network] = summary['by_network_quality'].get(network, 0) + count
-        
-        # Calculer les moyennes
-        if summary['total_requests'] > 0:
-            summary['avg_response_time_ms'] = total_response_time / summary['total_requests']
-            summary['error_rate'] = (summary['error_rate'] / summary['total_requests']) * 100
-        
-        if african_count > 0:
-            summary['african_avg_response_time_ms'] = african_response_time / african_count
-        
-        # Vérifier les objectifs de performance
-        african_target = 500  # 500ms pour l'Afrique
-        summary['performance_targets_met'] = summary['african_avg_response_time_ms'] <= african_target
+        # Vérifier les objectifs de performance (p95 africain)
+        summary['performance_targets_met'] = (
+            summary['african_latency_percentiles']['p95'] <= self.african_target_ms
+        )
         
         # Générer des recommandations
         summary['recommendations'] = self._generate_recommendations(summary)
@@ -206,6 +91,9 @@ class AfricanMetricsCollector:
         if summary['african_avg_response_time_ms'] > 500:
             recommendations.append("Temps de réponse africain trop élevé. Considérer l'optimisation du cache ou CDN.")
         
+        if summary['african_latency_percentiles']['p99'] > 2000:
+            recommendations.append("Latence extrême (p99 > 2s) pour une partie des utilisateurs africains.")
+        
         if summary['african_avg_response_time_ms'] > 1000:
             recommendations.append("Performance critique pour l'Afrique. Activer la compression agressive.")
         
@@ -234,16 +122,15 @@ class AfricanMetricsCollector:
         """
         Retourne les métriques en temps réel
         """
-        current_minute = int(time.time() // 60)
-        current_metrics = cache.get(f"{self.cache_prefix}_agg_{current_minute}", {})
+        _, current_metrics = request_metrics.minutes(1)[0]
         
         # Métriques système
         system_metrics = self._get_system_metrics()
         
         return {
             'timestamp': datetime.now().isoformat(),
-            'current_minute_requests': current_metrics.get('total_requests', 0),
-            'current_minute_african': current_metrics.get('african_requests', 0),
+            'current_minute_requests': current_metrics.get('requests', 0),
+            'current_minute_african': current_metrics.get('african', 0),
             'current_minute_errors': current_metrics.get('errors', 0),
             'system': system_metrics,
             'database': self._get_database_metrics()
@@ -285,18 +172,13 @@ class AfricanMetricsCollector:
     
     def cleanup_old_metrics(self):
         """
-        Nettoie les anciennes métriques
+        Nettoie les anciennes métriques (les hash Redis expirent d'eux-mêmes)
         """
         current_minute = int(time.time() // 60)
         cutoff_minute = current_minute - self.retention_minutes
         
-        # Supprimer les métriques détaillées anciennes
-        for i in range(10):  # Nettoyer les 10 dernières minutes expirées
-            old_key = f"{self.cache_prefix}_requests_{cutoff_minute - i}"
-            cache.delete(old_key)
-            
-            old_agg_key = f"{self.cache_prefix}_agg_{cutoff_minute - i}"
-            cache.delete(old_agg_key)
+        # Supprimer les 10 dernières minutes expirées
+        request_metrics.delete_minutes([cutoff_minute - i for i in range(10)])
 
 
 class AfricanPerformanceMonitor:
@@ -396,11 +278,12 @@ performance_monitor = AfricanPerformanceMonitor()
 
 
 # Fonctions utilitaires
-def record_request_metrics(request, response_time_ms: float, response_size_bytes: int = 0):
+def record_request_metrics(request, response_time_ms: float, response_size_bytes: int = 0,
+                           status_code: Optional[int] = None):
     """
     Fonction utilitaire pour enregistrer les métriques d'une requête
     """
-    metrics_collector.record_request_metrics(request, response_time_ms, response_size_bytes)
+    metrics_collector.record_request_metrics(request, response_time_ms, response_size_bytes, status_code)
 
 
 def get_african_performance_dashboard() -> Dict:
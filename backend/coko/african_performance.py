@@ -1,15 +1,13 @@
 # Système d'optimisation des performances pour l'Afrique
 # Implémente les recommandations pour la compression, mise en cache et CDN
 
-import gzip
-import brotli
 import json
 import hashlib
 from datetime import datetime, timedelta
 from django.core.cache import cache
 from django.conf import settings
-from django.http import HttpResponse, JsonResponse
-from django.utils.cache import get_cache_key
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_cache_key, patch_vary_headers
 from django.views.decorators.cache import cache_page
 from django.views.decorators.vary import vary_on_headers
 from django.middleware.gzip import GZipMiddleware
@@ -19,6 +17,11 @@ import logging
 import time
 import os
 
+from .compression import (
+    COMPRESSION_STREAM_THRESHOLD, STREAM_CHUNK_SIZE, compression_store, content_hash, negotiate_encoding
+)
+from .response_cache import response_cache
+
 logger = logging.getLogger(__name__)
 
 class AfricanPerformanceOptimizer:
@@ -97,9 +100,11 @@ class AfricanPerformanceOptimizer:
         else:
             return 'light'
     
-    def compress_content(self, content: bytes, content_type: str, strategy: str = 'balanced') -> Tuple[bytes, str]:
+    def compress_content(self, content: bytes, content_type: str, strategy: str = 'balanced',
+                         accept_encoding: str = 'br, gzip') -> Tuple[bytes, str]:
         """
-        Compresse le contenu selon la stratégie choisie
+        Compresse le contenu selon la stratégie choisie et les encodages
+        acceptés ; les variantes déjà calculées ou précompressées sont réutilisées
         """
         if content_type not in self.compressible_types:
             return content, 'identity'
@@ -109,24 +114,30 @@ class AfricanPerformanceOptimizer:
         if len(content) < config['min_size']:
             return content, 'identity'
         
-        # Essayer Brotli en premier (meilleure compression)
-        try:
-            compressed_brotli = brotli.compress(content, quality=config['brotli_level'])
-            if len(compressed_brotli) < len(content) * 0.9:  # Au moins 10% de gain
-                return compressed_brotli, 'br'
-        except Exception as e:
-            logger.warning(f"Brotli compression failed: {e}")
-        
-        # Fallback vers gzip
-        try:
-            compressed_gzip = gzip.compress(content, compresslevel=config['gzip_level'])
-            if len(compressed_gzip) < len(content) * 0.9:
-                return compressed_gzip, 'gzip'
-        except Exception as e:
-            logger.warning(f"Gzip compression failed: {e}")
+        digest = content_hash(content)
+        # Brotli en premier (meilleure compression), puis gzip
+        for encoding in ('br', 'gzip'):
+            if negotiate_encoding(accept_encoding, (encoding,)) is None:
+                continue
+            try:
+                compressed = compression_store.get_variant(
+                    content, encoding, self.get_compression_level(strategy, encoding), digest
+                )
+            except Exception as e:
+                logger.warning(f"{encoding} compression failed: {e}")
+                continue
+            if compressed is None:
+                # CPU sans marge : envoyer sans compression
+                break
+            if len(compressed) < len(content) * 0.9:  # Au moins 10% de gain
+                return compressed, encoding
         
         return content, 'identity'
     
+    def get_compression_level(self, strategy: str, encoding: str) -> int:
+        config = self.compression_levels[strategy]
+        return config['brotli_level'] if encoding == 'br' else config['gzip_level']
+    
     def get_cache_strategy(self, request, content_type: str) -> Dict:
         """
         Détermine la stratégie de cache selon le type de contenu
@@ -333,131 +344,95 @@ class AfricanCompressionMiddleware:
         
         # Vérifier si la compression est supportée
         accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
-        if not any(enc in accept_encoding for enc in ['gzip', 'br']):
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding is None:
+            return response
+        
+        # Réponses déjà compressées (cache de réponses)
+        if response.has_header('Content-Encoding'):
             return response
         
         # Vérifier le type de contenu
         content_type = response.get('Content-Type', '').split(';')[0]
+        if content_type not in performance_optimizer.compressible_types:
+            return response
         
-        if hasattr(response, 'content') and response.content:
-            # Déterminer la stratégie de compression
-            strategy = performance_optimizer.get_compression_strategy(request)
-            
-            # Compresser le contenu
-            compressed_content, encoding = performance_optimizer.compress_content(
-                response.content, content_type, strategy
+        # Déterminer la stratégie de compression
+        strategy = performance_optimizer.get_compression_strategy(request)
+        
+        if response.streaming:
+            return self.compress_streaming(response, encoding, strategy)
+        
+        if not response.content:
+            return response
+        
+        if len(response.content) >= COMPRESSION_STREAM_THRESHOLD:
+            # Grande réponse : compressée par morceaux au fil de l'envoi
+            content = response.content
+            streaming = StreamingHttpResponse(
+                (content[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(content), STREAM_CHUNK_SIZE)),
+                status=response.status_code
             )
-            
-            if encoding != 'identity':
-                response.content = compressed_content
-                response['Content-Encoding'] = encoding
-                response['Content-Length'] = str(len(compressed_content))
-                response['Vary'] = 'Accept-Encoding'
+            for header, value in response.items():
+                streaming[header] = value
+            streaming.cookies = response.cookies
+            return self.compress_streaming(streaming, encoding, strategy)
+        
+        # Compresser le contenu
+        compressed_content, encoding = performance_optimizer.compress_content(
+            response.content, content_type, strategy, accept_encoding
+        )
+        
+        if encoding != 'identity':
+            response.content = compressed_content
+            response['Content-Encoding'] = encoding
+            response['Content-Length'] = str(len(compressed_content))
+            patch_vary_headers(response, ['Accept-Encoding'])
+        
+        return response
+    
+    def compress_streaming(self, response, encoding: str, strategy: str):
+        """Compression incrémentale, sauf si le CPU manque de marge"""
+        if not compression_store.has_headroom():
+            return response
         
+        response.streaming_content = compression_store.stream(
+            response.streaming_content, encoding,
+            performance_optimizer.get_compression_level(strategy, encoding)
+        )
+        del response['Content-Length']
+        response['Content-Encoding'] = encoding
+        patch_vary_headers(response, ['Accept-Encoding'])
         return response
 
 
 class AfricanCacheMiddleware:
     """
-    Middleware de cache optimisé pour l'Afrique
+    Middleware de cache des réponses complètes
+
+    Seules les vues décorées par `coko.response_cache.cache_response` sont
+    mises en cache ; la politique (durée, portée, étiquettes) est portée par
+    la vue et appliquée dans `process_view`, quand l'utilisateur est connu.
+    `process_view` ne sert que les succès ; en cas d'échec la vue suit le
+    chemin normal et `process_response` stocke sa réponse.
     """
     
     def __init__(self, get_response):
         self.get_response = get_response
     
     def __call__(self, request):
-        # Vérifier le cache avant de traiter la requête
-        cache_key = self.get_cache_key(request)
-        cached_response = cache.get(cache_key)
-        
-        if cached_response and self.is_cache_valid(request, cached_response):
-            # Ajouter les en-têtes de cache hit
-            cached_response['X-Cache'] = 'HIT'
-            cached_response['X-Cache-Key'] = cache_key
-            return cached_response
-        
         response = self.get_response(request)
-        
-        # Mettre en cache la réponse si approprié
-        if self.should_cache_response(request, response):
-            cache_config = performance_optimizer.get_cache_strategy(
-                request, response.get('Content-Type', '')
-            )
-            
-            # Ajouter les en-têtes de cache
-            cache_headers = performance_optimizer.generate_cache_headers(cache_config)
-            for header, value in cache_headers.items():
-                response[header] = value
-            
-            # Mettre en cache
-            cache_timeout = cache_config.get('max_age', 3600)
-            cache.set(cache_key, response, cache_timeout)
-            
-            response['X-Cache'] = 'MISS'
-            response['X-Cache-Key'] = cache_key
-        
-        return response
-    
-    def get_cache_key(self, request) -> str:
-        """
-        Génère une clé de cache unique
-        """
-        key_parts = [
-            request.method,
-            request.get_full_path(),
-            request.META.get('HTTP_ACCEPT_LANGUAGE', ''),
-            request.META.get('HTTP_ACCEPT_ENCODING', '')
-        ]
-        
-        key_string = '|'.join(key_parts)
-        return hashlib.md5(key_string.encode()).hexdigest()
+        return self.process_response(request, response)
     
-    def is_cache_valid(self, request, cached_response) -> bool:
-        """
-        Vérifie si le cache est encore valide
-        """
-        # Vérifier l'ETag si présent
-        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
-        etag = cached_response.get('ETag')
-        
-        if if_none_match and etag and if_none_match == etag:
-            return True
-        
-        # Vérifier la date de modification
-        if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
-        last_modified = cached_response.get('Last-Modified')
-        
-        if if_modified_since and last_modified:
-            try:
-                from django.utils.http import parse_http_date
-                if_modified_timestamp = parse_http_date(if_modified_since)
-                last_modified_timestamp = parse_http_date(last_modified)
-                
-                if if_modified_timestamp >= last_modified_timestamp:
-                    return True
-            except ValueError:
-                pass
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        policy = getattr(view_func, 'response_cache_policy', None)
+        if policy is None:
+            return None
         
-        return True
+        return response_cache.lookup(request, policy, view_kwargs)
     
-    def should_cache_response(self, request, response) -> bool:
-        """
-        Détermine si la réponse doit être mise en cache
-        """
-        # Ne pas cacher les erreurs
-        if response.status_code >= 400:
-            return False
-        
-        # Ne pas cacher les requêtes POST/PUT/DELETE
-        if request.method not in ['GET', 'HEAD']:
-            return False
-        
-        # Ne pas cacher si explicitement désactivé
-        cache_control = response.get('Cache-Control', '')
-        if 'no-cache' in cache_control or 'no-store' in cache_control:
-            return False
-        
-        return True
+    def process_response(self, request, response):
+        return response_cache.store(request, response)
 
 
 class AfricanPerformanceMiddleware:
@@ -564,6 +539,8 @@ def cache_status_view(request):
     retrieved_value = cache.get(test_key)
     
     cache_stats['cache_working'] = retrieved_value == test_value
+    cache_stats['response_cache'] = response_cache.stats()
+    cache_stats['compression'] = compression_store.stats()
     
     return JsonResponse(cache_stats)
 
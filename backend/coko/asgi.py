@@ -16,6 +16,10 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coko.settings')
 
 django_asgi_app = get_asgi_application()
 
+# Index de suggestions chargé avant la première requête
+from catalog_service.suggest import warm_suggestions  # noqa: E402
+warm_suggestions()
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     # Add WebSocket routing here when needed
@@ -0,0 +1,172 @@
+"""
+Cache protégé contre les ruées (cache stampede)
+
+Les valeurs sont stockées dans une enveloppe qui porte deux échéances :
+
+- l'échéance douce (`soft_ttl`) après laquelle la valeur est périmée mais
+  encore servie pendant qu'un seul worker la recalcule en arrière-plan ;
+- l'échéance dure (`hard_ttl`), celle du backend de cache, au-delà de
+  laquelle la clé disparaît.
+
+Un seul calcul par clé est lancé à la fois (single-flight) : dans le
+processus grâce à des verrous répartis par clé, entre processus grâce à
+un bail posé avec `cache.add` (SET NX sous Redis). Le bail porte un jeton :
+il n'est supprimé que par son détenteur, jamais après avoir expiré et été
+repris par un autre worker. Les autres appelants servent la valeur
+périmée, ou attendent brièvement la valeur calculée lorsqu'il n'y en a
+aucune ; le verrou local n'est pas tenu pendant le calcul ni l'attente.
+
+L'expiration anticipée probabiliste (XFetch) étale les recalculs : plus
+l'échéance douce approche et plus le calcul a été long, plus un appel a de
+chances de déclencher le rafraîchissement avant qu'elle ne soit atteinte.
+"""
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+CACHE_STALE_FACTOR = getattr(settings, 'CACHE_STALE_FACTOR', 2)
+CACHE_LEASE_TIMEOUT = getattr(settings, 'CACHE_LEASE_TIMEOUT', 30)
+CACHE_LEASE_WAIT = getattr(settings, 'CACHE_LEASE_WAIT', 2.0)
+CACHE_XFETCH_BETA = getattr(settings, 'CACHE_XFETCH_BETA', 1.0)
+CACHE_BACKGROUND_REFRESH = getattr(settings, 'CACHE_BACKGROUND_REFRESH', True)
+LOCAL_LOCK_STRIPES = 64
+
+_ENVELOPE_MARKER = '__swr__'
+
+
+class CoalescingCache:
+    """Lecture `get_or_compute` avec single-flight, valeurs périmées et XFetch"""
+
+    def __init__(self, background_refresh: bool = CACHE_BACKGROUND_REFRESH,
+                 beta: float = CACHE_XFETCH_BETA):
+        self.background_refresh = background_refresh
+        self.beta = beta
+        self._local_locks = [threading.Lock() for _ in range(LOCAL_LOCK_STRIPES)]
+        self._executor_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def get_or_compute(self, key: str, fetch: Callable[[], Any], soft_ttl: int,
+                       hard_ttl: Optional[int] = None) -> Any:
+        """Valeur en cache, périmée ou recalculée, selon l'état de la clé"""
+        hard_ttl = hard_ttl or int(soft_ttl * CACHE_STALE_FACTOR)
+        envelope = self._read(key)
+
+        if envelope is not None:
+            if not self._should_refresh(envelope):
+                return envelope['value']
+            # Périmée (ou expiration anticipée) : un seul rafraîchissement
+            token = self._acquire_lease(key)
+            if token:
+                if self.background_refresh:
+                    self._get_executor().submit(self._refresh_in_background, key, fetch, soft_ttl, hard_ttl, token)
+                else:
+                    self._refresh(key, fetch, soft_ttl, hard_ttl, token)
+            return envelope['value']
+
+        # Absente : un seul calcul, les autres attendent son résultat.
+        # Le verrou local ne couvre que la relecture et la prise du bail.
+        with self._local_lock(key):
+            envelope = self._read(key)
+            token = self._acquire_lease(key) if envelope is None else None
+        if envelope is not None:
+            return envelope['value']
+        if token:
+            return self._refresh(key, fetch, soft_ttl, hard_ttl, token)
+        envelope = self._wait_for(key)
+        if envelope is not None:
+            return envelope['value']
+        logger.warning(f"Valeur toujours absente pour {key}, calcul sans coordination")
+        return self._store(key, fetch, soft_ttl, hard_ttl)
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        envelope = cache.get(key)
+        if isinstance(envelope, dict) and envelope.get(_ENVELOPE_MARKER):
+            return envelope
+        return None
+
+    def _should_refresh(self, envelope: Dict[str, Any]) -> bool:
+        """XFetch : now - delta * beta * ln(rand) >= échéance douce"""
+        jitter = -envelope.get('delta', 0) * self.beta * math.log(1 - random.random())
+        return time.time() + jitter >= envelope['soft_expires']
+
+    def _refresh(self, key: str, fetch, soft_ttl: int, hard_ttl: int, token: str) -> Any:
+        try:
+            return self._store(key, fetch, soft_ttl, hard_ttl)
+        finally:
+            self._release_lease(key, token)
+
+    def _refresh_in_background(self, key: str, fetch, soft_ttl: int, hard_ttl: int, token: str):
+        try:
+            self._refresh(key, fetch, soft_ttl, hard_ttl, token)
+        except Exception as e:
+            logger.error(f"Erreur lors du rafraîchissement du cache {key}: {str(e)}")
+        finally:
+            close_old_connections()
+
+    def _store(self, key: str, fetch, soft_ttl: int, hard_ttl: int) -> Any:
+        started = time.time()
+        value = fetch()
+        finished = time.time()
+        cache.set(key, {
+            _ENVELOPE_MARKER: True,
+            'value': value,
+            'soft_expires': finished + soft_ttl,
+            'delta': finished - started,
+        }, hard_ttl)
+        return value
+
+    def _wait_for(self, key: str) -> Optional[Dict[str, Any]]:
+        """Attendre la valeur calculée par le détenteur du bail"""
+        waited = 0.0
+        delay = 0.02
+        while waited < CACHE_LEASE_WAIT:
+            time.sleep(delay)
+            waited += delay
+            envelope = self._read(key)
+            if envelope is not None:
+                return envelope
+            if cache.get(self._lease_key(key)) is None:
+                # Bail libéré sans valeur (échec du calcul) : le reprendre
+                return None
+            delay = min(delay * 2, 0.2)
+        return None
+
+    def _acquire_lease(self, key: str) -> Optional[str]:
+        """Jeton du bail obtenu, ou None si un autre worker le détient"""
+        token = uuid.uuid4().hex
+        if cache.add(self._lease_key(key), token, CACHE_LEASE_TIMEOUT):
+            return token
+        return None
+
+    def _release_lease(self, key: str, token: str):
+        """Supprimer le bail seulement s'il porte encore notre jeton"""
+        lease_key = self._lease_key(key)
+        if cache.get(lease_key) == token:
+            cache.delete(lease_key)
+
+    def _lease_key(self, key: str) -> str:
+        return f"{key}:lease"
+
+    def _local_lock(self, key: str) -> threading.Lock:
+        return self._local_locks[hash(key) % LOCAL_LOCK_STRIPES]
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
+        return self._executor
+
+
+coalescing_cache = CoalescingCache()
@@ -0,0 +1,104 @@
+"""
+Invalidation du cache par étiquettes (tags)
+
+Chaque entrée est rattachée à des étiquettes (`user:42`, `book:<uuid>`,
+`category:<uuid>`…). Chaque étiquette possède un numéro de génération en
+cache, et la clé réellement utilisée contient les générations de ses
+étiquettes. Invalider une étiquette incrémente sa génération (une seule
+commande, sans SCAN ni KEYS) : toutes les entrées qui en dépendent
+deviennent introuvables et expirent d'elles-mêmes.
+
+Une génération évincée du cache est réinitialisée à partir de l'horloge
+(en nanosecondes), pour ne jamais retrouver une valeur déjà utilisée par
+d'anciennes entrées.
+"""
+import hashlib
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+TAG_KEY_PREFIX = 'cache_tag'
+MAX_VERSIONED_KEY_LENGTH = 200
+
+# Étiquettes globales
+CATALOG_TAG = 'catalog'
+RECOMMENDATIONS_TAG = 'recommendations'
+SIMILARITY_TAG = 'similarity'
+
+
+def user_tag(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def book_tag(book_id) -> str:
+    return f"book:{book_id}"
+
+
+def category_tag(category_id) -> str:
+    return f"category:{category_id}"
+
+
+class TaggedCache:
+    """Clés de cache versionnées par les générations de leurs étiquettes"""
+
+    def versioned_key(self, key: str, tags: Iterable[str]) -> str:
+        """Clé à utiliser pour `key` compte tenu des générations actuelles"""
+        tags = sorted(set(tags))
+        if not tags:
+            return key
+        generations = self._generations(tags)
+        suffix = '.'.join(str(generations[tag]) for tag in tags)
+        versioned = f"{key}@{suffix}"
+        if len(versioned) > MAX_VERSIONED_KEY_LENGTH:
+            versioned = f"{key}@{hashlib.md5(suffix.encode()).hexdigest()}"
+        return versioned
+
+    def get(self, key: str, tags: Iterable[str], default=None) -> Any:
+        return cache.get(self.versioned_key(key, tags), default)
+
+    def set(self, key: str, value: Any, timeout: Optional[int], tags: Iterable[str]):
+        cache.set(self.versioned_key(key, tags), value, timeout)
+
+    def get_or_set(self, key: str, fetch: Callable[[], Any], timeout: Optional[int],
+                   tags: Iterable[str]) -> Any:
+        versioned = self.versioned_key(key, tags)
+        value = cache.get(versioned)
+        if value is None:
+            value = fetch()
+            cache.set(versioned, value, timeout)
+        return value
+
+    def invalidate(self, *tags: str):
+        """Rendre introuvables toutes les entrées rattachées à ces étiquettes"""
+        for tag in set(tags):
+            tag_key = self._tag_key(tag)
+            try:
+                cache.incr(tag_key)
+            except ValueError:
+                # Génération absente : toute nouvelle valeur invalide les anciennes
+                cache.set(tag_key, self._seed(), None)
+
+    def _generations(self, tags) -> Dict[str, int]:
+        tag_keys = {tag: self._tag_key(tag) for tag in tags}
+        stored = cache.get_many(list(tag_keys.values()))
+        generations = {}
+        for tag, tag_key in tag_keys.items():
+            if tag_key not in stored:
+                cache.add(tag_key, self._seed(), None)
+                stored[tag_key] = cache.get(tag_key, 0)
+            generations[tag] = stored[tag_key]
+        return generations
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{TAG_KEY_PREFIX}:{tag}"
+
+    def _seed(self) -> int:
+        # Nanosecondes : aucune étiquette n'est invalidée plus d'une fois par ns
+        return time.time_ns()
+
+
+tagged_cache = TaggedCache()
@@ -2,6 +2,7 @@
 
 import os
 from celery import Celery
+from celery.schedules import crontab
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coko.settings')
@@ -31,6 +32,50 @@ app.conf.beat_schedule = {
         'task': 'auth_service.tasks.cleanup_expired_sessions',
         'schedule': 3600.0,  # Run hourly
     },
+    'flush-reading-progress': {
+        'task': 'reading_service.tasks.flush_reading_progress',
+        'schedule': 5.0,  # Apply queued page-turn events every 5 seconds
+    },
+    'flush-buffered-counters': {
+        'task': 'catalog_service.tasks.flush_buffered_counters',
+        'schedule': 10.0,  # Write buffered view/download counts every 10 seconds
+    },
+    'dispatch-event-outbox': {
+        'task': 'shared_models.tasks.dispatch_event_outbox',
+        'schedule': 2.0,  # Deliver outbox events in batches every 2 seconds
+    },
+    'process-service-syncs': {
+        'task': 'shared_models.tasks.process_service_syncs',
+        'schedule': 30.0,  # Apply pending reference syncs in bulk every 30 seconds
+    },
+    'purge-export-artifacts': {
+        'task': 'shared_models.tasks.purge_export_artifacts',
+        'schedule': 3600.0,  # Remove expired background export archives hourly
+    },
+    'refresh-analytics-rollups': {
+        'task': 'shared_models.tasks.refresh_analytics_rollups',
+        'schedule': 300.0,  # Advance dashboard rollups every 5 minutes
+    },
+    'refresh-materialized-recommendations': {
+        'task': 'recommendation_service.tasks.refresh_materialized_recommendations',
+        'schedule': crontab(minute='*/15'),  # Re-materialize stale recommendation lists every 15 minutes
+    },
+    'rebuild-rating-matrix': {
+        'task': 'recommendation_service.tasks.rebuild_rating_matrix_task',
+        'schedule': crontab(minute=15),  # Rebuild the sparse user x book rating matrix hourly
+    },
+    'rebuild-ann-index-daily': {
+        'task': 'recommendation_service.tasks.rebuild_ann_index',
+        'schedule': crontab(hour=0, minute=30),  # Rebuild the similar-books ANN index daily at 00:30
+    },
+}
+
+# Recommendation work runs on dedicated queues (see the worker command in docker-compose.yml)
+app.conf.task_routes = {
+    'recommendation_service.tasks.materialize_recommendations_batch': {'queue': 'recommendations'},
+    'recommendation_service.tasks.refresh_materialized_recommendations': {'queue': 'recommendations'},
+    'recommendation_service.tasks.rebuild_rating_matrix_task': {'queue': 'heavy_computation'},
+    'recommendation_service.tasks.rebuild_ann_index': {'queue': 'heavy_computation'},
 }
 
 app.conf.timezone = 'Africa/Dakar'
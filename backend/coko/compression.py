@@ -0,0 +1,359 @@
+"""
+Compression des réponses : variantes réutilisées et précompression
+
+Compresser le même corps JSON à chaque requête coûte du CPU pour un
+résultat identique. Les variantes compressées sont donc indexées par
+hachage du contenu × encodage × niveau :
+
+- un cache LRU par processus (borné en octets) garde les variantes
+  calculées à la volée ;
+- les corps qui reviennent souvent (listes du catalogue, `book_stats`,
+  tendances…) sont promus : une tâche Celery les recompresse hors requête
+  au niveau maximal (Brotli 11, gzip 9) et dépose l'artefact dans le cache
+  partagé, où tous les workers le retrouvent par hachage ;
+- `precompress_static` écrit les variantes `.br`/`.gz` des fichiers
+  statiques collectés, servies telles quelles par le serveur web.
+
+Les grandes réponses (et les réponses en flux) sont compressées par
+morceaux au fil de l'envoi. Quand la charge CPU dépasse
+`COMPRESSION_MAX_LOAD` par cœur, aucune nouvelle compression n'est
+calculée : seules les variantes déjà disponibles sont servies.
+
+Les compteurs (variantes réutilisées, compressions, octets et temps CPU
+économisés) sont cumulés par processus puis ajoutés au cache par `incr`.
+Le temps CPU économisé par une variante réutilisée est celui qu'aurait
+coûté la compression à la volée au niveau demandé (estimé d'après le débit
+mesuré à ce niveau), pas celui de l'artefact au niveau maximal.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_CACHE_MAX_BYTES = getattr(settings, 'COMPRESSION_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+COMPRESSION_ARTIFACT_TIMEOUT = getattr(settings, 'COMPRESSION_ARTIFACT_TIMEOUT', 86400)
+COMPRESSION_ARTIFACT_MAX_SIZE = getattr(settings, 'COMPRESSION_ARTIFACT_MAX_SIZE', 2 * 1024 * 1024)
+COMPRESSION_PROMOTE_AFTER = getattr(settings, 'COMPRESSION_PROMOTE_AFTER', 3)
+COMPRESSION_STREAM_THRESHOLD = getattr(settings, 'COMPRESSION_STREAM_THRESHOLD', 1024 * 1024)
+COMPRESSION_MAX_LOAD = getattr(settings, 'COMPRESSION_MAX_LOAD', 0.9)
+
+COMPRESSION_PREFIX = 'compression'
+# Durée de vie du corps source en attente de précompression
+COMPRESSION_SOURCE_TIMEOUT = 600
+COMPRESSION_STATS_FLUSH_INTERVAL = 5.0
+LOAD_SAMPLE_INTERVAL = 1.0
+STREAM_CHUNK_SIZE = 64 * 1024
+TRACKED_BODIES = 4096
+ARTIFACT_RECHECK_INTERVAL = 30.0
+
+# Niveau maximal de chaque encodage, utilisé pour la précompression
+MAX_LEVELS = {'br': 11, 'gzip': 9}
+FILE_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+STATIC_EXTENSIONS = ('.css', '.js', '.mjs', '.json', '.map', '.svg', '.html', '.txt', '.xml', '.webmanifest')
+STAT_NAMES = ('hits', 'misses', 'skipped', 'streamed', 'promoted', 'bytes_saved', 'cpu_us_saved', 'cpu_us_spent')
+
+# (corps compressé, secondes CPU qu'il a coûté)
+Variant = Tuple[bytes, float]
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def compress(content: bytes, encoding: str, level: int) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(content, quality=level)
+    return gzip.compress(content, compresslevel=level, mtime=0)
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str, level: int) -> Iterator[bytes]:
+    """Compresser un flux morceau par morceau (mémoire bornée)"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        write, finish = compressor.process, compressor.finish
+    else:
+        # wbits=31 : en-tête et somme de contrôle gzip
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        write, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = write(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def cpu_load() -> Optional[float]:
+    """Charge moyenne sur une minute, par cœur (None si indisponible)"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+class CompressionStore:
+    """Variantes compressées par hachage de contenu, encodage et niveau"""
+
+    def __init__(self, max_bytes: int = COMPRESSION_CACHE_MAX_BYTES, max_load: float = COMPRESSION_MAX_LOAD):
+        self.max_bytes = max_bytes
+        self.max_load = max_load
+        self._lock = threading.Lock()
+        self._variants: 'OrderedDict[Tuple[str, str, int], Variant]' = OrderedDict()
+        self._size = 0
+        self._sightings: 'OrderedDict[str, Tuple[int, float]]' = OrderedDict()
+        self._load = None
+        self._load_sampled = 0.0
+        self._stats = Counter()
+        self._stats_flushed = time.monotonic()
+        # Secondes CPU par octet source, mesurées par (encodage, niveau)
+        self._cpu_per_byte: Dict[Tuple[str, int], float] = {}
+
+    def has_headroom(self) -> bool:
+        """False quand le CPU est trop chargé pour compresser à la volée"""
+        now = time.monotonic()
+        if now - self._load_sampled >= LOAD_SAMPLE_INTERVAL:
+            self._load, self._load_sampled = cpu_load(), now
+        return self._load is None or self._load < self.max_load
+
+    def get_variant(self, content: bytes, encoding: str, level: int,
+                    digest: Optional[str] = None) -> Optional[bytes]:
+        """
+        Variante compressée de `content` : précompressée, en cache ou
+        calculée maintenant ; None si le CPU manque de marge
+        """
+        digest = digest or content_hash(content)
+        seen, check_artifact = self._track(digest)
+        if seen == COMPRESSION_PROMOTE_AFTER and len(content) <= COMPRESSION_ARTIFACT_MAX_SIZE:
+            self.schedule_precompression(digest, content)
+
+        found = self._lookup(digest, encoding, level, check_artifact)
+        if found is not None:
+            (body, cpu_seconds), found_level = found
+            if found_level != level:
+                # Artefact au niveau maximal : l'économie est la compression à la volée évitée
+                cpu_seconds = len(content) * self._cpu_per_byte.get((encoding, level), 0.0)
+            self._count('hits')
+            self._count('cpu_us_saved', int(cpu_seconds * 1_000_000))
+            self._count('bytes_saved', len(content) - len(body))
+            return body
+
+        if not self.has_headroom():
+            self._count('skipped')
+            return None
+
+        started = time.thread_time()
+        body = compress(content, encoding, level)
+        cpu_seconds = time.thread_time() - started
+        self._store_local((digest, encoding, level), (body, cpu_seconds))
+        if content:
+            with self._lock:
+                self._cpu_per_byte[(encoding, level)] = cpu_seconds / len(content)
+        self._count('misses')
+        self._count('cpu_us_spent', int(cpu_seconds * 1_000_000))
+        self._count('bytes_saved', len(content) - len(body))
+        return body
+
+    def stream(self, chunks: Iterable[bytes], encoding: str, level: int) -> Iterator[bytes]:
+        """Compression incrémentale d'un flux (sans mise en cache)"""
+        self._count('streamed')
+        return compress_stream(chunks, encoding, level)
+
+    def _lookup(self, digest: str, encoding: str, level: int,
+                check_artifact: bool) -> Optional[Tuple[Variant, int]]:
+        """Meilleure variante disponible et son niveau"""
+        max_level = MAX_LEVELS[encoding]
+        best = self._local((digest, encoding, max_level))
+        if best is not None:
+            return best, max_level
+        # Artefact précompressé : cherché seulement pour les corps promus
+        if check_artifact:
+            variant = cache.get(f"{COMPRESSION_PREFIX}:artifact:{digest}:{encoding}")
+            if variant is not None:
+                self._store_local((digest, encoding, max_level), variant)
+                return variant, max_level
+        variant = self._local((digest, encoding, level))
+        return (variant, level) if variant is not None else None
+
+    def _local(self, key: Tuple[str, str, int]) -> Optional[Variant]:
+        with self._lock:
+            variant = self._variants.get(key)
+            if variant is not None:
+                self._variants.move_to_end(key)
+            return variant
+
+    def _store_local(self, key: Tuple[str, str, int], variant: Variant):
+        size = len(variant[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._variants.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._variants[key] = variant
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._variants.popitem(last=False)
+                self._size -= len(evicted[0])
+
+    def _track(self, digest: str) -> Tuple[int, bool]:
+        """
+        Compter les occurrences d'un corps ; renvoie ce nombre et s'il faut
+        chercher son artefact partagé (corps promu, au plus une fois par
+        `ARTIFACT_RECHECK_INTERVAL`)
+        """
+        now = time.monotonic()
+        with self._lock:
+            seen, checked_at = self._sightings.pop(digest, (0, 0.0))
+            seen += 1
+            check = seen > COMPRESSION_PROMOTE_AFTER and now - checked_at >= ARTIFACT_RECHECK_INTERVAL
+            self._sightings[digest] = (seen, now if check else checked_at)
+            while len(self._sightings) > TRACKED_BODIES:
+                self._sightings.popitem(last=False)
+        return seen, check
+
+    def schedule_precompression(self, digest: str, content: bytes):
+        """
+        Planifier au plus une précompression par corps et par durée de vie d'artefact
+
+        Le marqueur vit aussi longtemps que le corps source ; `precompress`
+        le prolonge à la durée de vie de l'artefact une fois celui-ci publié.
+        """
+        if not cache.add(f"{COMPRESSION_PREFIX}:queued:{digest}", True, COMPRESSION_SOURCE_TIMEOUT):
+            return
+        cache.set(f"{COMPRESSION_PREFIX}:source:{digest}", content, COMPRESSION_SOURCE_TIMEOUT)
+        try:
+            from shared_models.tasks import precompress_response_body
+            precompress_response_body.delay(digest)
+            self._count('promoted')
+        except Exception as e:
+            cache.delete(f"{COMPRESSION_PREFIX}:queued:{digest}")
+            logger.warning(f"Précompression non planifiée pour {digest}: {e}")
+
+    def precompress(self, digest: str) -> Dict[str, int]:
+        """Compresser au niveau maximal un corps promu et publier ses artefacts"""
+        content = cache.get(f"{COMPRESSION_PREFIX}:source:{digest}")
+        if content is None:
+            # Source expirée avant la tâche : permettre une nouvelle planification
+            cache.delete(f"{COMPRESSION_PREFIX}:queued:{digest}")
+            return {}
+        sizes = {}
+        for encoding, level in MAX_LEVELS.items():
+            started = time.process_time()
+            body = compress(content, encoding, level)
+            cpu_seconds = time.process_time() - started
+            cache.set(
+                f"{COMPRESSION_PREFIX}:artifact:{digest}:{encoding}",
+                (body, cpu_seconds),
+                COMPRESSION_ARTIFACT_TIMEOUT
+            )
+            sizes[encoding] = len(body)
+        cache.set(f"{COMPRESSION_PREFIX}:queued:{digest}", True, COMPRESSION_ARTIFACT_TIMEOUT)
+        cache.delete(f"{COMPRESSION_PREFIX}:source:{digest}")
+        return sizes
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+        if time.monotonic() - self._stats_flushed >= COMPRESSION_STATS_FLUSH_INTERVAL:
+            self.flush_stats()
+
+    def flush_stats(self):
+        with self._lock:
+            pending, self._stats = self._stats, Counter()
+            self._stats_flushed = time.monotonic()
+        for name, amount in pending.items():
+            if not amount:
+                continue
+            key = f"{COMPRESSION_PREFIX}:stats:{name}"
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                if not cache.add(key, amount, None):
+                    cache.incr(key, amount)
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs cumulés de tous les processus"""
+        self.flush_stats()
+        keys = {name: f"{COMPRESSION_PREFIX}:stats:{name}" for name in STAT_NAMES}
+        stored = cache.get_many(list(keys.values()))
+        stats = {name: stored.get(key, 0) for name, key in keys.items()}
+        stats['cpu_seconds_saved'] = round(stats.pop('cpu_us_saved') / 1_000_000, 3)
+        stats['cpu_seconds_spent'] = round(stats.pop('cpu_us_spent') / 1_000_000, 3)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups * 100, 2) if lookups else 0.0
+        with self._lock:
+            stats['local_variants'] = len(self._variants)
+            stats['local_bytes'] = self._size
+        return stats
+
+
+def precompress_directory(root: str, force: bool = False) -> Dict[str, Any]:
+    """
+    Écrire à côté de chaque fichier statique compressible ses variantes
+    `.br` et `.gz` au niveau maximal ; les variantes à jour sont conservées
+    et celles qui ne gagnent pas 10 % sont supprimées
+    """
+    stats = Counter()
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if not filename.endswith(STATIC_EXTENSIONS):
+                continue
+            path = os.path.join(directory, filename)
+            source_mtime = os.stat(path).st_mtime_ns
+            content = None
+            for encoding, level in MAX_LEVELS.items():
+                target = path + FILE_SUFFIXES[encoding]
+                if not force and os.path.exists(target) and os.stat(target).st_mtime_ns >= source_mtime:
+                    stats['up_to_date'] += 1
+                    continue
+                if content is None:
+                    with open(path, 'rb') as handle:
+                        content = handle.read()
+                started = time.process_time()
+                body = compress(content, encoding, level)
+                stats['cpu_seconds'] += time.process_time() - started
+                if len(body) >= len(content) * 0.9:
+                    if os.path.exists(target):
+                        os.unlink(target)
+                    stats['not_worth_it'] += 1
+                    continue
+                descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.precompress-')
+                with os.fdopen(descriptor, 'wb') as output:
+                    output.write(body)
+                os.replace(temporary, target)
+                stats['written'] += 1
+                stats['bytes_saved'] += len(content) - len(body)
+    stats['cpu_seconds'] = round(stats['cpu_seconds'], 3)
+    return dict(stats)
+
+
+def negotiate_encoding(accept_encoding: str, available: Sequence[str] = ('br', 'gzip')) -> Optional[str]:
+    """Premier encodage de `available` accepté par le client (q > 0)"""
+    accepted = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in available:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+compression_store = CompressionStore()
@@ -0,0 +1,253 @@
+"""
+Compteurs à écriture différée (write-behind)
+
+Les incréments de compteurs très sollicités (vues, téléchargements) ne
+touchent plus la base à chaque requête : ils s'accumulent dans un hash
+Redis par cible et par champ, puis sont vidés périodiquement par une seule
+requête `UPDATE ... SET champ = champ + CASE ...` par lot de lignes.
+
+Sans Redis (développement, tests), un tampon en mémoire réparti en
+plusieurs segments verrouillés joue le même rôle et se vide de lui-même
+à intervalle régulier.
+
+Les lectures peuvent ajouter les incréments en attente à la valeur
+stockée (`pending`) pour offrir une lecture approximative de ses propres
+écritures.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+logger = logging.getLogger(__name__)
+
+COUNTER_KEY_PREFIX = 'buffered_counters'
+COUNTER_FLUSH_BATCH_SIZE = getattr(settings, 'BUFFERED_COUNTERS_FLUSH_BATCH_SIZE', 500)
+# Intervalle de vidage du tampon en mémoire (le mode Redis est vidé par Celery beat)
+COUNTER_LOCAL_FLUSH_INTERVAL = getattr(settings, 'BUFFERED_COUNTERS_LOCAL_FLUSH_INTERVAL', 5.0)
+LOCAL_SHARDS = 16
+
+
+@dataclass(frozen=True)
+class CounterTarget:
+    """Table cible d'un compteur"""
+    model: str
+    key_field: str
+    fields: Tuple[str, ...]
+
+    def get_model(self):
+        return apps.get_model(self.model)
+
+
+COUNTER_TARGETS = {
+    'book': CounterTarget('catalog_service.Book', 'id', ('view_count', 'download_count')),
+    'book_vector': CounterTarget(
+        'recommendation_service.BookVector', 'book_uuid', ('view_count', 'download_count')
+    ),
+}
+
+
+def _uses_redis() -> bool:
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    return backend.startswith('django_redis')
+
+
+class RedisCounterBuffer:
+    """Incréments en attente stockés dans des hash Redis (HINCRBY)"""
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+        from redis.exceptions import ResponseError
+        self.redis = get_redis_connection('default')
+        self.missing_key_error = ResponseError
+
+    def incr(self, key: str, member: str, amount: int):
+        self.redis.hincrby(key, member, amount)
+
+    def pending(self, key: str, members: List[str]) -> Dict[str, int]:
+        values = self.redis.hmget(key, members) if members else []
+        return {member: int(value) for member, value in zip(members, values) if value}
+
+    def drain(self, key: str) -> Dict[str, int]:
+        """Détacher le hash courant (RENAME atomique) et le lire"""
+        processing_key = f"{key}:flushing:{uuid.uuid4().hex}"
+        try:
+            self.redis.rename(key, processing_key)
+        except self.missing_key_error:
+            # Hash inexistant : rien à vider
+            return {}
+        values = self.redis.hgetall(processing_key)
+        self.redis.delete(processing_key)
+        return {member.decode(): int(value) for member, value in values.items()}
+
+    def restore(self, key: str, increments: Dict[str, int]):
+        pipeline = self.redis.pipeline()
+        for member, amount in increments.items():
+            pipeline.hincrby(key, member, amount)
+        pipeline.execute()
+
+    def should_flush(self) -> bool:
+        return False
+
+
+class LocalCounterBuffer:
+    """Tampon en mémoire, segmenté pour limiter la contention des verrous"""
+
+    def __init__(self, shards: int = LOCAL_SHARDS):
+        self.shards = [(threading.Lock(), {}) for _ in range(shards)]
+        self.last_flush = time.monotonic()
+
+    def _shard(self, member: str):
+        return self.shards[hash(member) % len(self.shards)]
+
+    def incr(self, key: str, member: str, amount: int):
+        lock, buckets = self._shard(member)
+        with lock:
+            bucket = buckets.setdefault(key, Counter())
+            bucket[member] += amount
+
+    def pending(self, key: str, members: List[str]) -> Dict[str, int]:
+        result = {}
+        for member in members:
+            lock, buckets = self._shard(member)
+            with lock:
+                value = buckets.get(key, {}).get(member)
+            if value:
+                result[member] = value
+        return result
+
+    def drain(self, key: str) -> Dict[str, int]:
+        drained = Counter()
+        for lock, buckets in self.shards:
+            with lock:
+                drained.update(buckets.pop(key, {}))
+        self.last_flush = time.monotonic()
+        return dict(drained)
+
+    def restore(self, key: str, increments: Dict[str, int]):
+        for member, amount in increments.items():
+            self.incr(key, member, amount)
+
+    def should_flush(self) -> bool:
+        return time.monotonic() - self.last_flush >= COUNTER_LOCAL_FLUSH_INTERVAL
+
+
+class BufferedCounters:
+    """Point d'entrée des compteurs à écriture différée"""
+
+    def __init__(self, targets: Dict[str, CounterTarget] = None):
+        self.targets = targets or COUNTER_TARGETS
+        self._buffer = None
+        self._flush_lock = threading.Lock()
+
+    @property
+    def buffer(self):
+        if self._buffer is None:
+            self._buffer = RedisCounterBuffer() if _uses_redis() else LocalCounterBuffer()
+        return self._buffer
+
+    def _key(self, target: str, field: str) -> str:
+        if field not in self.targets[target].fields:
+            raise ValueError(f"Compteur inconnu: {target}.{field}")
+        return f"{COUNTER_KEY_PREFIX}:{target}:{field}"
+
+    def incr(self, target: str, object_id, field: str, amount: int = 1):
+        """Enregistrer un incrément (aucune écriture en base)"""
+        try:
+            self.buffer.incr(self._key(target, field), str(object_id), amount)
+        except ValueError:
+            raise
+        except Exception as e:
+            # Repli : écriture directe si le tampon est indisponible
+            logger.error(f"Tampon de compteurs indisponible, écriture directe: {str(e)}")
+            self._apply(target, field, {str(object_id): amount})
+            return
+
+        if self.buffer.should_flush():
+            self.flush()
+
+    def pending(self, target: str, object_ids: Iterable, field: str) -> Dict[str, int]:
+        """Incréments pas encore écrits en base, par identifiant"""
+        try:
+            return self.buffer.pending(self._key(target, field), [str(pk) for pk in object_ids])
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.warning(f"Lecture des compteurs en attente impossible: {str(e)}")
+            return {}
+
+    def apply_pending(self, target: str, objects: Iterable, fields: Iterable[str] = None):
+        """Ajouter les incréments en attente aux instances chargées (lecture de ses écritures)"""
+        objects = list(objects)
+        if not objects:
+            return objects
+
+        counter_target = self.targets[target]
+        ids = [str(getattr(obj, counter_target.key_field)) for obj in objects]
+        for field in fields or counter_target.fields:
+            pending = self.pending(target, ids, field)
+            if not pending:
+                continue
+            for obj, object_id in zip(objects, ids):
+                if object_id in pending:
+                    setattr(obj, field, getattr(obj, field) + pending[object_id])
+        return objects
+
+    def flush(self) -> Dict[str, int]:
+        """Vider tous les compteurs en attente vers la base"""
+        stats = {}
+        if not self._flush_lock.acquire(blocking=False):
+            return stats
+        try:
+            for target, counter_target in self.targets.items():
+                for field in counter_target.fields:
+                    key = self._key(target, field)
+                    increments = self.buffer.drain(key)
+                    if not increments:
+                        continue
+                    try:
+                        self._apply(target, field, increments)
+                    except Exception as e:
+                        logger.error(f"Erreur lors du vidage de {target}.{field}: {str(e)}")
+                        self.buffer.restore(key, increments)
+                        continue
+                    stats[f"{target}.{field}"] = len(increments)
+        finally:
+            self._flush_lock.release()
+        return stats
+
+    def _apply(self, target: str, field: str, increments: Dict[str, int]):
+        """Un UPDATE par lot : champ = champ + CASE clé WHEN ... THEN n END"""
+        counter_target = self.targets[target]
+        model = counter_target.get_model()
+        key_field = model._meta.get_field(counter_target.key_field)
+        items = list(increments.items())
+
+        # Tous les lots ou aucun : `flush` remet l'ensemble des incréments en
+        # tampon après un échec, un lot déjà validé serait compté deux fois
+        with transaction.atomic(using=router.db_for_write(model)):
+            self._apply_batches(model, counter_target, field, key_field, items)
+
+    def _apply_batches(self, model, counter_target, field: str, key_field, items: List[Tuple[str, int]]):
+        for start in range(0, len(items), COUNTER_FLUSH_BATCH_SIZE):
+            batch = [(key_field.to_python(member), amount)
+                     for member, amount in items[start:start + COUNTER_FLUSH_BATCH_SIZE]]
+            delta = Case(
+                *[When(**{counter_target.key_field: pk}, then=Value(amount)) for pk, amount in batch],
+                default=Value(0),
+                output_field=IntegerField()
+            )
+            model.objects.filter(
+                **{f"{counter_target.key_field}__in": [pk for pk, _ in batch]}
+            ).update(**{field: F(field) + delta})
+
+
+book_counters = BufferedCounters()
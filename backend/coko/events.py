@@ -1,8 +1,15 @@
 """
 Système d'événements pour découpler les services
+
+Par défaut (`EVENT_BUS_ASYNC`), `publish` n'exécute aucun handler : il
+ajoute l'événement à la boîte d'envoi durable (`shared_models.event_outbox`),
+consommée par lots par un worker Celery. `dispatch` exécute les handlers
+immédiatement ; c'est ce qu'utilise le worker.
 """
 import logging
-from typing import Dict, Any, List, Callable
+import threading
+from typing import Dict, Any, List, Callable, Optional, Tuple
+from django.conf import settings
 from django.dispatch import Signal, receiver
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -12,6 +19,15 @@ from enum import Enum
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Attente maximale d'une place libre pour un handler à concurrence limitée
+EVENT_HANDLER_SLOT_TIMEOUT = getattr(settings, 'EVENT_HANDLER_SLOT_TIMEOUT', 30)
+
+DJANGO_SIGNAL_HANDLER = 'django_signals'
+
+
+class HandlerBusyError(Exception):
+    """Aucune place libre pour le handler : l'événement sera repris plus tard"""
+
 
 class EventType(Enum):
     """Types d'événements du système"""
@@ -75,40 +91,147 @@ class EventBus:
     
     _instance = None
     _handlers: Dict[EventType, List[Callable]] = {}
+    _limits: Dict[Callable, threading.BoundedSemaphore] = {}
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance._handlers = {}
+            cls._instance._limits = {}
         return cls._instance
     
-    def subscribe(self, event_type: EventType, handler: Callable):
-        """S'abonner à un type d'événement"""
+    def subscribe(self, event_type: EventType, handler: Callable, max_concurrency: Optional[int] = None):
+        """
+        S'abonner à un type d'événement
+        
+        `max_concurrency` borne le nombre d'exécutions simultanées du handler
+        dans un processus worker (appels vers un service lent, par exemple).
+        """
         if event_type not in self._handlers:
             self._handlers[event_type] = []
         self._handlers[event_type].append(handler)
+        if max_concurrency:
+            self._limits[handler] = threading.BoundedSemaphore(max_concurrency)
         logger.info(f"Handler enregistré pour l'événement {event_type.value}")
     
+    def unsubscribe(self, event_type: EventType, handler: Callable):
+        """Retirer un handler et sa limite de concurrence"""
+        handlers = self._handlers.get(event_type, [])
+        if handler in handlers:
+            handlers.remove(handler)
+        if not any(handler in registered for registered in self._handlers.values()):
+            self._limits.pop(handler, None)
+    
     def publish(self, event: Event):
-        """Publier un événement"""
+        """Publier un événement (ajout à la boîte d'envoi, sans attendre les handlers)"""
         try:
-            # Enregistrer l'événement (optionnel pour audit/debug)
             logger.info(f"Événement publié: {event.type.value} par {event.source_service}")
             
-            # Traiter avec les handlers enregistrés
-            if event.type in self._handlers:
-                for handler in self._handlers[event.type]:
-                    try:
-                        handler(event)
-                    except Exception as e:
-                        logger.error(f"Erreur dans le handler d'événement {event.type.value}: {str(e)}")
+            if not getattr(settings, 'EVENT_BUS_ASYNC', True):
+                self.dispatch(event)
+                return
             
-            # Publier via Django signals pour compatibilité
-            self._publish_django_signal(event)
+            from shared_models.event_outbox import append
+            append(
+                event_type=event.type.value,
+                source_service=event.source_service,
+                event_data=event.data,
+                aggregate_key=self.aggregate_key(event),
+                user_id=event.user_id,
+            )
             
         except Exception as e:
             logger.error(f"Erreur lors de la publication de l'événement: {str(e)}")
     
+    def dispatch(self, event: Event):
+        """
+        Exécuter immédiatement les handlers et les signaux Django d'un événement
+        
+        Un handler saturé n'est pas abandonné : l'événement est ajouté à la
+        boîte d'envoi pour ce seul handler.
+        """
+        handlers = self._handlers.get(event.type, [])
+        busy = []
+        for handler in handlers:
+            try:
+                self._call(handler, event)
+            except HandlerBusyError as e:
+                logger.warning(f"{str(e)} : événement {event.type.value} reporté dans la boîte d'envoi")
+                busy.append(handler)
+            except Exception as e:
+                logger.error(f"Erreur dans le handler d'événement {event.type.value}: {str(e)}")
+        
+        # Publier via Django signals pour compatibilité
+        self._publish_django_signal(event)
+        
+        if busy:
+            self._defer(event, done=[handler for handler in handlers if handler not in busy])
+    
+    def _defer(self, event: Event, done: List[Callable]):
+        """Confier à la boîte d'envoi les handlers qui n'ont pas pu s'exécuter"""
+        from shared_models.event_outbox import append
+        
+        now = timezone.now().isoformat()
+        names = [self._handler_name(handler) for handler in done] + [DJANGO_SIGNAL_HANDLER]
+        try:
+            append(
+                event_type=event.type.value,
+                source_service=event.source_service,
+                event_data=event.data,
+                aggregate_key=self.aggregate_key(event),
+                user_id=event.user_id,
+                processing_log=[{'handler': name, 'status': 'ok', 'at': now} for name in names],
+            )
+        except Exception as e:
+            logger.error(f"Impossible de reporter l'événement {event.type.value}: {str(e)}")
+    
+    def handlers_for(self, event_type: EventType) -> List[Tuple[str, Callable]]:
+        """
+        Handlers nommés prenant un `CrossServiceEvent` de la boîte d'envoi
+        
+        Les exceptions remontent : le worker les enregistre et reprogramme
+        l'événement. Les signaux Django forment un dernier handler.
+        """
+        handlers = [
+            (self._handler_name(handler), self._outbox_handler(handler))
+            for handler in self._handlers.get(event_type, [])
+        ]
+        handlers.append((DJANGO_SIGNAL_HANDLER, lambda record: self._publish_django_signal(self._from_record(record))))
+        return handlers
+    
+    def aggregate_key(self, event: Event) -> str:
+        """Clé d'ordre de livraison : les événements d'un utilisateur restent ordonnés"""
+        if event.user_id is not None:
+            return f"user:{event.user_id}"
+        book_id = (event.data or {}).get('book_id')
+        return f"book:{book_id}" if book_id else ''
+    
+    def _call(self, handler: Callable, event: Event):
+        limit = self._limits.get(handler)
+        if limit is None:
+            return handler(event)
+        if not limit.acquire(timeout=EVENT_HANDLER_SLOT_TIMEOUT):
+            raise HandlerBusyError(f"Handler {self._handler_name(handler)} saturé")
+        try:
+            return handler(event)
+        finally:
+            limit.release()
+    
+    def _outbox_handler(self, handler: Callable) -> Callable:
+        return lambda record: self._call(handler, self._from_record(record))
+    
+    def _from_record(self, record) -> Event:
+        return Event(
+            type=EventType(record.event_type),
+            data=record.event_data,
+            user_id=record.user_id,
+            timestamp=record.created_at,
+            source_service=record.source_service,
+        )
+    
+    def _handler_name(self, handler: Callable) -> str:
+        return f"{getattr(handler, '__module__', '')}.{getattr(handler, '__qualname__', repr(handler))}"
+    
     def _publish_django_signal(self, event: Event):
         """Publier l'événement via Django signals"""
         signal_mapping = {
@@ -0,0 +1,301 @@
+"""
+Base de géolocalisation IP locale, projetée en mémoire (mmap)
+
+Les plages d'adresses (IPv4 et IPv6) sont triées dans un fichier binaire
+compact, lu par recherche dichotomique directement dans la projection
+mémoire : aucune requête réseau sur le chemin des requêtes HTTP, et les
+pages du fichier sont partagées entre tous les workers d'une machine.
+
+Format du fichier :
+
+- en-tête `>8sIIII` : signature, nombre de plages IPv4, nombre de plages
+  IPv6, position et longueur de la table des lieux ;
+- plages IPv4 `>II2sI` : début, fin (inclus), code pays, indice du lieu ;
+- plages IPv6 `>16s16s2sI` : mêmes champs, adresses sur 16 octets
+  (l'ordre des octets big-endian est l'ordre des adresses) ;
+- table des lieux : liste JSON `[région, ville, latitude, longitude]`.
+
+`import_geoip` construit le fichier à partir d'un export CSV de plages
+(DB-IP, IP2Location, CIDR) ou d'une base MMDB ; le fichier est remplacé
+atomiquement et les workers le rechargent d'eux-mêmes (comparaison de
+`os.stat` au plus une fois par `GEOIP_RELOAD_INTERVAL` secondes).
+"""
+import csv
+import ipaddress
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+try:
+    import maxminddb
+except ImportError:  # Dépendance optionnelle : import des bases MMDB indisponible
+    maxminddb = None
+
+logger = logging.getLogger(__name__)
+
+GEOIP_DATABASE_PATH = getattr(
+    settings, 'GEOIP_DATABASE_PATH', os.path.join(settings.BASE_DIR, 'data', 'geoip.bin')
+)
+GEOIP_RELOAD_INTERVAL = getattr(settings, 'GEOIP_RELOAD_INTERVAL', 60)
+
+MAGIC = b'COKOGEO\x01'
+HEADER = struct.Struct('>8sIIII')
+IPV4_RECORD = struct.Struct('>II2sI')
+IPV6_RECORD = struct.Struct('>16s16s2sI')
+
+# Colonnes des exports CSV reconnus : indices de chaque champ
+CSV_LAYOUTS = {
+    # dbip-city-lite : ip_start, ip_end, continent, country, stateprov, city, latitude, longitude
+    'dbip': {'start': 0, 'end': 1, 'country': 3, 'region': 4, 'city': 5, 'latitude': 6, 'longitude': 7},
+    # dbip-country-lite : ip_start, ip_end, country
+    'dbip-country': {'start': 0, 'end': 1, 'country': 2},
+    # IP2Location DB5 : ip_from, ip_to, country_code, country_name, region, city, latitude, longitude
+    'ip2location': {'start': 0, 'end': 1, 'country': 2, 'region': 4, 'city': 5, 'latitude': 6, 'longitude': 7},
+    # Générique : réseau CIDR, pays, région, ville, latitude, longitude
+    'cidr': {'network': 0, 'country': 1, 'region': 2, 'city': 3, 'latitude': 4, 'longitude': 5},
+}
+
+# (début, fin, code pays, région, ville, latitude, longitude)
+IPRange = Tuple[Any, Any, str, str, str, Optional[float], Optional[float]]
+
+
+def _ip_address(value: str):
+    """Adresse IP depuis sa notation textuelle ou entière (IP2Location)"""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return ipaddress.IPv4Address(number) if number <= 0xFFFFFFFF else ipaddress.IPv6Address(number)
+    return ipaddress.ip_address(value)
+
+
+def _float(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class GeoIPDatabase:
+    """Un fichier de plages projeté en mémoire"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.ipv4_count, self.ipv6_count, locations_offset, locations_length = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"Fichier de géolocalisation invalide: {path}")
+        self._ipv4_offset = HEADER.size
+        self._ipv6_offset = self._ipv4_offset + self.ipv4_count * IPV4_RECORD.size
+        self._locations = json.loads(self._map[locations_offset:locations_offset + locations_length])
+
+    def lookup(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        """Plage contenant l'adresse, ou None"""
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+
+        if address.version == 4:
+            found = self._search(IPV4_RECORD, self._ipv4_offset, self.ipv4_count, int(address))
+        else:
+            found = self._search(IPV6_RECORD, self._ipv6_offset, self.ipv6_count, address.packed)
+        if found is None:
+            return None
+
+        country_code, location_index = found
+        region, city, latitude, longitude = self._locations[location_index]
+        return {
+            'country_code': country_code,
+            'country_name': country_code,
+            'region': region,
+            'city': city,
+            'latitude': latitude,
+            'longitude': longitude,
+            'isp': None,
+            'organization': None,
+            'source': 'local'
+        }
+
+    def _search(self, record: struct.Struct, offset: int, count: int, key) -> Optional[Tuple[str, int]]:
+        # Dernière plage dont le début est <= key
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            start = record.unpack_from(self._map, offset + middle * record.size)[0]
+            if start <= key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            return None
+        _, end, country, location_index = record.unpack_from(self._map, offset + (low - 1) * record.size)
+        if key > end:
+            return None
+        return country.decode('ascii').strip(), location_index
+
+    def close(self):
+        self._map.close()
+
+
+class GeoIPStore:
+    """Base courante, rechargée quand le fichier est remplacé"""
+
+    def __init__(self, path: str = GEOIP_DATABASE_PATH, reload_interval: float = GEOIP_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._database: Optional[GeoIPDatabase] = None
+        self._signature = None
+        self._checked_at = 0.0
+
+    def lookup(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        database = self.database()
+        return database.lookup(ip_address) if database is not None else None
+
+    def database(self) -> Optional[GeoIPDatabase]:
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            self.reload()
+        return self._database
+
+    def reload(self, force: bool = False) -> bool:
+        """Recharger le fichier s'il a changé ; True si une nouvelle base est chargée"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                if self._database is not None:
+                    logger.warning(f"Base de géolocalisation absente: {self.path}")
+                self._database, self._signature = None, None
+                return False
+
+            signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if signature == self._signature and not force:
+                return False
+            try:
+                database = GeoIPDatabase(self.path)
+            except (OSError, ValueError, struct.error) as e:
+                logger.error(f"Chargement de la base de géolocalisation impossible: {e}")
+                return False
+            # L'ancienne projection est libérée quand plus aucune recherche ne la référence
+            self._database, self._signature = database, signature
+            logger.info(
+                f"Base de géolocalisation chargée: {database.ipv4_count} plages IPv4, "
+                f"{database.ipv6_count} plages IPv6"
+            )
+            return True
+
+
+def read_csv_ranges(lines: Iterable[str], layout: str = 'dbip') -> Iterator[IPRange]:
+    """Plages d'un export CSV ; les lignes illisibles (en-têtes…) sont ignorées"""
+    columns = CSV_LAYOUTS[layout]
+    for row in csv.reader(lines):
+        try:
+            if 'network' in columns:
+                network = ipaddress.ip_network(row[columns['network']].strip(), strict=False)
+                start, end = network.network_address, network.broadcast_address
+            else:
+                start, end = _ip_address(row[columns['start']]), _ip_address(row[columns['end']])
+            country = row[columns['country']].strip().upper()
+        except (IndexError, ValueError):
+            continue
+        if len(country) != 2 or start.version != end.version:
+            continue
+        yield (
+            start, end, country,
+            *(row[columns[field]].strip() if field in columns and columns[field] < len(row) else ''
+              for field in ('region', 'city')),
+            *(_float(row[columns[field]]) if field in columns and columns[field] < len(row) else None
+              for field in ('latitude', 'longitude')),
+        )
+
+
+def read_mmdb_ranges(path: str) -> Iterator[IPRange]:
+    """Plages d'une base MMDB (GeoLite2/GeoIP2 City ou Country)"""
+    if maxminddb is None:
+        raise RuntimeError("Import MMDB indisponible: maxminddb n'est pas installé")
+
+    with maxminddb.open_database(path) as reader:
+        for network, record in reader:
+            country = ((record or {}).get('country') or {}).get('iso_code')
+            if not country:
+                continue
+            subdivisions = record.get('subdivisions') or [{}]
+            location = record.get('location') or {}
+            yield (
+                network.network_address, network.broadcast_address, country,
+                subdivisions[0].get('names', {}).get('en', ''),
+                (record.get('city') or {}).get('names', {}).get('en', ''),
+                location.get('latitude'),
+                location.get('longitude'),
+            )
+
+
+def build_database(ranges: Iterable[IPRange], path: str = GEOIP_DATABASE_PATH) -> Dict[str, int]:
+    """
+    Écrire le fichier de plages puis le substituer atomiquement à l'ancien
+
+    Les plages qui en chevauchent une précédente sont ignorées.
+    """
+    locations: Dict[Tuple, int] = {}
+    tables: Dict[int, List[Tuple]] = {4: [], 6: []}
+    for start, end, country, region, city, latitude, longitude in ranges:
+        key = (region or '', city or '', latitude, longitude)
+        index = locations.setdefault(key, len(locations))
+        tables[start.version].append((int(start), int(end), country.encode('ascii'), index))
+
+    stats = {'ipv4': 0, 'ipv6': 0, 'overlapping': 0, 'locations': len(locations)}
+    records = {}
+    for version, rows in tables.items():
+        rows.sort()
+        kept, previous_end = [], -1
+        for row in rows:
+            if row[0] <= previous_end or row[1] < row[0]:
+                stats['overlapping'] += 1
+                continue
+            kept.append(row)
+            previous_end = row[1]
+        records[version] = kept
+        stats[f'ipv{version}'] = len(kept)
+
+    location_table = json.dumps([list(key) for key in locations], ensure_ascii=False).encode('utf-8')
+    locations_offset = (
+        HEADER.size + len(records[4]) * IPV4_RECORD.size + len(records[6]) * IPV6_RECORD.size
+    )
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.geoip-')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(HEADER.pack(
+                MAGIC, len(records[4]), len(records[6]), locations_offset, len(location_table)
+            ))
+            for start, end, country, index in records[4]:
+                output.write(IPV4_RECORD.pack(start, end, country, index))
+            for start, end, country, index in records[6]:
+                output.write(IPV6_RECORD.pack(
+                    start.to_bytes(16, 'big'), end.to_bytes(16, 'big'), country, index
+                ))
+            output.write(location_table)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return stats
+
+
+geoip_database = GeoIPStore()
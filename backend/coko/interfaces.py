@@ -16,6 +16,11 @@ class BookServiceInterface(ABC):
         """Récupérer un livre par son ID"""
         pass
     
+    @abstractmethod
+    def get_books_by_ids(self, book_ids: List[int]) -> Dict[Any, Dict[str, Any]]:
+        """Récupérer plusieurs livres en une fois, indexés par ID"""
+        pass
+    
     @abstractmethod
     def get_books_by_category(self, category_names: List[str], limit: int = 10) -> List[Dict[str, Any]]:
         """Récupérer des livres par catégorie"""
@@ -0,0 +1,307 @@
+"""
+Métriques de requêtes : tampon par processus et histogrammes de latence
+
+Enregistrer une requête ne fait aucun aller-retour réseau : l'échantillon
+(un tuple) est ajouté au tampon du processus (une `deque` dont `append`/
+`popleft` sont atomiques : ni verrou ni lecture-modification-écriture).
+Au plus une fois par `REQUEST_METRICS_FLUSH_INTERVAL` secondes, ou dès que
+le tampon atteint `REQUEST_METRICS_BUFFER_SIZE` échantillons, le tampon est
+vidé, agrégé en mémoire, puis ajouté au hash Redis de chaque minute par un
+pipeline de `HINCRBY` : les incréments de plusieurs processus
+s'additionnent sans perte de mise à jour. Les seuls échantillons perdus
+sont ceux d'un vidage en échec ; ils sont comptés dans `dropped_samples`.
+
+Les latences sont comptées dans un histogramme à classes logarithmiques
+(précision relative de ±2,5 %, à la manière de HDR Histogram) par pays et
+par qualité réseau ; les histogrammes de plusieurs minutes s'additionnent
+et donnent de vrais p50/p95/p99.
+
+Sans Redis (développement, tests), un magasin en mémoire joue le rôle des
+hash par minute.
+"""
+import logging
+import math
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+REQUEST_METRICS_KEY_PREFIX = 'request_metrics'
+REQUEST_METRICS_FLUSH_INTERVAL = getattr(settings, 'REQUEST_METRICS_FLUSH_INTERVAL', 5.0)
+REQUEST_METRICS_BUFFER_SIZE = getattr(settings, 'REQUEST_METRICS_BUFFER_SIZE', 10000)
+REQUEST_METRICS_RETENTION = getattr(settings, 'REQUEST_METRICS_RETENTION', 3600)
+
+# Classes de latence : 0 pour <= LATENCY_MIN_MS, puis bornes en progression géométrique
+LATENCY_MIN_MS = 0.1
+LATENCY_GROWTH = 1.05
+PERCENTILES = (50, 95, 99)
+
+# Seuils de lenteur : 500 ms pour l'Afrique, 200 ms pour le reste
+AFRICAN_SLOW_MS = 500
+GLOBAL_SLOW_MS = 200
+
+# (minute, latence ms, taille, statut, africain, pays, qualité réseau)
+Sample = Tuple[int, float, int, int, bool, str, str]
+
+
+def _uses_redis() -> bool:
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    return backend.startswith('django_redis')
+
+
+def latency_bucket(value_ms: float) -> int:
+    if value_ms <= LATENCY_MIN_MS:
+        return 0
+    return int(math.log(value_ms / LATENCY_MIN_MS, LATENCY_GROWTH)) + 1
+
+
+def bucket_value(bucket: int) -> float:
+    """Valeur représentative d'une classe (moyenne géométrique de ses bornes)"""
+    if bucket <= 0:
+        return LATENCY_MIN_MS
+    lower = LATENCY_MIN_MS * LATENCY_GROWTH ** (bucket - 1)
+    return lower * math.sqrt(LATENCY_GROWTH)
+
+
+def percentiles(histogram: Dict[int, int], quantiles: Iterable[int] = PERCENTILES) -> Dict[str, float]:
+    """Percentiles d'un histogramme {classe: nombre}"""
+    total = sum(histogram.values())
+    result = {f"p{q}": 0.0 for q in quantiles}
+    if not total:
+        return result
+    buckets = sorted(histogram.items())
+    for q in quantiles:
+        rank = max(1, math.ceil(total * q / 100))
+        seen = 0
+        for bucket, count in buckets:
+            seen += count
+            if seen >= rank:
+                result[f"p{q}"] = round(bucket_value(bucket), 2)
+                break
+    return result
+
+
+class RedisMetricsStore:
+    """Un hash Redis par minute, alimenté par pipeline de HINCRBY"""
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+        self.redis = get_redis_connection('default')
+
+    def _key(self, minute: int) -> str:
+        return f"{REQUEST_METRICS_KEY_PREFIX}:{minute}"
+
+    def add(self, increments: Dict[int, Counter]):
+        pipeline = self.redis.pipeline(transaction=False)
+        for minute, fields in increments.items():
+            key = self._key(minute)
+            for field, amount in fields.items():
+                pipeline.hincrby(key, field, amount)
+            pipeline.expire(key, REQUEST_METRICS_RETENTION)
+        pipeline.execute()
+
+    def read(self, minutes: List[int]) -> List[Dict[str, int]]:
+        pipeline = self.redis.pipeline(transaction=False)
+        for minute in minutes:
+            pipeline.hgetall(self._key(minute))
+        return [
+            {field.decode(): int(value) for field, value in values.items()}
+            for values in pipeline.execute()
+        ]
+
+    def delete(self, minutes: List[int]):
+        if minutes:
+            self.redis.delete(*[self._key(minute) for minute in minutes])
+
+
+class LocalMetricsStore:
+    """Hash par minute en mémoire (un seul processus)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._minutes: Dict[int, Counter] = {}
+
+    def add(self, increments: Dict[int, Counter]):
+        with self._lock:
+            for minute, fields in increments.items():
+                self._minutes.setdefault(minute, Counter()).update(fields)
+            oldest = int(time.time() // 60) - REQUEST_METRICS_RETENTION // 60
+            for minute in [minute for minute in self._minutes if minute < oldest]:
+                del self._minutes[minute]
+
+    def read(self, minutes: List[int]) -> List[Dict[str, int]]:
+        with self._lock:
+            return [dict(self._minutes.get(minute, {})) for minute in minutes]
+
+    def delete(self, minutes: List[int]):
+        with self._lock:
+            for minute in minutes:
+                self._minutes.pop(minute, None)
+
+
+class RequestMetrics:
+    """Enregistrement sans verrou, vidage périodique et lectures agrégées"""
+
+    def __init__(self, buffer_size: int = REQUEST_METRICS_BUFFER_SIZE,
+                 flush_interval: float = REQUEST_METRICS_FLUSH_INTERVAL):
+        self._samples = deque()
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.dropped_samples = 0
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = RedisMetricsStore() if _uses_redis() else LocalMetricsStore()
+        return self._store
+
+    def record(self, response_time_ms: float, response_size_bytes: int = 0, status_code: int = 200,
+               is_african: bool = False, country_code: Optional[str] = None,
+               network_quality: Optional[str] = None):
+        """Ajouter un échantillon au tampon du processus (aucune E/S)"""
+        self._samples.append((
+            int(time.time() // 60), float(response_time_ms), int(response_size_bytes or 0),
+            int(status_code or 0), bool(is_african), country_code or 'unknown', network_quality or 'unknown'
+        ))
+        if len(self._samples) >= self.buffer_size:
+            # Tampon plein : attendre le vidage en cours plutôt que de perdre des échantillons
+            self.flush(blocking=True)
+        elif time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, blocking: bool = False) -> int:
+        """
+        Agréger le tampon et l'ajouter aux hash par minute ; renvoie le nombre d'échantillons.
+
+        Sans `blocking`, le vidage est abandonné si un autre thread vide déjà
+        le tampon : ses échantillons restent pour le vidage suivant.
+        """
+        if not self._flush_lock.acquire(blocking=blocking):
+            return 0
+        try:
+            self._last_flush = time.monotonic()
+            # Ne vider que l'existant : un flot continu d'ajouts ne prolonge pas le vidage
+            samples = [self._samples.popleft() for _ in range(len(self._samples))]
+            if not samples:
+                return 0
+            try:
+                self.store.add(self.aggregate(samples))
+            except Exception as e:
+                self.dropped_samples += len(samples)
+                logger.error(f"Error flushing request metrics, {len(samples)} samples dropped: {e}")
+                return 0
+            return len(samples)
+        finally:
+            self._flush_lock.release()
+
+    @staticmethod
+    def aggregate(samples: Iterable[Sample]) -> Dict[int, Counter]:
+        """Champs de hash incrémentés par minute"""
+        increments: Dict[int, Counter] = {}
+        for minute, response_time_ms, size, status_code, is_african, country, network in samples:
+            fields = increments.setdefault(minute, Counter())
+            time_us = int(response_time_ms * 1000)
+            bucket = latency_bucket(response_time_ms)
+            fields['requests'] += 1
+            fields['time_us'] += time_us
+            fields['bytes'] += size
+            fields[f'country:{country}'] += 1
+            fields[f'network:{network}'] += 1
+            fields[f'status:{status_code}'] += 1
+            fields[f'lat:all:{bucket}'] += 1
+            fields[f'lat:country:{country}:{bucket}'] += 1
+            fields[f'lat:network:{network}:{bucket}'] += 1
+            if is_african:
+                fields['african'] += 1
+                fields['african_time_us'] += time_us
+                fields[f'lat:african:{bucket}'] += 1
+            if response_time_ms > (AFRICAN_SLOW_MS if is_african else GLOBAL_SLOW_MS):
+                fields['slow'] += 1
+            if status_code >= 400:
+                fields['errors'] += 1
+        return increments
+
+    def minutes(self, count: int, flush: bool = True) -> List[Tuple[int, Dict[str, int]]]:
+        """Hash des `count` dernières minutes, de la plus récente à la plus ancienne"""
+        if flush:
+            self.flush()
+        current = int(time.time() // 60)
+        minutes = [current - offset for offset in range(count)]
+        try:
+            return list(zip(minutes, self.store.read(minutes)))
+        except Exception as e:
+            logger.error(f"Error reading request metrics: {e}")
+            return [(minute, {}) for minute in minutes]
+
+    def summary(self, minutes: int = 10) -> Dict[str, Any]:
+        """Totaux, moyennes et percentiles de latence sur les dernières minutes"""
+        totals = Counter()
+        for _, fields in self.minutes(minutes):
+            totals.update(fields)
+
+        histograms: Dict[Tuple[str, ...], Counter] = {}
+        by_country, by_network, by_status = {}, {}, {}
+        for field, value in totals.items():
+            parts = field.split(':')
+            if parts[0] == 'lat':
+                histograms.setdefault(tuple(parts[1:-1]), Counter())[int(parts[-1])] += value
+            elif parts[0] == 'country':
+                by_country[parts[1]] = value
+            elif parts[0] == 'network':
+                by_network[parts[1]] = value
+            elif parts[0] == 'status':
+                by_status[parts[1]] = value
+
+        def latency(key: Tuple[str, ...], count: int) -> Dict[str, Any]:
+            return {'count': count, **percentiles(histograms.get(key, {}))}
+
+        return {
+            'total_requests': totals['requests'],
+            'african_requests': totals['african'],
+            'slow_requests': totals['slow'],
+            'errors': totals['errors'],
+            'total_response_size': totals['bytes'],
+            'total_response_time_ms': totals['time_us'] / 1000,
+            'african_response_time_ms': totals['african_time_us'] / 1000,
+            'by_country': by_country,
+            'by_network_quality': by_network,
+            'by_status_code': by_status,
+            'latency': {
+                'all': latency(('all',), totals['requests']),
+                'african': latency(('african',), totals['african']),
+            },
+            'latency_by_country': {
+                country: latency(('country', country), count) for country, count in by_country.items()
+            },
+            'latency_by_network_quality': {
+                network: latency(('network', network), count) for network, count in by_network.items()
+            },
+        }
+
+    def delete_minutes(self, minutes: List[int]):
+        self.store.delete(minutes)
+
+
+request_metrics = RequestMetrics()
+
+
+def record_request(request, response_time_ms: float, response_size_bytes: int = 0, status_code: int = 200):
+    """Enregistrer une requête Django avec la localisation de son client"""
+    from .african_geolocation import get_user_location
+
+    location = get_user_location(request)
+    request_metrics.record(
+        response_time_ms,
+        response_size_bytes,
+        status_code,
+        is_african=location.get('is_african', False),
+        country_code=location.get('country_code'),
+        network_quality=location.get('network_quality')
+    )
@@ -0,0 +1,294 @@
+"""
+Cache de réponses complètes, sur option par vue
+
+Une vue décorée par `cache_response` voit ses réponses GET/HEAD servies
+depuis le cache par `AfricanCacheMiddleware` ; la vue elle-même est toujours
+appelée par Django (transactions et autres middlewares inclus) :
+
+- la clé combine l'URL complète, la portée d'authentification
+  (`public` : partagée par tous ; `user` : par utilisateur, par jeton
+  `Authorization` ou anonyme) et les valeurs des en-têtes listés dans
+  `Vary` (appris de la réponse, comme le cache de Django) ;
+- l'entrée stockée est un dictionnaire (statut, en-têtes, corps compressé
+  en gzip une seule fois, ETag) et non un objet `HttpResponse` ; le corps
+  est décompressé pour les clients qui n'acceptent pas gzip ;
+- l'ETag (faible) est un hachage du corps : `If-None-Match` reçoit un 304,
+  que la réponse vienne du cache ou d'être calculée ;
+- les entrées sont rattachées à des étiquettes (`coko.cache_tags`) :
+  invalider `catalog` ou `book:<id>` depuis les signaux des modèles les
+  rend introuvables.
+
+Les compteurs (succès, échecs, 304, octets économisés) sont cumulés par
+processus puis ajoutés au cache par `incr` au plus toutes les quelques
+secondes.
+"""
+import gzip
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import cc_delim_re, patch_vary_headers
+from django.utils.http import parse_etags
+
+from .cache_tags import tagged_cache
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = getattr(settings, 'RESPONSE_CACHE_ENABLED', True)
+RESPONSE_CACHE_PREFIX = 'response_cache'
+RESPONSE_CACHE_MIN_COMPRESS_SIZE = getattr(settings, 'RESPONSE_CACHE_MIN_COMPRESS_SIZE', 512)
+RESPONSE_CACHE_STATS_FLUSH_INTERVAL = 5.0
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/xml',
+    'application/rss+xml', 'application/atom+xml', 'image/svg+xml'
+)
+# En-têtes propres à la connexion ou recalculés à chaque envoi
+UNSTORED_HEADERS = {
+    'content-length', 'content-encoding', 'etag', 'set-cookie', 'x-cache', 'x-response-time'
+}
+# En-têtes de `Vary` qui désignent l'utilisateur : couverts par la portée
+IDENTITY_HEADERS = {'cookie', 'authorization'}
+STAT_NAMES = ('hits', 'misses', 'not_modified', 'bypassed', 'bytes_saved')
+
+Tags = Union[Iterable[str], Callable[..., Iterable[str]]]
+
+
+@dataclass(frozen=True)
+class ResponseCachePolicy:
+    """Règles de cache d'une vue"""
+    timeout: int = 300
+    tags: Tags = ()
+    scope: str = 'user'
+    vary: Tuple[str, ...] = ('Accept-Language',)
+
+    def tags_for(self, request, kwargs) -> List[str]:
+        tags = self.tags(request, **kwargs) if callable(self.tags) else self.tags
+        return list(tags)
+
+
+def cache_response(timeout: int = 300, tags: Tags = (), scope: str = 'user',
+                   vary: Iterable[str] = ('Accept-Language',)):
+    """
+    Activer le cache de réponses pour une vue (fonction ou `as_view()`)
+
+    `tags` est une liste d'étiquettes ou une fonction `(request, **kwargs)`
+    qui la renvoie ; `scope='public'` partage l'entrée entre tous les
+    utilisateurs et ne doit servir que pour des réponses qui n'en dépendent pas.
+    """
+    if scope not in ('public', 'user'):
+        raise ValueError(f"Portée de cache inconnue: {scope}")
+    policy = ResponseCachePolicy(timeout=timeout, tags=tags, scope=scope, vary=tuple(vary))
+
+    def decorator(view):
+        view.response_cache_policy = policy
+        return view
+    return decorator
+
+
+def _accepts_gzip(request) -> bool:
+    accept = request.META.get('HTTP_ACCEPT_ENCODING', '').lower()
+    return bool(re.search(r'\bgzip\b(?!\s*;\s*q=0(\.0+)?\b)', accept))
+
+
+def _etag_matches(request, etag: str) -> bool:
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    candidates = parse_etags(header)
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    return '*' in candidates or any(
+        (candidate[2:] if candidate.startswith('W/') else candidate) == opaque for candidate in candidates
+    )
+
+
+class ResponseCache:
+    """Recherche, stockage et revalidation des réponses mises en cache"""
+
+    def __init__(self):
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._stats_flushed = time.monotonic()
+
+    def lookup(self, request, policy: ResponseCachePolicy, kwargs=None) -> Optional[HttpResponse]:
+        """
+        Réponse en cache si elle existe, sinon None
+
+        En cas d'échec, la clé est retenue sur la requête pour que `store`
+        enregistre la réponse produite par la vue.
+        """
+        if not RESPONSE_CACHE_ENABLED or request.method not in ('GET', 'HEAD'):
+            return None
+
+        tags = policy.tags_for(request, kwargs or {})
+        base = self._base_key(request, policy)
+        vary = cache.get(f"{RESPONSE_CACHE_PREFIX}:vary:{base}")
+        if vary is not None:
+            entry = cache.get(self._entry_key(request, base, vary, tags))
+            if entry is not None:
+                self._count('hits')
+                return self._respond(request, entry, 'HIT')
+
+        self._count('misses')
+        request._response_cache_pending = (policy, base, tags)
+        return None
+
+    def store(self, request, response) -> HttpResponse:
+        """Enregistrer la réponse d'un échec de `lookup` (sans effet sinon)"""
+        pending = getattr(request, '_response_cache_pending', None)
+        if pending is None:
+            return response
+        del request._response_cache_pending
+        policy, base, tags = pending
+
+        if hasattr(response, 'render') and callable(response.render) and not response.is_rendered:
+            response.render()
+
+        entry = self._entry(response, policy)
+        if entry is None:
+            self._count('bypassed')
+            response['X-Cache'] = 'BYPASS'
+            return response
+
+        vary = sorted(set(header.lower() for header in policy.vary) | set(entry.pop('vary')))
+        cache.set(f"{RESPONSE_CACHE_PREFIX}:vary:{base}", vary, policy.timeout)
+        cache.set(self._entry_key(request, base, vary, tags), entry, policy.timeout)
+        return self._respond(request, entry, 'MISS')
+
+    def _base_key(self, request, policy: ResponseCachePolicy) -> str:
+        # URL absolue : les sérialiseurs construisent des liens à partir de l'hôte
+        parts = [request.build_absolute_uri()]
+        if policy.scope == 'user':
+            parts.append(self._identity(request))
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+    def _identity(self, request) -> str:
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f"user:{user.pk}"
+        # Authentification par jeton (DRF) : résolue dans la vue, après ce cache
+        authorization = request.META.get('HTTP_AUTHORIZATION')
+        if authorization:
+            return f"token:{hashlib.sha256(authorization.encode()).hexdigest()}"
+        return 'anonymous'
+
+    def _entry_key(self, request, base: str, vary: List[str], tags: List[str]) -> str:
+        values = '|'.join(
+            f"{header}={request.META.get('HTTP_' + header.upper().replace('-', '_'), '')}"
+            for header in vary
+        )
+        key = f"{RESPONSE_CACHE_PREFIX}:{base}:{hashlib.sha256(values.encode()).hexdigest()}"
+        return tagged_cache.versioned_key(key, tags)
+
+    def _entry(self, response, policy: ResponseCachePolicy) -> Optional[Dict[str, Any]]:
+        """Entrée à stocker, ou None si la réponse ne doit pas être mise en cache"""
+        if response.status_code != 200 or getattr(response, 'streaming', False):
+            return None
+        if response.has_header('Set-Cookie') or response.cookies or response.has_header('Content-Encoding'):
+            return None
+        cache_control = response.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control or 'no-cache' in cache_control:
+            return None
+        if policy.scope == 'public' and 'private' in cache_control:
+            return None
+
+        vary = [header.strip().lower() for header in cc_delim_re.split(response.get('Vary', '')) if header.strip()]
+        if '*' in vary or (policy.scope == 'public' and IDENTITY_HEADERS & set(vary)):
+            return None
+
+        body = response.content
+        content_type = response.get('Content-Type', '')
+        encoding = 'identity'
+        if len(body) >= RESPONSE_CACHE_MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=6)
+            if len(compressed) < len(body):
+                body, encoding = compressed, 'gzip'
+
+        if not response.has_header('Cache-Control'):
+            response['Cache-Control'] = (
+                f'public, max-age={policy.timeout}' if policy.scope == 'public'
+                else 'private, max-age=0, must-revalidate'
+            )
+
+        return {
+            'status': response.status_code,
+            'headers': [
+                (name, value) for name, value in response.items() if name.lower() not in UNSTORED_HEADERS
+            ],
+            'body': body,
+            'encoding': encoding,
+            'size': len(response.content),
+            'etag': f'W/"{hashlib.blake2b(response.content, digest_size=16).hexdigest()}"',
+            'vary': [header for header in vary if header not in IDENTITY_HEADERS and header != 'accept-encoding'],
+        }
+
+    def _respond(self, request, entry: Dict[str, Any], status: str) -> HttpResponse:
+        if _etag_matches(request, entry['etag']):
+            self._count('not_modified')
+            self._count('bytes_saved', entry['size'])
+            response = HttpResponseNotModified()
+            for name, value in entry['headers']:
+                if name.lower() in ('cache-control', 'expires', 'last-modified', 'content-location'):
+                    response[name] = value
+        else:
+            body = entry['body']
+            response = HttpResponse(status=entry['status'])
+            for name, value in entry['headers']:
+                response[name] = value
+            if entry['encoding'] == 'gzip':
+                if _accepts_gzip(request):
+                    response['Content-Encoding'] = 'gzip'
+                    self._count('bytes_saved', entry['size'] - len(body))
+                else:
+                    body = gzip.decompress(body)
+            response.content = body
+
+        response['ETag'] = entry['etag']
+        response['X-Cache'] = status
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    def purge(self, *tags: str):
+        """Rendre introuvables les réponses rattachées à ces étiquettes"""
+        tagged_cache.invalidate(*tags)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+        if time.monotonic() - self._stats_flushed >= RESPONSE_CACHE_STATS_FLUSH_INTERVAL:
+            self.flush_stats()
+
+    def flush_stats(self):
+        with self._stats_lock:
+            pending, self._stats = self._stats, Counter()
+            self._stats_flushed = time.monotonic()
+        for name, amount in pending.items():
+            if not amount:
+                continue
+            key = f"{RESPONSE_CACHE_PREFIX}:stats:{name}"
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                if not cache.add(key, amount, None):
+                    cache.incr(key, amount)
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs cumulés de tous les processus"""
+        self.flush_stats()
+        keys = {name: f"{RESPONSE_CACHE_PREFIX}:stats:{name}" for name in STAT_NAMES}
+        stored = cache.get_many(list(keys.values()))
+        stats = {name: stored.get(key, 0) for name, key in keys.items()}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups * 100, 2) if lookups else 0.0
+        return stats
+
+
+response_cache = ResponseCache()
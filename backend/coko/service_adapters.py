@@ -15,6 +15,10 @@ from .interfaces import (
     RecommendationServiceInterface, UserServiceInterface
 )
 from .events import publish_event, EventType
+from .cache_layer import coalescing_cache, CACHE_STALE_FACTOR
+from .cache_tags import (
+    tagged_cache, user_tag, book_tag, CATALOG_TAG, RECOMMENDATIONS_TAG
+)
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -23,27 +27,34 @@ logger = logging.getLogger(__name__)
 class ServiceAdapterMixin:
     """Mixin pour les adaptateurs de service avec fonctionnalités communes"""
     
+    # Durée (multiple de la durée de fraîcheur) pendant laquelle une valeur
+    # périmée reste servie pendant son recalcul
+    cache_stale_factor = CACHE_STALE_FACTOR
+    
     def __init__(self):
         self.cache_timeout = 3600  # 1 heure par défaut
     
-    def get_cached_result(self, cache_key: str, fetch_func: callable, timeout: int = None) -> Any:
-        """Utiliser le cache pour optimiser les appels de service"""
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            return cached_result
-        
-        result = fetch_func()
-        cache.set(cache_key, result, timeout or self.cache_timeout)
-        return result
+    def get_cached_result(self, cache_key: str, fetch_func: callable, timeout: int = None,
+                          tags: List[str] = None) -> Any:
+        """
+        Utiliser le cache pour optimiser les appels de service
+        
+        Un seul worker recalcule une clé expirée ; les autres servent la
+        valeur périmée (ou attendent la première valeur) au lieu de
+        recalculer tous en même temps. Les étiquettes (`tags`) permettent
+        d'invalider l'entrée avec `invalidate_cache_tags`.
+        """
+        soft_ttl = timeout or self.cache_timeout
+        return coalescing_cache.get_or_compute(
+            tagged_cache.versioned_key(cache_key, tags or []),
+            fetch_func,
+            soft_ttl,
+            int(soft_ttl * self.cache_stale_factor)
+        )
     
-    def invalidate_cache_pattern(self, pattern: str):
-        """Invalider les clés de cache correspondant à un pattern"""
-        # Cette méthode devrait être implémentée selon le backend de cache utilisé
-        try:
-            cache.delete_many([key for key in cache._cache.keys() if pattern in key])
-        except AttributeError:
-            # Fallback pour les backends qui ne supportent pas _cache.keys()
-            logger.warning(f"Impossible d'invalider le cache pour le pattern: {pattern}")
+    def invalidate_cache_tags(self, *tags: str):
+        """Invalider toutes les entrées rattachées à ces étiquettes"""
+        tagged_cache.invalidate(*tags)
 
 
 class BookServiceAdapter(ServiceAdapterMixin):
@@ -58,7 +69,8 @@ class BookServiceAdapter(ServiceAdapterMixin):
         cache_key = f"book_data_{book_id}"
         return self.get_cached_result(
             cache_key,
-            lambda: self.book_service.get_book_by_id(book_id)
+            lambda: self.book_service.get_book_by_id(book_id),
+            tags=[book_tag(book_id)]
         )
     
     def search_books_with_filters(
@@ -72,7 +84,8 @@ class BookServiceAdapter(ServiceAdapterMixin):
         return self.get_cached_result(
             cache_key,
             lambda: self.book_service.search_books(query, filters, limit),
-            timeout=1800  # 30 minutes pour les recherches
+            timeout=1800,  # 30 minutes pour les recherches
+            tags=[CATALOG_TAG]
         )
     
     def get_popular_books_by_context(
@@ -91,7 +104,7 @@ class BookServiceAdapter(ServiceAdapterMixin):
                 book['recommendation_context'] = context
             return books
         
-        return self.get_cached_result(cache_key, fetch_popular)
+        return self.get_cached_result(cache_key, fetch_popular, tags=[CATALOG_TAG])
     
     def get_books_by_multiple_criteria(
         self, 
@@ -150,7 +163,7 @@ class ReadingServiceAdapter(ServiceAdapterMixin):
             profile['metrics'] = self._calculate_reading_metrics(profile)
             return profile
         
-        return self.get_cached_result(cache_key, fetch_profile, timeout=1800)
+        return self.get_cached_result(cache_key, fetch_profile, timeout=1800, tags=[user_tag(user_id)])
     
     def get_reading_patterns(self, user_id: int) -> Dict[str, Any]:
         """Analyser les patterns de lecture de l'utilisateur"""
@@ -205,7 +218,7 @@ class ReadingServiceAdapter(ServiceAdapterMixin):
         )
         
         # Invalider le cache du profil utilisateur
-        self.invalidate_cache_pattern(f"reading_profile_{user_id}")
+        self.invalidate_cache_tags(user_tag(user_id))
     
     def _calculate_reading_metrics(self, profile: Dict[str, Any]) -> Dict[str, Any]:
         """Calculer des métriques de lecture avancées"""
@@ -244,7 +257,7 @@ class UserServiceAdapter(ServiceAdapterMixin):
                 'privacy_settings': preferences.get('privacy', {})
             }
         
-        return self.get_cached_result(cache_key, fetch_enhanced_profile)
+        return self.get_cached_result(cache_key, fetch_enhanced_profile, tags=[user_tag(user_id)])
     
     def update_user_preferences_with_validation(
         self, 
@@ -264,7 +277,7 @@ class UserServiceAdapter(ServiceAdapterMixin):
         
         if success:
             # Invalider le cache
-            self.invalidate_cache_pattern(f"enhanced_user_profile_{user_id}")
+            self.invalidate_cache_tags(user_tag(user_id))
             
             # Publier l'événement
             publish_event(
@@ -329,9 +342,10 @@ class RecommendationServiceAdapter(ServiceAdapterMixin):
         """Obtenir des recommandations personnalisées avec contexte"""
         
         cache_key = f"recommendations_{user_id}_{algorithm}_{count}_{context}"
+        tags = [user_tag(user_id), RECOMMENDATIONS_TAG]
         
         if refresh_cache:
-            cache.delete(cache_key)
+            cache.delete(tagged_cache.versioned_key(cache_key, tags))
         
         def fetch_recommendations():
             return self.recommendation_service.get_personalized_recommendations(
@@ -341,7 +355,8 @@ class RecommendationServiceAdapter(ServiceAdapterMixin):
         return self.get_cached_result(
             cache_key, 
             fetch_recommendations, 
-            timeout=3600  # 1 heure pour les recommandations
+            timeout=3600,  # 1 heure pour les recommandations
+            tags=tags
         )
     
     def get_similar_books_with_explanation(
@@ -385,7 +400,7 @@ class RecommendationServiceAdapter(ServiceAdapterMixin):
         )
         
         # Invalider le cache des recommandations
-        self.invalidate_cache_pattern(f"recommendations_{user_id}")
+        self.invalidate_cache_tags(user_tag(user_id))
     
     def _generate_similarity_explanation(
         self, 
@@ -34,20 +34,7 @@ class BookService(BookServiceInterface):
                 'authors', 'categories'
             ).get(id=book_id, is_active=True)
             
-            book_data = {
-                'id': book.id,
-                'title': book.title,
-                'slug': book.slug,
-                'description': book.description,
-                'authors': [{'id': author.id, 'name': author.name} for author in book.authors.all()],
-                'categories': [{'id': cat.id, 'name': cat.name} for cat in book.categories.all()],
-                'cover_image': book.cover_image.url if book.cover_image else None,
-                'average_rating': book.average_rating,
-                'publication_date': book.publication_date,
-                'language': book.language,
-                'is_active': book.is_active
-            }
-            
+            book_data = self._book_data(book)
             cache.set(cache_key, book_data, 3600)  # Cache 1 heure
             return book_data
             
@@ -55,6 +42,52 @@ class BookService(BookServiceInterface):
             logger.error(f"Erreur lors de la récupération du livre {book_id}: {str(e)}")
             return None
     
+    def get_books_by_ids(self, book_ids: List[int]) -> Dict[Any, Dict[str, Any]]:
+        """
+        Récupérer plusieurs livres : une lecture groupée du cache, puis une
+        seule requête pour les livres absents
+        """
+        try:
+            from catalog_service.models import Book
+            
+            cache_keys = {book_id: f"book_{book_id}" for book_id in book_ids}
+            cached = cache.get_many(list(cache_keys.values()))
+            books = {
+                book_id: cached[key] for book_id, key in cache_keys.items() if cached.get(key)
+            }
+            
+            missing = {str(book_id): book_id for book_id in cache_keys if book_id not in books}
+            if missing:
+                fetched = {}
+                queryset = Book.objects.prefetch_related('authors', 'categories').filter(
+                    id__in=list(missing.values()), is_active=True
+                )
+                for book in queryset:
+                    book_id = missing.get(str(book.id), book.id)
+                    books[book_id] = fetched[cache_keys[book_id]] = self._book_data(book)
+                cache.set_many(fetched, 3600)
+            
+            return books
+            
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération groupée de {len(book_ids)} livres: {str(e)}")
+            return {}
+    
+    def _book_data(self, book) -> Dict[str, Any]:
+        return {
+            'id': book.id,
+            'title': book.title,
+            'slug': book.slug,
+            'description': book.description,
+            'authors': [{'id': author.id, 'name': author.name} for author in book.authors.all()],
+            'categories': [{'id': cat.id, 'name': cat.name} for cat in book.categories.all()],
+            'cover_image': book.cover_image.url if book.cover_image else None,
+            'average_rating': book.average_rating,
+            'publication_date': book.publication_date,
+            'language': book.language,
+            'is_active': book.is_active
+        }
+    
     def get_books_by_category(self, category_names: List[str], limit: int = 10) -> List[Dict[str, Any]]:
         """Récupérer des livres par catégorie"""
         try:
@@ -63,9 +63,11 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'coko.african_performance.AfricanCacheMiddleware',  # Cache des vues décorées par cache_response
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'shared_models.audit_trail.AuditTrailMiddleware',  # Audit automatique
+    'shared_models.transport.DeadlineMiddleware',  # Échéance des appels inter-services
 ]
 
 ROOT_URLCONF = 'coko.urls'
@@ -205,6 +207,16 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Book file delivery: set to 'X-Accel-Redirect' (nginx, internal location
+# at CATALOG_FILE_OFFLOAD_PREFIX) or 'X-Sendfile' to let the front proxy send files
+CATALOG_FILE_OFFLOAD_HEADER = os.environ.get('CATALOG_FILE_OFFLOAD_HEADER', '')
+CATALOG_FILE_OFFLOAD_PREFIX = os.environ.get('CATALOG_FILE_OFFLOAD_PREFIX', '/protected/media/')
+
+# Similar-books ANN index (memory-mapped, shared by all workers on a host)
+RECOMMENDATION_ANN_INDEX_DIR = os.environ.get(
+    'RECOMMENDATION_ANN_INDEX_DIR', str(BASE_DIR / 'data' / 'ann_index')
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -263,6 +275,23 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Inter-service HTTP: shared connection pool, retries and circuit breaker
+# per service (see shared_models.transport), overridable per service name
+INTER_SERVICE_BASE_URL = os.environ.get('INTER_SERVICE_BASE_URL', 'http://localhost:8000')
+INTER_SERVICE_TIMEOUT = float(os.environ.get('INTER_SERVICE_TIMEOUT', '10'))
+# X-Request-Deadline is only honoured from callers presenting this shared token
+# (sent by the transport as X-Service-Token) or connecting from these networks
+INTER_SERVICE_TOKEN = os.environ.get('INTER_SERVICE_TOKEN', '')
+INTER_SERVICE_TRUSTED_NETWORKS = [
+    network for network in os.environ.get('INTER_SERVICE_TRUSTED_NETWORKS', '').split(',') if network
+]
+INTER_SERVICE_HTTP = {
+    'default': {
+        'pool_maxsize': int(os.environ.get('INTER_SERVICE_POOL_MAXSIZE', '20')),
+        'max_attempts': int(os.environ.get('INTER_SERVICE_MAX_ATTEMPTS', '3')),
+    },
+}
+
 # Redis configuration
 REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 
@@ -275,6 +304,52 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 
+# Event bus: events are written to the durable outbox and delivered in
+# batches by shared_models.tasks.dispatch_event_outbox
+EVENT_BUS_ASYNC = env.bool('EVENT_BUS_ASYNC', default=True)
+EVENT_OUTBOX_BATCH_SIZE = int(os.environ.get('EVENT_OUTBOX_BATCH_SIZE', '200'))
+EVENT_OUTBOX_WORKERS = int(os.environ.get('EVENT_OUTBOX_WORKERS', '4'))
+
+# Reference synchronisation (ServiceSync): batch size and parallel workers
+SERVICE_SYNC_BATCH_SIZE = int(os.environ.get('SERVICE_SYNC_BATCH_SIZE', '500'))
+SERVICE_SYNC_WORKERS = int(os.environ.get('SERVICE_SYNC_WORKERS', '4'))
+
+# Creator exports: cursor chunk size, and number of books above which the
+# complete package is built by a background job instead of streamed
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '500'))
+EXPORT_ASYNC_THRESHOLD = int(os.environ.get('EXPORT_ASYNC_THRESHOLD', '5000'))
+
+# Analytics rollups: trailing hours recomputed on every run to absorb late
+# changes, and size of the windows used when catching up on history
+ROLLUP_RESTATE_HOURS = int(os.environ.get('ROLLUP_RESTATE_HOURS', '3'))
+ROLLUP_WINDOW_HOURS = int(os.environ.get('ROLLUP_WINDOW_HOURS', '24'))
+
+# IP geolocation: local memory-mapped range database (built by import_geoip,
+# reloaded by workers when replaced); remote providers only enrich unknown
+# addresses in the background
+GEOIP_DATABASE_PATH = os.environ.get('GEOIP_DATABASE_PATH', str(BASE_DIR / 'data' / 'geoip.bin'))
+GEOIP_RELOAD_INTERVAL = int(os.environ.get('GEOIP_RELOAD_INTERVAL', '60'))
+GEOIP_REMOTE_ENRICHMENT = env.bool('GEOIP_REMOTE_ENRICHMENT', default=True)
+
+# Request metrics: per-process sample buffer, flushed to per-minute Redis
+# hashes at most every REQUEST_METRICS_FLUSH_INTERVAL seconds
+REQUEST_METRICS_FLUSH_INTERVAL = float(os.environ.get('REQUEST_METRICS_FLUSH_INTERVAL', '5'))
+REQUEST_METRICS_BUFFER_SIZE = int(os.environ.get('REQUEST_METRICS_BUFFER_SIZE', '10000'))
+
+# Full-response cache for views opted in with coko.response_cache.cache_response;
+# bodies at least RESPONSE_CACHE_MIN_COMPRESS_SIZE bytes are stored gzipped
+RESPONSE_CACHE_ENABLED = env.bool('RESPONSE_CACHE_ENABLED', default=True)
+RESPONSE_CACHE_MIN_COMPRESS_SIZE = int(os.environ.get('RESPONSE_CACHE_MIN_COMPRESS_SIZE', '512'))
+
+# Response compression: compressed variants are reused by content hash, frequent
+# bodies are precompressed at maximum quality by a Celery task, bodies larger than
+# COMPRESSION_STREAM_THRESHOLD are compressed incrementally, and no new compression
+# is computed while the 1-minute load average per core exceeds COMPRESSION_MAX_LOAD
+COMPRESSION_CACHE_MAX_BYTES = int(os.environ.get('COMPRESSION_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+COMPRESSION_PROMOTE_AFTER = int(os.environ.get('COMPRESSION_PROMOTE_AFTER', '3'))
+COMPRESSION_STREAM_THRESHOLD = int(os.environ.get('COMPRESSION_STREAM_THRESHOLD', str(1024 * 1024)))
+COMPRESSION_MAX_LOAD = float(os.environ.get('COMPRESSION_MAX_LOAD', '0.9'))
+
 # Cache configuration
 CACHES = {
     'default': {
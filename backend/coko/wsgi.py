@@ -12,4 +12,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coko.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Index de suggestions chargé avant la première requête
+from catalog_service.suggest import warm_suggestions  # noqa: E402
+warm_suggestions()
@@ -0,0 +1,326 @@
+"""
+Ingestion groupée et asynchrone de la progression de lecture
+
+Les clients (y compris la PWA hors ligne lors de sa synchronisation)
+envoient des lots d'événements de changement de page. Ils sont ajoutés à
+une file (liste Redis, ou file en mémoire sans Redis) puis traités par un
+worker qui les regroupe par session :
+
+- une écriture groupée (`bulk_create`) des entrées `ReadingProgress` ;
+- une seule mise à jour (`bulk_update`) des sessions concernées ;
+- une seule mise à jour des objectifs par utilisateur et par vidage ;
+
+ces écritures sont faites dans une transaction par lot. Un lot annulé est
+remis en file par `flush`. Après `READING_EVENTS_MAX_ATTEMPTS` échecs, le
+lot est rejoué session par session et les événements des sessions qui
+échouent encore sont déplacés dans une file de lettres mortes.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import timedelta
+from typing import Dict, List
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from coko.cache_tags import tagged_cache, user_tag
+from .models import ReadingSession, ReadingProgress, DailyReadingRollup
+from .signals import notify_page_milestones
+from .utils import update_reading_goals
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+READING_EVENTS_QUEUE_KEY = 'reading_progress_events'
+READING_EVENTS_DEAD_LETTER_SUFFIX = ':dead_letter'
+# Échecs d'un lot avant de l'isoler par session
+READING_EVENTS_MAX_ATTEMPTS = getattr(settings, 'READING_EVENTS_MAX_ATTEMPTS', 3)
+READING_EVENTS_BATCH_SIZE = getattr(settings, 'READING_EVENTS_BATCH_SIZE', 5000)
+# Intervalle de traitement de la file en mémoire (la file Redis est vidée par Celery beat)
+READING_EVENTS_LOCAL_FLUSH_INTERVAL = getattr(settings, 'READING_EVENTS_LOCAL_FLUSH_INTERVAL', 5.0)
+
+SESSION_UPDATE_FIELDS = [
+    'current_page', 'current_position', 'total_pages_read',
+    'total_reading_time', 'last_activity', 'updated_at'
+]
+
+
+def _uses_redis() -> bool:
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    return backend.startswith('django_redis')
+
+
+class RedisEventQueue:
+    """File d'événements dans une liste Redis"""
+
+    def __init__(self, key: str):
+        from django_redis import get_redis_connection
+        self.redis = get_redis_connection('default')
+        self.key = key
+
+    def push(self, events: List[dict]):
+        self.redis.rpush(self.key, *[json.dumps(event) for event in events])
+
+    def pop(self, count: int) -> List[dict]:
+        """Retirer atomiquement les `count` plus anciens événements"""
+        pipeline = self.redis.pipeline()
+        pipeline.lrange(self.key, 0, count - 1)
+        pipeline.ltrim(self.key, count, -1)
+        raw_events, _ = pipeline.execute()
+        return [json.loads(raw) for raw in raw_events]
+
+    def requeue(self, events: List[dict]):
+        if events:
+            self.redis.lpush(self.key, *[json.dumps(event) for event in reversed(events)])
+
+    def __len__(self):
+        return self.redis.llen(self.key)
+
+    def should_flush(self) -> bool:
+        return False
+
+
+class LocalEventQueue:
+    """File en mémoire pour le développement et les tests"""
+
+    def __init__(self):
+        self.events = deque()
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def push(self, events: List[dict]):
+        with self.lock:
+            self.events.extend(events)
+
+    def pop(self, count: int) -> List[dict]:
+        with self.lock:
+            self.last_flush = time.monotonic()
+            return [self.events.popleft() for _ in range(min(count, len(self.events)))]
+
+    def requeue(self, events: List[dict]):
+        with self.lock:
+            self.events.extendleft(reversed(events))
+
+    def __len__(self):
+        return len(self.events)
+
+    def should_flush(self) -> bool:
+        return time.monotonic() - self.last_flush >= READING_EVENTS_LOCAL_FLUSH_INTERVAL
+
+
+class ReadingProgressIngestor:
+    """File d'événements de lecture et worker de regroupement par session"""
+
+    def __init__(self, key: str = READING_EVENTS_QUEUE_KEY):
+        self.key = key
+        self._queue = None
+        self._dead_letters = None
+        self._flush_lock = threading.Lock()
+
+    @property
+    def queue(self):
+        if self._queue is None:
+            self._queue = RedisEventQueue(self.key) if _uses_redis() else LocalEventQueue()
+        return self._queue
+
+    @property
+    def dead_letters(self):
+        """Événements abandonnés après échecs répétés, conservés pour analyse"""
+        if self._dead_letters is None:
+            key = f"{self.key}{READING_EVENTS_DEAD_LETTER_SUFFIX}"
+            self._dead_letters = RedisEventQueue(key) if _uses_redis() else LocalEventQueue()
+        return self._dead_letters
+
+    def enqueue(self, user, events: List[dict]) -> int:
+        """
+        Ajouter des événements validés à la file.
+
+        Chaque événement contient `session_id`, `page_number`,
+        `position_in_page`, `time_spent` (secondes), `chapter_title` et
+        `occurred_at` (horodatage client, facultatif).
+        """
+        received_at = timezone.now()
+        payload = [
+            {
+                'user_id': user.id,
+                'session_id': str(event['session_id']),
+                'page_number': event['page_number'],
+                'position_in_page': event.get('position_in_page', 0.0),
+                'time_spent': event.get('time_spent', 0),
+                'chapter_title': event.get('chapter_title', ''),
+                'occurred_at': (event.get('occurred_at') or received_at).isoformat(),
+            }
+            for event in events
+        ]
+        if not payload:
+            return 0
+
+        self.queue.push(payload)
+        if self.queue.should_flush():
+            self.flush()
+        return len(payload)
+
+    def flush(self, max_batches: int = None) -> Dict[str, int]:
+        """Traiter la file par lots jusqu'à ce qu'elle soit vide"""
+        stats = {'events': 0, 'sessions': 0, 'users': 0}
+        if not self._flush_lock.acquire(blocking=False):
+            return stats
+        try:
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                events = self.queue.pop(READING_EVENTS_BATCH_SIZE)
+                if not events:
+                    break
+                batches += 1
+                attempts = max(event.get('attempts', 0) for event in events)
+                if attempts >= READING_EVENTS_MAX_ATTEMPTS:
+                    # Lot en échec répété : isoler les sessions fautives
+                    processed = self._process_isolated(events)
+                else:
+                    try:
+                        processed = self.process(events)
+                    except Exception:
+                        for event in events:
+                            event['attempts'] = event.get('attempts', 0) + 1
+                        self.queue.requeue(events)
+                        raise
+                for name, value in processed.items():
+                    stats[name] = stats.get(name, 0) + value
+        finally:
+            self._flush_lock.release()
+        return stats
+
+    def _process_isolated(self, events: List[dict]) -> Dict[str, int]:
+        """Appliquer un lot session par session ; les sessions en échec vont en lettres mortes"""
+        by_session = defaultdict(list)
+        for event in events:
+            by_session[event['session_id']].append(event)
+
+        stats = {'events': 0, 'sessions': 0, 'users': 0}
+        for session_id, session_events in by_session.items():
+            try:
+                processed = self.process(session_events)
+            except Exception as e:
+                logger.error(
+                    f"{len(session_events)} événements de la session {session_id} "
+                    f"déplacés en lettres mortes: {e}"
+                )
+                self.dead_letters.push(session_events)
+                stats['dead_lettered'] = stats.get('dead_lettered', 0) + len(session_events)
+                continue
+            for name, value in processed.items():
+                stats[name] += value
+        return stats
+
+    def process(self, events: List[dict]) -> Dict[str, int]:
+        """Appliquer un lot d'événements, regroupés par session"""
+        by_session = defaultdict(list)
+        for event in events:
+            by_session[event['session_id']].append(event)
+
+        sessions = {
+            str(session_id): session
+            for session_id, session in ReadingSession.objects.in_bulk(list(by_session)).items()
+        }
+        page_counts = self._page_counts({session.book_uuid for session in sessions.values()})
+        now = timezone.now()
+
+        progress_entries = []
+        progress_keys = []
+        updated_sessions = []
+        milestones = []
+        for session_id, session_events in by_session.items():
+            session = sessions.get(session_id)
+            if session is None:
+                logger.warning(f"Événements ignorés pour une session inconnue: {session_id}")
+                continue
+
+            # Les événements d'une autre personne que le propriétaire sont ignorés
+            session_events = [e for e in session_events if e['user_id'] == session.user_id]
+            if not session_events:
+                continue
+            # Les lots hors ligne peuvent arriver dans le désordre
+            session_events.sort(key=lambda e: parse_datetime(e['occurred_at']))
+
+            previous_total = session.total_pages_read
+            for event in session_events:
+                page_number = event['page_number']
+                if page_number > session.current_page:
+                    session.total_pages_read += page_number - session.current_page
+                session.current_page = page_number
+                session.total_reading_time += timedelta(seconds=event['time_spent'])
+                # Moment de la lecture (borné à maintenant : horloges client en avance)
+                occurred_at = min(parse_datetime(event['occurred_at']), now)
+                progress_entries.append(ReadingProgress(
+                    session_id=session.id,
+                    page_number=page_number,
+                    position_in_page=event['position_in_page'],
+                    chapter_title=event['chapter_title'],
+                    time_spent=timedelta(seconds=event['time_spent']),
+                    timestamp=occurred_at,
+                ))
+                progress_keys.append((session.user_id, timezone.localdate(occurred_at)))
+
+            page_count = page_counts.get(session.book_uuid)
+            if page_count:
+                session.current_position = min(session.current_page / page_count * 100, 100.0)
+            last_activity = parse_datetime(session_events[-1]['occurred_at'])
+            session.last_activity = min(last_activity, now)
+            session.updated_at = now
+            updated_sessions.append(session)
+            milestones.append((session, previous_total))
+
+        # Les écritures d'un lot sont validées ou annulées ensemble : `flush`
+        # ne remet le lot en file qu'après une annulation, sans doublon
+        user_ids = {session.user_id for session in updated_sessions}
+        with transaction.atomic(using=router.db_for_write(ReadingProgress)):
+            ReadingProgress.objects.bulk_create(progress_entries, batch_size=1000)
+            ReadingSession.objects.bulk_update(updated_sessions, SESSION_UPDATE_FIELDS, batch_size=500)
+
+            # Cumuls quotidiens, au jour où la lecture a eu lieu (lots hors ligne)
+            deltas = defaultdict(lambda: {'pages_read': 0, 'reading_seconds': 0})
+            for entry, key in zip(progress_entries, progress_keys):
+                deltas[key]['pages_read'] += 1
+                deltas[key]['reading_seconds'] += int(entry.time_spent.total_seconds())
+            DailyReadingRollup.record(deltas)
+
+            users = User.objects.in_bulk(user_ids)
+            for user in users.values():
+                update_reading_goals(user)
+
+        # Effets hors base après validation : un échec ne doit pas rejouer le lot
+        try:
+            tagged_cache.invalidate(*[user_tag(user_id) for user_id in users])
+            for session in updated_sessions:
+                session.user = users[session.user_id]
+            for session, previous_total in milestones:
+                notify_page_milestones(session, previous_total)
+        except Exception as e:
+            logger.error(f"Erreur après l'ingestion d'un lot de progression: {e}")
+
+        return {
+            'events': len(progress_entries),
+            'sessions': len(updated_sessions),
+            'users': len(user_ids),
+        }
+
+    def _page_counts(self, book_uuids) -> Dict:
+        """Nombre de pages des livres (catalogue), en une requête"""
+        if not book_uuids:
+            return {}
+        from catalog_service.models import Book
+        try:
+            return dict(Book.objects.filter(id__in=book_uuids).order_by().values_list('id', 'page_count'))
+        except Exception as e:
+            logger.warning(f"Nombre de pages indisponible: {str(e)}")
+            return {}
+
+
+reading_ingestor = ReadingProgressIngestor()
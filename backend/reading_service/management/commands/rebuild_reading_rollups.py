@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import time
+
+from reading_service.models import DailyReadingRollup
+from reading_service.utils import update_reading_goals
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Reconstruire les cumuls quotidiens de lecture depuis les données brutes'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            action='append',
+            dest='user_ids',
+            help='Limiter la reconstruction à un utilisateur (option répétable)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Ne reconstruire que les N derniers jours (défaut: tout l\'historique)'
+        )
+        parser.add_argument(
+            '--skip-goals',
+            action='store_true',
+            help='Ne pas recalculer les objectifs actifs après la reconstruction'
+        )
+    
+    def handle(self, *args, **options):
+        self.verbosity = options.get('verbosity', 1)
+        start_time = time.monotonic()
+        
+        user_ids = options.get('user_ids')
+        since = None
+        if options.get('days'):
+            since = timezone.localdate() - timedelta(days=options['days'] - 1)
+        
+        try:
+            rebuilt = DailyReadingRollup.rebuild(user_ids=user_ids, since=since)
+        except Exception as e:
+            logger.error(f"Erreur lors de la reconstruction des cumuls de lecture: {str(e)}")
+            raise CommandError(f"Erreur: {str(e)}")
+        
+        self._log_success(
+            f"✓ {rebuilt} cumuls quotidiens reconstruits en {time.monotonic() - start_time:.2f}s"
+        )
+        
+        if options['skip_goals']:
+            return
+        
+        users = User.objects.filter(reading_goals__status='active').distinct()
+        if user_ids:
+            users = users.filter(id__in=user_ids)
+        count = 0
+        for user in users.iterator():
+            update_reading_goals(user)
+            count += 1
+        
+        self._log_success(f"✓ Objectifs recalculés pour {count} utilisateurs")
+    
+    def _log_success(self, message: str):
+        """Logger un message de succès"""
+        if self.verbosity >= 1:
+            self.stdout.write(self.style.SUCCESS(message))
+        
+        logger.info(message)
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import TruncDate
+
+
+def populate_daily_rollups(apps, schema_editor):
+    """Initialiser les cumuls quotidiens à partir de la progression existante"""
+    DailyReadingRollup = apps.get_model("reading_service", "DailyReadingRollup")
+    ReadingProgress = apps.get_model("reading_service", "ReadingProgress")
+    ReadingSession = apps.get_model("reading_service", "ReadingSession")
+    db_alias = schema_editor.connection.alias
+
+    rows = {}
+    for entry in (
+        ReadingProgress.objects.using(db_alias)
+        .annotate(day=TruncDate("timestamp"))
+        .values("session__user_id", "day")
+        .annotate(pages=models.Count("id"), time=models.Sum("time_spent"))
+        .order_by()
+    ):
+        rows[(entry["session__user_id"], entry["day"])] = DailyReadingRollup(
+            user_id=entry["session__user_id"],
+            date=entry["day"],
+            pages_read=entry["pages"],
+            reading_seconds=int(entry["time"].total_seconds()) if entry["time"] else 0,
+        )
+
+    for entry in (
+        ReadingSession.objects.using(db_alias)
+        .filter(status="completed", end_time__isnull=False)
+        .annotate(day=TruncDate("end_time"))
+        .values("user_id", "day")
+        .annotate(books=models.Count("id"))
+        .order_by()
+    ):
+        key = (entry["user_id"], entry["day"])
+        rows.setdefault(key, DailyReadingRollup(user_id=key[0], date=key[1]))
+        rows[key].books_completed = entry["books"]
+
+    DailyReadingRollup.objects.using(db_alias).bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("reading_service", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyReadingRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("pages_read", models.PositiveIntegerField(default=0)),
+                ("reading_seconds", models.PositiveIntegerField(default=0)),
+                ("books_completed", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_reading_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "reading_daily_rollups",
+                "ordering": ["-date"],
+                "unique_together": {("user", "date")},
+            },
+        ),
+        migrations.RunPython(populate_daily_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-16 21:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reading_service", "0002_daily_reading_rollups"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="readingprogress",
+            name="timestamp",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
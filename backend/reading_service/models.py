@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Greatest, TruncDate
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
+from collections import defaultdict
 import uuid
 
 User = get_user_model()
@@ -123,8 +126,8 @@ class ReadingProgress(models.Model):
     # Temps passé sur cette page
     time_spent = models.DurationField(default=timezone.timedelta)
     
-    # Métadonnées
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Métadonnées (moment de la lecture, transmis par l'ingestion groupée)
+    timestamp = models.DateTimeField(default=timezone.now)
     
     class Meta:
         db_table = 'reading_progress'
@@ -297,57 +300,165 @@ class ReadingGoal(models.Model):
             return max(remaining / self.days_remaining, 0)
         return 0
     
-    def update_progress(self):
-        """Met à jour la progression de l'objectif"""
-        today = timezone.now().date()
-        
+    def period_start(self, today=None):
+        """Premier jour compté par l'objectif (None si non calculé depuis les cumuls)"""
+        today = today or timezone.localdate()
         if self.goal_type == 'books_per_year':
-            # Compter les livres terminés cette année
-            year_start = today.replace(month=1, day=1)
-            completed_books = ReadingSession.objects.filter(
-                user=self.user,
-                status='completed',
-                end_time__date__gte=year_start,
-                end_time__date__lte=today
-            ).count()
-            self.current_value = completed_books
-            
-        elif self.goal_type == 'books_per_month':
-            # Compter les livres terminés ce mois
-            month_start = today.replace(day=1)
-            completed_books = ReadingSession.objects.filter(
-                user=self.user,
-                status='completed',
-                end_time__date__gte=month_start,
-                end_time__date__lte=today
-            ).count()
-            self.current_value = completed_books
-            
-        elif self.goal_type == 'pages_per_day':
-            # Compter les pages lues aujourd'hui
-            pages_today = ReadingProgress.objects.filter(
-                session__user=self.user,
-                timestamp__date=today
-            ).count()
-            self.current_value = pages_today
-            
-        elif self.goal_type == 'minutes_per_day':
-            # Calculer le temps de lecture aujourd'hui
-            sessions_today = ReadingSession.objects.filter(
-                user=self.user,
-                last_activity__date=today
-            )
-            total_minutes = sum(
-                session.total_reading_time.total_seconds() / 60 
-                for session in sessions_today
+            return today.replace(month=1, day=1)
+        if self.goal_type == 'books_per_month':
+            return today.replace(day=1)
+        if self.goal_type in ('pages_per_day', 'minutes_per_day'):
+            return today
+        return None
+    
+    def compute_progress(self, rollups, today=None):
+        """
+        Valeur de l'objectif à partir des cumuls quotidiens
+        
+        `rollups` associe une date à un `DailyReadingRollup` et doit couvrir
+        la période de l'objectif.
+        """
+        today = today or timezone.localdate()
+        start = self.period_start(today)
+        if start is None:
+            return self.current_value
+        
+        days = [rollup for day, rollup in rollups.items() if start <= day <= today]
+        if self.goal_type in ('books_per_year', 'books_per_month'):
+            return sum(rollup.books_completed for rollup in days)
+        if self.goal_type == 'pages_per_day':
+            return sum(rollup.pages_read for rollup in days)
+        return sum(rollup.reading_seconds for rollup in days) // 60
+    
+    def update_progress(self, rollups=None):
+        """Met à jour la progression de l'objectif depuis les cumuls quotidiens"""
+        today = timezone.localdate()
+        if rollups is None:
+            start = self.period_start(today) or today
+            rollups = DailyReadingRollup.for_period(self.user_id, start, today)
+        
+        current_value = self.compute_progress(rollups, today)
+        status = self.status
+        if current_value >= self.target_value and status == 'active':
+            status = 'completed'
+        
+        # Pas d'écriture (ni de signal) si rien n'a changé
+        if current_value == self.current_value and status == self.status:
+            return False
+        
+        self.current_value = current_value
+        self.status = status
+        self.save(update_fields=['current_value', 'status', 'updated_at'])
+        return True
+
+
+class DailyReadingRollup(models.Model):
+    """
+    Cumuls de lecture par utilisateur et par jour
+    
+    Tenus à jour par incréments (progression, sessions terminées) afin que
+    les objectifs se calculent sans recompter les données brutes ; la
+    commande `rebuild_reading_rollups` les reconstruit depuis ces données.
+    """
+    
+    COUNTER_FIELDS = ('pages_read', 'reading_seconds', 'books_completed')
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_reading_rollups')
+    date = models.DateField()
+    
+    pages_read = models.PositiveIntegerField(default=0)
+    reading_seconds = models.PositiveIntegerField(default=0)
+    books_completed = models.PositiveIntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'reading_daily_rollups'
+        unique_together = ['user', 'date']
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.date}"
+    
+    @property
+    def minutes_read(self):
+        return self.reading_seconds // 60
+    
+    @classmethod
+    def for_period(cls, user_id, start, end):
+        """Cumuls d'un utilisateur entre deux dates, indexés par date"""
+        return {
+            rollup.date: rollup
+            for rollup in cls.objects.filter(user_id=user_id, date__gte=start, date__lte=end)
+        }
+    
+    @classmethod
+    def record(cls, deltas):
+        """
+        Appliquer des incréments (éventuellement négatifs)
+        
+        `deltas` associe `(user_id, date)` à un dict de champs parmi
+        `COUNTER_FIELDS`. Une insertion groupée crée les lignes manquantes,
+        puis un UPDATE atomique par jour et par utilisateur.
+        """
+        deltas = {
+            key: {field: value for field, value in values.items() if value}
+            for key, values in deltas.items()
+        }
+        deltas = {key: values for key, values in deltas.items() if values}
+        if not deltas:
+            return
+        
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, date=day) for user_id, day in deltas],
+            ignore_conflicts=True
+        )
+        now = timezone.now()
+        for (user_id, day), values in deltas.items():
+            cls.objects.filter(user_id=user_id, date=day).update(
+                updated_at=now,
+                **{field: Greatest(F(field) + value, Value(0)) for field, value in values.items()}
             )
-            self.current_value = int(total_minutes)
+    
+    @classmethod
+    def rebuild(cls, user_ids=None, since=None):
+        """Reconstruire les cumuls depuis la progression et les sessions terminées"""
+        rows = defaultdict(lambda: cls())
         
-        # Vérifier si l'objectif est atteint
-        if self.is_completed and self.status == 'active':
-            self.status = 'completed'
+        progress = ReadingProgress.objects.all()
+        sessions = ReadingSession.objects.filter(status='completed', end_time__isnull=False)
+        existing = cls.objects.all()
+        if user_ids is not None:
+            progress = progress.filter(session__user_id__in=user_ids)
+            sessions = sessions.filter(user_id__in=user_ids)
+            existing = existing.filter(user_id__in=user_ids)
+        if since is not None:
+            progress = progress.filter(timestamp__date__gte=since)
+            sessions = sessions.filter(end_time__date__gte=since)
+            existing = existing.filter(date__gte=since)
         
-        self.save()
+        progress_totals = progress.annotate(day=TruncDate('timestamp')).values(
+            'session__user_id', 'day'
+        ).annotate(pages=Count('id'), time=Sum('time_spent')).order_by()
+        for entry in progress_totals:
+            rollup = rows[(entry['session__user_id'], entry['day'])]
+            rollup.pages_read = entry['pages']
+            rollup.reading_seconds = int(entry['time'].total_seconds()) if entry['time'] else 0
+        
+        completed_totals = sessions.annotate(day=TruncDate('end_time')).values(
+            'user_id', 'day'
+        ).annotate(books=Count('id')).order_by()
+        for entry in completed_totals:
+            rows[(entry['user_id'], entry['day'])].books_completed = entry['books']
+        
+        for (user_id, day), rollup in rows.items():
+            rollup.user_id = user_id
+            rollup.date = day
+        
+        with transaction.atomic(using=router.db_for_write(cls)):
+            existing.delete()
+            cls.objects.bulk_create(rows.values(), batch_size=1000)
+        return len(rows)
 
 
 class ReadingStatistics(models.Model):
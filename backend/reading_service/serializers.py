@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from datetime import timedelta
 from .models import (
     ReadingSession, ReadingProgress, Bookmark, 
     ReadingGoal, ReadingStatistics
@@ -86,6 +87,45 @@ class ReadingProgressSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'timestamp']
 
 
+class ReadingEventSerializer(serializers.Serializer):
+    """Sérialiseur pour un événement de changement de page"""
+    
+    session_id = serializers.UUIDField()
+    page_number = serializers.IntegerField(min_value=1)
+    position_in_page = serializers.FloatField(min_value=0.0, max_value=1.0, default=0.0)
+    time_spent = serializers.IntegerField(min_value=0, max_value=86400, default=0)  # en secondes
+    chapter_title = serializers.CharField(max_length=200, allow_blank=True, default='')
+    occurred_at = serializers.DateTimeField(required=False)  # horodatage client (hors ligne)
+    
+    def validate_occurred_at(self, value):
+        if value > timezone.now() + timedelta(minutes=5):
+            raise serializers.ValidationError("L'horodatage ne peut pas être dans le futur.")
+        return value
+
+
+class ReadingEventBatchSerializer(serializers.Serializer):
+    """Sérialiseur pour un lot d'événements de lecture"""
+    
+    MAX_EVENTS = 500
+    
+    events = ReadingEventSerializer(many=True, allow_empty=False, max_length=MAX_EVENTS)
+    
+    def validate_events(self, events):
+        """Toutes les sessions du lot doivent appartenir à l'utilisateur"""
+        session_ids = {event['session_id'] for event in events}
+        owned = set(ReadingSession.objects.filter(
+            id__in=session_ids,
+            user=self.context['request'].user
+        ).values_list('id', flat=True))
+        
+        unknown = session_ids - owned
+        if unknown:
+            raise serializers.ValidationError(
+                f"Sessions de lecture inconnues: {', '.join(sorted(str(pk) for pk in unknown))}"
+            )
+        return events
+
+
 class BookmarkSerializer(serializers.ModelSerializer):
     """Sérialiseur pour les signets"""
     
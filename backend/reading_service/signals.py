@@ -1,16 +1,18 @@
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
 from django.dispatch import receiver, Signal
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.core.cache import cache
 from django.core.mail import send_mail
 from django.conf import settings
 from datetime import timedelta
 import logging
 
+from coko.cache_tags import tagged_cache, user_tag
 from .models import (
     ReadingSession, ReadingProgress, Bookmark, 
-    ReadingGoal, ReadingStatistics
+    ReadingGoal, ReadingStatistics, DailyReadingRollup
 )
 from .utils import update_reading_goals, calculate_reading_statistics
 
@@ -23,39 +25,82 @@ goal_completed = Signal()
 reading_streak_updated = Signal()
 
 
+def _completion_day(status, end_time):
+    """Jour compté pour un livre terminé (None si la session n'est pas terminée)"""
+    if status == 'completed' and end_time:
+        return timezone.localdate(end_time)
+    return None
+
+
+@receiver(pre_save, sender=ReadingSession)
+def track_reading_session_completion(sender, instance, **kwargs):
+    """Mémorise le jour de fin avant sauvegarde pour les cumuls quotidiens"""
+    instance._previous_completion_day = None
+    if instance._state.adding:
+        return
+    previous = ReadingSession.objects.filter(pk=instance.pk).values('status', 'end_time').first()
+    if previous:
+        instance._previous_completion_day = _completion_day(previous['status'], previous['end_time'])
+
+
 @receiver(post_save, sender=ReadingSession)
 def handle_reading_session_save(sender, instance, created, **kwargs):
     """Gère la sauvegarde des sessions de lecture"""
     
+    previous_day = getattr(instance, '_previous_completion_day', None)
+    completion_day = _completion_day(instance.status, instance.end_time)
+    
+    if completion_day != previous_day:
+        # Livre terminé (ou plus terminé) : ajuster les cumuls quotidiens
+        deltas = {}
+        if previous_day:
+            deltas[(instance.user_id, previous_day)] = {'books_completed': -1}
+        if completion_day:
+            deltas[(instance.user_id, completion_day)] = {'books_completed': 1}
+        DailyReadingRollup.record(deltas)
+        
+        # Mettre à jour les objectifs de lecture
+        update_reading_goals(instance.user)
+        
+        # Invalider le cache des statistiques
+        tagged_cache.invalidate(user_tag(instance.user_id))
+    
     if created:
         logger.info(f"Nouvelle session de lecture créée: {instance.user.username} - {instance.book_title}")
         
         # Invalider le cache des statistiques
-        cache_key = f"reading_stats_{instance.user.id}"
-        cache.delete(cache_key)
+        tagged_cache.invalidate(user_tag(instance.user_id))
         
-        # Mettre à jour les objectifs de lecture
-        update_reading_goals(instance.user)
+    elif completion_day and not previous_day:
+        # Session qui vient d'être terminée
+        logger.info(f"Lecture terminée: {instance.user.username} - {instance.book_title}")
         
-    else:
-        # Session mise à jour
-        if instance.status == 'completed' and instance.end_time:
-            logger.info(f"Lecture terminée: {instance.user.username} - {instance.book_title}")
-            
-            # Envoyer le signal de milestone
-            reading_milestone_reached.send(
-                sender=ReadingSession,
-                user=instance.user,
-                session=instance,
-                milestone_type='book_completed'
-            )
-            
-            # Mettre à jour les objectifs
-            update_reading_goals(instance.user)
-            
-            # Invalider le cache
-            cache_key = f"reading_stats_{instance.user.id}"
-            cache.delete(cache_key)
+        # Envoyer le signal de milestone
+        reading_milestone_reached.send(
+            sender=ReadingSession,
+            user=instance.user,
+            session=instance,
+            milestone_type='book_completed'
+        )
+
+
+@receiver(pre_delete, sender=ReadingSession)
+def collect_reading_session_rollups(sender, instance, **kwargs):
+    """Calcule, avant la suppression en cascade, ce que la session retire des cumuls"""
+    deltas = {}
+    progress_totals = instance.progress_entries.annotate(
+        day=TruncDate('timestamp')
+    ).values('day').annotate(pages=Count('id'), time=Sum('time_spent')).order_by()
+    for entry in progress_totals:
+        deltas[(instance.user_id, entry['day'])] = {
+            'pages_read': -entry['pages'],
+            'reading_seconds': -int(entry['time'].total_seconds()) if entry['time'] else 0,
+        }
+    
+    completion_day = _completion_day(instance.status, instance.end_time)
+    if completion_day:
+        deltas.setdefault((instance.user_id, completion_day), {})['books_completed'] = -1
+    instance._rollup_deltas = deltas
 
 
 @receiver(post_delete, sender=ReadingSession)
@@ -64,22 +109,48 @@ def handle_reading_session_delete(sender, instance, **kwargs):
     
     logger.info(f"Session de lecture supprimée: {instance.user.username} - {instance.book_title}")
     
+    # Retirer la session des cumuls quotidiens
+    DailyReadingRollup.record(getattr(instance, '_rollup_deltas', {}))
+    
     # Invalider le cache des statistiques
-    cache_key = f"reading_stats_{instance.user.id}"
-    cache.delete(cache_key)
+    tagged_cache.invalidate(user_tag(instance.user_id))
     
     # Mettre à jour les objectifs
     update_reading_goals(instance.user)
 
 
+PAGE_MILESTONES = [50, 100, 250, 500, 1000]
+
+
+def notify_page_milestones(session, previous_total):
+    """Émettre le milestone de pages franchi depuis `previous_total`, s'il y en a un"""
+    total_pages = session.total_pages_read
+    for milestone in PAGE_MILESTONES:
+        if total_pages >= milestone and previous_total < milestone:
+            reading_milestone_reached.send(
+                sender=ReadingProgress,
+                user=session.user,
+                session=session,
+                milestone_type='pages_read',
+                milestone_value=milestone
+            )
+            break
+
+
 @receiver(post_save, sender=ReadingProgress)
 def handle_reading_progress_save(sender, instance, created, **kwargs):
-    """Gère la sauvegarde de la progression de lecture"""
+    """
+    Gère la sauvegarde unitaire de la progression de lecture
+
+    Les entrées créées par l'ingestion groupée (`bulk_create`) ne passent
+    pas par ce signal : la session est mise à jour par le worker.
+    """
     
     if created:
         # Mettre à jour la session associée
         session = instance.session
         session.last_activity = timezone.now()
+        previous_total = session.total_pages_read
         
         # Incrémenter le nombre total de pages lues
         if instance.page_number > session.current_page:
@@ -93,20 +164,16 @@ def handle_reading_progress_save(sender, instance, created, **kwargs):
         
         session.save()
         
-        # Vérifier les milestones de pages
-        total_pages = session.total_pages_read
-        milestones = [50, 100, 250, 500, 1000]
+        # Cumuls quotidiens : une page de plus et le temps passé
+        DailyReadingRollup.record({
+            (session.user_id, timezone.localdate(instance.timestamp)): {
+                'pages_read': 1,
+                'reading_seconds': int(instance.time_spent.total_seconds()) if instance.time_spent else 0,
+            }
+        })
         
-        for milestone in milestones:
-            if total_pages >= milestone and (total_pages - pages_read) < milestone:
-                reading_milestone_reached.send(
-                    sender=ReadingProgress,
-                    user=session.user,
-                    session=session,
-                    milestone_type='pages_read',
-                    milestone_value=milestone
-                )
-                break
+        # Vérifier les milestones de pages
+        notify_page_milestones(session, previous_total)
 
 
 @receiver(post_save, sender=Bookmark)
@@ -0,0 +1,25 @@
+from celery import shared_task
+import logging
+
+from .ingestion import reading_ingestor
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def flush_reading_progress(max_batches: int = 20):
+    """
+    Appliquer les événements de lecture en file : progression écrite en
+    groupe, sessions et objectifs mis à jour une fois par vidage
+    """
+    try:
+        stats = reading_ingestor.flush(max_batches=max_batches)
+        if stats['events']:
+            logger.info(
+                f"Progression de lecture ingérée: {stats['events']} événements, "
+                f"{stats['sessions']} sessions, {stats['users']} utilisateurs"
+            )
+        return {'success': True, **stats}
+    except Exception as e:
+        logger.error(f"Erreur lors de l'ingestion de la progression de lecture: {str(e)}")
+        return {'success': False, 'error': str(e)}
@@ -6,17 +6,23 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from datetime import datetime, timedelta
 from decimal import Decimal
+import uuid
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError
 
 from catalog_service.models import Book, Author, Publisher, Category
 from .models import (
     ReadingSession, ReadingProgress, Bookmark, 
-    ReadingGoal, ReadingStatistics
+    ReadingGoal, ReadingStatistics, DailyReadingRollup
 )
 from .utils import (
     calculate_reading_statistics, calculate_reading_consistency,
     get_reading_recommendations, update_reading_goals,
     generate_reading_insights, calculate_reading_streak
 )
+from .ingestion import READING_EVENTS_MAX_ATTEMPTS, reading_ingestor
 
 User = get_user_model()
 
@@ -304,6 +310,93 @@ class ReadingGoalModelTest(TestCase):
         self.assertEqual(goal.progress_percentage, 100.0)
 
 
+class DailyReadingRollupTest(TestCase):
+    """Tests pour les cumuls quotidiens et le calcul incrémental des objectifs"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='rollup',
+            email='rollup@example.com',
+            password='testpass123'
+        )
+        self.today = timezone.localdate()
+        self.session = ReadingSession.objects.create(
+            user=self.user,
+            book_uuid=uuid.uuid4(),
+            book_title='Livre'
+        )
+        self.pages_goal = ReadingGoal.objects.create(
+            user=self.user,
+            title='20 pages par jour',
+            goal_type='pages_per_day',
+            target_value=20,
+            start_date=self.today,
+            end_date=self.today + timedelta(days=30)
+        )
+        self.books_goal = ReadingGoal.objects.create(
+            user=self.user,
+            title='Deux livres cette année',
+            goal_type='books_per_year',
+            target_value=2,
+            start_date=self.today,
+            end_date=self.today + timedelta(days=365)
+        )
+    
+    def _rollup(self):
+        return DailyReadingRollup.objects.get(user=self.user, date=self.today)
+    
+    def test_progress_and_completion_are_recorded_as_deltas(self):
+        """La progression et les livres terminés alimentent les cumuls du jour"""
+        for page in (2, 3, 4):
+            ReadingProgress.objects.create(
+                session=self.session, page_number=page, time_spent=timedelta(seconds=45)
+            )
+        self.session.mark_as_completed()
+        self.session.save()  # une seconde sauvegarde ne compte pas deux fois
+        
+        rollup = self._rollup()
+        self.assertEqual(rollup.pages_read, 3)
+        self.assertEqual(rollup.reading_seconds, 135)
+        self.assertEqual(rollup.books_completed, 1)
+        
+        update_reading_goals(self.user)
+        self.pages_goal.refresh_from_db()
+        self.books_goal.refresh_from_db()
+        self.assertEqual(self.pages_goal.current_value, 3)
+        self.assertEqual(self.books_goal.current_value, 1)
+    
+    def test_goal_update_does_not_scan_raw_data(self):
+        """Le calcul des objectifs ne lit que les objectifs et les cumuls"""
+        DailyReadingRollup.record({(self.user.id, self.today): {'pages_read': 25}})
+        
+        with self.assertNumQueries(3):  # objectifs, cumuls, mise à jour de l'objectif atteint
+            update_reading_goals(self.user)
+        
+        self.pages_goal.refresh_from_db()
+        self.assertEqual(self.pages_goal.status, 'completed')
+    
+    def test_session_delete_removes_its_contribution(self):
+        """Supprimer une session retire ses pages et son livre des cumuls"""
+        ReadingProgress.objects.create(session=self.session, page_number=2)
+        self.session.mark_as_completed()
+        self.session.delete()
+        
+        rollup = self._rollup()
+        self.assertEqual((rollup.pages_read, rollup.books_completed), (0, 0))
+    
+    def test_rebuild_reconciles_with_raw_data(self):
+        """La reconstruction corrige les cumuls qui ont dérivé"""
+        ReadingProgress.objects.create(session=self.session, page_number=2)
+        DailyReadingRollup.objects.filter(user=self.user).update(pages_read=99, books_completed=4)
+        
+        call_command('rebuild_reading_rollups', verbosity=0)
+        
+        rollup = self._rollup()
+        self.assertEqual((rollup.pages_read, rollup.books_completed), (1, 0))
+        self.pages_goal.refresh_from_db()
+        self.assertEqual(self.pages_goal.current_value, 1)
+
+
 class ReadingStatisticsModelTest(TestCase):
     """Tests pour le modèle ReadingStatistics"""
     
@@ -460,6 +553,152 @@ class ReadingUtilsTest(TestCase):
         self.assertIn('preferred_times', insights)
 
 
+class ReadingEventIngestionTest(APITestCase):
+    """Tests pour l'ingestion groupée des événements de lecture"""
+    
+    def setUp(self):
+        reading_ingestor.flush()
+        self.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='testpass123'
+        )
+        self.book = Book.objects.create(title='Livre suivi', status='published', page_count=200)
+        self.session = ReadingSession.objects.create(
+            user=self.user,
+            book_uuid=self.book.id,
+            book_title=self.book.title
+        )
+        self.url = reverse('reading_service:progress-events')
+        self.client.force_authenticate(user=self.user)
+    
+    def _event(self, page, minutes_ago, time_spent=30):
+        return {
+            'session_id': str(self.session.id),
+            'page_number': page,
+            'time_spent': time_spent,
+            'occurred_at': (timezone.now() - timedelta(minutes=minutes_ago)).isoformat()
+        }
+    
+    def test_batch_is_queued_then_coalesced_per_session(self):
+        """Un lot est accepté sans écriture puis appliqué en une passe"""
+        # Envoyés dans le désordre, comme une synchronisation hors ligne
+        events = [self._event(4, 1), self._event(2, 3), self._event(3, 2)]
+        response = self.client.post(self.url, {'events': events}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['accepted'], 3)
+        self.assertFalse(ReadingProgress.objects.filter(session=self.session).exists())
+        
+        stats = reading_ingestor.flush()
+        self.assertEqual(stats, {'events': 3, 'sessions': 1, 'users': 1})
+        
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.current_page, 4)
+        self.assertEqual(self.session.total_pages_read, 3)
+        self.assertEqual(self.session.total_reading_time, timedelta(seconds=90))
+        self.assertEqual(self.session.current_position, 2.0)
+        self.assertEqual(
+            list(ReadingProgress.objects.filter(session=self.session)
+                 .order_by('page_number').values_list('page_number', flat=True)),
+            [2, 3, 4]
+        )
+    
+    def test_flush_query_count_does_not_grow_with_events(self):
+        """Le nombre de requêtes ne dépend pas du nombre d'événements"""
+        reading_ingestor.enqueue(self.user, [
+            {'session_id': self.session.id, 'page_number': page} for page in range(2, 5)
+        ])
+        # Dont la paire SAVEPOINT / RELEASE de la transaction du lot
+        with self.assertNumQueries(10):
+            reading_ingestor.flush()
+        
+        reading_ingestor.enqueue(self.user, [
+            {'session_id': self.session.id, 'page_number': page} for page in range(5, 105)
+        ])
+        with self.assertNumQueries(10):
+            reading_ingestor.flush()
+    
+    def test_failed_batch_is_rolled_back_then_requeued(self):
+        """Un lot en échec n'écrit rien et est rejoué une seule fois"""
+        reading_ingestor.enqueue(self.user, [
+            {'session_id': self.session.id, 'page_number': page} for page in (2, 3)
+        ])
+        with patch.object(DailyReadingRollup, 'record', side_effect=DatabaseError('indisponible')):
+            with self.assertRaises(DatabaseError):
+                reading_ingestor.flush()
+        
+        self.assertFalse(ReadingProgress.objects.filter(session=self.session).exists())
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.current_page, 1)
+        
+        self.assertEqual(reading_ingestor.flush()['events'], 2)
+        self.assertEqual(ReadingProgress.objects.filter(session=self.session).count(), 2)
+    
+    def test_poison_batch_is_isolated_after_repeated_failures(self):
+        """Après plusieurs échecs, seule la session fautive part en lettres mortes"""
+        other_session = ReadingSession.objects.create(
+            user=self.user,
+            book_uuid=self.book.id,
+            book_title=self.book.title
+        )
+        reading_ingestor.enqueue(self.user, [
+            {'session_id': self.session.id, 'page_number': 2},
+            {'session_id': other_session.id, 'page_number': 3},
+        ])
+        bulk_update = ReadingSession.objects.bulk_update
+        
+        def fail_for_poison(sessions, *args, **kwargs):
+            if any(session.id == other_session.id for session in sessions):
+                raise IntegrityError('session supprimée')
+            return bulk_update(sessions, *args, **kwargs)
+        
+        with patch.object(ReadingSession.objects, 'bulk_update', side_effect=fail_for_poison):
+            for _ in range(READING_EVENTS_MAX_ATTEMPTS):
+                with self.assertRaises(IntegrityError):
+                    reading_ingestor.flush()
+            stats = reading_ingestor.flush()
+        
+        self.assertEqual(stats['events'], 1)
+        self.assertEqual(stats['dead_lettered'], 1)
+        self.assertEqual(len(reading_ingestor.queue), 0)
+        self.assertEqual(reading_ingestor.dead_letters.pop(10)[0]['session_id'], str(other_session.id))
+        self.assertEqual(ReadingProgress.objects.filter(session=self.session).count(), 1)
+    
+    def test_offline_events_are_rolled_up_on_the_day_they_happened(self):
+        """Un lot synchronisé après coup alimente le cumul du jour de lecture"""
+        two_days_ago = timezone.now() - timedelta(days=2)
+        reading_ingestor.enqueue(self.user, [
+            {'session_id': self.session.id, 'page_number': 2, 'time_spent': 60, 'occurred_at': two_days_ago},
+            {'session_id': self.session.id, 'page_number': 3, 'time_spent': 30},
+        ])
+        reading_ingestor.flush()
+        
+        rollups = dict(DailyReadingRollup.objects.filter(user=self.user).values_list('date', 'reading_seconds'))
+        self.assertEqual(rollups, {
+            timezone.localdate(two_days_ago): 60,
+            timezone.localdate(): 30,
+        })
+        DailyReadingRollup.rebuild(user_ids=[self.user.id])
+        self.assertEqual(
+            dict(DailyReadingRollup.objects.filter(user=self.user).values_list('date', 'reading_seconds')),
+            rollups
+        )
+    
+    def test_foreign_session_is_rejected(self):
+        """Un lot visant la session d'un autre utilisateur est refusé"""
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.post(self.url, {'events': [self._event(2, 1)]}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(reading_ingestor.flush()['events'], 0)
+
+
 class ReadingAPITest(APITestCase):
     """Tests pour l'API de lecture"""
     
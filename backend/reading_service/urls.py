@@ -14,6 +14,7 @@ urlpatterns = [
     # Progression de lecture
     path('progress/', views.ReadingProgressListCreateView.as_view(), name='progress-list'),
     path('progress/update/', views.update_reading_position, name='progress-update'),
+    path('progress/events/', views.ingest_reading_events, name='progress-events'),
     
     # Signets
     path('bookmarks/', views.BookmarkListCreateView.as_view(), name='bookmark-list'),
@@ -216,23 +216,32 @@ def get_reading_recommendations(user, limit=10):
 
 
 def update_reading_goals(user):
-    """Met à jour la progression des objectifs de lecture de l'utilisateur"""
-    from .models import ReadingGoal
+    """
+    Met à jour la progression des objectifs de lecture de l'utilisateur
+    
+    Les objectifs sont calculés depuis les cumuls quotidiens : une requête
+    pour les objectifs, une pour les cumuls de la période la plus longue.
+    """
+    from .models import ReadingGoal, DailyReadingRollup
     
     try:
-        active_goals = ReadingGoal.objects.filter(
+        active_goals = list(ReadingGoal.objects.filter(
             user=user,
             status='active'
-        )
+        ))
+        if not active_goals:
+            return
+        
+        today = timezone.localdate()
+        starts = [goal.period_start(today) for goal in active_goals]
+        start = min((day for day in starts if day is not None), default=today)
+        rollups = DailyReadingRollup.for_period(user.id, start, today)
         
         for goal in active_goals:
-            goal.update_progress()
+            goal.user = user
+            goal.update_progress(rollups)
             
-            # Vérifier si l'objectif est atteint
-            if goal.is_completed and goal.status == 'active':
-                goal.status = 'completed'
-                goal.save()
-                
+            if goal.status == 'completed':
                 # Envoyer une notification (à implémenter)
                 logger.info(f"Objectif de lecture atteint pour l'utilisateur {user.username}: {goal.title}")
         
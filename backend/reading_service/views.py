@@ -5,11 +5,11 @@ from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.db.models import Q, Count, Sum, Avg, Max
-from django.core.cache import cache
 from django.shortcuts import get_object_or_404
 from datetime import datetime, timedelta
 import uuid
 
+from coko.cache_tags import tagged_cache, user_tag
 from .models import (
     ReadingSession, ReadingProgress, Bookmark, 
     ReadingGoal, ReadingStatistics
@@ -20,9 +20,11 @@ from .serializers import (
     ReadingGoalSerializer, ReadingGoalCreateSerializer, ReadingStatisticsSerializer,
     ReadingDashboardSerializer, ReadingSessionStatsSerializer, BookmarkStatsSerializer,
     ReadingProgressStatsSerializer, UserReadingPreferencesSerializer,
-    ReadingRecommendationSerializer, ReadingAnalyticsSerializer
+    ReadingRecommendationSerializer, ReadingAnalyticsSerializer,
+    ReadingEventBatchSerializer
 )
 from .permissions import IsOwnerOrReadOnly, CanAccessReadingData
+from .ingestion import reading_ingestor
 from .utils import (
     calculate_reading_statistics, get_reading_recommendations,
     update_reading_goals, generate_reading_insights
@@ -107,8 +109,7 @@ class ReadingSessionDetailView(generics.RetrieveUpdateDestroyAPIView):
         update_reading_goals(self.request.user)
         
         # Invalider le cache des statistiques
-        cache_key = f"reading_stats_{self.request.user.id}"
-        cache.delete(cache_key)
+        tagged_cache.invalidate(user_tag(self.request.user.id))
 
 
 class ReadingProgressListCreateView(generics.ListCreateAPIView):
@@ -327,7 +328,8 @@ class ReadingStatisticsView(APIView):
         
         # Vérifier le cache
         cache_key = f"reading_stats_{user.id}_{period}"
-        cached_stats = cache.get(cache_key)
+        cache_tags = [user_tag(user.id)]
+        cached_stats = tagged_cache.get(cache_key, cache_tags)
         if cached_stats:
             return Response(cached_stats)
         
@@ -335,7 +337,7 @@ class ReadingStatisticsView(APIView):
         stats = calculate_reading_statistics(user, period)
         
         # Mettre en cache pour 1 heure
-        cache.set(cache_key, stats, 3600)
+        tagged_cache.set(cache_key, stats, 3600, cache_tags)
         
         return Response(stats)
 
@@ -569,6 +571,26 @@ def update_reading_position(request):
         )
 
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def ingest_reading_events(request):
+    """
+    Reçoit un lot d'événements de changement de page (synchronisation PWA)
+    
+    Les événements sont mis en file et appliqués de façon groupée par un
+    worker : la réponse n'attend aucune écriture en base.
+    """
+    serializer = ReadingEventBatchSerializer(data=request.data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+    
+    accepted = reading_ingestor.enqueue(request.user, serializer.validated_data['events'])
+    
+    return Response({
+        'status': 'accepted',
+        'accepted': accepted
+    }, status=status.HTTP_202_ACCEPTED)
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def complete_reading_session(request, session_id):
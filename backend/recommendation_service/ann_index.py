@@ -0,0 +1,509 @@
+"""
+Index de plus proches voisins approximatifs (IVF) pour les livres similaires
+
+Les vecteurs `BookVector` normalisés sont regroupés en listes inversées
+autour de centroïdes k-means et stockés sur disque, triés par liste, dans
+des fichiers `.npy` ouverts en mémoire partagée (mmap). Une requête ne
+compare le livre qu'aux centroïdes puis aux `nprobe` listes les plus
+proches, au lieu de lire la matrice de similarité complète.
+
+Les insertions incrémentales (`upsert`) sont écrites dans un segment delta
+qui remplace les entrées de l'index principal de même UUID, jusqu'à la
+prochaine reconstruction. Le delta est relu puis réécrit sous un verrou de
+fichier : deux workers ne peuvent pas s'écraser leurs insertions.
+
+Chaque insertion est aussi notée dans un journal : une reconstruction
+rejoue, après la bascule, les insertions arrivées pendant qu'elle lisait
+les vecteurs. La version précédente est conservée jusqu'à la
+reconstruction suivante pour les workers qui l'ont encore ouverte.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid as uuid_lib
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import BookVector
+from .similarity_engine import (
+    VECTOR_BLOCKS, BookSimilarityEngine, _normalize_rows, build_features
+)
+
+logger = logging.getLogger(__name__)
+
+ANN_INDEX_DIR = getattr(
+    settings, 'RECOMMENDATION_ANN_INDEX_DIR',
+    os.path.join(settings.BASE_DIR, 'data', 'ann_index')
+)
+ANN_NPROBE = getattr(settings, 'RECOMMENDATION_ANN_NPROBE', 16)
+# Taille du delta (en part de l'index) au-delà de laquelle reconstruire
+ANN_DELTA_REBUILD_RATIO = getattr(settings, 'RECOMMENDATION_ANN_DELTA_REBUILD_RATIO', 0.05)
+CURRENT_FILE = 'CURRENT'
+DELTA_FILE = 'delta.npz'
+DELTA_LOCK_FILE = 'delta.lock'
+JOURNAL_FILE = 'upserts.journal'
+JOURNAL_LOCK_FILE = 'journal.lock'
+ANN_REBUILD_LOCK_KEY = 'recommendation_ann_index_rebuild'
+ANN_REBUILD_LOCK_TIMEOUT = 3600
+RELOAD_INTERVAL = 1.0
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10,
+                    sample_size: int = 20000, seed: int = 0) -> np.ndarray:
+    """k-means sphérique sur un échantillon des vecteurs normalisés"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    else:
+        sample = vectors
+
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = _normalize_rows(sums)
+    return centroids
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray,
+                 block_size: int = 4096) -> np.ndarray:
+    """Liste inversée (centroïde le plus proche) de chaque vecteur, par blocs"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        assignments[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def _atomic_save(path: str, writer):
+    """Écrire un fichier via un fichier temporaire puis le renommer"""
+    tmp_path = f"{path}.{uuid_lib.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as handle:
+        writer(handle)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Verrou exclusif entre processus (flock) sur un fichier à côté de l'index"""
+    with open(path, 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+class IVFSegment:
+    """Index principal en lecture seule, ouvert en mmap"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as handle:
+            self.manifest = json.load(handle)
+        with open(os.path.join(path, 'titles.json')) as handle:
+            self.titles = json.load(handle)
+
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        self.centroids = np.load(os.path.join(path, 'centroids.npy'))
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self.ids = np.load(os.path.join(path, 'ids.npy'))
+        self.row_index = {book_uuid: row for row, book_uuid in enumerate(self.ids.tolist())}
+
+    @property
+    def widths(self) -> Dict[str, int]:
+        return self.manifest['widths']
+
+    def __len__(self):
+        return len(self.ids)
+
+    def vector(self, book_uuid: str) -> Optional[np.ndarray]:
+        row = self.row_index.get(book_uuid)
+        if row is None:
+            return None
+        return np.asarray(self.vectors[row])
+
+    def search(self, query: np.ndarray, k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Retourner (lignes, scores) des k meilleurs candidats des nprobe listes"""
+        nprobe = min(nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+
+        rows = np.concatenate([
+            np.arange(self.offsets[i], self.offsets[i + 1]) for i in probe
+        ])
+        if len(rows) == 0:
+            return rows, np.empty(0, dtype=np.float32)
+
+        # Les listes sondées sont contiguës sur disque : lecture par tranches
+        candidates = np.concatenate([
+            self.vectors[self.offsets[i]:self.offsets[i + 1]] for i in probe
+        ])
+        scores = candidates @ query
+        if len(scores) > k:
+            top = np.argpartition(scores, -k)[-k:]
+            rows, scores = rows[top], scores[top]
+        return rows, scores
+
+
+class ANNIndex:
+    """
+    Index IVF partagé entre processus.
+
+    La version active est désignée par le fichier `CURRENT` ; une
+    reconstruction écrit une nouvelle version puis bascule ce pointeur. Les
+    lecteurs rechargent l'index et le delta lorsque les fichiers changent.
+    """
+
+    def __init__(self, path: str = None, nprobe: int = None):
+        self.path = str(path or ANN_INDEX_DIR)
+        self.nprobe = nprobe or ANN_NPROBE
+        self._lock = threading.Lock()
+        self._segment: Optional[IVFSegment] = None
+        self._version: Optional[str] = None
+        self._delta_mtime: Optional[float] = None
+        self._delta_ids: List[str] = []
+        self._delta_titles: List[str] = []
+        self._delta_vectors = np.empty((0, 0), dtype=np.float32)
+        self._delta_index: Dict[str, int] = {}
+        self._checked_at = 0.0
+
+    # Construction ---------------------------------------------------------
+
+    def build(self, queryset=None, nlist: int = None) -> Dict[str, float]:
+        """Construire une nouvelle version de l'index à partir de tous les vecteurs"""
+        start_time = time.monotonic()
+        # Les insertions notées après ce point peuvent manquer aux vecteurs lus
+        build_started = time.time()
+        engine = BookSimilarityEngine()
+        uuids, titles, blocks = engine.load_vectors(queryset)
+        if not uuids:
+            logger.warning("Aucun vecteur de livre : index ANN non construit")
+            return {'books': 0, 'lists': 0, 'elapsed_seconds': 0.0}
+
+        vectors = _normalize_rows(build_features(blocks)).astype(np.float32)
+        nlist = min(nlist or max(int(np.sqrt(len(vectors))), 1), len(vectors))
+        centroids = train_centroids(vectors, nlist)
+        assignments = assign_lists(vectors, centroids)
+
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=nlist)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        version = f"{int(time.time())}-{uuid_lib.uuid4().hex[:8]}"
+        version_path = os.path.join(self.path, version)
+        os.makedirs(version_path, exist_ok=True)
+
+        ids = np.array([str(uuids[i]) for i in order])
+        np.save(os.path.join(version_path, 'vectors.npy'), vectors[order])
+        np.save(os.path.join(version_path, 'centroids.npy'), centroids)
+        np.save(os.path.join(version_path, 'offsets.npy'), offsets)
+        np.save(os.path.join(version_path, 'ids.npy'), ids)
+        with open(os.path.join(version_path, 'titles.json'), 'w') as handle:
+            json.dump([titles[i] for i in order], handle)
+        with open(os.path.join(version_path, 'manifest.json'), 'w') as handle:
+            json.dump({
+                'version': version,
+                'books': len(ids),
+                'lists': nlist,
+                'widths': {name: int(blocks[name].shape[1]) for name in VECTOR_BLOCKS},
+                'built_at': time.time(),
+            }, handle)
+
+        # Bascule et lecture du journal sous le verrou des insertions : une
+        # insertion est soit notée avant la bascule, soit écrite dans la
+        # nouvelle version
+        with _file_lock(os.path.join(self.path, JOURNAL_LOCK_FILE)):
+            previous = self._read_current()
+            _atomic_save(
+                os.path.join(self.path, CURRENT_FILE),
+                lambda handle: handle.write(version.encode())
+            )
+            replay = self._take_journal(since=build_started)
+
+        # Les workers qui lisent encore la version précédente la gardent
+        # jusqu'à la reconstruction suivante
+        self._prune_versions(keep={version, previous})
+
+        with self._lock:
+            self._checked_at = 0.0
+
+        if replay:
+            self.upsert(replay)
+
+        elapsed = time.monotonic() - start_time
+        logger.info(
+            f"Index ANN reconstruit: {len(ids)} livres, {nlist} listes en {elapsed:.2f}s"
+        )
+        return {'books': len(ids), 'lists': nlist, 'elapsed_seconds': round(elapsed, 3)}
+
+    def upsert(self, book_uuids: Iterable) -> int:
+        """
+        Insérer ou remplacer des livres sans reconstruire l'index.
+
+        Les vecteurs sont ajoutés au segment delta, qui prime sur l'index
+        principal. Retourne la taille du delta après écriture.
+        """
+        book_uuids = [str(book_uuid) for book_uuid in book_uuids]
+        if not os.path.isdir(self.path):
+            return 0
+
+        with _file_lock(os.path.join(self.path, JOURNAL_LOCK_FILE)):
+            # Version relue sous le verrou : une reconstruction a pu basculer
+            with self._lock:
+                self._checked_at = 0.0
+            self._refresh()
+            segment = self._segment
+            if segment is None:
+                # Pas encore d'index : une construction complète est nécessaire
+                return 0
+
+            size = self._write_delta(segment, book_uuids)
+            with open(os.path.join(self.path, JOURNAL_FILE), 'a') as handle:
+                now = time.time()
+                handle.writelines(f"{now} {book_uuid}\n" for book_uuid in book_uuids)
+
+        with self._lock:
+            self._checked_at = 0.0
+
+        return size
+
+    def _write_delta(self, segment: IVFSegment, book_uuids: List[str]) -> int:
+        uuids, titles, blocks = BookSimilarityEngine().load_vectors(
+            BookVector.objects.filter(book_uuid__in=book_uuids),
+            widths=segment.widths
+        )
+        if not uuids:
+            return len(self._delta_ids)
+
+        vectors = _normalize_rows(build_features(blocks)).astype(np.float32)
+
+        version_path = os.path.join(self.path, segment.manifest['version'])
+        delta_path = os.path.join(version_path, DELTA_FILE)
+        with _file_lock(os.path.join(version_path, DELTA_LOCK_FILE)):
+            # Delta relu sur disque : la copie en mémoire peut dater d'avant
+            # l'écriture d'un autre processus
+            delta = {}
+            if os.path.exists(delta_path):
+                with np.load(delta_path) as arrays:
+                    delta = {
+                        book_uuid: (title, vector)
+                        for book_uuid, title, vector in zip(
+                            arrays['ids'].tolist(), arrays['titles'].tolist(), arrays['vectors']
+                        )
+                    }
+            for book_uuid, title, vector in zip(uuids, titles, vectors):
+                delta[str(book_uuid)] = (title, vector)
+
+            ids = np.array(list(delta.keys()))
+            _atomic_save(
+                delta_path,
+                lambda handle: np.savez(
+                    handle,
+                    ids=ids,
+                    titles=np.array([item[0] for item in delta.values()]),
+                    vectors=np.stack([item[1] for item in delta.values()])
+                )
+            )
+
+        return len(delta)
+
+    def _take_journal(self, since: float) -> List[str]:
+        """
+        Livres insérés depuis `since` ; les entrées plus anciennes, couvertes
+        par la reconstruction, sont retirées du journal (verrou du journal tenu)
+        """
+        journal_path = os.path.join(self.path, JOURNAL_FILE)
+        try:
+            with open(journal_path) as handle:
+                entries = [line.split() for line in handle if line.strip()]
+        except FileNotFoundError:
+            return []
+
+        recent = [(stamp, book_uuid) for stamp, book_uuid in entries if float(stamp) >= since]
+        _atomic_save(
+            journal_path,
+            lambda handle: handle.writelines(
+                f"{stamp} {book_uuid}\n".encode() for stamp, book_uuid in recent
+            )
+        )
+        return list(dict.fromkeys(book_uuid for _, book_uuid in recent))
+
+    def _prune_versions(self, keep: set):
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if name not in keep and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    @property
+    def needs_rebuild(self) -> bool:
+        """Le delta est devenu trop gros par rapport à l'index principal"""
+        self._refresh()
+        if self._segment is None:
+            return True
+        return len(self._delta_ids) > max(len(self._segment) * ANN_DELTA_REBUILD_RATIO, 100)
+
+    # Lecture --------------------------------------------------------------
+
+    def search(self, book_uuid, k: int = 10, min_similarity: float = 0.0,
+               nprobe: int = None) -> Optional[List[Dict]]:
+        """
+        Top-K livres similaires à un livre.
+
+        Retourne None si l'index n'est pas disponible ou ne connaît pas le
+        livre (l'appelant peut alors se replier sur la matrice de similarité).
+        """
+        self._refresh()
+        segment = self._segment
+        if segment is None:
+            return None
+
+        book_uuid = str(book_uuid)
+        delta_row = self._delta_index.get(book_uuid)
+        if delta_row is not None:
+            query = self._delta_vectors[delta_row]
+        else:
+            query = segment.vector(book_uuid)
+        if query is None:
+            return None
+
+        # Marge pour les entrées écartées (livre lui-même, remplacées par le delta)
+        rows, scores = segment.search(query, k + len(self._delta_ids) + 1,
+                                      nprobe or self.nprobe)
+        candidates = {}
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            candidate = segment.ids[row]
+            if candidate in self._delta_index:
+                continue
+            candidates[candidate] = (score, segment.titles[row], segment.vectors[row])
+
+        if len(self._delta_ids):
+            delta_scores = self._delta_vectors @ query
+            for row, score in enumerate(delta_scores.tolist()):
+                candidates[self._delta_ids[row]] = (
+                    score, self._delta_titles[row], self._delta_vectors[row]
+                )
+
+        candidates.pop(book_uuid, None)
+        ranked = sorted(
+            (item for item in candidates.items() if item[1][0] >= min_similarity),
+            key=lambda item: -item[1][0]
+        )[:k]
+
+        return [
+            {
+                'book_uuid': candidate,
+                'book_title': title,
+                'similarity': float(score),
+                'reasons': self._block_similarities(query, np.asarray(vector), segment.widths)
+            }
+            for candidate, (score, title, vector) in ranked
+        ]
+
+    def _block_similarities(self, query: np.ndarray, vector: np.ndarray,
+                            widths: Dict[str, int]) -> Dict[str, Optional[float]]:
+        """Similarité cosinus par bloc, pour expliquer le score global"""
+        reasons = {}
+        offset = 0
+        for name, key in zip(VECTOR_BLOCKS, ('content', 'genre', 'author', 'metadata')):
+            width = widths[name]
+            a, b = query[offset:offset + width], vector[offset:offset + width]
+            norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+            reasons[key] = float(a @ b) / norm if norm else 0.0
+            offset += width
+        reasons['user'] = None
+        return reasons
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE)) as handle:
+                return handle.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self):
+        """Recharger l'index et le delta s'ils ont changé (au plus une fois par seconde)"""
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_INTERVAL:
+            return
+
+        with self._lock:
+            if now - self._checked_at < RELOAD_INTERVAL:
+                return
+            self._checked_at = now
+
+            version = self._read_current()
+            if version is None:
+                self._segment = None
+                return
+
+            if version != self._version:
+                try:
+                    self._segment = IVFSegment(os.path.join(self.path, version))
+                    self._version = version
+                    self._delta_mtime = None
+                except (OSError, ValueError) as e:
+                    logger.error(f"Index ANN illisible ({version}): {str(e)}")
+                    return
+
+            delta_path = os.path.join(self.path, version, DELTA_FILE)
+            try:
+                mtime = os.stat(delta_path).st_mtime
+            except FileNotFoundError:
+                mtime = None
+
+            if mtime != self._delta_mtime:
+                self._load_delta(delta_path if mtime is not None else None)
+                self._delta_mtime = mtime
+
+    def _load_delta(self, delta_path: Optional[str]):
+        if delta_path is None:
+            self._delta_ids, self._delta_titles = [], []
+            self._delta_vectors = np.empty((0, 0), dtype=np.float32)
+        else:
+            with np.load(delta_path) as arrays:
+                self._delta_ids = arrays['ids'].tolist()
+                self._delta_titles = arrays['titles'].tolist()
+                self._delta_vectors = arrays['vectors']
+        self._delta_index = {book_uuid: row for row, book_uuid in enumerate(self._delta_ids)}
+
+
+_ann_index: Optional[ANNIndex] = None
+
+
+def get_ann_index() -> ANNIndex:
+    """Instance d'index partagée par le processus"""
+    global _ann_index
+    if _ann_index is None:
+        _ann_index = ANNIndex()
+    return _ann_index
+
+
+def schedule_ann_rebuild() -> bool:
+    """
+    Planifier une reconstruction de l'index, sauf si une est déjà planifiée.
+
+    Le verrou est libéré par la tâche (`rebuild_ann_index`) ou expire.
+    """
+    if not cache.add(ANN_REBUILD_LOCK_KEY, True, ANN_REBUILD_LOCK_TIMEOUT):
+        return False
+
+    from .tasks import rebuild_ann_index
+    try:
+        rebuild_ann_index.delay()
+    except Exception as e:
+        cache.delete(ANN_REBUILD_LOCK_KEY)
+        logger.warning(f"Reconstruction de l'index ANN non planifiée: {str(e)}")
+        return False
+    return True
@@ -45,12 +45,6 @@ CELERY_BEAT_SCHEDULE = {
         'options': {'queue': 'recommendations'}
     },
     
-    'calculate-similarity-matrix-weekly': {
-        'task': 'recommendation_service.tasks.calculate_similarity_matrix',
-        'schedule': crontab(hour=0, minute=0, day_of_week=0),  # Dimanche minuit
-        'options': {'queue': 'heavy_computation'}
-    },
-    
     'cleanup-old-data-weekly': {
         'task': 'recommendation_service.tasks.cleanup_old_data',
         'schedule': crontab(hour=2, minute=0, day_of_week=0),  # Dimanche 2h00
@@ -91,6 +85,8 @@ CELERY_TASK_ROUTES = {
     # Tâches de recommandations
     'recommendation_service.tasks.generate_user_recommendations': {'queue': 'recommendations'},
     'recommendation_service.tasks.batch_generate_recommendations': {'queue': 'recommendations'},
+    'recommendation_service.tasks.materialize_recommendations_batch': {'queue': 'recommendations'},
+    'recommendation_service.tasks.refresh_materialized_recommendations': {'queue': 'recommendations'},
     'recommendation_service.tasks.update_book_vectors': {'queue': 'recommendations'},
     'recommendation_service.tasks.update_trending_books': {'queue': 'recommendations'},
     'recommendation_service.tasks.daily_maintenance': {'queue': 'recommendations'},
@@ -99,6 +95,8 @@ CELERY_TASK_ROUTES = {
     # Tâches de calcul intensif
     'recommendation_service.tasks.calculate_similarity_matrix': {'queue': 'heavy_computation'},
     'recommendation_service.tasks.calculate_cosine_similarity_vectors': {'queue': 'heavy_computation'},
+    'recommendation_service.tasks.rebuild_rating_matrix_task': {'queue': 'heavy_computation'},
+    'recommendation_service.tasks.rebuild_ann_index': {'queue': 'heavy_computation'},
     
     # Tâches d'analytics
     'recommendation_service.tasks.generate_recommendation_analytics_report': {'queue': 'analytics'},
@@ -8,6 +8,7 @@ from typing import List, Tuple
 
 from catalog_service.models import Book
 from recommendation_service.models import BookVector, SimilarityMatrix
+from recommendation_service.similarity_engine import BookSimilarityEngine
 from recommendation_service.tasks import calculate_similarity_matrix
 from recommendation_service.signals import similarity_matrix_updated
 
@@ -21,8 +22,8 @@ class Command(BaseCommand):
         parser.add_argument(
             '--batch-size',
             type=int,
-            default=100,
-            help='Taille des lots pour le traitement (défaut: 100)'
+            default=1024,
+            help='Nombre de livres par bloc de produit matriciel (défaut: 1024)'
         )
         
         parser.add_argument(
@@ -32,11 +33,18 @@ class Command(BaseCommand):
             help='Seuil minimum de similarité à sauvegarder (défaut: 0.1)'
         )
         
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=50,
+            help='Nombre de voisins conservés par livre (défaut: 50)'
+        )
+        
         parser.add_argument(
             '--book-ids',
             nargs='+',
-            type=int,
-            help='IDs spécifiques des livres à traiter'
+            type=str,
+            help='UUIDs spécifiques des livres à traiter'
         )
         
         parser.add_argument(
@@ -226,7 +234,9 @@ class Command(BaseCommand):
         
         try:
             task = calculate_similarity_matrix.delay(
-                batch_size=options['batch_size']
+                batch_size=options['batch_size'],
+                top_k=options['top_k'],
+                threshold=self.threshold
             )
             
             self._log(f"Tâche asynchrone lancée: {task.id}")
@@ -239,99 +249,33 @@ class Command(BaseCommand):
         """Calculer la similarité de manière synchrone"""
         self._log("Calcul synchrone de la matrice de similarité...")
         
-        # Obtenir les vecteurs de livres
-        if options['book_ids']:
-            book_vectors = BookVector.objects.filter(
-                book__id__in=options['book_ids']
-            ).select_related('book')
-        else:
-            book_vectors = BookVector.objects.select_related('book').all()
+        engine = BookSimilarityEngine(
+            top_k=options['top_k'],
+            threshold=self.threshold,
+            block_size=options['batch_size']
+        )
         
-        book_vectors_list = list(book_vectors)
-        total_vectors = len(book_vectors_list)
+        stats = engine.run(
+            book_uuids=options['book_ids'],
+            dry_run=options['dry_run']
+        )
         
-        if total_vectors < 2:
+        if stats.books < 2:
             self._log_warning("Pas assez de vecteurs de livres pour calculer la similarité")
             return
         
-        self._log(f"Calcul des similarités pour {total_vectors} livres...")
-        
         if options['dry_run']:
-            total_pairs = (total_vectors * (total_vectors - 1)) // 2
-            self._log(f"[DRY RUN] {total_pairs} paires de similarité seraient calculées")
+            self._log(f"[DRY RUN] {stats.pairs_saved} paires de similarité seraient sauvegardées")
             return
         
-        batch_size = options['batch_size']
-        total_pairs = 0
-        saved_pairs = 0
-        
-        for i, vector1 in enumerate(book_vectors_list):
-            if i % batch_size == 0:
-                self._log(f"Traitement du lot {i // batch_size + 1}/{(total_vectors - 1) // batch_size + 1}")
-            
-            batch_similarities = []
-            
-            for j, vector2 in enumerate(book_vectors_list[i+1:], i+1):
-                try:
-                    similarity_score = self._calculate_cosine_similarity(vector1, vector2)
-                    total_pairs += 1
-                    
-                    if similarity_score >= self.threshold:
-                        batch_similarities.extend([
-                            SimilarityMatrix(
-                                book1=vector1.book,
-                                book2=vector2.book,
-                                similarity_score=similarity_score,
-                                algorithm_type='cosine',
-                                last_calculated=timezone.now()
-                            ),
-                            SimilarityMatrix(
-                                book1=vector2.book,
-                                book2=vector1.book,
-                                similarity_score=similarity_score,
-                                algorithm_type='cosine',
-                                last_calculated=timezone.now()
-                            )
-                        ])
-                        saved_pairs += 2
-                    
-                    if self.verbose and total_pairs % 1000 == 0:
-                        self._log(f"  {total_pairs} paires calculées, {saved_pairs} sauvegardées...")
-                
-                except Exception as e:
-                    logger.error(f"Erreur lors du calcul entre {vector1.book.title} et {vector2.book.title}: {str(e)}")
-                    continue
-            
-            # Sauvegarder le lot
-            if batch_similarities:
-                try:
-                    with transaction.atomic():
-                        # Supprimer les anciennes similarités pour ces livres
-                        SimilarityMatrix.objects.filter(
-                            book1=vector1.book
-                        ).delete()
-                        
-                        # Créer les nouvelles
-                        SimilarityMatrix.objects.bulk_create(
-                            batch_similarities,
-                            ignore_conflicts=True
-                        )
-                        
-                except Exception as e:
-                    logger.error(f"Erreur lors de la sauvegarde du lot: {str(e)}")
-                    continue
-        
-        # Nettoyer les anciennes similarités
-        if not options['force']:
-            old_threshold = timezone.now() - timezone.timedelta(days=7)
-            deleted_count = SimilarityMatrix.objects.filter(
-                last_calculated__lt=old_threshold
-            ).delete()[0]
-            
-            if deleted_count > 0:
-                self._log(f"✓ {deleted_count} anciennes similarités supprimées")
-        
-        self._log(f"✓ Calcul terminé: {total_pairs} paires calculées, {saved_pairs} sauvegardées")
+        self._log(
+            f"✓ Calcul terminé: {stats.books} livres, {stats.pairs_saved} paires sauvegardées, "
+            f"{stats.deleted_old} obsolètes supprimées"
+        )
+        self._log(
+            f"  Débit: {stats.rows_per_second:.0f} lignes/s, "
+            f"pic mémoire du processus: {stats.peak_memory_mb:.1f} Mo"
+        )
         
         # Émettre le signal de mise à jour
         similarity_matrix_updated.send(sender=None)
@@ -339,50 +283,6 @@ class Command(BaseCommand):
         # Invalider les caches liés
         self._invalidate_similarity_caches()
     
-    def _calculate_cosine_similarity(self, vector1: BookVector, vector2: BookVector) -> float:
-        """Calculer la similarité cosinus entre deux vecteurs de livres"""
-        import numpy as np
-        
-        try:
-            # Combiner tous les vecteurs
-            v1 = (
-                vector1.content_vector + 
-                vector1.genre_vector + 
-                vector1.author_vector + 
-                vector1.metadata_vector +
-                [vector1.popularity_score, vector1.quality_score, vector1.recency_score]
-            )
-            
-            v2 = (
-                vector2.content_vector + 
-                vector2.genre_vector + 
-                vector2.author_vector + 
-                vector2.metadata_vector +
-                [vector2.popularity_score, vector2.quality_score, vector2.recency_score]
-            )
-            
-            # S'assurer que les vecteurs ont la même longueur
-            max_len = max(len(v1), len(v2))
-            v1.extend([0.0] * (max_len - len(v1)))
-            v2.extend([0.0] * (max_len - len(v2)))
-            
-            # Calculer la similarité cosinus
-            v1_array = np.array(v1)
-            v2_array = np.array(v2)
-            
-            dot_product = np.dot(v1_array, v2_array)
-            norm1 = np.linalg.norm(v1_array)
-            norm2 = np.linalg.norm(v2_array)
-            
-            if norm1 == 0 or norm2 == 0:
-                return 0.0
-            
-            return float(dot_product / (norm1 * norm2))
-            
-        except Exception as e:
-            logger.error(f"Erreur lors du calcul de similarité cosinus: {str(e)}")
-            return 0.0
-    
     def _invalidate_similarity_caches(self):
         """Invalider les caches liés à la similarité"""
         try:
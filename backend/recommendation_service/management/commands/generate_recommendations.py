@@ -6,6 +6,7 @@ import logging
 from typing import Optional, List
 
 from recommendation_service.models import UserProfile, RecommendationSet
+from recommendation_service.materializer import RecommendationMaterializer
 from recommendation_service.utils import generate_personalized_recommendations
 from recommendation_service.tasks import (
     generate_user_recommendations, batch_generate_recommendations
@@ -158,9 +159,12 @@ class Command(BaseCommand):
             self._log("[DRY RUN] Simulation de génération pour tous les utilisateurs")
             return
         
-        # Filtrer les utilisateurs qui ont besoin de nouvelles recommandations
+        # Ne garder que les utilisateurs modifiés depuis le dernier passage
         if not options['force']:
-            users = [u for u in users if self._should_generate_recommendations(u, False)]
+            changed = RecommendationMaterializer(
+                algorithm=options['algorithm']
+            ).changed_user_ids()
+            users = [u for u in users if u.id in changed]
             self._log(f"Après filtrage: {len(users)} utilisateurs nécessitent de nouvelles recommandations")
         
         if options['use_async']:
@@ -219,9 +223,14 @@ class Command(BaseCommand):
             self._log(f"✗ Erreur pour {user.username}: {str(e)}")
     
     def _generate_sync_batch(self, users: List[User], options):
-        """Générer des recommandations de manière synchrone pour plusieurs utilisateurs"""
+        """Générer et matérialiser les recommandations de plusieurs utilisateurs par lots"""
         batch_size = options['batch_size']
         total_users = len(users)
+        materializer = RecommendationMaterializer(
+            algorithm=options['algorithm'],
+            contexts=[options['context']],
+            batch_size=batch_size
+        )
         successful = 0
         failed = 0
         
@@ -229,29 +238,12 @@ class Command(BaseCommand):
             batch = users[i:i + batch_size]
             self._log(f"Traitement du lot {i//batch_size + 1}/{(total_users-1)//batch_size + 1}")
             
-            for user in batch:
-                try:
-                    with transaction.atomic():
-                        recommendations = generate_personalized_recommendations(
-                            user=user,
-                            algorithm=options['algorithm'],
-                            count=options['count'],
-                            context=options['context']
-                        )
-                        
-                        if recommendations:
-                            successful += 1
-                            if self.verbose:
-                                self._log(f"  ✓ {user.username}: {len(recommendations)} recommandations")
-                        else:
-                            if self.verbose:
-                                self._log(f"  ⚠ {user.username}: aucune recommandation")
-                                
-                except Exception as e:
-                    failed += 1
-                    logger.error(f"Erreur pour {user.username}: {str(e)}")
-                    if self.verbose:
-                        self._log(f"  ✗ {user.username}: {str(e)}")
+            stats = materializer.materialize_users([user.id for user in batch])
+            successful += stats['users']
+            failed += stats['failed']
+            
+            if self.verbose:
+                self._log(f"  ✓ {stats['rows']} listes matérialisées, {stats['failed']} échecs")
         
         self._log(f"Terminé: {successful} succès, {failed} échecs")
     
@@ -278,7 +270,8 @@ class Command(BaseCommand):
         try:
             result = batch_generate_recommendations.delay(
                 user_ids=user_ids,
-                algorithm=options['algorithm']
+                algorithm=options['algorithm'],
+                chunk_size=options['batch_size']
             )
             
             self._log(f"Tâche de génération en lot lancée: {result.id}")
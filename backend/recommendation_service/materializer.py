@@ -0,0 +1,234 @@
+"""
+Matérialisation des recommandations personnalisées
+
+Les listes classées sont calculées en arrière-plan par lots, stockées par
+utilisateur × algorithme × contexte dans `MaterializedRecommendation` (et
+dans le cache), puis servies telles quelles par l'API.
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Max, Min
+from django.utils import timezone
+from datetime import timedelta
+
+from .models import MaterializedRecommendation, UserInteraction, UserProfile
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Taille des listes stockées : l'API sert au plus 50 recommandations
+MATERIALIZED_LIST_SIZE = 50
+# Moteurs dont les listes peuvent être matérialisées
+MATERIALIZED_ALGORITHMS = ('content_based', 'collaborative', 'hybrid')
+MATERIALIZED_CONTEXTS = getattr(settings, 'RECOMMENDATION_MATERIALIZED_CONTEXTS', ['general'])
+MATERIALIZED_MAX_AGE = timedelta(
+    hours=getattr(settings, 'RECOMMENDATION_MATERIALIZED_MAX_AGE_HOURS', 24)
+)
+WATERMARK_CACHE_KEY = 'recommendation_materializer_cursor_{algorithm}'
+CACHE_TIMEOUT = 6 * 3600
+# Au plus un recalcul à la demande par utilisateur × algorithme × contexte pendant ce délai
+REFRESH_LEASE_TIMEOUT = getattr(settings, 'RECOMMENDATION_REFRESH_LEASE_SECONDS', 60)
+
+
+def materialized_cache_key(user_id: int, algorithm: str, context: str) -> str:
+    return f"materialized_recommendations_{user_id}_{algorithm}_{context}"
+
+
+class RecommendationMaterializer:
+    """Calcul et stockage en masse des recommandations par utilisateur"""
+
+    def __init__(self, algorithm: str = 'hybrid', contexts: List[str] = None,
+                 batch_size: int = 100):
+        self.algorithm = algorithm
+        self.contexts = contexts or MATERIALIZED_CONTEXTS
+        self.batch_size = batch_size
+
+    @property
+    def watermark_cache_key(self) -> str:
+        # Un curseur par algorithme : chacun rafraîchit ses propres listes
+        return WATERMARK_CACHE_KEY.format(algorithm=self.algorithm)
+
+    def get(self, user_id: int, context: str = 'general') -> Optional[Dict]:
+        """Lire la liste précalculée (cache puis table, par clé unique)"""
+        cache_key = materialized_cache_key(user_id, self.algorithm, context)
+        payload = cache.get(cache_key)
+        if payload is not None:
+            return payload
+
+        row = MaterializedRecommendation.objects.filter(
+            user_id=user_id,
+            algorithm=self.algorithm,
+            context=context
+        ).values_list('payload', flat=True).first()
+
+        if row is not None:
+            cache.set(cache_key, row, CACHE_TIMEOUT)
+        return row
+
+    def claim_refresh(self, user_id: int, context: str = 'general') -> bool:
+        """
+        Prendre le bail de recalcul à la demande ; False si un recalcul est
+        déjà planifié (utilisateur très actif, client qui rafraîchit en boucle)
+        """
+        lease_key = f"{materialized_cache_key(user_id, self.algorithm, context)}_refresh"
+        return cache.add(lease_key, True, REFRESH_LEASE_TIMEOUT)
+
+    def stale_user_ids(self) -> Set[int]:
+        """Utilisateurs dont les listes sont plus anciennes que l'âge maximal"""
+        stale_before = timezone.now() - MATERIALIZED_MAX_AGE
+        return set(
+            MaterializedRecommendation.objects.filter(
+                algorithm=self.algorithm,
+                generated_at__lt=stale_before
+            ).values_list('user_id', flat=True)
+        )
+
+    def changed_users(self, cursor: Optional[Tuple] = None) -> List[Tuple]:
+        """
+        Utilisateurs modifiés après le curseur, sous forme de paires
+        (date de dernière modification, user_id) dans l'ordre du curseur.
+        """
+        if cursor is None:
+            cursor = self.get_watermark()
+
+        if cursor is None:
+            # Premier passage : tous les utilisateurs ayant activé les recommandations
+            return sorted(
+                UserProfile.objects.filter(
+                    enable_recommendations=True
+                ).values_list('updated_at', 'user_id')
+            )
+
+        since = cursor[0]
+        changed = dict(
+            UserInteraction.objects.filter(
+                timestamp__gte=since
+            ).order_by().values('user_id').annotate(
+                changed_at=Max('timestamp')
+            ).values_list('user_id', 'changed_at')
+        )
+        for user_id, updated_at in UserProfile.objects.filter(
+            updated_at__gte=since
+        ).values_list('user_id', 'updated_at'):
+            if user_id not in changed or updated_at > changed[user_id]:
+                changed[user_id] = updated_at
+
+        return sorted(
+            (changed_at, user_id) for user_id, changed_at in changed.items()
+            if (changed_at, user_id) > tuple(cursor)
+        )
+
+    def changed_user_ids(self, cursor: Optional[Tuple] = None) -> Set[int]:
+        """
+        Utilisateurs à rafraîchir : interactions ou profil modifiés depuis le
+        dernier passage, ou listes plus anciennes que l'âge maximal.
+        """
+        user_ids = self.stale_user_ids()
+        user_ids.update(user_id for _, user_id in self.changed_users(cursor))
+        return user_ids
+
+    def get_watermark(self) -> Optional[Tuple]:
+        """Curseur (date de modification, user_id) du dernier utilisateur rafraîchi"""
+        watermark = cache.get(self.watermark_cache_key)
+        if watermark is None:
+            # Repli prudent si le cache a été vidé
+            oldest = MaterializedRecommendation.objects.filter(
+                algorithm=self.algorithm
+            ).aggregate(oldest=Min('generated_at'))['oldest']
+            if oldest is not None:
+                watermark = (oldest, 0)
+        return watermark
+
+    def set_watermark(self, changed_at, user_id: int = 0):
+        cache.set(self.watermark_cache_key, (changed_at, user_id), None)
+
+    def materialize_users(self, user_ids: Iterable[int]) -> Dict[str, int]:
+        """Calculer et écrire les listes pour des utilisateurs, par lots"""
+        user_ids = list(user_ids)
+        stats = {'users': 0, 'rows': 0, 'failed': 0}
+
+        for start in range(0, len(user_ids), self.batch_size):
+            batch_stats = self._materialize_batch(user_ids[start:start + self.batch_size])
+            for key, value in batch_stats.items():
+                stats[key] += value
+
+        return stats
+
+    def refresh_changed(self, limit: int = None) -> Dict[str, int]:
+        """
+        Rafraîchir uniquement les utilisateurs modifiés depuis le dernier passage.
+
+        Avec `limit`, les utilisateurs sont pris dans l'ordre du curseur
+        (date de modification, user_id) et le curseur avance jusqu'au dernier
+        traité : le passage suivant reprend là où celui-ci s'est arrêté.
+        """
+        changes = self.changed_users()
+        changed_ids = [user_id for _, user_id in changes]
+        stale_ids = sorted(self.stale_user_ids().difference(changed_ids))
+        user_ids = changed_ids + stale_ids
+        if limit:
+            user_ids = user_ids[:limit]
+
+        stats = self.materialize_users(user_ids)
+
+        processed = changes[:len(user_ids)]
+        if processed:
+            self.set_watermark(*processed[-1])
+
+        logger.info(
+            f"Recommandations matérialisées: {stats['users']} utilisateurs, "
+            f"{stats['rows']} listes, {stats['failed']} échecs"
+        )
+        return stats
+
+    def _materialize_batch(self, user_ids: List[int]) -> Dict[str, int]:
+        from .utils import generate_personalized_recommendations
+
+        users = User.objects.filter(id__in=user_ids, is_active=True)
+        rows = []
+        cached = {}
+        failed = 0
+        done = 0
+
+        for user in users:
+            try:
+                for context in self.contexts:
+                    payload = generate_personalized_recommendations(
+                        user=user,
+                        algorithm=self.algorithm,
+                        count=MATERIALIZED_LIST_SIZE,
+                        context=context
+                    )
+                    rows.append(MaterializedRecommendation(
+                        user=user,
+                        algorithm=self.algorithm,
+                        context=context,
+                        payload=payload,
+                        book_count=len(payload.get('books', [])),
+                        generated_at=timezone.now()
+                    ))
+                    cached[materialized_cache_key(user.id, self.algorithm, context)] = payload
+                done += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"Erreur de matérialisation pour l'utilisateur {user.id}: {str(e)}")
+
+        if rows:
+            MaterializedRecommendation.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user', 'algorithm', 'context'],
+                update_fields=['payload', 'book_count', 'generated_at']
+            )
+            cache.set_many(cached, CACHE_TIMEOUT)
+
+        return {'users': done, 'rows': len(rows), 'failed': failed}
+
+
+def slice_materialized(payload: Dict, count: int) -> Dict:
+    """Limiter une liste précalculée au nombre de livres demandé"""
+    return {**payload, 'books': payload.get('books', [])[:count]}
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:16
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recommendation_service", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MaterializedRecommendation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("algorithm", models.CharField(default="hybrid", max_length=30)),
+                ("context", models.CharField(default="general", max_length=50)),
+                (
+                    "payload",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        help_text="Recommandations classées prêtes à servir",
+                    ),
+                ),
+                ("book_count", models.PositiveIntegerField(default=0)),
+                ("generated_at", models.DateTimeField()),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="materialized_recommendations",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Recommandations précalculées",
+                "verbose_name_plural": "Recommandations précalculées",
+                "db_table": "recommendation_materialized",
+                "indexes": [
+                    models.Index(
+                        fields=["generated_at"], name="recommendat_generat_3c97b6_idx"
+                    )
+                ],
+                "unique_together": {("user", "algorithm", "context")},
+            },
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
 from datetime import timedelta
 import uuid
 
@@ -576,9 +577,26 @@ class SimilarityMatrix(models.Model):
     
     @classmethod
     def get_similar_books(cls, book_uuid, limit=10, min_similarity=0.3):
-        """Obtenir les livres similaires à un livre donné par UUID"""
+        """
+        Obtenir les livres similaires à un livre donné par UUID.
+
+        L'index ANN est interrogé en premier ; la table n'est lue que si
+        l'index n'est pas encore construit ou ne connaît pas le livre.
+        Chaque résultat indique dans `source` qui l'a servi.
+        """
         from django.db import models as django_models
-        
+        from .ann_index import get_ann_index
+
+        similar_books = get_ann_index().search(
+            book_uuid, k=limit, min_similarity=min_similarity
+        )
+        if similar_books is not None:
+            # L'index stocke les identifiants en texte
+            for similar in similar_books:
+                similar['book_uuid'] = uuid.UUID(str(similar['book_uuid']))
+                similar['source'] = 'ann_index'
+            return similar_books
+
         similarities = cls.objects.filter(
             django_models.Q(book_a_uuid=book_uuid) | django_models.Q(book_b_uuid=book_uuid),
             overall_similarity__gte=min_similarity
@@ -602,7 +620,8 @@ class SimilarityMatrix(models.Model):
                     'genre': sim.genre_similarity,
                     'author': sim.author_similarity,
                     'user': sim.user_similarity
-                }
+                },
+                'source': 'similarity_matrix'
             })
         
         return similar_books
@@ -755,4 +774,36 @@ class RecommendationFeedback(models.Model):
             'poor_quality': -1.2,
             'good_recommendation': 1.5
         }
-        return weights.get(self.feedback_type, 0.0)
\ No newline at end of file
+        return weights.get(self.feedback_type, 0.0)
+
+class MaterializedRecommendation(models.Model):
+    """Liste de recommandations précalculée par utilisateur et contexte"""
+    
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='materialized_recommendations'
+    )
+    algorithm = models.CharField(max_length=30, default='hybrid')
+    context = models.CharField(max_length=50, default='general')
+    
+    # Réponse prête à servir (livres classés, scores, raisons)
+    payload = models.JSONField(
+        encoder=DjangoJSONEncoder,
+        help_text="Recommandations classées prêtes à servir"
+    )
+    book_count = models.PositiveIntegerField(default=0)
+    
+    generated_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'recommendation_materialized'
+        verbose_name = 'Recommandations précalculées'
+        verbose_name_plural = 'Recommandations précalculées'
+        unique_together = ['user', 'algorithm', 'context']
+        indexes = [
+            models.Index(fields=['generated_at']),
+        ]
+    
+    def __str__(self):
+        return f"Recommandations précalculées {self.algorithm}/{self.context} pour {self.user.username}"
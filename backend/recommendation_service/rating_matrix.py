@@ -0,0 +1,275 @@
+"""
+Matrice creuse utilisateur × livre des notes (CSR)
+
+Construite périodiquement à partir des interactions de type `rating`, elle
+permet de trouver les utilisateurs similaires par un seul produit creux et
+de scorer les livres candidats par sommes pondérées vectorisées.
+"""
+import io
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import UserInteraction
+
+logger = logging.getLogger(__name__)
+
+RATING_MATRIX_CACHE_KEY = 'recommendation_rating_matrix'
+RATING_MATRIX_TTL = getattr(settings, 'RECOMMENDATION_RATING_MATRIX_TTL', 3600)
+# Durée de conservation de la version publiée : servie périmée pendant sa reconstruction
+RATING_MATRIX_STALE_TTL = getattr(settings, 'RECOMMENDATION_RATING_MATRIX_STALE_TTL', RATING_MATRIX_TTL * 24)
+RATING_MATRIX_REBUILD_LOCK_KEY = f'{RATING_MATRIX_CACHE_KEY}_rebuild'
+RATING_MATRIX_REBUILD_LOCK_TIMEOUT = 600
+
+
+class RatingMatrix:
+    """Matrice des notes utilisateur × livre et index associés"""
+
+    def __init__(self, ratings: sparse.csr_matrix, user_ids: np.ndarray,
+                 book_uuids: np.ndarray, built_at: float = None):
+        self.ratings = ratings.tocsr()
+        self.user_ids = user_ids
+        self.book_uuids = book_uuids
+        self.built_at = built_at or time.time()
+        self.user_index = {int(uid): row for row, uid in enumerate(user_ids)}
+        self.book_index = {str(buid): col for col, buid in enumerate(book_uuids)}
+
+        # Lignes normalisées (L2) pour la similarité cosinus
+        norms = np.sqrt(np.asarray(self.ratings.multiply(self.ratings).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        self.normalized = sparse.diags(1.0 / norms) @ self.ratings
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.ratings.shape
+
+    @classmethod
+    def build(cls, interactions: Iterable[Tuple[int, object, float]] = None) -> 'RatingMatrix':
+        """
+        Construire la matrice à partir de triplets (user_id, book_uuid, note).
+
+        Lorsqu'un utilisateur a noté plusieurs fois un livre, la dernière note
+        l'emporte.
+        """
+        if interactions is None:
+            interactions = UserInteraction.objects.filter(
+                interaction_type='rating',
+                interaction_value__isnull=False
+            ).order_by('timestamp').values_list(
+                'user_id', 'book_uuid', 'interaction_value'
+            ).iterator(chunk_size=10000)
+
+        user_rows, book_cols, values = [], [], []
+        user_index: Dict[int, int] = {}
+        book_index: Dict[str, int] = {}
+        for user_id, book_uuid, value in interactions:
+            user_rows.append(user_index.setdefault(int(user_id), len(user_index)))
+            book_cols.append(book_index.setdefault(str(book_uuid), len(book_index)))
+            values.append(value)
+
+        rows = np.asarray(user_rows, dtype=np.int64)
+        cols = np.asarray(book_cols, dtype=np.int64)
+        data = np.asarray(values, dtype=np.float32)
+
+        # Garder la dernière note pour chaque couple (utilisateur, livre)
+        if len(rows):
+            keys = rows * max(len(book_index), 1) + cols
+            _, last = np.unique(keys[::-1], return_index=True)
+            keep = len(keys) - 1 - last
+            rows, cols, data = rows[keep], cols[keep], data[keep]
+
+        ratings = sparse.csr_matrix(
+            (data, (rows, cols)),
+            shape=(len(user_index), len(book_index)),
+            dtype=np.float32
+        )
+        return cls(
+            ratings,
+            np.fromiter(user_index.keys(), dtype=np.int64, count=len(user_index)),
+            np.array(list(book_index.keys()), dtype=object)
+        )
+
+    def similar_users(self, user_id: int, limit: int = 20,
+                      min_similarity: float = 0.1) -> List[Tuple[int, float]]:
+        """Top-K utilisateurs les plus proches (cosinus) via un produit creux"""
+        row = self.user_index.get(int(user_id))
+        if row is None:
+            return []
+
+        similarities = np.asarray(
+            (self.normalized @ self.normalized[row].T).todense()
+        ).ravel()
+        similarities[row] = 0.0
+
+        candidates = np.flatnonzero(similarities >= min_similarity)
+        if len(candidates) == 0:
+            return []
+        if len(candidates) > limit:
+            top = np.argpartition(similarities[candidates], -limit)[-limit:]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-similarities[candidates])]
+
+        return [(int(self.user_ids[i]), float(similarities[i])) for i in candidates]
+
+    def score_books(self, neighbours: List[Tuple[int, float]], exclude: Iterable = (),
+                    limit: int = 10, min_rating: float = 4.0) -> List[Tuple[str, float, int]]:
+        """
+        Scorer les livres bien notés par les voisins.
+
+        Le score est la moyenne des notes pondérée par la similarité, ramenée
+        sur [0, 1]. Retourne des triplets (book_uuid, score, nombre de voisins).
+        """
+        if not neighbours:
+            return []
+
+        rows = [self.user_index[uid] for uid, _ in neighbours if uid in self.user_index]
+        weights = np.array(
+            [sim for uid, sim in neighbours if uid in self.user_index], dtype=np.float32
+        )
+        if not rows:
+            return []
+
+        liked = self.ratings[rows]
+        liked = liked.multiply(liked >= min_rating).tocsr()
+        liked_mask = (liked > 0).astype(np.float32)
+
+        weighted_sum = np.asarray(liked.T @ weights).ravel()
+        weight_total = np.asarray(liked_mask.T @ weights).ravel()
+        supporters = np.asarray(liked_mask.sum(axis=0)).ravel()
+
+        scores = np.divide(
+            weighted_sum, weight_total,
+            out=np.zeros_like(weighted_sum), where=weight_total > 0
+        ) / 5.0
+        scores = np.minimum(scores, 1.0)
+
+        for book_uuid in exclude:
+            col = self.book_index.get(str(book_uuid))
+            if col is not None:
+                scores[col] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            top = np.argpartition(scores[candidates], -limit)[-limit:]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        return [
+            (self.book_uuids[i], float(scores[i]), int(supporters[i]))
+            for i in candidates
+        ]
+
+    def to_bytes(self) -> bytes:
+        """Sérialiser la matrice pour le partage entre processus"""
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            data=self.ratings.data, indices=self.ratings.indices,
+            indptr=self.ratings.indptr, shape=np.array(self.ratings.shape),
+            user_ids=self.user_ids, book_uuids=self.book_uuids.astype(str),
+            built_at=np.array([self.built_at])
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> 'RatingMatrix':
+        arrays = np.load(io.BytesIO(payload), allow_pickle=False)
+        ratings = sparse.csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']),
+            shape=tuple(arrays['shape'])
+        )
+        return cls(
+            ratings,
+            arrays['user_ids'],
+            arrays['book_uuids'].astype(object),
+            built_at=float(arrays['built_at'][0])
+        )
+
+
+_local_matrix: Optional[RatingMatrix] = None
+_local_lock = threading.Lock()
+
+
+def _is_fresh(matrix: Optional[RatingMatrix]) -> bool:
+    return matrix is not None and time.time() - matrix.built_at < RATING_MATRIX_TTL
+
+
+def rebuild_rating_matrix() -> RatingMatrix:
+    """Reconstruire la matrice et la publier dans le cache partagé"""
+    global _local_matrix
+
+    start_time = time.monotonic()
+    matrix = RatingMatrix.build()
+    cache.set(RATING_MATRIX_CACHE_KEY, matrix.to_bytes(), RATING_MATRIX_STALE_TTL)
+
+    with _local_lock:
+        _local_matrix = matrix
+
+    logger.info(
+        f"Matrice des notes reconstruite: {matrix.shape[0]} utilisateurs × "
+        f"{matrix.shape[1]} livres, {matrix.ratings.nnz} notes "
+        f"en {time.monotonic() - start_time:.2f}s"
+    )
+    return matrix
+
+
+def schedule_rating_matrix_rebuild() -> bool:
+    """
+    Planifier une reconstruction en tâche de fond, une seule à la fois
+
+    Le verrou est libéré par la tâche (`rebuild_rating_matrix_task`) ou expire.
+    """
+    if not cache.add(RATING_MATRIX_REBUILD_LOCK_KEY, True, RATING_MATRIX_REBUILD_LOCK_TIMEOUT):
+        return False
+
+    from .tasks import rebuild_rating_matrix_task
+    try:
+        rebuild_rating_matrix_task.delay()
+    except Exception as e:
+        cache.delete(RATING_MATRIX_REBUILD_LOCK_KEY)
+        logger.warning(f"Reconstruction de la matrice des notes non planifiée: {str(e)}")
+        return False
+    return True
+
+
+def get_rating_matrix() -> RatingMatrix:
+    """
+    Obtenir la matrice courante.
+
+    La copie locale au processus est réutilisée tant qu'elle est fraîche,
+    sinon la version publiée dans le cache est chargée. Une matrice périmée
+    reste servie pendant que sa reconstruction est planifiée en tâche de
+    fond ; la matrice n'est construite dans la requête qu'en l'absence de
+    toute version.
+    """
+    global _local_matrix
+
+    matrix = _local_matrix
+    if _is_fresh(matrix):
+        return matrix
+
+    with _local_lock:
+        matrix = _local_matrix
+        if _is_fresh(matrix):
+            return matrix
+
+        payload = cache.get(RATING_MATRIX_CACHE_KEY)
+        if payload is not None:
+            try:
+                shared = RatingMatrix.from_bytes(payload)
+                if matrix is None or shared.built_at > matrix.built_at:
+                    _local_matrix = matrix = shared
+            except Exception as e:
+                logger.error(f"Matrice des notes en cache illisible: {str(e)}")
+
+    if matrix is None:
+        return rebuild_rating_matrix()
+    if not _is_fresh(matrix):
+        schedule_rating_matrix_rebuild()
+    return matrix
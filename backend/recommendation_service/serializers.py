@@ -299,7 +299,7 @@ class TrendingBookSerializer(serializers.ModelSerializer):
     class Meta:
         model = TrendingBook
         fields = [
-            'id', 'book', 'trend_type',
+            'id', 'book_uuid', 'book_title', 'book_details', 'trend_type',
             'trend_score', 'velocity',
             'view_count', 'download_count', 'share_count',
             'period_start', 'period_end', 'is_active',
@@ -4,12 +4,12 @@ Adaptateurs pour utiliser les services dans le service de recommandations
 import logging
 from typing import Dict, List, Any, Optional, Tuple
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
 from django.utils import timezone
 from datetime import timedelta
 
 from coko.services import get_book_service, get_reading_service
 from coko.events import publish_event, EventType, event_bus, Event
+from coko.cache_tags import tagged_cache, user_tag
 from .models import UserProfile, UserInteraction, RecommendationSet, Recommendation
 
 User = get_user_model()
@@ -303,10 +303,7 @@ class RecommendationServiceAdapter:
             user_id = event.user_id
             if user_id:
                 # Invalider le cache des recommandations pour cet utilisateur
-                cache.delete_many([
-                    f"user_recommendations_{user_id}*",
-                    f"personalized_recommendations_{user_id}*"
-                ])
+                tagged_cache.invalidate(user_tag(user_id))
                 
                 logger.info(f"Cache de recommandations invalidé pour l'utilisateur {user_id}")
                 
@@ -5,16 +5,21 @@ from django.core.cache import cache
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db.models import Avg, Count
 from datetime import timedelta
 import logging
 import json
 
+from coko.cache_tags import tagged_cache, user_tag, SIMILARITY_TAG
+from coko.counters import book_counters
+
 from catalog_service.models import Book, BookRating
 from reading_service.models import ReadingSession, Bookmark
 from .models import (
     UserProfile, BookVector, UserInteraction, RecommendationSet,
     Recommendation, SimilarityMatrix, TrendingBook, RecommendationFeedback
 )
+from .trending import hot_trending, trending_engine
 from .utils import (
     calculate_recommendation_stats, update_recommendation_metrics,
     clean_old_recommendation_data
@@ -60,16 +65,7 @@ def invalidate_user_recommendations_cache(sender, instance, **kwargs):
     """Invalider le cache des recommandations quand le profil est mis à jour"""
     try:
         # Invalider tous les caches de recommandations pour cet utilisateur
-        cache_patterns = [
-            f"user_recommendations_{instance.user.id}_*",
-            f"personalized_recommendations_{instance.user.id}_*",
-            f"similar_users_{instance.user.id}"
-        ]
-        
-        for pattern in cache_patterns:
-            # Django cache ne supporte pas les wildcards, donc on utilise une approche différente
-            cache_key = f"user_recommendations_{instance.user.id}"
-            cache.delete(cache_key)
+        tagged_cache.invalidate(user_tag(instance.user.id))
         
         # Émettre le signal de mise à jour des préférences
         user_preferences_updated.send(
@@ -90,8 +86,10 @@ def process_user_interaction(sender, instance, created, **kwargs):
     if created:
         try:
             # Invalider le cache des recommandations
-            cache_key = f"user_recommendations_{instance.user.id}"
-            cache.delete(cache_key)
+            tagged_cache.invalidate(user_tag(instance.user.id))
+            
+            # Score « chaud » temps réel du livre
+            hot_trending.record(instance.book_uuid, instance.interaction_type)
             
             # Mettre à jour les métriques si l'interaction vient d'une recommandation
             if instance.from_recommendation and instance.recommendation_algorithm:
@@ -104,38 +102,24 @@ def process_user_interaction(sender, instance, created, **kwargs):
             
             # Mettre à jour le vecteur du livre si nécessaire
             try:
-                book_vector, created_vector = BookVector.objects.get_or_create(
-                    book=instance.book,
-                    defaults={
-                        'content_vector': [],
-                        'genre_vector': [],
-                        'author_vector': [],
-                        'metadata_vector': [],
-                        'popularity_score': 0.0,
-                        'quality_score': 0.0,
-                        'recency_score': 0.0
-                    }
-                )
-                
-                if instance.interaction_type == 'view':
-                    book_vector.view_count += 1
-                elif instance.interaction_type == 'download':
-                    book_vector.download_count += 1
+                if instance.interaction_type in ('view', 'download'):
+                    # Compteurs à écriture différée : pas de sauvegarde du vecteur à chaque vue
+                    book_counters.incr(
+                        'book_vector', instance.book_uuid, f"{instance.interaction_type}_count"
+                    )
                 elif instance.interaction_type == 'rating' and instance.interaction_value:
                     # Recalculer la moyenne des notes
-                    book_ratings = UserInteraction.objects.filter(
-                        book=instance.book,
+                    rating_stats = UserInteraction.objects.filter(
+                        book_uuid=instance.book_uuid,
                         interaction_type='rating',
                         interaction_value__isnull=False
-                    )
+                    ).aggregate(average=Avg('interaction_value'), count=Count('id'))
                     
-                    if book_ratings.exists():
-                        avg_rating = sum(r.interaction_value for r in book_ratings) / book_ratings.count()
-                        book_vector.rating_average = avg_rating
-                        book_vector.rating_count = book_ratings.count()
-                
-                book_vector.last_updated = timezone.now()
-                book_vector.save()
+                    BookVector.objects.filter(book_uuid=instance.book_uuid).update(
+                        rating_average=rating_stats['average'] or 0.0,
+                        rating_count=rating_stats['count'],
+                        last_updated=timezone.now()
+                    )
                 
             except Exception as e:
                 logger.error(f"Erreur lors de la mise à jour du vecteur du livre: {str(e)}")
@@ -216,8 +200,7 @@ def process_recommendation_feedback(sender, instance, created, **kwargs):
             )
             
             # Invalider le cache des recommandations pour améliorer les futures recommandations
-            cache_key = f"user_recommendations_{instance.user.id}"
-            cache.delete(cache_key)
+            tagged_cache.invalidate(user_tag(instance.user.id))
             
             # Envoyer une notification par email si le feedback est très négatif
             if instance.rating and instance.rating <= 2:
@@ -288,8 +271,7 @@ def update_recommendations_on_reading(sender, instance, **kwargs):
             )
             
             # Invalider le cache des recommandations
-            cache_key = f"user_recommendations_{instance.user.id}"
-            cache.delete(cache_key)
+            tagged_cache.invalidate(user_tag(instance.user.id))
             
             logger.info(
                 f"Recommandations mises à jour suite à la lecture complète de "
@@ -320,8 +302,7 @@ def update_recommendations_on_bookmark(sender, instance, created, **kwargs):
             )
             
             # Invalider le cache des recommandations
-            cache_key = f"user_recommendations_{instance.user.id}"
-            cache.delete(cache_key)
+            tagged_cache.invalidate(user_tag(instance.user.id))
             
             logger.info(
                 f"Recommandations mises à jour suite à l'ajout d'un marque-page "
@@ -349,14 +330,7 @@ def invalidate_similarity_cache(sender, **kwargs):
     """Invalider le cache de similarité quand la matrice est mise à jour"""
     try:
         # Invalider tous les caches liés à la similarité
-        cache_patterns = [
-            'similar_books_*',
-            'content_based_recommendations_*',
-            'collaborative_recommendations_*'
-        ]
-        
-        # Note: Django cache ne supporte pas les wildcards nativement
-        # Dans un environnement de production, vous pourriez utiliser Redis avec des patterns
+        tagged_cache.invalidate(SIMILARITY_TAG)
         
         logger.info("Cache de similarité invalidé")
         
@@ -425,22 +399,8 @@ def cleanup_old_recommendation_data():
 def update_trending_books_data():
     """Fonction utilitaire pour mettre à jour les données de tendances"""
     try:
-        from .utils import get_trending_books
-        
-        # Mettre à jour les livres en tendance pour différentes périodes
-        periods = ['day', 'week', 'month']
-        trend_types = ['overall', 'genre', 'new_releases']
-        
-        for period in periods:
-            for trend_type in trend_types:
-                trending_books = get_trending_books(
-                    period=period,
-                    trend_type=trend_type,
-                    limit=50
-                )
-                
-                # Mettre à jour ou créer les entrées TrendingBook
-                # (Logique à implémenter selon vos besoins)
+        # Toutes les fenêtres en une passe, classement remplacé atomiquement
+        trending_engine.refresh()
         
         # Émettre le signal de mise à jour
         trending_books_updated.send(sender=None)
@@ -0,0 +1,330 @@
+"""
+Moteur de similarité livre-livre vectorisé (NumPy)
+
+Charge tous les vecteurs de livres en une seule matrice dense, calcule la
+similarité cosinus par blocs via un produit matriciel, ne conserve que les
+K plus proches voisins de chaque livre et écrit la matrice de similarité
+en masse.
+"""
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BookVector, SimilarityMatrix
+
+try:
+    import resource
+except ImportError:  # Windows : pic mémoire non mesuré
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Blocs de caractéristiques composant un vecteur de livre
+VECTOR_BLOCKS = ('content_vector', 'genre_vector', 'author_vector', 'metadata_vector')
+SCORE_FIELDS = ('popularity_score', 'quality_score', 'recency_score')
+
+
+@dataclass
+class SimilarityRunStats:
+    """Statistiques d'exécution du moteur de similarité"""
+    books: int = 0
+    pairs_saved: int = 0
+    deleted_old: int = 0
+    elapsed_seconds: float = 0.0
+    peak_memory_mb: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return self.pairs_saved / self.elapsed_seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'books': self.books,
+            'pairs_saved': self.pairs_saved,
+            'deleted_old': self.deleted_old,
+            'elapsed_seconds': round(self.elapsed_seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'peak_memory_mb': round(self.peak_memory_mb, 2),
+        }
+
+
+def _peak_rss_mb() -> float:
+    """
+    Pic de mémoire résidente du processus (Mo), sans instrumenter les allocations
+
+    `ru_maxrss` est le maximum depuis le démarrage du processus : il est
+    exprimé en kilo-octets sous Linux et en octets sous macOS.
+    """
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def _pad_block(rows: List[list], width: Optional[int] = None) -> np.ndarray:
+    """Empiler des listes de longueurs variables en une matrice complétée par des zéros"""
+    if width is None:
+        width = max((len(row) for row in rows), default=0)
+    block = np.zeros((len(rows), width), dtype=np.float32)
+    for i, row in enumerate(rows):
+        if row:
+            row = row[:width]
+            block[i, :len(row)] = row
+    return block
+
+
+def build_features(blocks: Dict[str, np.ndarray]) -> np.ndarray:
+    """Concaténer les blocs en une matrice de caractéristiques (n × d)"""
+    return np.hstack([blocks[name] for name in VECTOR_BLOCKS] + [blocks['scores']])
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Normaliser chaque ligne (norme L2), les lignes nulles restent nulles"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class BookSimilarityEngine:
+    """Calcul vectorisé des K plus proches voisins entre livres"""
+
+    def __init__(self, top_k: int = 50, threshold: float = 0.1,
+                 block_size: int = 1024, write_batch_size: int = 2000,
+                 algorithm_version: str = '2.0'):
+        self.top_k = top_k
+        self.threshold = threshold
+        self.block_size = block_size
+        self.write_batch_size = write_batch_size
+        self.algorithm_version = algorithm_version
+
+    def load_vectors(self, queryset=None, widths: Optional[Dict[str, int]] = None
+                     ) -> Tuple[List, List[str], Dict[str, np.ndarray]]:
+        """
+        Charger tous les vecteurs en une passe et construire les matrices de blocs.
+
+        `widths` impose la largeur de chaque bloc (pour rester compatible avec
+        un index déjà construit).
+        """
+        widths = widths or {}
+        if queryset is None:
+            queryset = BookVector.objects.all()
+
+        rows = list(
+            queryset.order_by('book_uuid').values_list(
+                'book_uuid', 'book_title', *VECTOR_BLOCKS, *SCORE_FIELDS
+            )
+        )
+        uuids = [row[0] for row in rows]
+        titles = [row[1] for row in rows]
+
+        blocks = {
+            name: _pad_block([row[2 + i] or [] for row in rows], widths.get(name))
+            for i, name in enumerate(VECTOR_BLOCKS)
+        }
+        offset = 2 + len(VECTOR_BLOCKS)
+        blocks['scores'] = np.array(
+            [row[offset:offset + len(SCORE_FIELDS)] for row in rows],
+            dtype=np.float32
+        ).reshape(len(rows), len(SCORE_FIELDS))
+
+        return uuids, titles, blocks
+
+    def compute_neighbours(self, features: np.ndarray,
+                           query_indices: Optional[np.ndarray] = None
+                           ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Calculer les K voisins les plus proches par blocs de lignes.
+
+        Retourne trois tableaux (gauche, droite, similarité) avec gauche < droite,
+        chaque paire n'étant conservée qu'une seule fois.
+        """
+        normalized = _normalize_rows(features.astype(np.float32, copy=False))
+        n = normalized.shape[0]
+        if query_indices is None:
+            query_indices = np.arange(n)
+
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                 np.empty(0, dtype=np.float32))
+        k = min(self.top_k, n - 1)
+        if k <= 0 or len(query_indices) == 0:
+            return empty
+
+        lefts, rights, values = [], [], []
+        for start in range(0, len(query_indices), self.block_size):
+            rows = query_indices[start:start + self.block_size]
+            scores = normalized[rows] @ normalized.T
+            # Exclure la similarité d'un livre avec lui-même
+            scores[np.arange(len(rows)), rows] = -np.inf
+
+            top = np.argpartition(scores, -k, axis=1)[:, -k:]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+
+            keep = top_scores >= self.threshold
+            source = np.broadcast_to(rows[:, None], top.shape)[keep]
+            target = top[keep]
+            lefts.append(np.minimum(source, target))
+            rights.append(np.maximum(source, target))
+            values.append(top_scores[keep])
+
+        left = np.concatenate(lefts).astype(np.int64)
+        right = np.concatenate(rights).astype(np.int64)
+        if len(left) == 0:
+            return empty
+
+        # Dédoublonner les paires trouvées depuis les deux extrémités
+        _, unique = np.unique(left * n + right, return_index=True)
+        return left[unique], right[unique], np.concatenate(values)[unique]
+
+    @staticmethod
+    def _block_similarity(block: np.ndarray, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        """Similarité cosinus ligne à ligne entre deux ensembles de lignes d'un bloc"""
+        if block.shape[1] == 0:
+            return np.zeros(len(left), dtype=np.float32)
+        normalized = _normalize_rows(block)
+        return np.einsum('ij,ij->i', normalized[left], normalized[right])
+
+    def build_rows(self, pairs: Tuple[np.ndarray, np.ndarray, np.ndarray], uuids: List,
+                   titles: List[str], blocks: Dict[str, np.ndarray]) -> Iterable[SimilarityMatrix]:
+        """Construire les lignes SimilarityMatrix (détail par bloc calculé pour les paires retenues)"""
+        left, right, scores = pairs
+        if len(left) == 0:
+            return []
+
+        overall = np.clip(scores, 0.0, 1.0)
+        content = np.clip(self._block_similarity(blocks['content_vector'], left, right), 0.0, 1.0)
+        genre = np.clip(self._block_similarity(blocks['genre_vector'], left, right), 0.0, 1.0)
+        author = np.clip(self._block_similarity(blocks['author_vector'], left, right), 0.0, 1.0)
+
+        return (
+            SimilarityMatrix(
+                book_a_uuid=uuids[a],
+                book_a_title=titles[a],
+                book_b_uuid=uuids[b],
+                book_b_title=titles[b],
+                content_similarity=float(content[n]),
+                genre_similarity=float(genre[n]),
+                author_similarity=float(author[n]),
+                user_similarity=0.0,
+                overall_similarity=float(overall[n]),
+                algorithm_version=self.algorithm_version,
+            )
+            for n, (a, b) in enumerate(zip(left.tolist(), right.tolist()))
+        )
+
+    def write_rows(self, rows: Iterable[SimilarityMatrix]) -> int:
+        """Écrire les lignes en masse (upsert sur la paire de livres)"""
+        saved = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.write_batch_size:
+                saved += self._flush(batch)
+                batch = []
+        if batch:
+            saved += self._flush(batch)
+        return saved
+
+    def _flush(self, batch: List[SimilarityMatrix]) -> int:
+        SimilarityMatrix.objects.bulk_create(
+            batch,
+            batch_size=self.write_batch_size,
+            update_conflicts=True,
+            unique_fields=['book_a_uuid', 'book_b_uuid'],
+            update_fields=[
+                'book_a_title', 'book_b_title', 'content_similarity',
+                'genre_similarity', 'author_similarity', 'overall_similarity',
+                'calculated_at', 'algorithm_version',
+            ],
+        )
+        return len(batch)
+
+    @staticmethod
+    def _incremental_query_indices(uuids: List, touched: List) -> np.ndarray:
+        """
+        Lignes à recalculer pour un calcul partiel.
+
+        Une paire (A, B) reste valide si l'un des deux livres garde l'autre
+        dans ses K voisins : les livres touchés et tous leurs voisins
+        actuels sont donc recalculés.
+        """
+        index_by_uuid = {str(u): i for i, u in enumerate(uuids)}
+        wanted = {str(u) for u in touched}
+        for book_a, book_b in SimilarityMatrix.objects.filter(
+            Q(book_a_uuid__in=touched) | Q(book_b_uuid__in=touched)
+        ).values_list('book_a_uuid', 'book_b_uuid').iterator():
+            wanted.add(str(book_a))
+            wanted.add(str(book_b))
+        return np.array(
+            sorted(index_by_uuid[u] for u in wanted if u in index_by_uuid), dtype=np.int64
+        )
+
+    def run(self, book_uuids: Optional[List] = None, dry_run: bool = False) -> SimilarityRunStats:
+        """
+        Recalculer la matrice de similarité.
+
+        Si `book_uuids` est fourni, seuls ces livres (et leurs voisins actuels)
+        sont comparés au reste du catalogue ; sinon tout le catalogue est
+        recalculé. Les paires qui ne font plus partie des K voisins sont
+        supprimées.
+        """
+        stats = SimilarityRunStats()
+        start_time = time.monotonic()
+
+        try:
+            uuids, titles, blocks = self.load_vectors()
+            stats.books = len(uuids)
+            if stats.books < 2:
+                logger.warning("Pas assez de vecteurs de livres pour calculer la similarité")
+                return stats
+
+            features = build_features(blocks)
+
+            query_indices = None
+            touched = None
+            if book_uuids:
+                wanted = {str(u) for u in book_uuids}
+                touched = [u for u in uuids if str(u) in wanted]
+                query_indices = self._incremental_query_indices(uuids, touched)
+
+            pairs = self.compute_neighbours(features, query_indices)
+
+            if dry_run:
+                stats.pairs_saved = len(pairs[0])
+                return stats
+
+            with transaction.atomic():
+                run_started = timezone.now()
+                stats.pairs_saved = self.write_rows(
+                    self.build_rows(pairs, uuids, titles, blocks)
+                )
+                # Supprimer les paires qui ne font plus partie des voisins
+                stale = SimilarityMatrix.objects.filter(calculated_at__lt=run_started)
+                if touched is not None:
+                    # Les deux extrémités de chaque paire touchée ont été
+                    # recalculées : une paire encore voisine a été réécrite
+                    stale = stale.filter(
+                        Q(book_a_uuid__in=touched) | Q(book_b_uuid__in=touched)
+                    )
+                stats.deleted_old = stale.delete()[0]
+
+            return stats
+
+        finally:
+            stats.elapsed_seconds = time.monotonic() - start_time
+            stats.peak_memory_mb = _peak_rss_mb()
+            logger.info(
+                f"Moteur de similarité: {stats.books} livres, {stats.pairs_saved} paires "
+                f"en {stats.elapsed_seconds:.2f}s ({stats.rows_per_second:.0f} lignes/s, "
+                f"pic mémoire du processus {stats.peak_memory_mb:.1f} Mo)"
+            )
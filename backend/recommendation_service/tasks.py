@@ -19,6 +19,11 @@ from .utils import (
     generate_personalized_recommendations, calculate_recommendation_stats,
     get_trending_books, clean_old_recommendation_data, get_recommendation_analytics
 )
+from .ann_index import ANN_REBUILD_LOCK_KEY, get_ann_index, schedule_ann_rebuild
+from .materializer import RecommendationMaterializer
+from .rating_matrix import RATING_MATRIX_REBUILD_LOCK_KEY, rebuild_rating_matrix
+from .similarity_engine import BookSimilarityEngine
+from .trending import trending_engine
 from .signals import (
     similarity_matrix_updated, trending_books_updated, recommendation_generated
 )
@@ -81,32 +86,81 @@ def generate_user_recommendations(self, user_id: int, algorithm: str = 'hybrid',
 
 
 @shared_task
-def batch_generate_recommendations(user_ids: List[int], algorithm: str = 'hybrid'):
+def batch_generate_recommendations(user_ids: Optional[List[int]] = None, algorithm: str = 'hybrid',
+                                   user_limit: Optional[int] = None, chunk_size: int = 100):
     """
     Générer des recommandations pour plusieurs utilisateurs en lot
+    
+    Les utilisateurs sont découpés en lots matérialisés par une tâche chacun.
+    Sans liste explicite, seuls les utilisateurs modifiés depuis le dernier
+    passage sont traités.
     """
+    if user_ids is None:
+        materializer = RecommendationMaterializer(algorithm=algorithm)
+        user_ids = sorted(materializer.changed_user_ids())
+    
+    if user_limit:
+        user_ids = user_ids[:user_limit]
+    
     results = []
     
-    for user_id in user_ids:
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
         try:
-            result = generate_user_recommendations.delay(user_id, algorithm)
+            result = materialize_recommendations_batch.delay(chunk, algorithm)
             results.append({
-                'user_id': user_id,
+                'user_count': len(chunk),
                 'task_id': result.id,
                 'status': 'queued'
             })
         except Exception as e:
-            logger.error(f"Erreur lors de la mise en file d'attente pour l'utilisateur {user_id}: {str(e)}")
+            logger.error(f"Erreur lors de la mise en file d'attente du lot {start // chunk_size + 1}: {str(e)}")
             results.append({
-                'user_id': user_id,
+                'user_count': len(chunk),
                 'status': 'error',
                 'error': str(e)
             })
     
-    logger.info(f"Génération en lot lancée pour {len(user_ids)} utilisateurs")
+    logger.info(f"Génération en lot lancée pour {len(user_ids)} utilisateurs ({len(results)} lots)")
     return results
 
 
+@shared_task(bind=True, max_retries=2)
+def materialize_recommendations_batch(self, user_ids: List[int], algorithm: str = 'hybrid',
+                                      contexts: Optional[List[str]] = None):
+    """
+    Calculer et stocker les recommandations d'un lot d'utilisateurs
+    """
+    try:
+        materializer = RecommendationMaterializer(algorithm=algorithm, contexts=contexts)
+        stats = materializer.materialize_users(user_ids)
+        return {'success': True, **stats}
+        
+    except Exception as exc:
+        logger.error(f"Erreur lors de la matérialisation du lot: {str(exc)}")
+        
+        if self.request.retries < self.max_retries:
+            raise self.retry(countdown=120)
+        
+        return {'success': False, 'error': str(exc)}
+
+
+@shared_task
+def refresh_materialized_recommendations(algorithm: str = 'hybrid', user_limit: Optional[int] = None):
+    """
+    Rafraîchir les recommandations des utilisateurs dont les interactions
+    ou le profil ont changé depuis le dernier passage
+    """
+    try:
+        materializer = RecommendationMaterializer(algorithm=algorithm)
+        stats = materializer.refresh_changed(limit=user_limit)
+        return {'success': True, **stats}
+        
+    except Exception as e:
+        logger.error(f"Erreur lors du rafraîchissement des recommandations: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
 @shared_task(bind=True, max_retries=2)
 def update_book_vectors(self, book_ids: Optional[List[int]] = None):
     """
@@ -121,6 +175,7 @@ def update_book_vectors(self, book_ids: Optional[List[int]] = None):
             books = Book.objects.filter(updated_at__gte=yesterday)
         
         updated_count = 0
+        updated_uuids = []
         
         for book in books:
             try:
@@ -174,12 +229,21 @@ def update_book_vectors(self, book_ids: Optional[List[int]] = None):
                 
                 book_vector.save()
                 updated_count += 1
+                updated_uuids.append(book_vector.book_uuid)
                 
             except Exception as e:
                 logger.error(f"Erreur lors de la mise à jour du vecteur pour le livre {book.id}: {str(e)}")
                 continue
         
         logger.info(f"Vecteurs mis à jour pour {updated_count} livres")
+        
+        # Insertion incrémentale dans l'index ANN des livres similaires
+        if updated_uuids:
+            ann_index = get_ann_index()
+            ann_index.upsert(updated_uuids)
+            if ann_index.needs_rebuild:
+                schedule_ann_rebuild()
+        
         return {'success': True, 'updated_count': updated_count}
         
     except Exception as exc:
@@ -192,78 +256,62 @@ def update_book_vectors(self, book_ids: Optional[List[int]] = None):
 
 
 @shared_task(bind=True, max_retries=2)
-def calculate_similarity_matrix(self, batch_size: int = 100):
+def rebuild_ann_index(self, nlist: Optional[int] = None):
     """
-    Calculer la matrice de similarité entre les livres
+    Reconstruire l'index ANN (IVF) des livres similaires
     """
+    retrying = False
     try:
-        logger.info("Début du calcul de la matrice de similarité")
+        stats = get_ann_index().build(nlist=nlist)
+        return {'success': True, **stats}
         
-        # Obtenir tous les vecteurs de livres
-        book_vectors = BookVector.objects.select_related('book').all()
+    except Exception as exc:
+        logger.error(f"Erreur lors de la reconstruction de l'index ANN: {str(exc)}")
         
-        if book_vectors.count() < 2:
-            logger.warning("Pas assez de vecteurs de livres pour calculer la similarité")
-            return {'success': False, 'error': 'Not enough book vectors'}
+        if self.request.retries < self.max_retries:
+            retrying = True
+            raise self.retry(countdown=600)
         
-        # Traiter par lots pour éviter les problèmes de mémoire
-        total_pairs = 0
+        return {'success': False, 'error': str(exc)}
+    
+    finally:
+        # Le verrou posé par `schedule_ann_rebuild` couvre aussi les nouvelles tentatives
+        if not retrying:
+            cache.delete(ANN_REBUILD_LOCK_KEY)
+
+
+@shared_task(bind=True, max_retries=2)
+def calculate_similarity_matrix(self, batch_size: int = 1024, top_k: int = 50,
+                                threshold: float = 0.1):
+    """
+    Calculer la matrice de similarité entre les livres (top-K voisins par livre)
+    """
+    try:
+        logger.info("Début du calcul de la matrice de similarité")
         
-        for i, vector1 in enumerate(book_vectors):
-            if i % batch_size == 0:
-                logger.info(f"Traitement du lot {i // batch_size + 1}")
-            
-            for j, vector2 in enumerate(book_vectors[i+1:], i+1):
-                try:
-                    # Calculer la similarité cosinus
-                    similarity_score = calculate_cosine_similarity_vectors(
-                        vector1, vector2
-                    )
-                    
-                    if similarity_score > 0.1:  # Seuil minimum de similarité
-                        # Sauvegarder la similarité
-                        SimilarityMatrix.objects.update_or_create(
-                            book1=vector1.book,
-                            book2=vector2.book,
-                            defaults={
-                                'similarity_score': similarity_score,
-                                'algorithm_type': 'cosine',
-                                'last_calculated': timezone.now()
-                            }
-                        )
-                        
-                        # Sauvegarder aussi la relation inverse
-                        SimilarityMatrix.objects.update_or_create(
-                            book1=vector2.book,
-                            book2=vector1.book,
-                            defaults={
-                                'similarity_score': similarity_score,
-                                'algorithm_type': 'cosine',
-                                'last_calculated': timezone.now()
-                            }
-                        )
-                        
-                        total_pairs += 1
-                
-                except Exception as e:
-                    logger.error(f"Erreur lors du calcul de similarité entre {vector1.book.id} et {vector2.book.id}: {str(e)}")
-                    continue
+        engine = BookSimilarityEngine(
+            top_k=top_k,
+            threshold=threshold,
+            block_size=batch_size
+        )
+        stats = engine.run()
         
-        # Nettoyer les anciennes similarités
-        old_threshold = timezone.now() - timedelta(days=7)
-        deleted_count = SimilarityMatrix.objects.filter(
-            last_calculated__lt=old_threshold
-        ).delete()[0]
+        if stats.books < 2:
+            return {'success': False, 'error': 'Not enough book vectors'}
         
-        logger.info(f"Matrice de similarité calculée: {total_pairs} paires, {deleted_count} anciennes supprimées")
+        logger.info(
+            f"Matrice de similarité calculée: {stats.pairs_saved} paires, "
+            f"{stats.deleted_old} anciennes supprimées"
+        )
         
         # Émettre le signal de mise à jour
         similarity_matrix_updated.send(sender=None)
         
         return {
             'success': True,
-            'total_pairs': total_pairs,
-            'deleted_old': deleted_count
+            'total_pairs': stats.pairs_saved,
+            'deleted_old': stats.deleted_old,
+            **stats.as_dict()
         }
         
     except Exception as exc:
@@ -275,6 +323,29 @@ def calculate_similarity_matrix(self, batch_size: int = 100):
         return {'success': False, 'error': str(exc)}
 
 
+@shared_task
+def rebuild_rating_matrix_task():
+    """
+    Reconstruire la matrice creuse utilisateur × livre des notes
+    """
+    try:
+        matrix = rebuild_rating_matrix()
+        
+        return {
+            'success': True,
+            'users': matrix.shape[0],
+            'books': matrix.shape[1],
+            'ratings': int(matrix.ratings.nnz)
+        }
+        
+    except Exception as e:
+        logger.error(f"Erreur lors de la reconstruction de la matrice des notes: {str(e)}")
+        return {'success': False, 'error': str(e)}
+    
+    finally:
+        cache.delete(RATING_MATRIX_REBUILD_LOCK_KEY)
+
+
 def calculate_cosine_similarity_vectors(vector1: BookVector, vector2: BookVector) -> float:
     """
     Calculer la similarité cosinus entre deux vecteurs de livres
@@ -321,62 +392,18 @@ def calculate_cosine_similarity_vectors(vector1: BookVector, vector2: BookVector
 @shared_task
 def update_trending_books():
     """
-    Mettre à jour les livres en tendance
+    Mettre à jour les livres en tendance : une lecture des interactions pour
+    toutes les fenêtres, puis remplacement atomique du classement actif
     """
     try:
         logger.info("Mise à jour des livres en tendance")
         
-        periods = ['day', 'week', 'month']
-        trend_types = ['overall', 'genre', 'new_releases']
-        
-        for period in periods:
-            for trend_type in trend_types:
-                try:
-                    trending_books = get_trending_books(
-                        period=period,
-                        trend_type=trend_type,
-                        limit=50
-                    )
-                    
-                    # Marquer tous les anciens comme inactifs pour cette catégorie
-                    TrendingBook.objects.filter(
-                        period=period,
-                        trend_type=trend_type
-                    ).update(is_active=False)
-                    
-                    # Créer ou mettre à jour les nouveaux
-                    for rank, book_data in enumerate(trending_books, 1):
-                        TrendingBook.objects.update_or_create(
-                            book_id=book_data['book_id'],
-                            period=period,
-                            trend_type=trend_type,
-                            defaults={
-                                'rank': rank,
-                                'score': book_data.get('score', 0.0),
-                                'is_active': True,
-                                'last_updated': timezone.now()
-                            }
-                        )
-                    
-                    logger.info(f"Tendances mises à jour: {period}/{trend_type} - {len(trending_books)} livres")
-                    
-                except Exception as e:
-                    logger.error(f"Erreur lors de la mise à jour des tendances {period}/{trend_type}: {str(e)}")
-                    continue
-        
-        # Nettoyer les anciennes entrées
-        old_threshold = timezone.now() - timedelta(days=30)
-        deleted_count = TrendingBook.objects.filter(
-            last_updated__lt=old_threshold,
-            is_active=False
-        ).delete()[0]
-        
-        logger.info(f"Livres en tendance mis à jour, {deleted_count} anciennes entrées supprimées")
+        stats = trending_engine.refresh()
         
         # Émettre le signal de mise à jour
         trending_books_updated.send(sender=None)
         
-        return {'success': True, 'deleted_old': deleted_count}
+        return {'success': True, 'trending': stats}
         
     except Exception as e:
         logger.error(f"Erreur lors de la mise à jour des tendances: {str(e)}")
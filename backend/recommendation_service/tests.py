@@ -8,21 +8,35 @@ from rest_framework import status
 from unittest.mock import patch, MagicMock
 from datetime import timedelta
 import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import numpy as np
 
 from catalog_service.models import Book, BookRating
 from .models import (
     UserProfile, BookVector, UserInteraction, RecommendationSet,
-    Recommendation, SimilarityMatrix, TrendingBook, RecommendationFeedback
+    Recommendation, SimilarityMatrix, TrendingBook, RecommendationFeedback,
+    MaterializedRecommendation
 )
 from .utils import (
     generate_personalized_recommendations, calculate_cosine_similarity,
     calculate_diversity_score, calculate_novelty_score, calculate_confidence_score,
-    find_similar_users, get_trending_books
+    find_similar_users, get_trending_books, generate_collaborative_recommendations
 )
 from .serializers import (
     UserProfileSerializer, UserInteractionSerializer, RecommendationSerializer
 )
 from .permissions import IsOwnerOrReadOnly, CanAccessRecommendations
+from .materializer import RecommendationMaterializer, slice_materialized
+from . import rating_matrix
+from .rating_matrix import RatingMatrix, get_rating_matrix
+from .similarity_engine import BookSimilarityEngine
+from .ann_index import ANNIndex, schedule_ann_rebuild
+from .trending import TrendingEngine, HotTrending, LocalHotScores
 
 User = get_user_model()
 
@@ -400,6 +414,19 @@ class RecommendationAPITest(APITestCase):
         
         mock_generate.assert_called_once()
     
+    @patch('recommendation_service.views.materialize_recommendations_batch.delay')
+    def test_personalized_recommendations_rejects_unknown_parameters(self, mock_delay):
+        """Un algorithme ou un contexte inconnu est refusé sans créer de tâche"""
+        url = reverse('recommendation_service:personalized-recommendations')
+        
+        response = self.client.get(url, {'algorithm': 'x' * 40})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.get(url, {'algorithm': 'hybrid', 'context': 'unknown'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        mock_delay.assert_not_called()
+    
     def test_recommendation_feedback_create(self):
         """Test de création de feedback de recommandation"""
         # Créer une recommandation
@@ -858,4 +885,505 @@ class RecommendationPerformanceTest(TestCase):
         execution_time = end_time - start_time
         
         self.assertLess(execution_time, 5)  # Moins de 5 secondes
-        print(f"Temps de calcul de similarité pour {len(similarities)} paires: {execution_time:.2f} secondes")
\ No newline at end of file
+        print(f"Temps de calcul de similarité pour {len(similarities)} paires: {execution_time:.2f} secondes")
+
+class BookSimilarityEngineTest(TestCase):
+    """Tests pour le moteur de similarité vectorisé"""
+    
+    def setUp(self):
+        self.engine = BookSimilarityEngine(top_k=2, threshold=0.1, block_size=2)
+    
+    def _create_vector(self, title, content_vector, genre_vector):
+        return BookVector.objects.create(
+            book_uuid=uuid.uuid4(),
+            book_title=title,
+            content_vector=content_vector,
+            genre_vector=genre_vector,
+            author_vector=[],
+            metadata_vector=[]
+        )
+    
+    def test_compute_neighbours_keeps_top_k_unique_pairs(self):
+        """Chaque livre garde ses K voisins et chaque paire n'apparaît qu'une fois"""
+        features = np.array([
+            [1.0, 0.0, 0.0],
+            [0.9, 0.1, 0.0],
+            [0.0, 1.0, 0.0],
+            [0.0, 0.9, 0.1],
+        ], dtype=np.float32)
+        
+        left, right, scores = self.engine.compute_neighbours(features)
+        pairs = set(zip(left.tolist(), right.tolist()))
+        
+        self.assertIn((0, 1), pairs)
+        self.assertIn((2, 3), pairs)
+        self.assertTrue(all(a < b for a, b in pairs))
+        self.assertEqual(len(pairs), len(left))
+        self.assertTrue(np.all(scores >= 0.1))
+    
+    def test_run_bulk_writes_similarity_rows(self):
+        """Le calcul complet écrit les paires et rapporte les statistiques"""
+        self._create_vector('Livre A', [1.0, 0.0], [1.0, 0.0])
+        self._create_vector('Livre B', [0.9, 0.1], [1.0, 0.0])
+        self._create_vector('Livre C', [0.0, 1.0], [0.0, 1.0])
+        
+        stats = self.engine.run()
+        
+        self.assertEqual(stats.books, 3)
+        self.assertEqual(SimilarityMatrix.objects.count(), stats.pairs_saved)
+        self.assertGreater(stats.pairs_saved, 0)
+        self.assertGreaterEqual(stats.peak_memory_mb, 0.0)
+        
+        # Un second calcul met à jour les lignes sans les dupliquer
+        second = self.engine.run()
+        self.assertEqual(SimilarityMatrix.objects.count(), second.pairs_saved)
+    
+    def test_incremental_run_keeps_neighbours_of_other_books(self):
+        """Un recalcul partiel ne supprime pas les voisins des livres non recalculés"""
+        engine = BookSimilarityEngine(top_k=1, threshold=0.1)
+        vectors = []
+        for i, content_vector in enumerate([[1.0, 0.0], [0.6, 0.8], [0.5, 0.87]], start=1):
+            vector = self._create_vector(f'Livre {i}', content_vector, [1.0, 0.0])
+            BookVector.objects.filter(pk=vector.pk).update(book_uuid=uuid.UUID(int=i))
+            vectors.append(uuid.UUID(int=i))
+        first, touched, third = vectors
+        engine.run()
+        
+        # Le voisin de `first` est `touched`, mais celui de `touched` est `third`
+        engine.run(book_uuids=[touched])
+        
+        self.assertTrue(SimilarityMatrix.objects.filter(book_a_uuid=first, book_b_uuid=touched).exists())
+        self.assertTrue(SimilarityMatrix.objects.filter(book_a_uuid=touched, book_b_uuid=third).exists())
+    
+    def test_incremental_run_keeps_pairs_owned_by_the_other_endpoint(self):
+        """Une paire voisine pour le seul livre non recalculé n'est pas supprimée"""
+        engine = BookSimilarityEngine(top_k=1, threshold=0.1)
+        for i, degrees in enumerate([45, 40, 60], start=1):
+            angle = np.radians(degrees)
+            vector = self._create_vector(
+                f'Livre {i}', [float(np.cos(angle)), float(np.sin(angle))], [1.0, 0.0]
+            )
+            BookVector.objects.filter(pk=vector.pk).update(book_uuid=uuid.UUID(int=i))
+        engine.run()
+        full_pairs = set(SimilarityMatrix.objects.values_list('book_a_uuid', 'book_b_uuid'))
+        self.assertEqual(full_pairs, {
+            (uuid.UUID(int=1), uuid.UUID(int=2)), (uuid.UUID(int=1), uuid.UUID(int=3))
+        })
+        
+        # Le seul voisin du livre 3 est le livre 1
+        engine.run(book_uuids=[uuid.UUID(int=1)])
+        
+        self.assertEqual(
+            set(SimilarityMatrix.objects.values_list('book_a_uuid', 'book_b_uuid')), full_pairs
+        )
+    
+    def test_incremental_run_deletes_stale_pairs_of_book_b(self):
+        """Une paire périmée est supprimée même si le livre touché est en position B"""
+        engine = BookSimilarityEngine(top_k=1, threshold=0.0)
+        vectors = {}
+        for i, content_vector in enumerate([[1.0, 0.0], [0.9, 0.1], [0.0, 1.0], [0.1, 0.9]], start=1):
+            vector = self._create_vector(f'Livre {i}', content_vector, [1.0, 0.0])
+            BookVector.objects.filter(pk=vector.pk).update(book_uuid=uuid.UUID(int=i))
+            vectors[i] = uuid.UUID(int=i)
+        engine.run()
+        self.assertTrue(SimilarityMatrix.objects.filter(book_a_uuid=vectors[1], book_b_uuid=vectors[2]).exists())
+        
+        # Le livre 2 rejoint les livres 3 et 4 : la paire (1, 2) n'a plus de raison d'être
+        BookVector.objects.filter(book_uuid=vectors[2]).update(content_vector=[0.0, 1.0])
+        engine.run(book_uuids=[vectors[2]])
+        
+        self.assertFalse(SimilarityMatrix.objects.filter(book_a_uuid=vectors[1], book_b_uuid=vectors[2]).exists())
+
+
+class ANNIndexTest(TestCase):
+    """Tests pour l'index ANN des livres similaires"""
+    
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.index = ANNIndex(path=self.index_dir, nprobe=4)
+        self.vectors = [
+            BookVector.objects.create(
+                book_uuid=uuid.uuid4(),
+                book_title=f'Livre {i}',
+                content_vector=content_vector,
+                genre_vector=[1.0, 0.0],
+                author_vector=[],
+                metadata_vector=[]
+            )
+            for i, content_vector in enumerate([
+                [1.0, 0.0, 0.0], [0.9, 0.1, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]
+            ])
+        ]
+    
+    def tearDown(self):
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+    
+    def test_search_without_index_returns_none(self):
+        """Sans index construit, l'appelant doit se replier sur la table"""
+        self.assertIsNone(self.index.search(self.vectors[0].book_uuid))
+    
+    def test_build_and_search_nearest_first(self):
+        """Le voisin le plus proche arrive en tête, sans le livre lui-même"""
+        stats = self.index.build(nlist=2)
+        self.assertEqual(stats['books'], 4)
+        
+        results = self.index.search(self.vectors[0].book_uuid, k=2)
+        
+        self.assertEqual(results[0]['book_uuid'], str(self.vectors[1].book_uuid))
+        self.assertNotIn(str(self.vectors[0].book_uuid), [r['book_uuid'] for r in results])
+        self.assertIn('genre', results[0]['reasons'])
+    
+    def test_upsert_overrides_indexed_vector(self):
+        """Un livre mis à jour est servi depuis le delta sans reconstruction"""
+        self.index.build(nlist=2)
+        moved = self.vectors[3]
+        moved.content_vector = [1.0, 0.0, 0.0]
+        moved.save()
+        
+        self.assertEqual(self.index.upsert([moved.book_uuid]), 1)
+        
+        # Une autre instance (autre processus) voit aussi le delta
+        results = ANNIndex(path=self.index_dir).search(self.vectors[0].book_uuid, k=1)
+        self.assertEqual(results[0]['book_uuid'], str(moved.book_uuid))
+        self.assertAlmostEqual(results[0]['similarity'], 1.0, places=5)
+    
+    def test_upserts_from_several_processes_are_merged(self):
+        """Une instance au delta périmé n'efface pas les insertions d'une autre"""
+        self.index.build(nlist=2)
+        other = ANNIndex(path=self.index_dir)
+        other.search(self.vectors[0].book_uuid)
+        
+        self.index.upsert([self.vectors[2].book_uuid])
+        self.assertEqual(other.upsert([self.vectors[3].book_uuid]), 2)
+    
+    def test_rebuild_keeps_previous_version_and_replays_upserts(self):
+        """Les insertions faites pendant une reconstruction survivent à la bascule"""
+        self.index.build(nlist=2)
+        first_version = self.index._read_current()
+        moved = self.vectors[3]
+        load_vectors = BookSimilarityEngine.load_vectors
+        
+        def load_then_upsert(engine, queryset=None, widths=None):
+            result = load_vectors(engine, queryset, widths)
+            if queryset is None:
+                # Un autre worker met à jour un livre après la lecture des vecteurs
+                moved.content_vector = [1.0, 0.0, 0.0]
+                moved.save()
+                ANNIndex(path=self.index_dir).upsert([moved.book_uuid])
+            return result
+        
+        with patch.object(BookSimilarityEngine, 'load_vectors', autospec=True,
+                          side_effect=load_then_upsert):
+            self.index.build(nlist=2)
+        
+        self.assertTrue(os.path.isdir(os.path.join(self.index_dir, first_version)))
+        results = ANNIndex(path=self.index_dir).search(self.vectors[0].book_uuid, k=1)
+        self.assertEqual(results[0]['book_uuid'], str(moved.book_uuid))
+        
+        # La version précédente n'est supprimée qu'à la reconstruction suivante
+        self.index.build(nlist=2)
+        self.assertFalse(os.path.isdir(os.path.join(self.index_dir, first_version)))
+    
+    @patch('recommendation_service.tasks.rebuild_ann_index.delay')
+    def test_rebuild_is_scheduled_once(self, mock_delay):
+        """Une seule reconstruction est planifiée tant que la tâche n'a pas tourné"""
+        cache.clear()
+        self.assertTrue(schedule_ann_rebuild())
+        self.assertFalse(schedule_ann_rebuild())
+        mock_delay.assert_called_once_with()
+    
+    def test_similar_books_endpoint_serves_ann_results(self):
+        """L'API résout les identifiants de l'index en livres du catalogue"""
+        cache.clear()
+        books = [
+            Book.objects.create(
+                title=vector.book_title,
+                description='Livre indexé',
+                status='published'
+            )
+            for vector in self.vectors
+        ]
+        for book, vector in zip(books, self.vectors):
+            BookVector.objects.filter(pk=vector.pk).update(book_uuid=book.id)
+        self.index.build(nlist=2)
+        
+        user = User.objects.create_user(
+            username='annuser', email='ann@example.com', password='testpass123'
+        )
+        client = APIClient()
+        client.force_authenticate(user=user)
+        url = reverse('recommendation_service:similar-books', args=[books[0].id])
+        
+        with patch('recommendation_service.ann_index.get_ann_index', return_value=self.index):
+            response = client.get(url, {'count': 2})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['algorithm'], 'ann_index')
+        self.assertEqual(response.data['similar_books'][0]['book']['id'], books[1].id)
+
+
+class RatingMatrixTest(TestCase):
+    """Tests pour la matrice creuse des notes"""
+    
+    def setUp(self):
+        self.matrix = RatingMatrix.build([
+            (1, 'book-a', 5), (1, 'book-b', 4), (1, 'book-c', 1),
+            (2, 'book-a', 5), (2, 'book-b', 4), (2, 'book-d', 2),
+            (2, 'book-d', 5),  # La dernière note l'emporte
+            (3, 'book-c', 5), (3, 'book-e', 5),
+        ])
+    
+    def test_build_keeps_latest_rating(self):
+        """Une seule cellule par couple utilisateur/livre"""
+        self.assertEqual(self.matrix.shape, (3, 5))
+        self.assertEqual(self.matrix.ratings.nnz, 8)
+        row = self.matrix.user_index[2]
+        col = self.matrix.book_index['book-d']
+        self.assertEqual(self.matrix.ratings[row, col], 5)
+    
+    def test_similar_users_sorted_by_similarity(self):
+        """Les voisins sont triés et l'utilisateur lui-même est exclu"""
+        similar = self.matrix.similar_users(1, limit=5)
+        
+        self.assertEqual(similar[0][0], 2)
+        self.assertNotIn(1, [user_id for user_id, _ in similar])
+        self.assertEqual(similar, sorted(similar, key=lambda x: x[1], reverse=True))
+        self.assertEqual(self.matrix.similar_users(999), [])
+    
+    def test_score_books_excludes_read_books(self):
+        """Les livres déjà lus ne sont pas recommandés"""
+        similar = self.matrix.similar_users(1, limit=5)
+        scored = self.matrix.score_books(similar, exclude=['book-a', 'book-b', 'book-c'])
+        
+        book_uuids = [book_uuid for book_uuid, _, _ in scored]
+        self.assertIn('book-d', book_uuids)
+        self.assertNotIn('book-a', book_uuids)
+        self.assertTrue(all(0 < score <= 1 for _, score, _ in scored))
+    
+    def test_collaborative_candidates_are_fetched_in_one_batch(self):
+        """Les livres candidats sont lus en un seul appel groupé"""
+        book_service = MagicMock()
+        book_service.get_books_by_ids.return_value = {
+            'book-d': {'id': 'book-d', 'title': 'Livre D'},
+            'book-e': {'id': 'book-e', 'title': 'Livre E'},
+        }
+        
+        with patch('recommendation_service.utils.get_rating_matrix', return_value=self.matrix), \
+                patch('recommendation_service.utils.get_book_service', return_value=book_service):
+            recommendations = generate_collaborative_recommendations(
+                MagicMock(id=1), None, {'book-a', 'book-b', 'book-c'}, 1, 'general'
+            )
+        
+        book_service.get_books_by_ids.assert_called_once()
+        book_service.get_book_by_id.assert_not_called()
+        self.assertEqual(len(recommendations), 1)
+        self.assertIn(recommendations[0][0]['id'], book_service.get_books_by_ids.call_args.args[0])
+    
+    @patch('recommendation_service.tasks.rebuild_rating_matrix_task.delay')
+    def test_stale_matrix_is_served_while_rebuilt_in_background(self, mock_delay):
+        """Une matrice périmée est servie et une seule reconstruction est planifiée"""
+        cache.clear()
+        self.matrix.built_at = time.time() - rating_matrix.RATING_MATRIX_TTL - 1
+        
+        with patch.object(rating_matrix, '_local_matrix', self.matrix):
+            self.assertIs(get_rating_matrix(), self.matrix)
+            self.assertIs(get_rating_matrix(), self.matrix)
+        
+        mock_delay.assert_called_once_with()
+
+
+class RecommendationMaterializerTest(TestCase):
+    """Tests pour la matérialisation des recommandations"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='materialized',
+            email='materialized@example.com',
+            password='testpass123'
+        )
+        # Le profil est créé par le signal post_save de l'utilisateur
+        UserProfile.objects.get_or_create(user=self.user)
+        self.materializer = RecommendationMaterializer(algorithm='hybrid')
+    
+    @patch('recommendation_service.utils.generate_personalized_recommendations')
+    def test_materialize_and_serve(self, mock_generate):
+        """Les listes matérialisées sont servies sans recalcul"""
+        mock_generate.return_value = {
+            'books': [{'id': str(i), 'score': 1.0 - i / 100} for i in range(20)],
+            'algorithm_used': 'hybrid'
+        }
+        
+        self.assertIsNone(self.materializer.get(self.user.id))
+        
+        stats = self.materializer.materialize_users([self.user.id])
+        self.assertEqual(stats['users'], 1)
+        self.assertEqual(MaterializedRecommendation.objects.count(), 1)
+        
+        cache.clear()
+        payload = self.materializer.get(self.user.id)
+        self.assertEqual(len(slice_materialized(payload, 5)['books']), 5)
+        
+        # Un second passage met à jour la ligne existante
+        self.materializer.materialize_users([self.user.id])
+        self.assertEqual(MaterializedRecommendation.objects.count(), 1)
+    
+    def test_changed_user_ids_uses_watermark(self):
+        """Seuls les utilisateurs modifiés depuis le filigrane sont rafraîchis"""
+        self.assertIn(self.user.id, self.materializer.changed_user_ids())
+        
+        self.materializer.set_watermark(timezone.now())
+        self.assertNotIn(self.user.id, self.materializer.changed_user_ids())
+        
+        UserInteraction.objects.create(
+            user=self.user,
+            book_uuid=uuid.uuid4(),
+            book_title='Livre',
+            interaction_type='view'
+        )
+        self.assertIn(self.user.id, self.materializer.changed_user_ids())
+    
+    def test_watermark_is_kept_per_algorithm(self):
+        """Le curseur d'un algorithme ne fait pas sauter d'utilisateurs aux autres"""
+        self.materializer.set_watermark(timezone.now())
+        
+        self.assertNotIn(self.user.id, self.materializer.changed_user_ids())
+        self.assertIn(
+            self.user.id,
+            RecommendationMaterializer(algorithm='collaborative').changed_user_ids()
+        )
+    
+    @patch('recommendation_service.utils.generate_personalized_recommendations')
+    def test_limited_refresh_advances_cursor_past_processed_users(self, mock_generate):
+        """Avec une limite, chaque passage reprend après le dernier utilisateur traité"""
+        mock_generate.return_value = {'books': [], 'algorithm_used': 'hybrid'}
+        self.materializer.set_watermark(timezone.now() - timedelta(minutes=1))
+        other = User.objects.create_user(
+            username='materialized-other',
+            email='materialized-other@example.com',
+            password='testpass123'
+        )
+        UserProfile.objects.get_or_create(user=other)
+        
+        self.assertEqual(self.materializer.refresh_changed(limit=1)['users'], 1)
+        self.assertTrue(MaterializedRecommendation.objects.filter(user=self.user).exists())
+        
+        # Le premier utilisateur change encore : il passe après celui qui attend
+        UserInteraction.objects.create(
+            user=self.user,
+            book_uuid=uuid.uuid4(),
+            book_title='Livre',
+            interaction_type='view'
+        )
+        self.materializer.refresh_changed(limit=1)
+        self.assertTrue(MaterializedRecommendation.objects.filter(user=other).exists())
+
+
+class RecommendationRefreshLeaseTest(TestCase):
+    """Tests pour le bail de recalcul à la demande"""
+    
+    def setUp(self):
+        cache.clear()
+        self.materializer = RecommendationMaterializer(algorithm='hybrid')
+    
+    def test_refresh_lease_is_claimed_once(self):
+        """Un seul recalcul à la demande est planifié pendant la durée du bail"""
+        self.assertTrue(self.materializer.claim_refresh(42, 'general'))
+        self.assertFalse(self.materializer.claim_refresh(42, 'general'))
+        self.assertTrue(self.materializer.claim_refresh(42, 'home'))
+
+
+class TrendingEngineTest(TestCase):
+    """Tests pour le calcul des tendances en une passe"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='trending_user',
+            email='trending@example.com',
+            password='testpass123'
+        )
+        self.engine = TrendingEngine(limit=10, min_interactions=2, viral_min_shares=2)
+        self.now = timezone.now()
+    
+    def interact(self, book_uuid, interaction_type, count, age):
+        for _ in range(count):
+            interaction = UserInteraction.objects.create(
+                user=self.user,
+                book_uuid=book_uuid,
+                book_title=f"Livre {book_uuid}",
+                interaction_type=interaction_type
+            )
+            UserInteraction.objects.filter(pk=interaction.pk).update(timestamp=self.now - age)
+    
+    def test_single_pass_rankings(self):
+        """Toutes les fenêtres sont calculées en une seule requête"""
+        fresh, old, shared = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        self.interact(fresh, 'view', 4, timedelta(hours=2))
+        self.interact(old, 'download', 5, timedelta(days=10))
+        self.interact(shared, 'share', 3, timedelta(days=3))
+        
+        with self.assertNumQueries(1):
+            rankings = self.engine.compute(self.now)
+        
+        daily = [entry['book_uuid'] for entry in rankings['daily']]
+        weekly = [entry['book_uuid'] for entry in rankings['weekly']]
+        monthly = [entry['book_uuid'] for entry in rankings['monthly']]
+        self.assertEqual(daily, [fresh])
+        self.assertEqual(set(weekly), {fresh, shared})
+        self.assertEqual(set(monthly), {fresh, old, shared})
+        self.assertEqual(rankings['viral'][0]['book_uuid'], shared)
+        self.assertEqual(rankings['viral'][0]['share_count'], 3)
+        # Décroissance : 5 téléchargements (poids 15) vieux de 10 jours, demi-vie de 7 jours
+        old_entry = next(entry for entry in rankings['monthly'] if entry['book_uuid'] == old)
+        self.assertAlmostEqual(old_entry['trend_score'], 15 * 2 ** (-239.5 / 168), places=1)
+        self.assertEqual([entry['book_uuid'] for entry in rankings['rising']], [fresh])
+    
+    def test_refresh_replaces_active_set(self):
+        """Le classement précédent est remplacé en bloc"""
+        first, second = uuid.uuid4(), uuid.uuid4()
+        self.interact(first, 'view', 3, timedelta(hours=1))
+        self.engine.refresh(self.now)
+        self.assertEqual(
+            list(TrendingBook.objects.filter(trend_type='daily').values_list('book_uuid', flat=True)),
+            [first]
+        )
+        
+        UserInteraction.objects.all().delete()
+        self.interact(second, 'view', 3, timedelta(hours=1))
+        self.engine.refresh(self.now + timedelta(minutes=5))
+        
+        self.assertEqual(
+            list(TrendingBook.objects.filter(trend_type='daily').values_list('book_uuid', flat=True)),
+            [second]
+        )
+        self.assertFalse(TrendingBook.objects.filter(book_uuid=first).exists())
+
+
+class HotTrendingTest(TestCase):
+    """Tests pour le score chaud à décroissance exponentielle"""
+    
+    def setUp(self):
+        self.hot = HotTrending(key='test:hot', half_life_hours=1)
+        self.hot._store = LocalHotScores('test:hot')
+        self.epoch = self.hot.store.epoch()
+    
+    def test_recent_interactions_outrank_older_ones(self):
+        """Une interaction récente pèse plus qu'une ancienne de même type"""
+        self.hot.record('old', 'download', at=self.epoch)
+        self.hot.record('new', 'download', at=self.epoch + 3600)
+        
+        top = self.hot.top(now=self.epoch + 3600)
+        self.assertEqual([entry['book_uuid'] for entry in top], ['new', 'old'])
+        self.assertAlmostEqual(top[0]['score'], 3.0, places=3)
+        self.assertAlmostEqual(top[1]['score'], 1.5, places=3)
+    
+    def test_rebase_preserves_scores(self):
+        """La renormalisation ne change pas les scores ramenés au présent"""
+        self.hot.record('book', 'view', at=self.epoch)
+        later = self.epoch + 3600 * 80  # exposant au-delà du seuil de renormalisation
+        self.hot.record('other', 'view', at=later)
+        
+        self.assertEqual(self.hot.store.epoch(), later)
+        scores = {entry['book_uuid']: entry['score'] for entry in self.hot.top(now=later)}
+        self.assertAlmostEqual(scores['other'], 1.0, places=6)
+        self.assertAlmostEqual(scores['book'], 2 ** -80, places=12)
@@ -0,0 +1,343 @@
+"""
+Calcul des tendances en une passe
+
+`TrendingEngine` lit une seule fois `UserInteraction` sur la fenêtre la
+plus longue : une requête agrégée par livre et par heure (compteurs
+`FILTER` par type d'interaction, poids pondérés), puis une passe Python
+qui alimente toutes les fenêtres (`daily`, `weekly`, `monthly`) et les
+tendances dérivées (`rising`, `viral`) avec une décroissance exponentielle
+par fenêtre. Le nouvel ensemble `TrendingBook` remplace l'ancien par
+insertion groupée dans une transaction : les lecteurs voient l'ancien
+classement ou le nouveau, jamais un mélange.
+
+`HotTrending` maintient en parallèle un score « chaud » quasi temps réel
+dans un ensemble trié Redis, mis à jour à chaque interaction. La
+décroissance est appliquée « vers l'avant » : chaque incrément est
+multiplié par e^(λ·(t - t0)), ce qui évite de toucher aux autres membres ;
+l'ensemble est renormalisé (ZUNIONSTORE … WEIGHTS) quand l'exposant
+devient trop grand.
+"""
+import heapq
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Case, Count, FloatField, Max, Q, Sum, Value, When
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import TrendingBook, UserInteraction
+
+logger = logging.getLogger(__name__)
+
+TRENDING_LIMIT = getattr(settings, 'TRENDING_LIMIT', 50)
+TRENDING_MIN_INTERACTIONS = getattr(settings, 'TRENDING_MIN_INTERACTIONS', 3)
+TRENDING_VIRAL_MIN_SHARES = getattr(settings, 'TRENDING_VIRAL_MIN_SHARES', 5)
+HOT_TRENDING_HALF_LIFE_HOURS = getattr(settings, 'HOT_TRENDING_HALF_LIFE_HOURS', 6)
+HOT_TRENDING_MAX_MEMBERS = getattr(settings, 'HOT_TRENDING_MAX_MEMBERS', 5000)
+
+INTERACTION_WEIGHTS = {
+    'view': 1.0,
+    'download': 3.0,
+    'read_start': 2.0,
+    'read_progress': 0.5,
+    'read_complete': 5.0,
+    'bookmark': 1.5,
+    'rating': 2.0,
+    'share': 4.0,
+    'purchase': 5.0,
+    'wishlist': 1.5,
+    'recommendation_click': 1.0,
+    'search': 0.0,
+}
+
+# trend_type -> (fenêtre, demi-vie de la décroissance en heures)
+TREND_WINDOWS = {
+    'daily': (timedelta(days=1), 6.0),
+    'weekly': (timedelta(days=7), 48.0),
+    'monthly': (timedelta(days=30), 168.0),
+}
+COMPUTED_TREND_TYPES = tuple(TREND_WINDOWS) + ('rising', 'viral')
+# Anciens paramètres de période des API -> type de tendance calculé
+PERIOD_TREND_TYPES = {'day': 'daily', 'week': 'weekly', 'month': 'monthly'}
+
+
+def resolve_trend_type(period: str = 'week', trend_type: Optional[str] = None) -> str:
+    """Type de tendance stocké correspondant aux paramètres d'une requête"""
+    if trend_type in COMPUTED_TREND_TYPES:
+        return trend_type
+    return PERIOD_TREND_TYPES.get(period, 'weekly')
+
+
+class _BookWindow:
+    """Accumulateurs d'un livre sur une fenêtre"""
+
+    __slots__ = ('score', 'weight', 'interactions', 'views', 'downloads', 'shares')
+
+    def __init__(self):
+        self.score = 0.0
+        self.weight = 0.0
+        self.interactions = 0
+        self.views = 0
+        self.downloads = 0
+        self.shares = 0
+
+
+class TrendingEngine:
+    """Classements de tendances calculés en une lecture des interactions"""
+
+    def __init__(self, limit: int = TRENDING_LIMIT,
+                 min_interactions: int = TRENDING_MIN_INTERACTIONS,
+                 viral_min_shares: int = TRENDING_VIRAL_MIN_SHARES):
+        self.limit = limit
+        self.min_interactions = min_interactions
+        self.viral_min_shares = viral_min_shares
+
+    def hourly_buckets(self, since):
+        """Une ligne par livre et par heure : poids et compteurs par type"""
+        weight = Case(
+            *[When(interaction_type=kind, then=Value(w)) for kind, w in INTERACTION_WEIGHTS.items()],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        return (
+            UserInteraction.objects.filter(timestamp__gte=since)
+            .annotate(bucket=TruncHour('timestamp'))
+            .values('book_uuid', 'bucket')
+            .annotate(
+                weight=Sum(weight),
+                interactions=Count('id'),
+                views=Count('id', filter=Q(interaction_type='view')),
+                downloads=Count('id', filter=Q(interaction_type='download')),
+                shares=Count('id', filter=Q(interaction_type='share')),
+                title=Max('book_title'),
+            )
+            .order_by()
+        )
+
+    def compute(self, now=None) -> Dict[str, List[Dict]]:
+        """Classements `{trend_type: [ligne, …]}` triés par score décroissant"""
+        now = now or timezone.now()
+        longest = max(window for window, _ in TREND_WINDOWS.values())
+        windows = {trend_type: defaultdict(_BookWindow) for trend_type in TREND_WINDOWS}
+        previous_week = defaultdict(float)
+        titles = {}
+
+        for row in self.hourly_buckets(now - longest).iterator(chunk_size=5000):
+            book_uuid = row['book_uuid']
+            titles[book_uuid] = row['title']
+            age = now - row['bucket']
+            # Âge au milieu de l'heure, borné à zéro pour l'heure en cours
+            age_hours = max(age.total_seconds() / 3600 - 0.5, 0.0)
+
+            for trend_type, (window, half_life) in TREND_WINDOWS.items():
+                if age > window:
+                    continue
+                stats = windows[trend_type][book_uuid]
+                stats.score += row['weight'] * 2 ** (-age_hours / half_life)
+                stats.weight += row['weight']
+                stats.interactions += row['interactions']
+                stats.views += row['views']
+                stats.downloads += row['downloads']
+                stats.shares += row['shares']
+
+            if timedelta(days=1) < age <= timedelta(days=7):
+                previous_week[book_uuid] += row['weight']
+
+        velocities = self._velocities(windows['daily'], previous_week)
+        rankings = {}
+        for trend_type, (window, _) in TREND_WINDOWS.items():
+            stats_by_book = windows[trend_type]
+            scores = {book: stats.score for book, stats in stats_by_book.items()}
+            rankings[trend_type] = self._rank(trend_type, window, stats_by_book, scores, now, titles, velocities)
+
+        rising = {book: velocity for book, velocity in velocities.items() if velocity > 0}
+        rankings['rising'] = self._rank(
+            'rising', timedelta(days=1), windows['daily'], rising, now, titles, velocities
+        )
+        weekly = windows['weekly']
+        viral = {
+            book: stats.score * stats.shares / stats.interactions
+            for book, stats in weekly.items() if stats.shares >= self.viral_min_shares
+        }
+        rankings['viral'] = self._rank('viral', timedelta(days=7), weekly, viral, now, titles, velocities)
+        return rankings
+
+    def _velocities(self, daily: Dict[str, _BookWindow], previous_week: Dict[str, float]) -> Dict[str, float]:
+        """Croissance du poids des dernières 24 h par rapport à la moyenne des 6 jours précédents"""
+        velocities = {}
+        for book_uuid, stats in daily.items():
+            baseline = previous_week.get(book_uuid, 0.0) / 6
+            velocities[book_uuid] = (stats.weight - baseline) / (baseline + 1.0)
+        return velocities
+
+    def _rank(self, trend_type: str, window: timedelta, stats_by_book: Dict[str, _BookWindow],
+              scores: Dict[str, float], now, titles: Dict, velocities: Dict) -> List[Dict]:
+        candidates = (
+            (score, book, stats_by_book[book])
+            for book, score in scores.items()
+            if stats_by_book[book].interactions >= self.min_interactions
+        )
+        top = heapq.nlargest(self.limit, candidates, key=lambda item: item[0])
+        return [
+            {
+                'book_uuid': book,
+                'book_title': titles.get(book) or '',
+                'trend_type': trend_type,
+                'trend_score': round(max(value, 0.0), 6),
+                'velocity': round(velocities.get(book, 0.0), 6),
+                'view_count': stats.views,
+                'download_count': stats.downloads,
+                'share_count': stats.shares,
+                'period_start': now - window,
+                'period_end': now,
+            }
+            for value, book, stats in top
+        ]
+
+    def refresh(self, now=None) -> Dict[str, int]:
+        """Calculer et remplacer atomiquement les classements actifs"""
+        now = now or timezone.now()
+        started = time.monotonic()
+        rankings = self.compute(now)
+        rows = [TrendingBook(**entry) for entries in rankings.values() for entry in entries]
+
+        with transaction.atomic(using=router.db_for_write(TrendingBook)):
+            TrendingBook.objects.filter(trend_type__in=COMPUTED_TREND_TYPES).delete()
+            TrendingBook.objects.bulk_create(rows, batch_size=500)
+
+        stats = {trend_type: len(entries) for trend_type, entries in rankings.items()}
+        logger.info(
+            f"Tendances recalculées en {time.monotonic() - started:.2f}s: "
+            + ', '.join(f"{trend_type}={count}" for trend_type, count in stats.items())
+        )
+        return stats
+
+
+def _uses_redis() -> bool:
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    return backend.startswith('django_redis')
+
+
+class RedisHotScores:
+    """Scores chauds dans un ensemble trié Redis (ZINCRBY)"""
+
+    def __init__(self, key: str):
+        from django_redis import get_redis_connection
+        self.redis = get_redis_connection('default')
+        self.key = key
+        self.epoch_key = f"{key}:epoch"
+
+    def epoch(self) -> float:
+        value = self.redis.get(self.epoch_key)
+        if value is None:
+            now = time.time()
+            self.redis.set(self.epoch_key, now, nx=True)
+            value = self.redis.get(self.epoch_key)
+        return float(value)
+
+    def incr(self, member: str, amount: float):
+        self.redis.zincrby(self.key, amount, member)
+
+    def top(self, limit: int) -> List[Tuple[str, float]]:
+        return [
+            (member.decode(), score)
+            for member, score in self.redis.zrevrange(self.key, 0, limit - 1, withscores=True)
+        ]
+
+    def rebase(self, factor: float, new_epoch: float, max_members: int):
+        """Multiplier tous les scores par `factor` et ne garder que les meilleurs"""
+        if not self.redis.set(f"{self.key}:rebase", 1, nx=True, ex=60):
+            # Renormalisation déjà en cours dans un autre processus
+            return
+        pipeline = self.redis.pipeline()
+        pipeline.zunionstore(self.key, {self.key: factor})
+        pipeline.zremrangebyrank(self.key, 0, -max_members - 1)
+        pipeline.set(self.epoch_key, new_epoch)
+        pipeline.execute()
+
+
+class LocalHotScores:
+    """Équivalent en mémoire (développement, tests)"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self._lock = threading.Lock()
+        self._scores: Dict[str, float] = defaultdict(float)
+        self._epoch = time.time()
+
+    def epoch(self) -> float:
+        return self._epoch
+
+    def incr(self, member: str, amount: float):
+        with self._lock:
+            self._scores[member] += amount
+
+    def top(self, limit: int) -> List[Tuple[str, float]]:
+        with self._lock:
+            return heapq.nlargest(limit, self._scores.items(), key=lambda item: item[1])
+
+    def rebase(self, factor: float, new_epoch: float, max_members: int):
+        with self._lock:
+            kept = heapq.nlargest(max_members, self._scores.items(), key=lambda item: item[1])
+            self._scores = defaultdict(float, {member: score * factor for member, score in kept})
+            self._epoch = new_epoch
+
+
+class HotTrending:
+    """Score « chaud » à décroissance exponentielle, mis à jour à chaque interaction"""
+
+    # Au-delà, e^exposant approche les limites de précision des flottants
+    MAX_EXPONENT = 50.0
+
+    def __init__(self, key: str = 'trending:hot', half_life_hours: float = HOT_TRENDING_HALF_LIFE_HOURS,
+                 max_members: int = HOT_TRENDING_MAX_MEMBERS):
+        self.key = key
+        self.decay_rate = math.log(2) / (half_life_hours * 3600)
+        self.max_members = max_members
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = RedisHotScores(self.key) if _uses_redis() else LocalHotScores(self.key)
+        return self._store
+
+    def record(self, book_uuid, interaction_type: str, at: Optional[float] = None):
+        """Ajouter une interaction au score chaud du livre"""
+        weight = INTERACTION_WEIGHTS.get(interaction_type, 0.0)
+        if not weight:
+            return
+        try:
+            at = at or time.time()
+            epoch = self.store.epoch()
+            exponent = self.decay_rate * (at - epoch)
+            if exponent > self.MAX_EXPONENT:
+                self.store.rebase(math.exp(-exponent), at, self.max_members)
+                exponent = 0.0
+            self.store.incr(str(book_uuid), weight * math.exp(exponent))
+        except Exception as e:
+            logger.warning(f"Score chaud non mis à jour pour {book_uuid}: {str(e)}")
+
+    def top(self, limit: int = 20, now: Optional[float] = None) -> List[Dict]:
+        """Livres les plus chauds, score ramené à l'instant présent"""
+        try:
+            now = now or time.time()
+            scale = math.exp(-self.decay_rate * (now - self.store.epoch()))
+            return [
+                {'book_uuid': member, 'score': round(score * scale, 6)}
+                for member, score in self.store.top(limit)
+            ]
+        except Exception as e:
+            logger.warning(f"Lecture des livres chauds impossible: {str(e)}")
+            return []
+
+
+trending_engine = TrendingEngine()
+hot_trending = HotTrending()
@@ -49,7 +49,7 @@ urlpatterns = [
     
     # Livres similaires
     path(
-        'books/<int:book_id>/similar/',
+        'books/<uuid:book_id>/similar/',
         views.SimilarBooksView.as_view(),
         name='similar-books'
     ),
@@ -60,6 +60,11 @@ urlpatterns = [
         views.TrendingBooksView.as_view(),
         name='trending-books'
     ),
+    path(
+        'trending/hot/',
+        views.hot_books,
+        name='hot-books'
+    ),
     
     # Feedbacks de recommandations
     path(
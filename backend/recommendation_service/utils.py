@@ -19,6 +19,8 @@ from .models import (
     UserProfile, BookVector, UserInteraction, RecommendationSet,
     Recommendation, SimilarityMatrix, TrendingBook, RecommendationFeedback
 )
+from .rating_matrix import get_rating_matrix
+from .trending import resolve_trend_type
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -211,7 +213,8 @@ def generate_collaborative_recommendations(
     recommendations = []
     
     # Trouver des utilisateurs similaires
-    similar_users = find_similar_users(user, limit=20)
+    rating_matrix = get_rating_matrix()
+    similar_users = rating_matrix.similar_users(user.id, limit=20)
     
     if not similar_users:
         # Fallback vers les recommandations basées sur le contenu
@@ -219,45 +222,22 @@ def generate_collaborative_recommendations(
             user, user_profile, read_books, count, context
         )
     
-    # Obtenir les livres aimés par les utilisateurs similaires
-    similar_user_books = defaultdict(list)
-    
-    for similar_user, similarity_score in similar_users:
-        # Obtenir les livres bien notés par cet utilisateur
-        liked_books = UserInteraction.objects.filter(
-            user=similar_user,
-            interaction_type='rating',
-            interaction_value__gte=4
-        ).exclude(
-            book_id__in=read_books
-        ).select_related('book')
-        
-        for interaction in liked_books:
-            similar_user_books[interaction.book].append(
-                (similarity_score, interaction.interaction_value)
-            )
+    # Scorer en une passe les livres bien notés par les utilisateurs similaires
+    scored_books = rating_matrix.score_books(
+        similar_users,
+        exclude=read_books,
+        limit=count
+    )
     
-    # Calculer les scores de recommandation
-    book_scores = []
-    for book, user_ratings in similar_user_books.items():
-        if not book.is_active:
+    # Une seule lecture groupée pour tous les candidats
+    books = get_book_service().get_books_by_ids([book_uuid for book_uuid, _, _ in scored_books])
+    for book_uuid, final_score, supporters in scored_books:
+        book_data = books.get(book_uuid)
+        if not book_data or not book_data.get('is_active', True):
             continue
-            
-        # Calculer le score pondéré
-        total_weight = sum(sim_score for sim_score, _ in user_ratings)
-        weighted_rating = sum(
-            sim_score * rating for sim_score, rating in user_ratings
-        ) / total_weight if total_weight > 0 else 0
         
-        # Normaliser le score
-        final_score = min(weighted_rating / 5.0, 1.0)
-        
-        reasons = [f'Aimé par {len(user_ratings)} utilisateurs similaires']
-        book_scores.append((book, final_score, reasons))
-    
-    # Trier par score et retourner les meilleurs
-    book_scores.sort(key=lambda x: x[1], reverse=True)
-    recommendations = book_scores[:count]
+        reasons = [f'Aimé par {supporters} utilisateurs similaires']
+        recommendations.append((book_data, final_score, reasons))
     
     # Compléter si nécessaire
     if len(recommendations) < count:
@@ -368,46 +348,19 @@ def generate_hybrid_recommendations(
 
 
 def find_similar_users(user: User, limit: int = 20) -> List[Tuple[User, float]]:
-    """Trouver des utilisateurs similaires basés sur les interactions"""
+    """Trouver des utilisateurs similaires basés sur les notes (matrice creuse)"""
     
-    # Obtenir les interactions de l'utilisateur
-    user_interactions = UserInteraction.objects.filter(
-        user=user,
-        interaction_type='rating'
-    ).values('book_id', 'interaction_value')
-    
-    if not user_interactions:
+    similar = get_rating_matrix().similar_users(user.id, limit=limit)
+    if not similar:
         return []
     
-    user_ratings = {item['book_id']: item['interaction_value'] for item in user_interactions}
-    
-    # Trouver d'autres utilisateurs qui ont noté les mêmes livres
-    other_users = User.objects.filter(
-        userinteraction__book_id__in=user_ratings.keys(),
-        userinteraction__interaction_type='rating'
-    ).exclude(id=user.id).distinct()
-    
-    similar_users = []
-    
-    for other_user in other_users:
-        other_interactions = UserInteraction.objects.filter(
-            user=other_user,
-            interaction_type='rating',
-            book_id__in=user_ratings.keys()
-        ).values('book_id', 'interaction_value')
-        
-        other_ratings = {item['book_id']: item['interaction_value'] for item in other_interactions}
-        
-        # Calculer la similarité cosinus
-        similarity = calculate_cosine_similarity(user_ratings, other_ratings)
-        
-        if similarity > 0.1:  # Seuil minimum de similarité
-            similar_users.append((other_user, similarity))
-    
-    # Trier par similarité décroissante
-    similar_users.sort(key=lambda x: x[1], reverse=True)
+    users = User.objects.in_bulk([user_id for user_id, _ in similar])
     
-    return similar_users[:limit]
+    return [
+        (users[user_id], similarity)
+        for user_id, similarity in similar
+        if user_id in users
+    ]
 
 
 def calculate_cosine_similarity(ratings1: Dict[int, float], ratings2: Dict[int, float]) -> float:
@@ -699,27 +652,21 @@ def update_recommendation_metrics(
         logger.error(f"Erreur lors de la mise à jour des métriques: {str(e)}")
 
 
-def get_trending_books(period: str = 'week', trend_type: str = 'overall', limit: int = 20) -> List[Book]:
-    """Obtenir les livres en tendance"""
-    
-    # Définir la période
-    if period == 'day':
-        start_date = timezone.now() - timedelta(days=1)
-    elif period == 'week':
-        start_date = timezone.now() - timedelta(weeks=1)
-    elif period == 'month':
-        start_date = timezone.now() - timedelta(days=30)
-    else:
-        start_date = timezone.now() - timedelta(weeks=1)
-    
-    # Obtenir les livres en tendance
+def get_trending_books(period: str = 'week', trend_type: str = 'overall', limit: int = 20) -> List[Dict[str, Any]]:
+    """Obtenir les livres en tendance (classement actif calculé par le moteur de tendances)"""
     trending_books = TrendingBook.objects.filter(
-        trend_type=trend_type,
-        period_start__gte=start_date,
-        is_active=True
-    ).select_related('book').order_by('-trend_score')[:limit]
-    
-    return [tb.book for tb in trending_books]
+        trend_type=resolve_trend_type(period, trend_type)
+    ).order_by('-trend_score')[:limit]
+    
+    return [
+        {
+            'book_id': tb.book_uuid,
+            'title': tb.book_title,
+            'score': tb.trend_score,
+            'velocity': tb.velocity,
+        }
+        for tb in trending_books
+    ]
 
 
 def get_recommendation_analytics(period: str = 'month') -> Dict[str, Any]:
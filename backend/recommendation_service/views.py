@@ -11,6 +11,7 @@ from datetime import timedelta, datetime
 import logging
 import json
 
+from coko.cache_tags import tagged_cache, user_tag, book_tag, RECOMMENDATIONS_TAG, SIMILARITY_TAG
 from catalog_service.models import Book
 from .models import (
     UserProfile, BookVector, UserInteraction, RecommendationSet,
@@ -30,6 +31,11 @@ from .permissions import (
     IsOwnerOrReadOnly, CanAccessRecommendations, CanManageRecommendations,
     CanViewRecommendationAnalytics, IsAdminOrOwner
 )
+from .materializer import (
+    MATERIALIZED_ALGORITHMS, MATERIALIZED_CONTEXTS, RecommendationMaterializer, slice_materialized
+)
+from .tasks import materialize_recommendations_batch
+from .trending import hot_trending, resolve_trend_type
 # from .utils import (
 #     generate_personalized_recommendations, calculate_recommendation_stats,
 #     update_recommendation_metrics, get_trending_books,
@@ -64,8 +70,7 @@ class UserProfileListCreateView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user)
         
         # Invalider le cache des recommandations
-        cache_key = f"user_recommendations_{self.request.user.id}"
-        cache.delete(cache_key)
+        tagged_cache.invalidate(user_tag(self.request.user.id))
         
         logger.info(f"Profil de recommandations créé pour l'utilisateur {self.request.user.username}")
 
@@ -83,8 +88,7 @@ class UserProfileDetailView(generics.RetrieveUpdateDestroyAPIView):
         serializer.save()
         
         # Invalider le cache des recommandations
-        cache_key = f"user_recommendations_{self.request.user.id}"
-        cache.delete(cache_key)
+        tagged_cache.invalidate(user_tag(self.request.user.id))
         
         logger.info(f"Profil de recommandations mis à jour pour l'utilisateur {self.request.user.username}")
     
@@ -93,8 +97,7 @@ class UserProfileDetailView(generics.RetrieveUpdateDestroyAPIView):
         instance.delete()
         
         # Nettoyer le cache
-        cache_key = f"user_recommendations_{user_id}"
-        cache.delete(cache_key)
+        tagged_cache.invalidate(user_tag(user_id))
         
         logger.info(f"Profil de recommandations supprimé pour l'utilisateur {instance.user.username}")
 
@@ -141,8 +144,7 @@ class UserInteractionListCreateView(generics.ListCreateAPIView):
         #     )
         
         # Invalider le cache des recommandations
-        cache_key = f"user_recommendations_{self.request.user.id}"
-        cache.delete(cache_key)
+        tagged_cache.invalidate(user_tag(self.request.user.id))
         
         logger.info(
             f"Interaction {interaction.interaction_type} enregistrée pour "
@@ -213,36 +215,41 @@ class PersonalizedRecommendationsView(APIView):
         context = request.query_params.get('context', 'general')
         force_refresh = request.query_params.get('refresh', 'false').lower() == 'true'
         
-        # Vérifier le cache
-        cache_key = f"user_recommendations_{user.id}_{algorithm}_{count}_{context}"
+        # Seules les listes rafraîchies par la tâche périodique sont servies
+        if algorithm not in MATERIALIZED_ALGORITHMS:
+            return Response(
+                {'error': f"Algorithme inconnu: {algorithm}", 'allowed': list(MATERIALIZED_ALGORITHMS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if context not in MATERIALIZED_CONTEXTS:
+            return Response(
+                {'error': f"Contexte inconnu: {context}", 'allowed': list(MATERIALIZED_CONTEXTS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        if not force_refresh:
-            cached_recommendations = cache.get(cache_key)
-            if cached_recommendations:
-                return Response(cached_recommendations)
+        materializer = RecommendationMaterializer(algorithm=algorithm)
         
         try:
-            # Générer les recommandations
-            # recommendations_data = generate_personalized_recommendations(
-            #     user=user,
-            #     algorithm=algorithm,
-            #     count=count,
-            #     context=context
-            # )
-            recommendations_data = {'recommendations': [], 'message': 'Service temporairement indisponible'}
+            # Servir la liste précalculée (lecture par clé unique)
+            materialized = materializer.get(user.id, context)
             
-            # Mettre en cache pour 1 heure
-            cache.set(cache_key, recommendations_data, 3600)
+            if (materialized is None or force_refresh) and materializer.claim_refresh(user.id, context):
+                # Absente ou rafraîchissement demandé : recalculer en arrière-plan
+                materialize_recommendations_batch.delay([user.id], algorithm, [context])
             
-            logger.info(
-                f"Recommandations générées pour l'utilisateur {user.username} "
-                f"(algorithme: {algorithm}, contexte: {context})"
-            )
+            if materialized is None:
+                return Response({
+                    'books': [],
+                    'algorithm_used': algorithm,
+                    'context': context,
+                    'status': 'pending',
+                    'message': 'Recommandations en cours de préparation'
+                })
             
-            return Response(recommendations_data)
+            return Response(slice_materialized(materialized, count))
             
         except Exception as e:
-            logger.error(f"Erreur lors de la génération des recommandations: {str(e)}")
+            logger.error(f"Erreur lors de la lecture des recommandations: {str(e)}")
             return Response(
                 {'error': 'Erreur lors de la génération des recommandations'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -268,20 +275,26 @@ class SimilarBooksView(APIView):
         
         # Vérifier le cache
         cache_key = f"similar_books_{book_id}_{count}"
-        cached_similar = cache.get(cache_key)
+        cache_tags = [book_tag(book.id), SIMILARITY_TAG]
+        cached_similar = tagged_cache.get(cache_key, cache_tags)
         
         if cached_similar:
             return Response(cached_similar)
         
         try:
-            # Obtenir les livres similaires via la matrice de similarité
-            similar_books = SimilarityMatrix.objects.filter(
-                Q(book_a=book) | Q(book_b=book)
-            ).order_by('-overall_similarity')[:count]
+            # Index ANN en priorité, matrice de similarité en repli
+            similar_books = SimilarityMatrix.get_similar_books(
+                book.id, limit=count, min_similarity=0.0
+            )
+            books_by_id = Book.objects.in_bulk(
+                [similar['book_uuid'] for similar in similar_books]
+            )
             
             similar_data = []
-            for similarity in similar_books:
-                similar_book = similarity.book_b if similarity.book_a == book else similarity.book_a
+            for similar in similar_books:
+                similar_book = books_by_id.get(similar['book_uuid'])
+                if similar_book is None:
+                    continue
                 similar_data.append({
                     'book': {
                         'id': similar_book.id,
@@ -289,12 +302,12 @@ class SimilarBooksView(APIView):
                         'slug': similar_book.slug,
                         'cover_image': similar_book.cover_image.url if similar_book.cover_image else None
                     },
-                    'similarity_score': similarity.overall_similarity,
+                    'similarity_score': similar['similarity'],
                     'reasons': {
-                        'content': similarity.content_similarity,
-                        'genre': similarity.genre_similarity,
-                        'author': similarity.author_similarity,
-                        'user_behavior': similarity.user_similarity
+                        'content': similar['reasons']['content'],
+                        'genre': similar['reasons']['genre'],
+                        'author': similar['reasons']['author'],
+                        'user_behavior': similar['reasons']['user']
                     }
                 })
             
@@ -305,12 +318,12 @@ class SimilarBooksView(APIView):
                     'slug': book.slug
                 },
                 'similar_books': similar_data,
-                'algorithm': 'similarity_matrix',
+                'algorithm': similar_books[0]['source'] if similar_books else None,
                 'generated_at': timezone.now()
             }
             
             # Mettre en cache pour 6 heures
-            cache.set(cache_key, response_data, 21600)
+            tagged_cache.set(cache_key, response_data, 21600, cache_tags)
             
             return Response(response_data)
             
@@ -329,27 +342,24 @@ class TrendingBooksView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        trend_type = self.request.query_params.get('type', 'overall')
-        period = self.request.query_params.get('period', 'week')
-        
-        queryset = TrendingBook.objects.filter(
-            trend_type=trend_type,
-            is_active=True
+        # `type` : daily, weekly, monthly, rising ou viral ; sinon déduit de `period`
+        trend_type = resolve_trend_type(
+            self.request.query_params.get('period', 'week'),
+            self.request.query_params.get('type')
         )
         
-        # Filtrer par période
-        if period == 'day':
-            start_date = timezone.now() - timedelta(days=1)
-        elif period == 'week':
-            start_date = timezone.now() - timedelta(weeks=1)
-        elif period == 'month':
-            start_date = timezone.now() - timedelta(days=30)
-        else:
-            start_date = timezone.now() - timedelta(weeks=1)
-        
-        queryset = queryset.filter(period_start__gte=start_date)
-        
-        return queryset.order_by('-trend_score')[:20]
+        return TrendingBook.objects.filter(trend_type=trend_type).order_by('-trend_score')[:20]
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def hot_books(request):
+    """Livres « chauds » en temps réel (score à décroissance exponentielle)"""
+    try:
+        limit = min(int(request.query_params.get('limit', 20)), 100)
+    except ValueError:
+        limit = 20
+    return Response({'books': hot_trending.top(limit)})
 
 
 class RecommendationFeedbackListCreateView(generics.ListCreateAPIView):
@@ -470,7 +480,7 @@ class RecommendationEngineConfigView(APIView):
             cache.set('recommendation_engine_config', serializer.validated_data, None)
             
             # Invalider tous les caches de recommandations
-            cache.delete_many([key for key in cache._cache.keys() if 'recommendations' in key])
+            tagged_cache.invalidate(RECOMMENDATIONS_TAG)
             
             logger.info(f"Configuration du moteur de recommandations mise à jour par {request.user.username}")
             
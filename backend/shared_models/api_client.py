@@ -3,14 +3,16 @@ Client API pour la communication inter-services.
 Fournit une interface unifiée pour communiquer avec les différents services.
 """
 
-import requests
 import uuid
 from typing import Dict, List, Optional, Any, Union
-from django.conf import settings
 from django.core.cache import cache
 import logging
 
 from .services import service_registry
+from .transport import (
+    ServiceAPIError, CircuitOpenError, DeadlineExceeded, ServiceCall,
+    deadline, gather, get_transport, latency_stats
+)
 
 logger = logging.getLogger(__name__)
 
@@ -18,100 +20,64 @@ logger = logging.getLogger(__name__)
 class ServiceAPIClient:
     """
     Client API générique pour la communication inter-services.
+    
+    Les requêtes passent par le transport partagé du service (pool de
+    connexions, échéance, nouvelles tentatives, disjoncteur) ; `call` prépare
+    un appel à exécuter en parallèle avec `gather`.
     """
     
     def __init__(self, service_name: str, base_url: Optional[str] = None):
         self.service_name = service_name
-        self.base_url = base_url or service_registry.get_service_endpoint(service_name, '')
-        self.session = requests.Session()
-        
-        # Configuration par défaut
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-        })
-        
-        # Timeout par défaut
-        self.timeout = getattr(settings, 'INTER_SERVICE_TIMEOUT', 30)
+        self.base_url = base_url or service_registry.get_service_base_url(service_name)
+        self.transport = get_transport(service_name, self.base_url)
     
-    def get(self, endpoint: str, params: Optional[Dict] = None, **kwargs) -> Dict[str, Any]:
+    @property
+    def session(self):
+        return self.transport.session
+    
+    def request(self, method: str, endpoint: str, **kwargs) -> Any:
         """
-        Effectue une requête GET vers un service.
+        Effectue une requête vers un service et retourne le corps JSON.
         """
-        url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
-        
+        response = self.transport.request(method, endpoint, **kwargs)
+        if method.upper() == 'DELETE':
+            return True
+        if response.status_code == 204 or not response.content:
+            return {}
         try:
-            response = self.session.get(
-                url,
-                params=params,
-                timeout=self.timeout,
-                **kwargs
-            )
-            response.raise_for_status()
             return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error calling {self.service_name} GET {endpoint}: {e}")
-            raise ServiceAPIError(f"Failed to call {self.service_name}: {e}")
+        except ValueError as e:
+            raise ServiceAPIError(f"Invalid JSON from {self.service_name} {endpoint}: {e}")
+    
+    def call(self, method: str, endpoint: str, **kwargs) -> ServiceCall:
+        """
+        Prépare un appel à exécuter avec `gather`.
+        """
+        return ServiceCall(self, method, endpoint, kwargs)
+    
+    def get(self, endpoint: str, params: Optional[Dict] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Effectue une requête GET vers un service.
+        """
+        return self.request('GET', endpoint, params=params, **kwargs)
     
     def post(self, endpoint: str, data: Optional[Dict] = None, **kwargs) -> Dict[str, Any]:
         """
         Effectue une requête POST vers un service.
         """
-        url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
-        
-        try:
-            response = self.session.post(
-                url,
-                json=data,
-                timeout=self.timeout,
-                **kwargs
-            )
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error calling {self.service_name} POST {endpoint}: {e}")
-            raise ServiceAPIError(f"Failed to call {self.service_name}: {e}")
+        return self.request('POST', endpoint, json=data, **kwargs)
     
     def put(self, endpoint: str, data: Optional[Dict] = None, **kwargs) -> Dict[str, Any]:
         """
         Effectue une requête PUT vers un service.
         """
-        url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
-        
-        try:
-            response = self.session.put(
-                url,
-                json=data,
-                timeout=self.timeout,
-                **kwargs
-            )
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error calling {self.service_name} PUT {endpoint}: {e}")
-            raise ServiceAPIError(f"Failed to call {self.service_name}: {e}")
+        return self.request('PUT', endpoint, json=data, **kwargs)
     
     def delete(self, endpoint: str, **kwargs) -> bool:
         """
         Effectue une requête DELETE vers un service.
         """
-        url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
-        
-        try:
-            response = self.session.delete(
-                url,
-                timeout=self.timeout,
-                **kwargs
-            )
-            response.raise_for_status()
-            return True
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error calling {self.service_name} DELETE {endpoint}: {e}")
-            raise ServiceAPIError(f"Failed to call {self.service_name}: {e}")
+        return self.request('DELETE', endpoint, **kwargs)
 
 
 class CatalogServiceClient(ServiceAPIClient):
@@ -119,6 +85,9 @@ class CatalogServiceClient(ServiceAPIClient):
     Client spécialisé pour le service catalog.
     """
     
+    # Taille maximale d'un lot accepté par `books/batch/`
+    BOOKS_BATCH_SIZE = 300
+    
     def __init__(self):
         super().__init__('catalog_service')
     
@@ -147,41 +116,46 @@ class CatalogServiceClient(ServiceAPIClient):
     def get_books_batch(self, book_uuids: List[Union[str, uuid.UUID]]) -> Dict[str, Dict[str, Any]]:
         """
         Récupère plusieurs livres en une seule requête.
+        
+        Le cache est lu et rempli en un aller-retour (`get_many` / `set_many`) ;
+        les livres absents sont demandés par lots de `BOOKS_BATCH_SIZE`.
+        La projection compacte de `books/batch/` est mise en cache sous sa
+        propre clé pour ne pas remplacer les détails complets de `get_book`.
         """
         if not book_uuids:
             return {}
         
-        # Vérifier le cache d'abord
-        cached_books = {}
-        missing_uuids = []
+        book_uuids = list(dict.fromkeys(str(book_uuid) for book_uuid in book_uuids))
+        cache_keys = {book_uuid: f"book_summary_{book_uuid}" for book_uuid in book_uuids}
         
-        for book_uuid in book_uuids:
-            cache_key = f"book_details_{book_uuid}"
-            cached_book = cache.get(cache_key)
-            if cached_book:
-                cached_books[str(book_uuid)] = cached_book
-            else:
-                missing_uuids.append(str(book_uuid))
+        # Vérifier le cache d'abord
+        cached = cache.get_many(list(cache_keys.values()))
+        books = {
+            book_uuid: cached[cache_key]
+            for book_uuid, cache_key in cache_keys.items()
+            if cache_key in cached
+        }
+        missing_uuids = [book_uuid for book_uuid in book_uuids if book_uuid not in books]
         
         # Récupérer les livres manquants
-        if missing_uuids:
+        for start in range(0, len(missing_uuids), self.BOOKS_BATCH_SIZE):
             try:
                 response = self.post("books/batch/", {
-                    "book_uuids": missing_uuids
-                })
-                
-                fetched_books = response.get('books', {})
-                
-                # Mettre en cache les nouveaux livres
-                for book_uuid, book_data in fetched_books.items():
-                    cache_key = f"book_details_{book_uuid}"
-                    cache.set(cache_key, book_data, 3600)
-                    cached_books[book_uuid] = book_data
-                    
+                    "book_uuids": missing_uuids[start:start + self.BOOKS_BATCH_SIZE]
+                }, idempotent=True)
             except ServiceAPIError as e:
                 logger.warning(f"Failed to get books batch: {e}")
+                continue
+            
+            fetched_books = response.get('books', {})
+            if fetched_books:
+                cache.set_many(
+                    {f"book_summary_{book_uuid}": book_data for book_uuid, book_data in fetched_books.items()},
+                    3600
+                )
+                books.update(fetched_books)
         
-        return cached_books
+        return books
     
     def get_author(self, author_uuid: Union[str, uuid.UUID]) -> Optional[Dict[str, Any]]:
         """
@@ -368,13 +342,6 @@ class RecommendationServiceClient(ServiceAPIClient):
             return False
 
 
-class ServiceAPIError(Exception):
-    """
-    Exception pour les erreurs d'API inter-services.
-    """
-    pass
-
-
 # Instances singleton des clients
 catalog_client = CatalogServiceClient()
 auth_client = AuthServiceClient()
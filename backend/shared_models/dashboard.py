@@ -10,6 +10,10 @@ from datetime import timedelta, datetime
 from typing import Dict, List, Any, Optional
 import json
 
+from .rollups import (
+    PREMIUM_SUBSCRIPTIONS, RollupQuery, latest_snapshot, lifetime_total, snapshot_total
+)
+
 User = get_user_model()
 
 
@@ -20,6 +24,8 @@ class UnifiedDashboard:
         self.period_days = period_days
         self.start_date = timezone.now() - timedelta(days=period_days)
         self.end_date = timezone.now()
+        # Comptages, répartitions et tendances lus dans les agrégats (voir rollups)
+        self.rollups = RollupQuery(self.start_date, self.end_date)
     
     def get_overview_metrics(self) -> Dict[str, Any]:
         """Métriques générales de la plateforme"""
@@ -33,28 +39,19 @@ class UnifiedDashboard:
     
     def _get_user_metrics(self) -> Dict[str, Any]:
         """Métriques utilisateurs"""
-        total_users = User.objects.count()
-        new_users = User.objects.filter(
-            date_joined__gte=self.start_date
-        ).count()
+        total_users = snapshot_total('user_base')
+        new_users = self.rollups.total('signups')['count']
         
+        # Connexions : état courant, non additif, lu directement
         active_users = User.objects.filter(
             last_login__gte=self.start_date
         ).count()
         
         # Répartition par type d'abonnement
-        subscription_breakdown = dict(
-            User.objects.values('subscription_type').annotate(
-                count=Count('id')
-            ).values_list('subscription_type', 'count')
-        )
+        subscription_breakdown = latest_snapshot('user_base', ['subscription_type'])
         
         # Répartition par pays
-        country_breakdown = dict(
-            User.objects.values('country').annotate(
-                count=Count('id')
-            ).values_list('country', 'count')
-        )
+        country_breakdown = latest_snapshot('user_base', ['country'])
         
         return {
             'total': total_users,
@@ -69,21 +66,21 @@ class UnifiedDashboard:
     def _get_content_metrics(self) -> Dict[str, Any]:
         """Métriques de contenu (livres, auteurs, etc.)"""
         try:
-            from catalog_service.models import Book, Author, Publisher, BookRating
+            from catalog_service.models import Book, Author, Publisher
             
-            total_books = Book.objects.count()
-            published_books = Book.objects.filter(status='published').count()
-            new_books = Book.objects.filter(
-                created_at__gte=self.start_date
-            ).count()
+            books_by_status = latest_snapshot('book_catalog', ['status'])
+            total_books = sum(books_by_status.values())
+            published_books = books_by_status.get('published', 0)
+            new_books = self.rollups.total('books')['count']
             
             total_authors = Author.objects.count()
             total_publishers = Publisher.objects.count()
             
-            # Métriques de qualité
-            avg_rating = BookRating.objects.aggregate(
-                avg=Avg('score')
-            )['avg'] or 0
+            # Métriques de qualité (agrégats d'évaluation dénormalisés sur les livres)
+            ratings = Book.objects.aggregate(
+                rating_sum=Sum('rating_sum'), rating_count=Sum('rating_count')
+            )
+            avg_rating = ratings['rating_sum'] / ratings['rating_count'] if ratings['rating_count'] else 0
             
             # Livres les plus populaires
             popular_books = Book.objects.filter(
@@ -109,21 +106,17 @@ class UnifiedDashboard:
     def _get_reading_metrics(self) -> Dict[str, Any]:
         """Métriques de lecture"""
         try:
-            from reading_service.models import ReadingSession, ReadingProgress, Bookmark
-            
-            total_sessions = ReadingSession.objects.count()
-            active_sessions = ReadingSession.objects.filter(
-                last_activity__gte=self.start_date
-            ).count()
+            from reading_service.models import ReadingProgress, Bookmark
             
-            completed_sessions = ReadingSession.objects.filter(
-                status='completed',
-                end_time__gte=self.start_date
-            ).count()
+            total_sessions = lifetime_total('reading_sessions')
+            active_sessions = self.rollups.total('reading_sessions')['count']
             
-            avg_session_time = ReadingSession.objects.filter(
-                total_reading_time__isnull=False
-            ).aggregate(avg=Avg('total_reading_time'))['avg']
+            completions = self.rollups.total('reading_completions')
+            completed_sessions = completions['count']
+            avg_session_time = (
+                timedelta(seconds=round(completions['duration_seconds'] / completed_sessions))
+                if completed_sessions else None
+            )
             
             total_bookmarks = Bookmark.objects.count()
             new_bookmarks = Bookmark.objects.filter(
@@ -153,9 +146,9 @@ class UnifiedDashboard:
     def _get_revenue_metrics(self) -> Dict[str, Any]:
         """Métriques de revenus et paiements"""
         # Simuler des métriques de revenus (à connecter avec le système de paiement réel)
-        premium_users = User.objects.filter(
-            subscription_type__in=['premium', 'creator', 'institutional']
-        ).count()
+        users_by_subscription = latest_snapshot('user_base', ['subscription_type'])
+        total_users = sum(users_by_subscription.values())
+        premium_users = sum(users_by_subscription.get(sub_type, 0) for sub_type in PREMIUM_SUBSCRIPTIONS)
         
         # Estimation basée sur les types d'abonnement
         pricing = {
@@ -164,18 +157,17 @@ class UnifiedDashboard:
             'institutional': 10000  # FCFA
         }
         
-        estimated_monthly_revenue = 0
-        for sub_type, price in pricing.items():
-            count = User.objects.filter(subscription_type=sub_type).count()
-            estimated_monthly_revenue += count * price
+        estimated_monthly_revenue = sum(
+            users_by_subscription.get(sub_type, 0) * price for sub_type, price in pricing.items()
+        )
         
         # Répartition par pays pour les revenus
+        premium_by_country = latest_snapshot(
+            'user_base', ['country'], subscription_type__in=PREMIUM_SUBSCRIPTIONS
+        )
         revenue_by_country = {}
         for country_code, country_name in User.COUNTRY_CHOICES:
-            country_premium = User.objects.filter(
-                country=country_code,
-                subscription_type__in=['premium', 'creator', 'institutional']
-            ).count()
+            country_premium = premium_by_country.get(country_code, 0)
             if country_premium > 0:
                 revenue_by_country[country_name] = country_premium * 2000  # Estimation moyenne
         
@@ -184,7 +176,7 @@ class UnifiedDashboard:
             'estimated_monthly_revenue': estimated_monthly_revenue,
             'estimated_annual_revenue': estimated_monthly_revenue * 12,
             'revenue_by_country': revenue_by_country,
-            'conversion_rate': round((premium_users / User.objects.count() * 100), 2) if User.objects.count() > 0 else 0,
+            'conversion_rate': round((premium_users / total_users * 100), 2) if total_users > 0 else 0,
             'african_payment_providers': ['Orange Money', 'MTN MoMo', 'Wave'],
             'payment_method_adoption': self._get_payment_adoption()
         }
@@ -214,15 +206,18 @@ class UnifiedDashboard:
             )
             
             # Métriques africaines spécifiques
-            african_users = User.objects.filter(
-                country__in=['SN', 'CI', 'ML', 'BF', 'MA', 'TN', 'DZ', 'CM', 'CD']
-            ).count()
+            users_by_country = latest_snapshot('user_base', ['country'])
+            total_users = sum(users_by_country.values())
+            african_users = sum(
+                users_by_country.get(country, 0)
+                for country in ['SN', 'CI', 'ML', 'BF', 'MA', 'TN', 'DZ', 'CM', 'CD']
+            )
             
             return {
                 'active_sessions': active_sessions,
                 'device_breakdown': device_breakdown,
                 'security_events_period': list(security_events),
-                'african_users_percentage': round((african_users / User.objects.count() * 100), 2) if User.objects.count() > 0 else 0,
+                'african_users_percentage': round((african_users / total_users * 100), 2) if total_users > 0 else 0,
                 'platform_health': self._get_platform_health(),
                 'performance_metrics': self._get_performance_metrics()
             }
@@ -232,31 +227,14 @@ class UnifiedDashboard:
     
     def _calculate_growth_rate(self, metric_type: str) -> float:
         """Calcule le taux de croissance pour une métrique"""
-        previous_period_start = self.start_date - timedelta(days=self.period_days)
-        
-        if metric_type == 'users':
-            current_count = User.objects.filter(
-                date_joined__gte=self.start_date
-            ).count()
-            previous_count = User.objects.filter(
-                date_joined__gte=previous_period_start,
-                date_joined__lt=self.start_date
-            ).count()
-        elif metric_type == 'books':
-            try:
-                from catalog_service.models import Book
-                current_count = Book.objects.filter(
-                    created_at__gte=self.start_date
-                ).count()
-                previous_count = Book.objects.filter(
-                    created_at__gte=previous_period_start,
-                    created_at__lt=self.start_date
-                ).count()
-            except ImportError:
-                return 0.0
-        else:
+        metrics = {'users': 'signups', 'books': 'books'}
+        if metric_type not in metrics:
             return 0.0
         
+        previous_period_start = self.start_date - timedelta(days=self.period_days)
+        current_count = self.rollups.total(metrics[metric_type])['count']
+        previous_count = RollupQuery(previous_period_start, self.start_date).total(metrics[metric_type])['count']
+        
         if previous_count == 0:
             return 100.0 if current_count > 0 else 0.0
         
@@ -392,20 +370,20 @@ class UnifiedDashboard:
         try:
             from catalog_service.models import Book, BookRating, Category
             
-            books_by_language = dict(
-                Book.objects.values('language').annotate(
-                    count=Count('id')
-                ).values_list('language', 'count')
-            )
+            books_by_language = latest_snapshot('book_catalog', ['segment'])
             
             top_categories = Category.objects.annotate(
                 book_count=Count('books')
             ).order_by('-book_count')[:5].values('name', 'book_count')
             
-            rating_distribution = {}
-            for i in range(1, 6):
-                count = BookRating.objects.filter(score=i).count()
-                rating_distribution[f'{i}_stars'] = count
+            ratings_by_score = dict(
+                BookRating.objects.values('score').annotate(
+                    count=Count('id')
+                ).values_list('score', 'count')
+            )
+            rating_distribution = {
+                f'{i}_stars': ratings_by_score.get(i, 0) for i in range(1, 6)
+            }
             
             return {
                 'books_by_language': books_by_language,
@@ -449,27 +427,13 @@ class UnifiedDashboard:
     
     def _get_content_upload_trend(self) -> List[Dict[str, Any]]:
         """Tendance d'upload de contenu par mois"""
-        try:
-            from catalog_service.models import Book
-            from django.db.models import Count, TruncMonth
-            
-            trend_data = Book.objects.filter(
-                created_at__gte=self.start_date
-            ).annotate(
-                month=TruncMonth('created_at')
-            ).values('month').annotate(
-                count=Count('id')
-            ).order_by('month')
-            
-            return [
-                {
-                    'month': item['month'].strftime('%Y-%m'),
-                    'uploads': item['count']
-                }
-                for item in trend_data
-            ]
-        except ImportError:
-            return []
+        return [
+            {
+                'month': item['period'].strftime('%Y-%m'),
+                'uploads': item['count']
+            }
+            for item in self.rollups.series('books', period='month')
+        ]
 
     def export_dashboard_data(self, format_type: str = 'json') -> str:
         """Exporte les données du dashboard"""
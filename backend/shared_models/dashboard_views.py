@@ -16,6 +16,7 @@ import json
 from datetime import datetime, timedelta
 
 from .dashboard import UnifiedDashboard
+from .rollups import rollup_engine
 
 
 @method_decorator(staff_member_required, name='dispatch')
@@ -48,6 +49,7 @@ class DashboardOverviewView(TemplateView):
             'available_periods': [7, 30, 90, 365],
             'dashboard_title': 'Dashboard Coko - Vue d\'ensemble',
             'refresh_time': datetime.now().strftime('%H:%M:%S'),
+            'data_as_of': rollup_engine.freshness(),
             'services_status': self._get_services_status()
         })
         
@@ -91,6 +93,7 @@ def dashboard_api_metrics(request):
         'success': True,
         'data': data,
         'timestamp': datetime.now().isoformat(),
+        'data_as_of': rollup_engine.freshness(),
         'period_days': period_days
     })
 
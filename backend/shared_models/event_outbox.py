@@ -0,0 +1,292 @@
+"""
+Boîte d'envoi (outbox) durable des événements
+
+Publier un événement se limite à insérer une ligne `CrossServiceEvent`
+(dans la transaction de l'appelant, s'il y en a une) : aucun handler ne
+s'exécute dans la requête HTTP. Un worker Celery réclame ensuite les
+événements par lots avec `SELECT … FOR UPDATE SKIP LOCKED`, de sorte que
+plusieurs workers se partagent la file sans se bloquer ni traiter deux
+fois le même événement.
+
+Garanties :
+
+- ordre par clé d'agrégat : un événement n'est réclamé que si aucun
+  événement plus ancien de la même clé n'est encore en attente ou en
+  cours ailleurs ; dans un lot, les événements d'une clé s'exécutent en
+  séquence, les clés différentes en parallèle ;
+- reprise : chaque handler réussi est noté dans `processing_log` et n'est
+  pas rejoué ; un échec reprogramme l'événement avec un backoff
+  exponentiel (`retry_count`, `next_retry_at`) ;
+- lettre morte : au-delà de `max_retries`, l'événement passe en
+  `dead_letter` et ne bloque plus sa clé d'agrégat ;
+- saturation : un handler sans place libre (`HandlerBusyError`) fait
+  reprendre l'événement peu après, sans consommer de tentative.
+"""
+import json
+import logging
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, router, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import CrossServiceEvent
+
+logger = logging.getLogger(__name__)
+
+EVENT_OUTBOX_BATCH_SIZE = getattr(settings, 'EVENT_OUTBOX_BATCH_SIZE', 200)
+EVENT_OUTBOX_WORKERS = getattr(settings, 'EVENT_OUTBOX_WORKERS', 4)
+EVENT_OUTBOX_LEASE_SECONDS = getattr(settings, 'EVENT_OUTBOX_LEASE_SECONDS', 300)
+EVENT_OUTBOX_MAX_ROUNDS = getattr(settings, 'EVENT_OUTBOX_MAX_ROUNDS', 10)
+# Délai de reprise d'un événement dont un handler était saturé (sans tentative consommée)
+EVENT_OUTBOX_BUSY_RETRY_SECONDS = getattr(settings, 'EVENT_OUTBOX_BUSY_RETRY_SECONDS', 30)
+
+# Statuts à partir desquels un événement ne bloque plus sa clé d'agrégat
+FINISHED_STATUSES = ('processed', 'ignored', 'dead_letter')
+
+Handler = Tuple[str, Callable[[CrossServiceEvent], Any]]
+
+
+def _normalize(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Données sérialisables en JSON (dates, UUID, décimaux…)"""
+    return json.loads(json.dumps(data or {}, cls=DjangoJSONEncoder))
+
+
+def _as_uuid(value) -> Optional[uuid.UUID]:
+    if value is None:
+        return None
+    try:
+        return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def append(event_type: str, source_service: str, event_data: Dict[str, Any],
+           aggregate_key: str = '', user_id=None,
+           target_services: Optional[List[str]] = None,
+           correlation_id=None,
+           processing_log: Optional[List[Dict[str, Any]]] = None) -> CrossServiceEvent:
+    """
+    Ajouter un événement à la boîte d'envoi (une seule insertion)
+
+    `processing_log` marque des handlers comme déjà exécutés.
+    """
+    return CrossServiceEvent.objects.create(
+        event_type=event_type,
+        source_service=source_service or '',
+        target_services=target_services or [],
+        event_data=_normalize(event_data),
+        aggregate_key=aggregate_key or '',
+        user_id=_as_uuid(user_id),
+        correlation_id=correlation_id,
+        processing_log=processing_log or [],
+    )
+
+
+def resolve_handlers(event: CrossServiceEvent) -> List[Handler]:
+    """Handlers nommés à exécuter pour un événement de la boîte d'envoi"""
+    from coko.events import EventType, event_bus
+    from .services import service_communication
+
+    try:
+        event_type = EventType(event.event_type)
+    except ValueError:
+        return [('service_communication', service_communication.process_event)]
+    return event_bus.handlers_for(event_type)
+
+
+class EventOutboxDispatcher:
+    """Consommation par lots de la boîte d'envoi"""
+
+    def __init__(self, batch_size: int = EVENT_OUTBOX_BATCH_SIZE,
+                 workers: int = EVENT_OUTBOX_WORKERS,
+                 lease_seconds: int = EVENT_OUTBOX_LEASE_SECONDS):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.using = router.db_for_write(CrossServiceEvent)
+
+    def claim(self, limit: Optional[int] = None) -> List[CrossServiceEvent]:
+        """
+        Réclamer jusqu'à `limit` événements livrables et les marquer en cours
+
+        Le bail (`next_retry_at`) rend l'événement de nouveau réclamable si
+        le worker qui le détient disparaît.
+        """
+        limit = limit or self.batch_size
+        now = timezone.now()
+        due = Q(status='pending') | Q(status__in=('failed', 'processing'), next_retry_at__lte=now)
+
+        with transaction.atomic(using=self.using):
+            candidates = list(
+                CrossServiceEvent.objects.using(self.using)
+                .select_for_update(skip_locked=True)
+                .filter(due)
+                .order_by('created_at')[:limit]
+            )
+            claimed = self._deliverable(candidates)
+            if claimed:
+                CrossServiceEvent.objects.using(self.using).filter(
+                    event_id__in=[event.event_id for event in claimed]
+                ).update(
+                    status='processing',
+                    next_retry_at=now + timezone.timedelta(seconds=self.lease_seconds),
+                )
+        return claimed
+
+    def _deliverable(self, candidates: List[CrossServiceEvent]) -> List[CrossServiceEvent]:
+        """Écarter les événements devancés par un événement plus ancien de leur clé"""
+        keys = {event.aggregate_key for event in candidates if event.aggregate_key}
+        if not keys:
+            return candidates
+
+        candidate_ids = [event.event_id for event in candidates]
+        older_unfinished = CrossServiceEvent.objects.using(self.using).filter(
+            aggregate_key=OuterRef('aggregate_key'),
+            created_at__lt=OuterRef('created_at'),
+        ).exclude(status__in=FINISHED_STATUSES).exclude(event_id__in=candidate_ids)
+        blocked = set(
+            CrossServiceEvent.objects.using(self.using)
+            .filter(event_id__in=candidate_ids, aggregate_key__in=keys)
+            .filter(Exists(older_unfinished))
+            .values_list('event_id', flat=True)
+        )
+
+        deliverable = []
+        blocked_keys = set()
+        for event in candidates:
+            key = event.aggregate_key
+            if key and (event.event_id in blocked or key in blocked_keys):
+                # Tout ce qui suit dans la clé attend aussi
+                blocked_keys.add(key)
+                continue
+            deliverable.append(event)
+        return deliverable
+
+    def dispatch_pending(self, max_rounds: int = EVENT_OUTBOX_MAX_ROUNDS) -> Dict[str, int]:
+        """Réclamer et traiter des lots jusqu'à épuisement (ou `max_rounds`)"""
+        stats = {'claimed': 0, 'processed': 0, 'failed': 0, 'busy': 0, 'dead_letter': 0, 'released': 0}
+        for _ in range(max_rounds):
+            events = self.claim()
+            if not events:
+                break
+            stats['claimed'] += len(events)
+            for outcome in self._run_groups(self._group(events)):
+                for status, count in outcome.items():
+                    stats[status] += count
+            if len(events) < self.batch_size:
+                break
+        return stats
+
+    def _group(self, events: List[CrossServiceEvent]) -> List[List[CrossServiceEvent]]:
+        groups: 'OrderedDict[str, List[CrossServiceEvent]]' = OrderedDict()
+        for event in events:
+            # Sans clé d'agrégat, chaque événement forme son propre groupe
+            key = event.aggregate_key or f"event:{event.event_id}"
+            groups.setdefault(key, []).append(event)
+        return list(groups.values())
+
+    def _run_groups(self, groups: List[List[CrossServiceEvent]]) -> List[Dict[str, int]]:
+        if self.workers <= 1 or len(groups) == 1:
+            return [self._run_group(group) for group in groups]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='event-outbox') as executor:
+            return list(executor.map(self._run_group_in_thread, groups))
+
+    def _run_group_in_thread(self, group: List[CrossServiceEvent]) -> Dict[str, int]:
+        try:
+            return self._run_group(group)
+        finally:
+            close_old_connections()
+
+    def _run_group(self, group: List[CrossServiceEvent]) -> Dict[str, int]:
+        """Traiter les événements d'une clé dans l'ordre, en s'arrêtant au premier échec"""
+        outcome = {}
+        for index, event in enumerate(group):
+            status = self.deliver(event)
+            outcome[status] = outcome.get(status, 0) + 1
+            if status in ('failed', 'busy'):
+                released = self._release(group[index + 1:])
+                outcome['released'] = outcome.get('released', 0) + released
+                break
+        return outcome
+
+    def deliver(self, event: CrossServiceEvent) -> str:
+        """Exécuter les handlers restants d'un événement et enregistrer le résultat"""
+        from coko.events import HandlerBusyError
+
+        log = list(event.processing_log or [])
+        done = {entry['handler'] for entry in log if entry.get('status') == 'ok'}
+        error = None
+
+        for name, handler in resolve_handlers(event):
+            if name in done:
+                continue
+            try:
+                handler(event)
+                log.append({'handler': name, 'status': 'ok', 'at': timezone.now().isoformat()})
+            except HandlerBusyError as e:
+                # Saturation passagère : reprise rapide, tentative non décomptée
+                logger.warning(f"Handler {name} saturé pour l'événement {event.event_id}: {str(e)}")
+                event.processing_log = log
+                event.status = 'failed'
+                event.next_retry_at = timezone.now() + timezone.timedelta(
+                    seconds=EVENT_OUTBOX_BUSY_RETRY_SECONDS
+                )
+                event.save(using=self.using, update_fields=['status', 'next_retry_at', 'processing_log'])
+                return 'busy'
+            except Exception as e:
+                error = f"{name}: {str(e)}"
+                log.append({
+                    'handler': name, 'status': 'error', 'error': str(e),
+                    'attempt': event.retry_count + 1, 'at': timezone.now().isoformat(),
+                })
+                logger.error(f"Erreur du handler {name} pour l'événement {event.event_id}: {str(e)}")
+                break
+
+        event.processing_log = log
+        if error is None:
+            event.status = 'processed'
+            event.processed_at = timezone.now()
+            event.next_retry_at = None
+            event.save(using=self.using, update_fields=['status', 'processed_at', 'next_retry_at', 'processing_log'])
+            return 'processed'
+
+        event.retry_count += 1
+        event.error_message = error
+        if event.retry_count >= event.max_retries:
+            event.status = 'dead_letter'
+            event.next_retry_at = None
+            logger.warning(f"Événement {event.event_id} ({event.event_type}) abandonné après "
+                           f"{event.retry_count} tentatives")
+        else:
+            event.status = 'failed'
+            event.next_retry_at = timezone.now() + timezone.timedelta(
+                minutes=2 ** event.retry_count  # Backoff exponentiel
+            )
+        event.save(using=self.using, update_fields=[
+            'status', 'retry_count', 'next_retry_at', 'error_message', 'processing_log'
+        ])
+        return event.status
+
+    def _release(self, events: List[CrossServiceEvent]) -> int:
+        """Rendre à la file les événements réclamés mais non traités"""
+        if not events:
+            return 0
+        return CrossServiceEvent.objects.using(self.using).filter(
+            event_id__in=[event.event_id for event in events], status='processing'
+        ).update(status='pending', next_retry_at=None)
+
+    def requeue_dead_letters(self, event_ids=None) -> int:
+        """Remettre des lettres mortes en file, compteur de tentatives réinitialisé"""
+        queryset = CrossServiceEvent.objects.using(self.using).filter(status='dead_letter')
+        if event_ids is not None:
+            queryset = queryset.filter(event_id__in=list(event_ids))
+        return queryset.update(status='pending', retry_count=0, next_retry_at=None, error_message='')
+
+
+event_outbox = EventOutboxDispatcher()
@@ -1,101 +1,199 @@
 """
 APIs d'export spécialisées pour auteurs et éditeurs
 Facilite l'extraction de données pour les créateurs de contenu
+
+Les exports sont produits en flux (voir `export_streaming`) : les livres
+sont parcourus par curseur (`.iterator(chunk_size)`), les statistiques
+sont agrégées par requêtes groupées et les formats CSV, NDJSON, XLSX et
+ZIP sont écrits ligne par ligne.
 """
 
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
+from django.core.files.storage import default_storage
 from django.core.serializers import serialize
-from django.db.models import Count, Sum, Avg, Q
+from django.db.models import Count, Sum, Avg, Q, OuterRef, Prefetch, Subquery
+from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth import get_user_model
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
-import csv
 import json
-# import xlsxwriter
-from io import BytesIO, StringIO
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
-import zipfile
+from itertools import islice
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Set, Tuple
+
+from .export_streaming import (
+    EXPORT_ASYNC_THRESHOLD, EXPORT_CHUNK_SIZE, export_jobs,
+    iter_csv, iter_ndjson, iter_xlsx, iter_zip, xlsx_available
+)
 
 User = get_user_model()
 
+STREAM_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+BOOK_COLUMNS = [
+    ('id', 'ID'), ('title', 'Titre'), ('subtitle', 'Sous-titre'), ('isbn', 'ISBN'),
+    ('status', 'Statut'), ('language', 'Langue'), ('page_count', 'Pages'),
+    ('publication_date', 'Date de publication'), ('created_at', 'Date de création'),
+    ('is_featured', 'Mis en avant'), ('is_free', 'Gratuit'),
+    ('is_premium_only', 'Premium seulement'), ('view_count', 'Vues'),
+    ('download_count', 'Téléchargements'), ('average_rating', 'Note moyenne'),
+    ('total_ratings', 'Nombre d\'évaluations'), ('categories', 'Catégories'),
+    ('co_authors', 'Co-auteurs'),
+]
+
+ANALYTICS_COLUMNS = [
+    ('book_id', 'ID du livre'), ('book_title', 'Titre'),
+    ('total_reading_sessions', 'Sessions de lecture'), ('completed_sessions', 'Sessions terminées'),
+    ('completion_rate', 'Taux de complétion'), ('unique_readers', 'Lecteurs uniques'),
+    ('avg_reading_time_minutes', 'Temps de lecture moyen (min)'),
+    ('avg_progress_pages', 'Progression moyenne (pages)'), ('engagement_score', 'Score d\'engagement'),
+]
+
+REVENUE_COLUMNS = [
+    ('book_id', 'ID du livre'), ('book_title', 'Titre'), ('book_type', 'Type'),
+    ('estimated_revenue', 'Revenus estimés'), ('downloads', 'Téléchargements'),
+    ('views', 'Vues'), ('conversion_rate', 'Taux de conversion'),
+]
+
+AUTHOR_PERFORMANCE_COLUMNS = [
+    ('author_name', 'Auteur'), ('author_nationality', 'Nationalité'),
+    ('total_books_with_publisher', 'Livres chez l\'éditeur'), ('recent_books', 'Livres récents'),
+    ('total_views', 'Vues'), ('total_downloads', 'Téléchargements'),
+    ('avg_rating', 'Note moyenne'), ('most_popular_book', 'Livre le plus populaire'),
+    ('productivity_score', 'Score de productivité'),
+]
+
+
+def _chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_rows(format_type: str, columns, rows: Iterable[Dict[str, Any]], sheet_name: str):
+    """Blocs d'un export ligne par ligne, ou dictionnaire d'erreur"""
+    if format_type == 'csv':
+        return iter_csv(columns, rows)
+    if format_type == 'ndjson':
+        return iter_ndjson(rows)
+    if format_type == 'xlsx':
+        if not xlsx_available():
+            return {'error': 'Excel export temporarily unavailable'}
+        return iter_xlsx(sheet_name, columns, rows)
+    return {'error': f'Format d\'export inconnu: {format_type}'}
+
 
 class AuthorExportAPI:
     """API d'export pour les auteurs"""
-    
+
     def __init__(self, user):
         self.user = user
         self.is_author = self._check_author_permissions()
-    
+
     def _check_author_permissions(self):
-        """Vérifie si l'utilisateur est un auteur"""
+        """Vérifie si l'utilisateur est un auteur rattaché à une fiche auteur"""
+        from catalog_service.models import Author
+
         try:
             # Vérifier les rôles
             user_roles = self.user.user_roles.values_list('role__name', flat=True)
-            return 'author' in user_roles or self.user.is_staff
+            if not ('author' in user_roles or self.user.is_staff):
+                return False
+            return Author.objects.filter(user=self.user).exists()
         except:
             return False
-    
+
+    def _is_user_author(self, author):
+        return author.user_id is not None and author.user_id == self.user.pk
+
+    def author_books(self):
+        """
+        Livres de l'auteur
+
+        Seules les fiches auteur rattachées explicitement au compte
+        (`Author.user`) sont prises en compte : le nom du compte est
+        modifiable par l'utilisateur et ne prouve rien.
+        """
+        from catalog_service.models import Book
+
+        return Book.objects.filter(
+            pk__in=Book.objects.filter(authors__user=self.user).values('pk')
+        )
+
+    def iter_books(self, period_days=None) -> Iterator[Dict[str, Any]]:
+        """
+        Lignes d'export des livres, lues par curseur
+
+        Notes et répartition viennent des agrégats dénormalisés du livre
+        (`rating_*`) : aucune requête sur les évaluations.
+        """
+        from catalog_service.models import Author, Category
+
+        books_query = self.author_books().prefetch_related(
+            Prefetch('categories', queryset=Category.objects.only('id', 'name')),
+            Prefetch('authors', queryset=Author.objects.only('id', 'first_name', 'last_name', 'user_id')),
+        ).order_by('created_at')
+
+        if period_days:
+            cutoff_date = timezone.now() - timedelta(days=period_days)
+            books_query = books_query.filter(created_at__gte=cutoff_date)
+
+        for book in books_query.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            histogram = book.rating_histogram or {}
+            yield {
+                'id': str(book.id),
+                'title': book.title,
+                'subtitle': book.subtitle,
+                'isbn': book.isbn,
+                'status': book.status,
+                'language': book.language,
+                'page_count': book.page_count,
+                'publication_date': book.publication_date.isoformat() if book.publication_date else None,
+                'created_at': book.created_at.isoformat(),
+                'is_featured': book.is_featured,
+                'is_free': book.is_free,
+                'is_premium_only': book.is_premium_only,
+                'view_count': book.view_count,
+                'download_count': book.download_count,
+                'average_rating': round(book.rating_average or 0, 2),
+                'total_ratings': book.rating_count,
+                'categories': [cat.name for cat in book.categories.all()],
+                'co_authors': [
+                    author.full_name for author in book.authors.all()
+                    if not self._is_user_author(author)
+                ],
+                # Répartition des notes
+                'rating_distribution': {
+                    f'{i}_stars': histogram.get(str(i), 0) for i in range(1, 6)
+                },
+            }
+
     def get_author_books_data(self, format_type='json', period_days=None):
-        """Exporte les données des livres de l'auteur"""
+        """
+        Exporte les données des livres de l'auteur
+
+        Les formats `csv`, `ndjson` et `xlsx` retournent un itérateur de blocs
+        à servir en flux.
+        """
         if not self.is_author:
             return {'error': 'Permissions insuffisantes'}
-        
+
         try:
-            from catalog_service.models import Book, BookRating
-            
-            # Filtrer les livres de l'auteur
-            books_query = Book.objects.filter(
-                authors__user=self.user
-            ).prefetch_related('ratings', 'categories', 'authors')
-            
-            if period_days:
-                cutoff_date = timezone.now() - timedelta(days=period_days)
-                books_query = books_query.filter(created_at__gte=cutoff_date)
-            
-            books_data = []
-            for book in books_query:
-                # Statistiques du livre
-                ratings = book.ratings.all()
-                avg_rating = ratings.aggregate(avg=Avg('score'))['avg'] or 0
-                total_ratings = ratings.count()
-                
-                book_data = {
-                    'id': str(book.id),
-                    'title': book.title,
-                    'subtitle': book.subtitle,
-                    'isbn': book.isbn,
-                    'status': book.status,
-                    'language': book.language,
-                    'page_count': book.page_count,
-                    'publication_date': book.publication_date.isoformat() if book.publication_date else None,
-                    'created_at': book.created_at.isoformat(),
-                    'is_featured': book.is_featured,
-                    'is_free': book.is_free,
-                    'is_premium_only': book.is_premium_only,
-                    'view_count': book.view_count,
-                    'download_count': book.download_count,
-                    'average_rating': round(avg_rating, 2),
-                    'total_ratings': total_ratings,
-                    'categories': [cat.name for cat in book.categories.all()],
-                    'co_authors': [author.full_name for author in book.authors.exclude(user=self.user)]
-                }
-                
-                # Répartition des notes
-                rating_distribution = {}
-                for i in range(1, 6):
-                    count = ratings.filter(score=i).count()
-                    rating_distribution[f'{i}_stars'] = count
-                book_data['rating_distribution'] = rating_distribution
-                
-                books_data.append(book_data)
-            
             if format_type == 'json':
+                books_data = list(self.iter_books(period_days))
                 return {
                     'success': True,
                     'data': books_data,
@@ -106,128 +204,133 @@ class AuthorExportAPI:
                         'period_days': period_days
                     }
                 }
-            elif format_type == 'csv':
-                return self._export_books_csv(books_data)
-            elif format_type == 'xlsx':
-                return self._export_books_xlsx(books_data)
-            
+            return stream_rows(format_type, BOOK_COLUMNS, self.iter_books(period_days), 'Mes Livres')
+
         except Exception as e:
             return {'error': f'Erreur lors de l\'export: {str(e)}'}
-    
-    def get_reading_analytics(self, format_type='json', period_days=30):
-        """Analytics de lecture pour les livres de l'auteur"""
-        if not self.is_author:
-            return {'error': 'Permissions insuffisantes'}
-        
-        try:
-            from catalog_service.models import Book
-            from reading_service.models import ReadingSession, ReadingProgress
-            
-            # Livres de l'auteur
-            author_books = Book.objects.filter(authors__user=self.user)
-            book_ids = [str(book.id) for book in author_books]
-            
-            cutoff_date = timezone.now() - timedelta(days=period_days)
-            
-            # Sessions de lecture
-            reading_sessions = ReadingSession.objects.filter(
-                book_uuid__in=book_ids,
-                created_at__gte=cutoff_date
-            )
-            
-            analytics_data = []
-            for book in author_books:
-                book_sessions = reading_sessions.filter(book_uuid=str(book.id))
-                
-                # Métriques par livre
-                total_sessions = book_sessions.count()
-                completed_sessions = book_sessions.filter(status='completed').count()
-                active_readers = book_sessions.values('user').distinct().count()
-                
-                # Temps de lecture moyen
-                avg_reading_time = book_sessions.aggregate(
-                    avg=Avg('total_reading_time')
-                )['avg'] or timedelta()
-                
-                # Progression moyenne
-                avg_progress = book_sessions.aggregate(
-                    avg=Avg('current_page')
-                )['avg'] or 0
-                
+
+    def iter_reading_analytics(self, period_days=30) -> Iterator[Dict[str, Any]]:
+        """Analytics par livre : une requête groupée par lot de livres"""
+        from reading_service.models import ReadingSession
+
+        cutoff_date = timezone.now() - timedelta(days=period_days)
+        books = self.author_books().only('id', 'title').order_by('created_at')
+
+        for chunk in _chunked(books.iterator(chunk_size=EXPORT_CHUNK_SIZE), EXPORT_CHUNK_SIZE):
+            stats = {
+                row['book_uuid']: row
+                for row in ReadingSession.objects.filter(
+                    book_uuid__in=[book.id for book in chunk],
+                    created_at__gte=cutoff_date
+                ).values('book_uuid').annotate(
+                    total=Count('id'),
+                    completed=Count('id', filter=Q(status='completed')),
+                    readers=Count('user', distinct=True),
+                    avg_time=Avg('total_reading_time'),
+                    avg_page=Avg('current_page'),
+                ).order_by()
+            }
+            for book in chunk:
+                row = stats.get(book.id, {})
+                total_sessions = row.get('total', 0)
+                completed_sessions = row.get('completed', 0)
+                avg_reading_time = row.get('avg_time') or timedelta()
+                avg_progress = row.get('avg_page') or 0
                 completion_rate = (completed_sessions / total_sessions * 100) if total_sessions > 0 else 0
-                
-                book_analytics = {
+
+                yield {
                     'book_id': str(book.id),
                     'book_title': book.title,
                     'total_reading_sessions': total_sessions,
                     'completed_sessions': completed_sessions,
                     'completion_rate': round(completion_rate, 2),
-                    'unique_readers': active_readers,
+                    'unique_readers': row.get('readers', 0),
                     'avg_reading_time_minutes': int(avg_reading_time.total_seconds() / 60),
                     'avg_progress_pages': round(avg_progress, 2),
-                    'engagement_score': self._calculate_engagement_score(book_sessions)
+                    'engagement_score': self._calculate_engagement_score(
+                        total_sessions, completed_sessions, avg_progress
+                    )
                 }
-                
-                analytics_data.append(book_analytics)
-            
-            if format_type == 'json':
-                return {
-                    'success': True,
-                    'data': analytics_data,
-                    'summary': {
-                        'total_books_analyzed': len(analytics_data),
-                        'period_days': period_days,
-                        'total_unique_readers': reading_sessions.values('user').distinct().count(),
-                        'total_reading_sessions': reading_sessions.count(),
-                        'avg_completion_rate': round(
-                            sum(item['completion_rate'] for item in analytics_data) / len(analytics_data), 2
-                        ) if analytics_data else 0
-                    }
+
+    def get_reading_analytics(self, format_type='json', period_days=30):
+        """Analytics de lecture pour les livres de l'auteur"""
+        if not self.is_author:
+            return {'error': 'Permissions insuffisantes'}
+
+        try:
+            from reading_service.models import ReadingSession
+
+            if format_type != 'json':
+                return stream_rows(
+                    format_type, ANALYTICS_COLUMNS, self.iter_reading_analytics(period_days), 'Analytics'
+                )
+
+            analytics_data = list(self.iter_reading_analytics(period_days))
+            cutoff_date = timezone.now() - timedelta(days=period_days)
+            totals = ReadingSession.objects.filter(
+                book_uuid__in=[item['book_id'] for item in analytics_data],
+                created_at__gte=cutoff_date
+            ).aggregate(
+                readers=Count('user', distinct=True),
+                sessions=Count('id')
+            )
+
+            return {
+                'success': True,
+                'data': analytics_data,
+                'summary': {
+                    'total_books_analyzed': len(analytics_data),
+                    'period_days': period_days,
+                    'total_unique_readers': totals['readers'],
+                    'total_reading_sessions': totals['sessions'],
+                    'avg_completion_rate': round(
+                        sum(item['completion_rate'] for item in analytics_data) / len(analytics_data), 2
+                    ) if analytics_data else 0
                 }
-            
+            }
+
         except Exception as e:
             return {'error': f'Erreur lors de l\'analyse: {str(e)}'}
-    
+
+    def iter_revenue(self) -> Iterator[Dict[str, Any]]:
+        """Revenus estimés par livre, lus par curseur"""
+        books = self.author_books().only(
+            'id', 'title', 'is_free', 'is_premium_only', 'download_count', 'view_count'
+        ).order_by('created_at')
+
+        # Simuler les revenus par livre (à adapter selon le modèle réel)
+        for book in books.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            # Simulation basée sur les téléchargements et le type de livre
+            if book.is_free:
+                book_revenue = 0
+            else:
+                # Revenus estimés basés sur les vues et téléchargements
+                base_price = 500 if book.is_premium_only else 200  # FCFA
+                estimated_sales = book.download_count * 0.1  # 10% de conversion
+                book_revenue = estimated_sales * base_price
+
+            yield {
+                'book_id': str(book.id),
+                'book_title': book.title,
+                'book_type': 'Premium' if book.is_premium_only else 'Gratuit' if book.is_free else 'Standard',
+                'estimated_revenue': book_revenue,
+                'downloads': book.download_count,
+                'views': book.view_count,
+                'conversion_rate': '10%'  # Estimation
+            }
+
     def get_revenue_report(self, format_type='json', period_days=30):
         """Rapport de revenus pour l'auteur"""
         if not self.is_author:
             return {'error': 'Permissions insuffisantes'}
-        
+
         try:
-            from shared_models.financial_reports import PaymentTransaction
-            from catalog_service.models import Book
-            
-            # Livres de l'auteur
-            author_books = Book.objects.filter(authors__user=self.user)
-            
-            cutoff_date = timezone.now() - timedelta(days=period_days)
-            
-            # Simuler les revenus par livre (à adapter selon le modèle réel)
-            revenue_data = []
-            total_revenue = 0
-            
-            for book in author_books:
-                # Simulation basée sur les téléchargements et le type de livre
-                if book.is_free:
-                    book_revenue = 0
-                else:
-                    # Revenus estimés basés sur les vues et téléchargements
-                    base_price = 500 if book.is_premium_only else 200  # FCFA
-                    estimated_sales = book.download_count * 0.1  # 10% de conversion
-                    book_revenue = estimated_sales * base_price
-                
-                revenue_data.append({
-                    'book_id': str(book.id),
-                    'book_title': book.title,
-                    'book_type': 'Premium' if book.is_premium_only else 'Gratuit' if book.is_free else 'Standard',
-                    'estimated_revenue': book_revenue,
-                    'downloads': book.download_count,
-                    'views': book.view_count,
-                    'conversion_rate': '10%'  # Estimation
-                })
-                
-                total_revenue += book_revenue
-            
+            if format_type != 'json':
+                return stream_rows(format_type, REVENUE_COLUMNS, self.iter_revenue(), 'Revenus')
+
+            revenue_data = list(self.iter_revenue())
+            total_revenue = sum(item['estimated_revenue'] for item in revenue_data)
+
             return {
                 'success': True,
                 'data': revenue_data,
@@ -239,104 +342,29 @@ class AuthorExportAPI:
                     'avg_revenue_per_book': round(total_revenue / len(revenue_data), 2) if revenue_data else 0
                 }
             }
-            
+
         except Exception as e:
             return {'error': f'Erreur lors du calcul des revenus: {str(e)}'}
-    
-    def _calculate_engagement_score(self, sessions):
+
+    def _calculate_engagement_score(self, total_sessions, completed_sessions, avg_progress):
         """Calcule un score d'engagement pour un livre"""
-        if not sessions.exists():
+        if not total_sessions:
             return 0
-        
-        total_sessions = sessions.count()
-        completed_sessions = sessions.filter(status='completed').count()
-        avg_progress = sessions.aggregate(avg=Avg('current_page'))['avg'] or 0
-        
+
         # Score basé sur taux de complétion et progression moyenne
         completion_score = (completed_sessions / total_sessions) * 50
         progress_score = min(avg_progress / 100, 1) * 50  # Normalisé sur 50
-        
+
         return round(completion_score + progress_score, 2)
-    
-    def _export_books_csv(self, books_data):
-        """Exporte les données des livres au format CSV"""
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # En-têtes
-        headers = [
-            'ID', 'Titre', 'Sous-titre', 'ISBN', 'Statut', 'Langue',
-            'Pages', 'Date de publication', 'Date de création', 'Mis en avant',
-            'Gratuit', 'Premium seulement', 'Vues', 'Téléchargements',
-            'Note moyenne', 'Nombre d\'évaluations', 'Catégories', 'Co-auteurs'
-        ]
-        writer.writerow(headers)
-        
-        # Données
-        for book in books_data:
-            row = [
-                book['id'], book['title'], book['subtitle'], book['isbn'],
-                book['status'], book['language'], book['page_count'],
-                book['publication_date'], book['created_at'], book['is_featured'],
-                book['is_free'], book['is_premium_only'], book['view_count'],
-                book['download_count'], book['average_rating'], book['total_ratings'],
-                ', '.join(book['categories']), ', '.join(book['co_authors'])
-            ]
-            writer.writerow(row)
-        
-        return output.getvalue()
-    
-    def _export_books_xlsx(self, books_data):
-        """Exporte les données des livres au format Excel"""
-        # Temporarily disabled - xlsxwriter not installed
-        return {'error': 'Excel export temporarily unavailable'}
-        worksheet = workbook.add_worksheet('Mes Livres')
-        
-        # Formats
-        header_format = workbook.add_format({
-            'bold': True,
-            'bg_color': '#4472C4',
-            'font_color': 'white'
-        })
-        
-        # En-têtes
-        headers = [
-            'ID', 'Titre', 'Sous-titre', 'ISBN', 'Statut', 'Langue',
-            'Pages', 'Date de publication', 'Vues', 'Téléchargements',
-            'Note moyenne', 'Évaluations'
-        ]
-        
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header, header_format)
-        
-        # Données
-        for row, book in enumerate(books_data, 1):
-            worksheet.write(row, 0, book['id'])
-            worksheet.write(row, 1, book['title'])
-            worksheet.write(row, 2, book['subtitle'] or '')
-            worksheet.write(row, 3, book['isbn'] or '')
-            worksheet.write(row, 4, book['status'])
-            worksheet.write(row, 5, book['language'])
-            worksheet.write(row, 6, book['page_count'] or 0)
-            worksheet.write(row, 7, book['publication_date'] or '')
-            worksheet.write(row, 8, book['view_count'])
-            worksheet.write(row, 9, book['download_count'])
-            worksheet.write(row, 10, book['average_rating'])
-            worksheet.write(row, 11, book['total_ratings'])
-        
-        workbook.close()
-        output.seek(0)
-        
-        return output.getvalue()
 
 
 class PublisherExportAPI:
     """API d'export pour les éditeurs"""
-    
+
     def __init__(self, user):
         self.user = user
         self.is_publisher = self._check_publisher_permissions()
-    
+
     def _check_publisher_permissions(self):
         """Vérifie si l'utilisateur est un éditeur"""
         try:
@@ -344,27 +372,43 @@ class PublisherExportAPI:
             return 'publisher' in user_roles or self.user.is_staff
         except:
             return False
-    
+
+    def get_publisher(self):
+        """Trouver l'éditeur associé à l'utilisateur"""
+        from catalog_service.models import Publisher
+
+        return Publisher.objects.filter(
+            # Supposons qu'il y ait un lien user dans Publisher
+            name__icontains=self.user.get_full_name()
+        ).first()
+
     def get_catalog_overview(self, format_type='json'):
         """Vue d'ensemble du catalogue de l'éditeur"""
         if not self.is_publisher:
             return {'error': 'Permissions insuffisantes'}
-        
+
         try:
-            from catalog_service.models import Book, Publisher, Author
-            
-            # Trouver l'éditeur associé à l'utilisateur
-            publisher = Publisher.objects.filter(
-                # Supposons qu'il y ait un lien user dans Publisher
-                name__icontains=self.user.get_full_name()
-            ).first()
-            
+            from catalog_service.models import Book
+
+            publisher = self.get_publisher()
             if not publisher:
                 return {'error': 'Aucun éditeur associé à ce compte'}
-            
-            # Livres de l'éditeur
+
+            # Livres de l'éditeur : toutes les statistiques en une requête
             books = Book.objects.filter(publisher=publisher)
-            
+            stats = books.aggregate(
+                total_books=Count('id'),
+                published_books=Count('id', filter=Q(status='published')),
+                draft_books=Count('id', filter=Q(status='draft')),
+                featured_books=Count('id', filter=Q(is_featured=True)),
+                free_books=Count('id', filter=Q(is_free=True)),
+                premium_books=Count('id', filter=Q(is_premium_only=True)),
+                total_views=Sum('view_count'),
+                total_downloads=Sum('download_count'),
+                rating_sum=Sum('rating_sum'),
+                rating_count=Sum('rating_count'),
+            )
+
             catalog_data = {
                 'publisher_info': {
                     'name': publisher.name,
@@ -373,17 +417,17 @@ class PublisherExportAPI:
                     'website': publisher.website
                 },
                 'catalog_stats': {
-                    'total_books': books.count(),
-                    'published_books': books.filter(status='published').count(),
-                    'draft_books': books.filter(status='draft').count(),
-                    'featured_books': books.filter(is_featured=True).count(),
-                    'free_books': books.filter(is_free=True).count(),
-                    'premium_books': books.filter(is_premium_only=True).count()
+                    key: stats[key] for key in (
+                        'total_books', 'published_books', 'draft_books',
+                        'featured_books', 'free_books', 'premium_books'
+                    )
                 },
                 'performance_metrics': {
-                    'total_views': books.aggregate(total=Sum('view_count'))['total'] or 0,
-                    'total_downloads': books.aggregate(total=Sum('download_count'))['total'] or 0,
-                    'avg_rating': books.aggregate(avg=Avg('ratings__score'))['avg'] or 0
+                    'total_views': stats['total_views'] or 0,
+                    'total_downloads': stats['total_downloads'] or 0,
+                    'avg_rating': (
+                        stats['rating_sum'] / stats['rating_count'] if stats['rating_count'] else 0
+                    )
                 },
                 'top_performing_books': list(
                     books.order_by('-view_count')[:10].values(
@@ -391,59 +435,70 @@ class PublisherExportAPI:
                     )
                 )
             }
-            
+
             return {
                 'success': True,
                 'data': catalog_data,
                 'export_date': timezone.now().isoformat()
             }
-            
+
         except Exception as e:
             return {'error': f'Erreur lors de l\'export: {str(e)}'}
-    
+
+    def iter_authors_performance(self, publisher, period_days=90) -> Iterator[Dict[str, Any]]:
+        """Performance des auteurs : une requête annotée, triée par vues"""
+        from catalog_service.models import Book, Author
+
+        cutoff_date = timezone.now() - timedelta(days=period_days)
+        most_popular = Book.objects.filter(
+            publisher=publisher, authors=OuterRef('pk')
+        ).order_by('-view_count').values('title')[:1]
+
+        # Le filtre précède les annotations : elles ne portent que sur les livres de l'éditeur
+        authors = Author.objects.filter(books__publisher=publisher).annotate(
+            total_books=Count('books', distinct=True),
+            recent_count=Count('books', filter=Q(books__created_at__gte=cutoff_date), distinct=True),
+            total_views=Sum('books__view_count'),
+            total_downloads=Sum('books__download_count'),
+            rating_sum=Sum('books__rating_sum'),
+            rating_count=Sum('books__rating_count'),
+            most_popular_book=Subquery(most_popular),
+        ).order_by('-total_views')
+
+        for author in authors.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            total_views = author.total_views or 0
+            yield {
+                'author_name': author.full_name,
+                'author_nationality': author.nationality,
+                'total_books_with_publisher': author.total_books,
+                'recent_books': author.recent_count,
+                'total_views': total_views,
+                'total_downloads': author.total_downloads or 0,
+                'avg_rating': author.rating_sum / author.rating_count if author.rating_count else 0,
+                'most_popular_book': author.most_popular_book,
+                'productivity_score': self._calculate_productivity_score(
+                    author.total_books, author.recent_count, total_views / max(author.total_books, 1)
+                )
+            }
+
     def get_authors_performance(self, format_type='json', period_days=90):
         """Performance des auteurs de l'éditeur"""
         if not self.is_publisher:
             return {'error': 'Permissions insuffisantes'}
-        
+
         try:
-            from catalog_service.models import Book, Publisher, Author
-            
-            publisher = Publisher.objects.filter(
-                name__icontains=self.user.get_full_name()
-            ).first()
-            
+            publisher = self.get_publisher()
             if not publisher:
                 return {'error': 'Aucun éditeur associé à ce compte'}
-            
-            # Auteurs qui ont publié avec cet éditeur
-            books = Book.objects.filter(publisher=publisher)
-            authors = Author.objects.filter(books__in=books).distinct()
-            
-            cutoff_date = timezone.now() - timedelta(days=period_days)
-            
-            authors_data = []
-            for author in authors:
-                author_books = books.filter(authors=author)
-                recent_books = author_books.filter(created_at__gte=cutoff_date)
-                
-                author_stats = {
-                    'author_name': author.full_name,
-                    'author_nationality': author.nationality,
-                    'total_books_with_publisher': author_books.count(),
-                    'recent_books': recent_books.count(),
-                    'total_views': author_books.aggregate(total=Sum('view_count'))['total'] or 0,
-                    'total_downloads': author_books.aggregate(total=Sum('download_count'))['total'] or 0,
-                    'avg_rating': author_books.aggregate(avg=Avg('ratings__score'))['avg'] or 0,
-                    'most_popular_book': author_books.order_by('-view_count').first().title if author_books.exists() else None,
-                    'productivity_score': self._calculate_productivity_score(author_books, recent_books)
-                }
-                
-                authors_data.append(author_stats)
-            
-            # Trier par performance
-            authors_data.sort(key=lambda x: x['total_views'], reverse=True)
-            
+
+            if format_type != 'json':
+                return stream_rows(
+                    format_type, AUTHOR_PERFORMANCE_COLUMNS,
+                    self.iter_authors_performance(publisher, period_days), 'Auteurs'
+                )
+
+            authors_data = list(self.iter_authors_performance(publisher, period_days))
+
             return {
                 'success': True,
                 'data': authors_data,
@@ -453,79 +508,195 @@ class PublisherExportAPI:
                     'top_performer': authors_data[0]['author_name'] if authors_data else None
                 }
             }
-            
+
         except Exception as e:
             return {'error': f'Erreur lors de l\'analyse: {str(e)}'}
-    
-    def _calculate_productivity_score(self, all_books, recent_books):
+
+    def _calculate_productivity_score(self, total_books, recent_count, avg_views):
         """Calcule un score de productivité pour un auteur"""
-        total_books = all_books.count()
-        recent_count = recent_books.count()
-        avg_views = all_books.aggregate(avg=Avg('view_count'))['avg'] or 0
-        
         # Score basé sur la productivité récente et la popularité
         productivity = (recent_count / max(total_books, 1)) * 50
         popularity = min(avg_views / 1000, 1) * 50
-        
+
         return round(productivity + popularity, 2)
 
 
+# Export complet
+def _user_roles(user) -> Set[str]:
+    return set(user.user_roles.values_list('role__name', flat=True))
+
+
+def _json_entry(data) -> Iterator[bytes]:
+    yield json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def package_entries(user, user_roles: Optional[Set[str]] = None) -> Iterator[Tuple[str, Iterable[bytes]]]:
+    """
+    Entrées `(nom, blocs)` de l'export complet
+
+    Les listes sont écrites en NDJSON (un objet par ligne) au fur et à
+    mesure de leur lecture en base.
+    """
+    user_roles = _user_roles(user) if user_roles is None else user_roles
+    is_author = 'author' in user_roles or user.is_staff
+    is_publisher = 'publisher' in user_roles or user.is_staff
+
+    if is_author:
+        author_exporter = AuthorExportAPI(user)
+        if author_exporter.is_author:
+            yield 'auteur_livres.ndjson', iter_ndjson(author_exporter.iter_books())
+            yield 'auteur_analytics.ndjson', iter_ndjson(author_exporter.iter_reading_analytics())
+            yield 'auteur_revenus.ndjson', iter_ndjson(author_exporter.iter_revenue())
+
+    if is_publisher:
+        publisher_exporter = PublisherExportAPI(user)
+        catalog_data = publisher_exporter.get_catalog_overview('json')
+        if catalog_data.get('success'):
+            yield 'editeur_catalogue.json', _json_entry(catalog_data)
+            yield 'editeur_auteurs.ndjson', iter_ndjson(
+                publisher_exporter.iter_authors_performance(publisher_exporter.get_publisher())
+            )
+
+    yield 'README.txt', [_package_readme(user, is_author, is_publisher).encode('utf-8')]
+
+
+def _package_readme(user, is_author, is_publisher) -> str:
+    readme_content = f"""
+# Export Coko - {user.get_full_name()}
+
+Date d'export: {timezone.now().strftime('%d/%m/%Y %H:%M')}
+
+## Contenu du package:
+
+Les fichiers .ndjson contiennent un objet JSON par ligne.
+"""
+    if is_author:
+        readme_content += """
+### Données Auteur:
+- auteur_livres.ndjson: Liste de vos livres avec statistiques
+- auteur_analytics.ndjson: Analytics de lecture de vos livres
+- auteur_revenus.ndjson: Rapport de revenus estimés
+
+"""
+
+    if is_publisher:
+        readme_content += """
+### Données Éditeur:
+- editeur_catalogue.json: Vue d'ensemble de votre catalogue
+- editeur_auteurs.ndjson: Performance de vos auteurs
+
+"""
+
+    readme_content += """
+## Support:
+Pour toute question sur ces données, contactez support@coko.africa
+"""
+    return readme_content
+
+
+def package_size(user, user_roles: Set[str]) -> int:
+    """Nombre de livres couverts par l'export complet (estimation de son volume)"""
+    from catalog_service.models import Book
+
+    size = 0
+    if 'author' in user_roles or user.is_staff:
+        size += AuthorExportAPI(user).author_books().count()
+    if 'publisher' in user_roles or user.is_staff:
+        publisher = PublisherExportAPI(user).get_publisher()
+        if publisher:
+            size += Book.objects.filter(publisher=publisher).count()
+    return size
+
+
+def _package_filename(user) -> str:
+    return f'export_coko_{user.username}_{timezone.now().strftime("%Y%m%d")}.zip'
+
+
 # Vues d'API REST
+class _ExportRenderer(BaseRenderer):
+    """Accepte `?format=…` ; le contenu est produit par la vue"""
+
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class CSVExportRenderer(_ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONExportRenderer(_ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class XLSXExportRenderer(_ExportRenderer):
+    media_type = STREAM_CONTENT_TYPES['xlsx']
+    format = 'xlsx'
+
+
+EXPORT_RENDERERS = [JSONRenderer, CSVExportRenderer, NDJSONExportRenderer, XLSXExportRenderer]
+
+
+def _export_response(data, format_type, filename):
+    """Réponse JSON, ou fichier servi en flux pour les formats ligne par ligne"""
+    if isinstance(data, dict):
+        return Response(data) if format_type == 'json' else JsonResponse(data)
+    response = StreamingHttpResponse(data, content_type=STREAM_CONTENT_TYPES[format_type])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{filename}_{timezone.now().strftime("%Y%m%d")}.{format_type}"'
+    )
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(EXPORT_RENDERERS)
 def export_author_books(request):
     """Export des livres d'un auteur"""
     format_type = request.GET.get('format', 'json')
     period_days = request.GET.get('period_days')
-    
+
     if period_days:
         try:
             period_days = int(period_days)
         except ValueError:
             period_days = None
-    
+
     exporter = AuthorExportAPI(request.user)
     data = exporter.get_author_books_data(format_type, period_days)
-    
-    if format_type == 'csv':
-        response = HttpResponse(data, content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="mes_livres_{timezone.now().strftime("%Y%m%d")}.csv"'
-        return response
-    elif format_type == 'xlsx':
-        response = HttpResponse(
-            data,
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename="mes_livres_{timezone.now().strftime("%Y%m%d")}.xlsx"'
-        return response
-    
-    return Response(data)
+
+    return _export_response(data, format_type, 'mes_livres')
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(EXPORT_RENDERERS)
 def export_author_analytics(request):
     """Export des analytics de lecture pour un auteur"""
     format_type = request.GET.get('format', 'json')
     period_days = int(request.GET.get('period_days', 30))
-    
+
     exporter = AuthorExportAPI(request.user)
     data = exporter.get_reading_analytics(format_type, period_days)
-    
-    return Response(data)
+
+    return _export_response(data, format_type, 'analytics_lecture')
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(EXPORT_RENDERERS)
 def export_author_revenue(request):
     """Export du rapport de revenus pour un auteur"""
     format_type = request.GET.get('format', 'json')
     period_days = int(request.GET.get('period_days', 30))
-    
+
     exporter = AuthorExportAPI(request.user)
     data = exporter.get_revenue_report(format_type, period_days)
-    
-    return Response(data)
+
+    return _export_response(data, format_type, 'revenus')
 
 
 @api_view(['GET'])
@@ -533,119 +704,94 @@ def export_author_revenue(request):
 def export_publisher_catalog(request):
     """Export du catalogue d'un éditeur"""
     format_type = request.GET.get('format', 'json')
-    
+
     exporter = PublisherExportAPI(request.user)
     data = exporter.get_catalog_overview(format_type)
-    
+
     return Response(data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes(EXPORT_RENDERERS)
 def export_publisher_authors(request):
     """Export de la performance des auteurs d'un éditeur"""
     format_type = request.GET.get('format', 'json')
     period_days = int(request.GET.get('period_days', 90))
-    
+
     exporter = PublisherExportAPI(request.user)
     data = exporter.get_authors_performance(format_type, period_days)
-    
-    return Response(data)
+
+    return _export_response(data, format_type, 'performance_auteurs')
+
+
+def _job_payload(request, job):
+    return {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'filename': job['filename'],
+        'created_at': job['created_at'],
+        'error': job.get('error'),
+        'download_url': request.build_absolute_uri(
+            reverse('dashboard:export_package_job', kwargs={'job_id': job['job_id']})
+        ),
+    }
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def export_complete_package(request):
-    """Export complet pour auteurs et éditeurs"""
-    user_roles = request.user.user_roles.values_list('role__name', flat=True)
-    
-    # Créer un package ZIP avec tous les exports disponibles
-    zip_buffer = BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        
-        if 'author' in user_roles or request.user.is_staff:
-            author_exporter = AuthorExportAPI(request.user)
-            
-            # Export des livres
-            books_data = author_exporter.get_author_books_data('json')
-            if books_data.get('success'):
-                zip_file.writestr(
-                    'auteur_livres.json',
-                    json.dumps(books_data, indent=2, ensure_ascii=False)
-                )
-            
-            # Export des analytics
-            analytics_data = author_exporter.get_reading_analytics('json')
-            if analytics_data.get('success'):
-                zip_file.writestr(
-                    'auteur_analytics.json',
-                    json.dumps(analytics_data, indent=2, ensure_ascii=False)
-                )
-            
-            # Export des revenus
-            revenue_data = author_exporter.get_revenue_report('json')
-            if revenue_data.get('success'):
-                zip_file.writestr(
-                    'auteur_revenus.json',
-                    json.dumps(revenue_data, indent=2, ensure_ascii=False)
-                )
-        
-        if 'publisher' in user_roles or request.user.is_staff:
-            publisher_exporter = PublisherExportAPI(request.user)
-            
-            # Export du catalogue
-            catalog_data = publisher_exporter.get_catalog_overview('json')
-            if catalog_data.get('success'):
-                zip_file.writestr(
-                    'editeur_catalogue.json',
-                    json.dumps(catalog_data, indent=2, ensure_ascii=False)
-                )
-            
-            # Export des auteurs
-            authors_data = publisher_exporter.get_authors_performance('json')
-            if authors_data.get('success'):
-                zip_file.writestr(
-                    'editeur_auteurs.json',
-                    json.dumps(authors_data, indent=2, ensure_ascii=False)
-                )
-        
-        # Ajouter un fichier README
-        readme_content = f"""
-# Export Coko - {request.user.get_full_name()}
+    """
+    Export complet pour auteurs et éditeurs
 
-Date d'export: {timezone.now().strftime('%d/%m/%Y %H:%M')}
+    L'archive ZIP est servie en flux. Au-delà de `EXPORT_ASYNC_THRESHOLD`
+    livres (ou avec `?async=1`), elle est construite en arrière-plan et
+    la réponse 202 indique où la télécharger.
+    """
+    user_roles = _user_roles(request.user)
+    filename = _package_filename(request.user)
 
-## Contenu du package:
+    run_async = request.GET.get('async') in ('1', 'true')
+    if run_async or package_size(request.user, user_roles) > EXPORT_ASYNC_THRESHOLD:
+        from .tasks import build_export_package
 
-"""
-        if 'author' in user_roles:
-            readme_content += """
-### Données Auteur:
-- auteur_livres.json: Liste de vos livres avec statistiques
-- auteur_analytics.json: Analytics de lecture de vos livres  
-- auteur_revenus.json: Rapport de revenus estimés
+        # Un seul export en arrière-plan par utilisateur : les demandes
+        # répétées renvoient celui qui est déjà en cours
+        job, created = export_jobs.claim(request.user, filename)
+        if job is None:
+            return Response(
+                {'error': 'Un export est déjà en cours'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        if created:
+            build_export_package.delay(job['job_id'], str(request.user.pk))
+        return Response(_job_payload(request, job), status=status.HTTP_202_ACCEPTED)
 
-"""
-        
-        if 'publisher' in user_roles:
-            readme_content += """
-### Données Éditeur:
-- editeur_catalogue.json: Vue d'ensemble de votre catalogue
-- editeur_auteurs.json: Performance de vos auteurs
+    response = StreamingHttpResponse(
+        iter_zip(package_entries(request.user, user_roles)),
+        content_type='application/zip'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
 
-"""
-        
-        readme_content += """
-## Support:
-Pour toute question sur ces données, contactez support@coko.africa
-"""
-        
-        zip_file.writestr('README.txt', readme_content)
-    
-    zip_buffer.seek(0)
-    
-    response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
-    response['Content-Disposition'] = f'attachment; filename="export_coko_{request.user.username}_{timezone.now().strftime("%Y%m%d")}.zip"'
-    
-    return response
\ No newline at end of file
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_package_job(request, job_id):
+    """État d'un export complet construit en arrière-plan, ou son archive une fois prête"""
+    job = export_jobs.get(job_id)
+    if not job or job['user_id'] != str(request.user.pk):
+        return Response({'error': 'Export introuvable ou expiré'}, status=status.HTTP_404_NOT_FOUND)
+
+    if job['status'] == 'ready':
+        return FileResponse(
+            default_storage.open(job['path'], 'rb'),
+            as_attachment=True,
+            filename=job['filename'],
+            content_type='application/zip'
+        )
+
+    if job['status'] == 'failed':
+        return Response(_job_payload(request, job), status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(_job_payload(request, job), status=status.HTTP_202_ACCEPTED)
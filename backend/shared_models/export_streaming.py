@@ -0,0 +1,255 @@
+"""
+Écriture des exports au fil de l'eau (CSV, NDJSON, XLSX, ZIP)
+
+Les exports sont produits ligne par ligne à partir d'itérateurs (curseur
+côté serveur via `.iterator(chunk_size)`), sans jamais construire la liste
+complète ni le fichier complet en mémoire :
+
+- CSV et NDJSON : chaque ligne est encodée puis rendue immédiatement ;
+- ZIP : l'archive est écrite dans un tampon vidé après chaque ligne
+  (`zipfile` accepte une sortie non positionnable et ajoute alors des
+  descripteurs de données) ;
+- XLSX : `xlsxwriter` en mode `constant_memory`, dans un fichier
+  temporaire relu par blocs.
+
+Les exports trop volumineux pour une réponse HTTP sont construits par une
+tâche Celery dans le stockage de fichiers ; `ExportJobs` suit leur état
+en cache jusqu'au téléchargement.
+"""
+import csv
+import json
+import logging
+import tempfile
+import uuid
+import zipfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+try:
+    import xlsxwriter
+except ImportError:  # Dépendance optionnelle : export Excel indisponible
+    xlsxwriter = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 500)
+EXPORT_ASYNC_THRESHOLD = getattr(settings, 'EXPORT_ASYNC_THRESHOLD', 5000)
+EXPORT_JOB_TTL = getattr(settings, 'EXPORT_JOB_TTL', 24 * 3600)
+# Au plus un export en arrière-plan par utilisateur pendant ce délai
+EXPORT_JOB_LOCK_TIMEOUT = getattr(settings, 'EXPORT_JOB_LOCK_TIMEOUT', 3600)
+EXPORT_STORAGE_PREFIX = 'exports'
+FILE_CHUNK_SIZE = 64 * 1024
+
+# (clé dans la ligne, libellé de la colonne)
+Columns = List[Tuple[str, str]]
+
+
+class _Echo:
+    """Pseudo-fichier : `csv.writer` rend la ligne au lieu de l'écrire"""
+
+    def write(self, value):
+        return value
+
+
+class _Sink:
+    """Fichier en écriture seule dont le contenu est vidé au fil de l'eau"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False, cls=DjangoJSONEncoder)
+    return value
+
+
+def iter_csv(columns: Columns, rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Lignes CSV encodées en UTF-8, en-tête compris"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow([label for _, label in columns]).encode('utf-8')
+    for row in rows:
+        yield writer.writerow([_cell(row.get(key)) for key, _ in columns]).encode('utf-8')
+
+
+def iter_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Un objet JSON par ligne"""
+    for row in rows:
+        yield (json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n').encode('utf-8')
+
+
+def xlsx_available() -> bool:
+    return xlsxwriter is not None
+
+
+def iter_xlsx(sheet_name: str, columns: Columns, rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Classeur Excel écrit ligne par ligne (`constant_memory`) dans un
+    fichier temporaire, puis rendu par blocs
+    """
+    if xlsxwriter is None:
+        raise RuntimeError("Export Excel indisponible: xlsxwriter n'est pas installé")
+
+    with tempfile.TemporaryFile() as output:
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+        worksheet = workbook.add_worksheet(sheet_name)
+        header_format = workbook.add_format({
+            'bold': True,
+            'bg_color': '#4472C4',
+            'font_color': 'white'
+        })
+        for col, (_, label) in enumerate(columns):
+            worksheet.write(0, col, label, header_format)
+        for index, row in enumerate(rows, 1):
+            for col, (key, _) in enumerate(columns):
+                value = _cell(row.get(key))
+                worksheet.write(index, col, '' if value is None else value)
+        workbook.close()
+
+        output.seek(0)
+        while True:
+            chunk = output.read(FILE_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+class ZipStream:
+    """Archive ZIP produite au fil de l'eau, entrée par entrée"""
+
+    def __init__(self, compression: int = zipfile.ZIP_DEFLATED):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', compression)
+
+    def write_entry(self, name: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        with self._zip.open(name, 'w', force_zip64=True) as entry:
+            for chunk in chunks:
+                entry.write(chunk)
+                data = self._sink.drain()
+                if data:
+                    yield data
+        data = self._sink.drain()
+        if data:
+            yield data
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
+
+
+def iter_zip(entries: Iterable[Tuple[str, Iterable[bytes]]]) -> Iterator[bytes]:
+    """Archive ZIP des entrées `(nom, blocs)`, construites paresseusement"""
+    stream = ZipStream()
+    for name, chunks in entries:
+        yield from stream.write_entry(name, chunks)
+    yield stream.close()
+
+
+class ExportJobs:
+    """Exports construits en arrière-plan et conservés dans le stockage"""
+
+    def _key(self, job_id) -> str:
+        return f"export_job:{job_id}"
+
+    def create(self, user, filename: str, job_id: str = None) -> Dict[str, Any]:
+        job = {
+            'job_id': job_id or str(uuid.uuid4()),
+            'user_id': str(user.pk),
+            'filename': filename,
+            'status': 'pending',
+            'path': None,
+            'error': None,
+            'created_at': timezone.now().isoformat(),
+        }
+        cache.set(self._key(job['job_id']), job, EXPORT_JOB_TTL)
+        return job
+
+    def _lock_key(self, user_id) -> str:
+        return f"export_job_lock:{user_id}"
+
+    def claim(self, user, filename: str) -> Tuple[Dict[str, Any], bool]:
+        """
+        Créer l'export en arrière-plan de l'utilisateur, ou retrouver celui
+        qui est déjà en cours ; renvoie (tâche, créée)
+        """
+        lock_key = self._lock_key(user.pk)
+        for _ in range(2):
+            job_id = str(uuid.uuid4())
+            if cache.add(lock_key, job_id, EXPORT_JOB_LOCK_TIMEOUT):
+                return self.create(user, filename, job_id=job_id), True
+            current = self.get(cache.get(lock_key))
+            if current is not None and current['status'] in ('pending', 'running'):
+                return current, False
+            # Verrou d'une tâche terminée ou expirée
+            cache.delete(lock_key)
+        return current, False
+
+    def release(self, job: Dict[str, Any]):
+        """Libérer le verrou de l'utilisateur s'il appartient encore à cette tâche"""
+        lock_key = self._lock_key(job['user_id'])
+        if cache.get(lock_key) == job['job_id']:
+            cache.delete(lock_key)
+
+    def get(self, job_id) -> Optional[Dict[str, Any]]:
+        return cache.get(self._key(job_id))
+
+    def update(self, job: Dict[str, Any], **changes) -> Dict[str, Any]:
+        job = {**job, **changes}
+        cache.set(self._key(job['job_id']), job, EXPORT_JOB_TTL)
+        return job
+
+    def build(self, job: Dict[str, Any], chunks: Iterable[bytes]) -> Dict[str, Any]:
+        """Écrire l'export dans un fichier temporaire puis dans le stockage"""
+        job = self.update(job, status='running')
+        try:
+            with tempfile.TemporaryFile() as output:
+                for chunk in chunks:
+                    output.write(chunk)
+                output.seek(0)
+                path = default_storage.save(
+                    f"{EXPORT_STORAGE_PREFIX}/{job['user_id']}/{job['job_id']}.zip", File(output)
+                )
+        except Exception as e:
+            logger.error(f"Erreur lors de la construction de l'export {job['job_id']}: {str(e)}")
+            return self.update(job, status='failed', error=str(e))
+        return self.update(job, status='ready', path=path, finished_at=timezone.now().isoformat())
+
+    def purge(self, older_than_seconds: int = EXPORT_JOB_TTL) -> int:
+        """Supprimer les fichiers d'export plus anciens que la durée de vie des tâches"""
+        cutoff = timezone.now() - timezone.timedelta(seconds=older_than_seconds)
+        removed = 0
+        try:
+            user_dirs, _ = default_storage.listdir(EXPORT_STORAGE_PREFIX)
+        except (FileNotFoundError, NotImplementedError):
+            return 0
+        for user_dir in user_dirs:
+            _, files = default_storage.listdir(f"{EXPORT_STORAGE_PREFIX}/{user_dir}")
+            for name in files:
+                path = f"{EXPORT_STORAGE_PREFIX}/{user_dir}/{name}"
+                if default_storage.get_modified_time(path) < cutoff:
+                    default_storage.delete(path)
+                    removed += 1
+        return removed
+
+
+export_jobs = ExportJobs()
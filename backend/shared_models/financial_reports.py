@@ -114,49 +114,40 @@ class FinancialReport:
     """Générateur de rapports financiers"""
     
     def __init__(self, start_date: datetime = None, end_date: datetime = None):
+        # Import différé : les modèles de ce module sont chargés par models.py
+        from .rollups import RollupQuery
+        
         self.end_date = end_date or timezone.now()
         self.start_date = start_date or (self.end_date - timedelta(days=30))
+        # Comptages et sommes lus dans les agrégats horaires/journaliers
+        self.rollups = RollupQuery(self.start_date, self.end_date)
     
     def get_revenue_overview(self) -> Dict[str, Any]:
         """Vue d'ensemble des revenus"""
-        transactions = PaymentTransaction.objects.filter(
-            created_at__gte=self.start_date,
-            created_at__lte=self.end_date,
-            status='completed'
-        )
-        
-        total_revenue = transactions.aggregate(
-            total=Sum('net_amount')
-        )['total'] or Decimal('0.00')
-        
-        total_fees = transactions.aggregate(
-            total=Sum('fees')
-        )['total'] or Decimal('0.00')
-        
-        transaction_count = transactions.count()
+        completed = self.rollups.total('payments', status='completed')
+        total_revenue = completed['amount'] or Decimal('0.00')
+        total_fees = completed['fees'] or Decimal('0.00')
+        transaction_count = completed['count']
         
         # Revenus par provider
+        provider_names = dict(PaymentTransaction.PAYMENT_PROVIDERS)
         revenue_by_provider = {}
-        for provider, name in PaymentTransaction.PAYMENT_PROVIDERS:
-            provider_revenue = transactions.filter(
-                payment_provider=provider
-            ).aggregate(total=Sum('net_amount'))['total'] or Decimal('0.00')
-            
-            if provider_revenue > 0:
-                revenue_by_provider[name] = float(provider_revenue)
+        for row in self.rollups.totals('payments', ['provider'], status='completed'):
+            if row['amount'] and row['amount'] > 0:
+                name = provider_names.get(row['provider'], row['provider'])
+                revenue_by_provider[name] = float(row['amount'])
         
         # Revenus par pays
         revenue_by_country = {}
-        for country_code in ['SN', 'CI', 'ML', 'BF', 'NG', 'GH']:
-            country_revenue = transactions.filter(
-                country_code=country_code
-            ).aggregate(total=Sum('net_amount'))['total'] or Decimal('0.00')
-            
-            if country_revenue > 0:
-                revenue_by_country[country_code] = float(country_revenue)
+        for row in self.rollups.totals(
+            'payments', ['country'], status='completed',
+            country__in=['SN', 'CI', 'ML', 'BF', 'NG', 'GH']
+        ):
+            if row['amount'] and row['amount'] > 0:
+                revenue_by_country[row['country']] = float(row['amount'])
         
         # Tendance quotidienne
-        daily_revenue = self._get_daily_revenue_trend(transactions)
+        daily_revenue = self._get_daily_revenue_trend()
         
         return {
             'total_revenue': float(total_revenue),
@@ -178,85 +169,76 @@ class FinancialReport:
         """Performance des providers de paiement"""
         performance = {}
         
+        # Une lecture des agrégats : (provider, statut) -> mesures
+        cells = {
+            (row['provider'], row['status']): row
+            for row in self.rollups.totals('payments', ['provider', 'status'])
+        }
+        all_count = sum(row['count'] for row in cells.values())
+        
         for provider, provider_name in PaymentTransaction.PAYMENT_PROVIDERS:
-            provider_transactions = PaymentTransaction.objects.filter(
-                payment_provider=provider,
-                created_at__gte=self.start_date,
-                created_at__lte=self.end_date
-            )
+            rows = [row for (cell_provider, _), row in cells.items() if cell_provider == provider]
+            if not rows:
+                continue
+            
+            total_count = sum(row['count'] for row in rows)
+            completed = cells.get((provider, 'completed'), {})
+            completed_count = completed.get('count', 0)
+            failed_count = cells.get((provider, 'failed'), {}).get('count', 0)
+            
+            success_rate = (completed_count / total_count * 100) if total_count > 0 else 0
+            
+            revenue = completed.get('amount') or Decimal('0.00')
             
-            if provider_transactions.exists():
-                total_count = provider_transactions.count()
-                completed_count = provider_transactions.filter(status='completed').count()
-                failed_count = provider_transactions.filter(status='failed').count()
-                
-                success_rate = (completed_count / total_count * 100) if total_count > 0 else 0
-                
-                revenue = provider_transactions.filter(
-                    status='completed'
-                ).aggregate(total=Sum('net_amount'))['total'] or Decimal('0.00')
-                
-                avg_processing_time = self._calculate_avg_processing_time(provider_transactions)
-                
-                performance[provider_name] = {
-                    'total_transactions': total_count,
-                    'successful_transactions': completed_count,
-                    'failed_transactions': failed_count,
-                    'success_rate': round(success_rate, 2),
-                    'total_revenue': float(revenue),
-                    'avg_processing_time_minutes': avg_processing_time,
-                    'market_share': round((total_count / PaymentTransaction.objects.filter(
-                        created_at__gte=self.start_date,
-                        created_at__lte=self.end_date
-                    ).count() * 100), 2) if PaymentTransaction.objects.filter(
-                        created_at__gte=self.start_date,
-                        created_at__lte=self.end_date
-                    ).count() > 0 else 0
-                }
+            performance[provider_name] = {
+                'total_transactions': total_count,
+                'successful_transactions': completed_count,
+                'failed_transactions': failed_count,
+                'success_rate': round(success_rate, 2),
+                'total_revenue': float(revenue),
+                'avg_processing_time_minutes': self._calculate_avg_processing_time(completed),
+                'market_share': round((total_count / all_count * 100), 2) if all_count > 0 else 0
+            }
         
         return performance
     
     def get_african_payment_insights(self) -> Dict[str, Any]:
         """Insights spécifiques aux paiements mobiles africains"""
+        from .rollups import latest_snapshot
+        
+        african_providers = ['orange_money', 'mtn_momo', 'wave']
         african_transactions = PaymentTransaction.objects.filter(
             created_at__gte=self.start_date,
             created_at__lte=self.end_date,
-            payment_provider__in=['orange_money', 'mtn_momo', 'wave']
+            payment_provider__in=african_providers
         )
         
-        total_african = african_transactions.count()
-        total_all = PaymentTransaction.objects.filter(
-            created_at__gte=self.start_date,
-            created_at__lte=self.end_date
-        ).count()
+        total_african = self.rollups.total('payments', provider__in=african_providers)['count']
+        total_all = self.rollups.total('payments')['count']
         
         african_adoption_rate = (total_african / total_all * 100) if total_all > 0 else 0
         
         # Analyse par heure pour optimiser les campagnes
-        hourly_distribution = {}
-        for hour in range(24):
-            hour_count = african_transactions.filter(
-                created_at__hour=hour
-            ).count()
-            hourly_distribution[hour] = hour_count
+        hourly_distribution = self.rollups.hour_of_day('payments', provider__in=african_providers)
         
         # Taux de conversion par pays
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
+        users_by_country = latest_snapshot('user_base', ['country'])
+        transactions_by_country = {
+            row['country']: row['count']
+            for row in self.rollups.totals('payments', ['country'], provider__in=african_providers)
+        }
         
         conversion_by_country = {}
         for country_code in ['SN', 'CI', 'ML', 'BF', 'NG', 'GH']:
-            country_users = User.objects.filter(country=country_code).count()
-            country_transactions = african_transactions.filter(
-                country_code=country_code
-            ).count()
+            country_users = users_by_country.get(country_code, 0)
+            country_transactions = transactions_by_country.get(country_code, 0)
             
             if country_users > 0:
                 conversion_rate = (country_transactions / country_users * 100)
                 conversion_by_country[country_code] = round(conversion_rate, 2)
         
         # Analyse des échecs
-        failure_analysis = self._analyze_payment_failures(african_transactions)
+        failure_analysis = self._analyze_payment_failures(african_transactions, african_providers)
         
         return {
             'african_adoption_rate': round(african_adoption_rate, 2),
@@ -265,7 +247,7 @@ class FinancialReport:
             'peak_hours': self._get_peak_hours(hourly_distribution),
             'conversion_by_country': conversion_by_country,
             'failure_analysis': failure_analysis,
-            'recommended_actions': self._get_recommendations(african_transactions)
+            'recommended_actions': self._get_recommendations(african_providers)
         }
     
     def get_subscription_analytics(self) -> Dict[str, Any]:
@@ -278,9 +260,9 @@ class FinancialReport:
         )
         
         # MRR (Monthly Recurring Revenue)
-        monthly_revenue = subscription_transactions.aggregate(
-            total=Sum('net_amount')
-        )['total'] or Decimal('0.00')
+        monthly_revenue = self.rollups.total(
+            'payments', segment='subscription', status='completed'
+        )['amount'] or Decimal('0.00')
         
         # Convertir en MRR si la période n'est pas d'un mois
         period_days = (self.end_date - self.start_date).days
@@ -312,67 +294,45 @@ class FinancialReport:
             'ltv_estimate': round(arpu / (churn_rate / 100), 2) if churn_rate > 0 else 0
         }
     
-    def _get_daily_revenue_trend(self, transactions) -> List[Dict[str, Any]]:
+    def _get_daily_revenue_trend(self) -> List[Dict[str, Any]]:
         """Tendance quotidienne des revenus"""
-        from django.db.models import TruncDate
-        
-        daily_data = transactions.filter(
-            status='completed'
-        ).annotate(
-            date=TruncDate('created_at')
-        ).values('date').annotate(
-            revenue=Sum('net_amount'),
-            count=Count('id')
-        ).order_by('date')
-        
         return [
             {
-                'date': item['date'].isoformat(),
-                'revenue': float(item['revenue']),
+                'date': timezone.localtime(item['period']).date().isoformat(),
+                'revenue': float(item['amount']),
                 'transactions': item['count']
             }
-            for item in daily_data
+            for item in self.rollups.series('payments', period='day', status='completed')
         ]
     
-    def _calculate_avg_processing_time(self, transactions) -> float:
-        """Calcule le temps moyen de traitement"""
-        completed_transactions = transactions.filter(
-            status='completed',
-            completed_at__isnull=False
-        )
-        
-        total_time = timedelta()
-        count = 0
-        
-        for transaction in completed_transactions:
-            processing_time = transaction.completed_at - transaction.created_at
-            total_time += processing_time
-            count += 1
-        
+    def _calculate_avg_processing_time(self, completed: Dict[str, Any]) -> float:
+        """Calcule le temps moyen de traitement à partir des mesures des transactions terminées"""
+        count = completed.get('count', 0)
         if count == 0:
             return 0
         
-        avg_time = total_time / count
-        return avg_time.total_seconds() / 60  # en minutes
+        return completed.get('duration_seconds', 0) / count / 60  # en minutes
     
-    def _analyze_payment_failures(self, transactions) -> Dict[str, Any]:
+    def _analyze_payment_failures(self, transactions, providers: List[str]) -> Dict[str, Any]:
         """Analyse les échecs de paiement"""
-        failed_transactions = transactions.filter(status='failed')
-        
+        # Les motifs d'échec ne sont que dans les métadonnées : lecture des seuls échecs
         failure_reasons = {}
-        for transaction in failed_transactions:
-            reason = transaction.metadata.get('failure_reason', 'Unknown')
+        for metadata in transactions.filter(status='failed').values_list('metadata', flat=True).iterator():
+            reason = (metadata or {}).get('failure_reason', 'Unknown')
             failure_reasons[reason] = failure_reasons.get(reason, 0) + 1
         
+        failures_by_provider = {
+            row['provider']: row['count']
+            for row in self.rollups.totals('payments', ['provider'], status='failed', provider__in=providers)
+        }
+        total_failures = sum(failures_by_provider.values())
+        total = self.rollups.total('payments', provider__in=providers)['count']
+        
         return {
-            'total_failures': failed_transactions.count(),
-            'failure_rate': round((failed_transactions.count() / transactions.count() * 100), 2) if transactions.count() > 0 else 0,
+            'total_failures': total_failures,
+            'failure_rate': round((total_failures / total * 100), 2) if total > 0 else 0,
             'common_reasons': failure_reasons,
-            'failures_by_provider': dict(
-                failed_transactions.values('payment_provider').annotate(
-                    count=Count('id')
-                ).values_list('payment_provider', 'count')
-            )
+            'failures_by_provider': failures_by_provider
         }
     
     def _get_peak_hours(self, hourly_distribution: Dict[int, int]) -> List[int]:
@@ -380,18 +340,25 @@ class FinancialReport:
         sorted_hours = sorted(hourly_distribution.items(), key=lambda x: x[1], reverse=True)
         return [hour for hour, count in sorted_hours[:3]]
     
-    def _get_recommendations(self, transactions) -> List[str]:
+    def _get_recommendations(self, providers: List[str]) -> List[str]:
         """Recommandations basées sur l'analyse"""
         recommendations = []
         
+        counts = {
+            (row['provider'], row['status']): row['count']
+            for row in self.rollups.totals('payments', ['provider', 'status'], provider__in=providers)
+        }
+        total = sum(counts.values())
+        
         # Analyse du taux de succès
-        success_rate = transactions.filter(status='completed').count() / transactions.count() * 100
+        completed = sum(count for (_, status), count in counts.items() if status == 'completed')
+        success_rate = completed / total * 100 if total > 0 else 100
         if success_rate < 90:
             recommendations.append("Améliorer la stabilité des paiements mobiles")
         
         # Analyse de l'adoption
-        orange_money_count = transactions.filter(payment_provider='orange_money').count()
-        wave_count = transactions.filter(payment_provider='wave').count()
+        orange_money_count = sum(count for (provider, _), count in counts.items() if provider == 'orange_money')
+        wave_count = sum(count for (provider, _), count in counts.items() if provider == 'wave')
         
         if wave_count > orange_money_count:
             recommendations.append("Promouvoir davantage Wave qui performe bien")
@@ -0,0 +1,70 @@
+"""
+Commande de gestion pour (re)construire l'historique des agrégats analytiques.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from shared_models.rollups import ROLLUP_SOURCES, rollup_engine
+
+
+def parse_moment(value: str):
+    """Date (`2024-01-31`) ou date et heure ISO, dans le fuseau courant"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Date invalide: {value}")
+        moment = timezone.datetime.combine(day, timezone.datetime.min.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    """
+    Commande pour agréger l'historique des tables sources.
+    
+    Usage:
+        python manage.py backfill_rollups
+        python manage.py backfill_rollups --source payments --since 2024-01-01
+    """
+    
+    help = 'Agrège l\'historique des tables sources dans les agrégats du dashboard'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            type=str,
+            choices=sorted(ROLLUP_SOURCES),
+            help='Source spécifique à agréger'
+        )
+        
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Début de la période (par défaut : premier enregistrement de la source)'
+        )
+        
+        parser.add_argument(
+            '--until',
+            type=str,
+            help='Fin de la période (par défaut : maintenant)'
+        )
+    
+    def handle(self, *args, **options):
+        until = parse_moment(options['until']) if options['until'] else timezone.now()
+        names = [options['source']] if options['source'] else sorted(ROLLUP_SOURCES)
+        
+        for name in names:
+            source = ROLLUP_SOURCES[name]
+            since = parse_moment(options['since']) if options['since'] else source.earliest()
+            if since is None:
+                self.stdout.write(f"{name}: aucune donnée")
+                continue
+            
+            stats = rollup_engine.rebuild(source, since, until)
+            self.stdout.write(
+                self.style.SUCCESS(f"{name}: {stats['windows']} fenêtres, {stats['rows']} lignes horaires")
+            )
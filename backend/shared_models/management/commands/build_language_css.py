@@ -0,0 +1,43 @@
+"""
+Commande de gestion pour écrire le CSS par langue en fichiers statiques à empreinte.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from coko.african_languages import language_manager
+
+
+class Command(BaseCommand):
+    """
+    Commande pour écrire le CSS de chaque langue sous
+    `css/languages/<langue>.<empreinte>.css`. Le nom change avec le contenu :
+    le serveur web peut servir ces fichiers avec un cache d'un an
+    (`immutable`), et `css_url` de la configuration de langue y pointe.
+    
+    Usage:
+        python manage.py collectstatic --noinput
+        python manage.py build_language_css
+        python manage.py precompress_static
+    """
+    
+    help = 'Écrit le CSS par langue en fichiers statiques à empreinte'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--root',
+            type=str,
+            help='Répertoire de destination (par défaut : STATIC_ROOT)'
+        )
+    
+    def handle(self, *args, **options):
+        root = options['root'] or settings.STATIC_ROOT
+        if not root:
+            raise CommandError("STATIC_ROOT n'est pas configuré")
+        
+        written = language_manager.write_language_css(str(root))
+        for path in written:
+            self.stdout.write(f"  {path}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(written)} fichiers CSS écrits, {len(language_manager.language_css) - len(written)} déjà à jour"
+        ))
@@ -0,0 +1,63 @@
+"""
+Commande de gestion pour construire la base locale de géolocalisation IP.
+"""
+
+import gzip
+
+from django.core.management.base import BaseCommand, CommandError
+
+from coko.geoip import (
+    CSV_LAYOUTS, GEOIP_DATABASE_PATH, build_database, read_csv_ranges, read_mmdb_ranges
+)
+
+
+class Command(BaseCommand):
+    """
+    Commande pour importer un export de plages IP (CSV ou MMDB).
+    
+    Le fichier produit remplace atomiquement la base courante ; les workers
+    le rechargent sans redémarrage.
+    
+    Usage:
+        python manage.py import_geoip dbip-city-lite.csv.gz
+        python manage.py import_geoip IP2LOCATION-LITE-DB5.CSV --layout ip2location
+        python manage.py import_geoip GeoLite2-City.mmdb
+    """
+    
+    help = 'Construit la base locale de géolocalisation IP à partir d\'un export CSV ou MMDB'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('source', type=str, help='Fichier CSV (éventuellement .gz) ou MMDB')
+        
+        parser.add_argument(
+            '--layout',
+            type=str,
+            choices=sorted(CSV_LAYOUTS),
+            default='dbip',
+            help='Disposition des colonnes du CSV'
+        )
+        
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=GEOIP_DATABASE_PATH,
+            help='Fichier de base à produire'
+        )
+    
+    def handle(self, *args, **options):
+        source = options['source']
+        
+        try:
+            if source.endswith('.mmdb'):
+                stats = build_database(read_mmdb_ranges(source), options['output'])
+            else:
+                opener = gzip.open if source.endswith('.gz') else open
+                with opener(source, 'rt', encoding='utf-8', newline='') as lines:
+                    stats = build_database(read_csv_ranges(lines, options['layout']), options['output'])
+        except (OSError, RuntimeError) as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['ipv4']} plages IPv4, {stats['ipv6']} plages IPv6, "
+            f"{stats['locations']} lieux ({stats['overlapping']} plages ignorées) -> {options['output']}"
+        ))
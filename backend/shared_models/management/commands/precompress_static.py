@@ -0,0 +1,47 @@
+"""
+Commande de gestion pour précompresser les fichiers statiques collectés.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from coko.compression import precompress_directory
+
+
+class Command(BaseCommand):
+    """
+    Commande pour écrire les variantes `.br` et `.gz` (niveau maximal) des
+    fichiers statiques, servies directement par le serveur web (nginx
+    `gzip_static`/`brotli_static`) sans compression à chaque requête.
+    
+    Usage:
+        python manage.py collectstatic --noinput
+        python manage.py precompress_static
+        python manage.py precompress_static --force
+    """
+    
+    help = 'Précompresse les fichiers statiques (Brotli et gzip)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--root',
+            type=str,
+            help='Répertoire à traiter (par défaut : STATIC_ROOT)'
+        )
+        
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompresser même les variantes à jour'
+        )
+    
+    def handle(self, *args, **options):
+        root = options['root'] or settings.STATIC_ROOT
+        if not root:
+            raise CommandError("STATIC_ROOT n'est pas configuré")
+        
+        stats = precompress_directory(str(root), force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats.get('written', 0)} variantes écrites, {stats.get('up_to_date', 0)} à jour, "
+            f"{stats.get('bytes_saved', 0)} octets économisés ({stats.get('cpu_seconds', 0)} s CPU)"
+        ))
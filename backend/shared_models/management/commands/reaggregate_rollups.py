@@ -0,0 +1,60 @@
+"""
+Commande de gestion pour recalculer les agrégats analytiques d'une période passée.
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shared_models.rollups import ROLLUP_SOURCES, SNAPSHOT_SOURCES, rollup_engine
+from .backfill_rollups import parse_moment
+
+
+class Command(BaseCommand):
+    """
+    Commande pour recalculer les agrégats après une correction des données
+    sources (remboursements, imports tardifs…), au-delà de la fenêtre
+    recalculée à chaque passage de la tâche planifiée.
+    
+    Usage:
+        python manage.py reaggregate_rollups --since 2024-03-01
+        python manage.py reaggregate_rollups --since 2024-03-01 --until 2024-03-08 --source payments
+    """
+    
+    help = 'Recalcule les agrégats du dashboard sur une période passée'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=str,
+            required=True,
+            help='Début de la période à recalculer'
+        )
+        
+        parser.add_argument(
+            '--until',
+            type=str,
+            help='Fin de la période (par défaut : maintenant)'
+        )
+        
+        parser.add_argument(
+            '--source',
+            type=str,
+            choices=sorted(ROLLUP_SOURCES),
+            help='Source spécifique à recalculer'
+        )
+    
+    def handle(self, *args, **options):
+        since = parse_moment(options['since'])
+        until = parse_moment(options['until']) if options['until'] else timezone.now()
+        names = [options['source']] if options['source'] else sorted(ROLLUP_SOURCES)
+        
+        for name in names:
+            stats = rollup_engine.rebuild(ROLLUP_SOURCES[name], since, until)
+            self.stdout.write(
+                self.style.SUCCESS(f"{name}: {stats['windows']} fenêtres, {stats['rows']} lignes horaires")
+            )
+        
+        if not options['source']:
+            for name, source in SNAPSHOT_SOURCES.items():
+                stats = rollup_engine.capture(source)
+                self.stdout.write(self.style.SUCCESS(f"{name}: instantané du {stats['day']}"))
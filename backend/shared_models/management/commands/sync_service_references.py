@@ -7,8 +7,9 @@ from django.utils import timezone
 from typing import List, Optional
 import uuid
 
-from shared_models.services import reference_manager, service_communication
+from shared_models.services import service_communication
 from shared_models.api_client import service_clients
+from shared_models.sync_engine import SERVICE_SYNC_BATCH_SIZE, upsert_references
 
 
 class Command(BaseCommand):
@@ -49,6 +50,13 @@ class Command(BaseCommand):
             default=1000,
             help='Limite le nombre d\'objets à synchroniser'
         )
+        
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Nombre de workers parallèles pour les synchronisations en attente'
+        )
     
     def handle(self, *args, **options):
         """
@@ -56,6 +64,7 @@ class Command(BaseCommand):
         """
         self.dry_run = options['dry_run']
         self.limit = options['limit']
+        self.workers = options['workers']
         
         start_time = timezone.now()
         
@@ -133,19 +142,18 @@ class Command(BaseCommand):
             response = catalog_client.get('books/', params={'limit': self.limit})
             books = response.get('results', [])
             
-            count = 0
+            rows = []
             for book_data in books:
                 if self.dry_run:
                     self.stdout.write(f'  [DRY-RUN] Sync book: {book_data.get("title", "N/A")}')
-                else:
-                    reference_manager.create_book_reference({
-                        'uuid': book_data['id'],
-                        'title': book_data.get('title', ''),
-                        'slug': book_data.get('slug', ''),
-                        'isbn': book_data.get('isbn', ''),
-                        'is_active': book_data.get('is_active', True),
-                    })
-                count += 1
+                rows.append({
+                    'uuid': book_data['id'],
+                    'title': book_data.get('title', ''),
+                    'slug': book_data.get('slug', ''),
+                    'isbn': book_data.get('isbn', ''),
+                    'is_active': book_data.get('is_active', True),
+                })
+            count = self.apply_rows('Book', rows)
             
             self.stdout.write(
                 self.style.SUCCESS(f'  {count} livres synchronisés')
@@ -167,18 +175,17 @@ class Command(BaseCommand):
             response = catalog_client.get('authors/', params={'limit': self.limit})
             authors = response.get('results', [])
             
-            count = 0
+            rows = []
             for author_data in authors:
                 if self.dry_run:
                     self.stdout.write(f'  [DRY-RUN] Sync author: {author_data.get("name", "N/A")}')
-                else:
-                    reference_manager.create_author_reference({
-                        'uuid': author_data['id'],
-                        'name': author_data.get('name', ''),
-                        'slug': author_data.get('slug', ''),
-                        'is_active': author_data.get('is_active', True),
-                    })
-                count += 1
+                rows.append({
+                    'uuid': author_data['id'],
+                    'name': author_data.get('name', ''),
+                    'slug': author_data.get('slug', ''),
+                    'is_active': author_data.get('is_active', True),
+                })
+            count = self.apply_rows('Author', rows)
             
             self.stdout.write(
                 self.style.SUCCESS(f'  {count} auteurs synchronisés')
@@ -200,19 +207,18 @@ class Command(BaseCommand):
             response = catalog_client.get('categories/', params={'limit': self.limit})
             categories = response.get('results', [])
             
-            count = 0
+            rows = []
             for category_data in categories:
                 if self.dry_run:
                     self.stdout.write(f'  [DRY-RUN] Sync category: {category_data.get("name", "N/A")}')
-                else:
-                    reference_manager.create_category_reference({
-                        'uuid': category_data['id'],
-                        'name': category_data.get('name', ''),
-                        'slug': category_data.get('slug', ''),
-                        'parent_uuid': category_data.get('parent_id'),
-                        'is_active': category_data.get('is_active', True),
-                    })
-                count += 1
+                rows.append({
+                    'uuid': category_data['id'],
+                    'name': category_data.get('name', ''),
+                    'slug': category_data.get('slug', ''),
+                    'parent_uuid': category_data.get('parent_id'),
+                    'is_active': category_data.get('is_active', True),
+                })
+            count = self.apply_rows('Category', rows)
             
             self.stdout.write(
                 self.style.SUCCESS(f'  {count} catégories synchronisées')
@@ -223,6 +229,19 @@ class Command(BaseCommand):
                 self.style.ERROR(f'  Erreur lors de la synchronisation des catégories: {e}')
             )
     
+    def apply_rows(self, object_type: str, rows: List[dict]) -> int:
+        """
+        Applique des références par upserts groupés (même moteur que les
+        synchronisations en attente).
+        """
+        if self.dry_run:
+            return len(rows)
+        
+        count = 0
+        for start in range(0, len(rows), SERVICE_SYNC_BATCH_SIZE):
+            count += upsert_references(object_type, rows[start:start + SERVICE_SYNC_BATCH_SIZE])
+        return count
+    
     def sync_auth_service(self):
         """
         Synchronise les données du service auth.
@@ -241,18 +260,17 @@ class Command(BaseCommand):
             response = auth_client.get('users/', params={'limit': self.limit})
             users = response.get('results', [])
             
-            count = 0
+            rows = []
             for user_data in users:
                 if self.dry_run:
                     self.stdout.write(f'  [DRY-RUN] Sync user: {user_data.get("username", "N/A")}')
-                else:
-                    reference_manager.create_user_reference({
-                        'uuid': user_data['id'],
-                        'username': user_data.get('username', ''),
-                        'display_name': user_data.get('display_name', ''),
-                        'is_active': user_data.get('is_active', True),
-                    })
-                count += 1
+                rows.append({
+                    'uuid': user_data['id'],
+                    'username': user_data.get('username', ''),
+                    'display_name': user_data.get('display_name', ''),
+                    'is_active': user_data.get('is_active', True),
+                })
+            count = self.apply_rows('User', rows)
             
             self.stdout.write(
                 self.style.SUCCESS(f'  {count} utilisateurs synchronisés')
@@ -283,9 +301,15 @@ class Command(BaseCommand):
                     f'    [DRY-RUN] Process event: {event.event_type} from {event.source_service}'
                 )
         else:
-            # Traiter les événements réels
-            service_communication.process_pending_syncs(limit=self.limit)
+            # Traiter les synchronisations réelles
+            stats = service_communication.process_pending_syncs(
+                limit=self.limit, workers=self.workers
+            )
             
             self.stdout.write(
-                self.style.SUCCESS('Événements en attente traités')
+                self.style.SUCCESS(
+                    f"Synchronisations traitées: {stats['completed']} terminées, "
+                    f"{stats['failed']} échouées ({stats['throughput_per_second']}/s, "
+                    f"retard max {stats['max_lag_seconds']}s, arriéré {stats['backlog']})"
+                )
             )
\ No newline at end of file
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-16 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("shared_models", "0003_alter_paymenttransaction_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crossserviceevent",
+            name="aggregate_key",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Clé d'agrégat : les événements d'une même clé sont livrés dans l'ordre",
+                max_length=100,
+            ),
+        ),
+        migrations.AddField(
+            model_name="crossserviceevent",
+            name="user_id",
+            field=models.UUIDField(
+                blank=True, help_text="Utilisateur concerné par l'événement", null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="crossserviceevent",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "En attente"),
+                    ("processing", "En traitement"),
+                    ("processed", "Traité"),
+                    ("failed", "Échoué"),
+                    ("dead_letter", "Abandonné (lettre morte)"),
+                    ("ignored", "Ignoré"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="crossserviceevent",
+            index=models.Index(
+                fields=["status", "created_at"], name="shared_cros_status_f09cab_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="crossserviceevent",
+            index=models.Index(
+                fields=["aggregate_key", "created_at"],
+                name="shared_cros_aggrega_69e1b7_idx",
+            ),
+        ),
+    ]
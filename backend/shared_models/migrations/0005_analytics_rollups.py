@@ -0,0 +1,113 @@
+# Generated by Django 4.2.7 on 2026-10-16 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("shared_models", "0004_cross_service_event_outbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                (
+                    "source",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("position", models.DateTimeField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Filigrane d'agrégation",
+                "verbose_name_plural": "Filigranes d'agrégation",
+                "db_table": "shared_rollup_watermarks",
+            },
+        ),
+        migrations.CreateModel(
+            name="AnalyticsRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "granularity",
+                    models.CharField(
+                        choices=[("hour", "Heure"), ("day", "Jour")], max_length=4
+                    ),
+                ),
+                (
+                    "bucket_start",
+                    models.DateTimeField(help_text="Début de la tranche agrégée"),
+                ),
+                (
+                    "metric",
+                    models.CharField(
+                        help_text="Source agrégée (signups, payments, etc.)",
+                        max_length=50,
+                    ),
+                ),
+                ("country", models.CharField(blank=True, default="", max_length=10)),
+                (
+                    "subscription_type",
+                    models.CharField(blank=True, default="", max_length=20),
+                ),
+                ("provider", models.CharField(blank=True, default="", max_length=20)),
+                ("status", models.CharField(blank=True, default="", max_length=20)),
+                (
+                    "segment",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="Dimension propre à la métrique (type de transaction, langue…)",
+                        max_length=30,
+                    ),
+                ),
+                ("count", models.BigIntegerField(default=0)),
+                (
+                    "amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+                (
+                    "fees",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+                ("duration_seconds", models.FloatField(default=0.0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Agrégat analytique",
+                "verbose_name_plural": "Agrégats analytiques",
+                "db_table": "shared_analytics_rollups",
+                "indexes": [
+                    models.Index(
+                        fields=["metric", "granularity", "bucket_start"],
+                        name="shared_anal_metric_1c15ad_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="analyticsrollup",
+            constraint=models.UniqueConstraint(
+                fields=(
+                    "metric",
+                    "granularity",
+                    "bucket_start",
+                    "country",
+                    "subscription_type",
+                    "provider",
+                    "status",
+                    "segment",
+                ),
+                name="unique_analytics_rollup_cell",
+            ),
+        ),
+    ]
@@ -352,6 +352,7 @@ class CrossServiceEvent(models.Model):
         ('processing', 'En traitement'),
         ('processed', 'Traité'),
         ('failed', 'Échoué'),
+        ('dead_letter', 'Abandonné (lettre morte)'),
         ('ignored', 'Ignoré'),
     ]
     
@@ -395,6 +396,17 @@ class CrossServiceEvent(models.Model):
         blank=True,
         help_text="ID de corrélation pour tracer les événements liés"
     )
+    aggregate_key = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="Clé d'agrégat : les événements d'une même clé sont livrés dans l'ordre"
+    )
+    user_id = models.UUIDField(
+        null=True,
+        blank=True,
+        help_text="Utilisateur concerné par l'événement"
+    )
     
     # Statut
     status = models.CharField(
@@ -430,6 +442,8 @@ class CrossServiceEvent(models.Model):
             models.Index(fields=['created_at']),
             models.Index(fields=['next_retry_at']),
             models.Index(fields=['correlation_id']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['aggregate_key', 'created_at']),
         ]
         ordering = ['-created_at']
     
@@ -442,4 +456,78 @@ class CrossServiceEvent(models.Model):
         return (
             self.status == 'failed' and 
             self.retry_count < self.max_retries
-        )
\ No newline at end of file
+        )
+
+class AnalyticsRollup(models.Model):
+    """
+    Table de faits pré-agrégée pour les tableaux de bord.
+    Une ligne par métrique, tranche (heure ou jour) et combinaison de dimensions.
+    """
+    
+    GRANULARITY_CHOICES = [
+        ('hour', 'Heure'),
+        ('day', 'Jour'),
+    ]
+    
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField(help_text="Début de la tranche agrégée")
+    metric = models.CharField(
+        max_length=50,
+        help_text="Source agrégée (signups, payments, etc.)"
+    )
+    
+    # Dimensions (vides lorsqu'elles ne s'appliquent pas à la métrique)
+    country = models.CharField(max_length=10, blank=True, default='')
+    subscription_type = models.CharField(max_length=20, blank=True, default='')
+    provider = models.CharField(max_length=20, blank=True, default='')
+    status = models.CharField(max_length=20, blank=True, default='')
+    segment = models.CharField(
+        max_length=30,
+        blank=True,
+        default='',
+        help_text="Dimension propre à la métrique (type de transaction, langue…)"
+    )
+    
+    # Mesures additives
+    count = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    fees = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    duration_seconds = models.FloatField(default=0.0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'shared_analytics_rollups'
+        verbose_name = 'Agrégat analytique'
+        verbose_name_plural = 'Agrégats analytiques'
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'metric', 'granularity', 'bucket_start', 'country',
+                    'subscription_type', 'provider', 'status', 'segment'
+                ],
+                name='unique_analytics_rollup_cell'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['metric', 'granularity', 'bucket_start']),
+        ]
+    
+    def __str__(self):
+        return f"Rollup: {self.metric} {self.granularity} {self.bucket_start:%Y-%m-%d %H:%M}"
+
+
+class RollupWatermark(models.Model):
+    """Position jusqu'à laquelle une source a été agrégée"""
+    
+    source = models.CharField(max_length=50, primary_key=True)
+    position = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'shared_rollup_watermarks'
+        verbose_name = 'Filigrane d\'agrégation'
+        verbose_name_plural = 'Filigranes d\'agrégation'
+    
+    def __str__(self):
+        return f"{self.source} @ {self.position.isoformat()}"
@@ -0,0 +1,384 @@
+"""
+Agrégats analytiques (rollups) pour le dashboard et les rapports financiers
+
+Les tables sources (`User`, `Book`, `ReadingSession`, `PaymentTransaction`)
+ne sont plus parcourues à chaque affichage : une tâche planifiée les agrège
+par heure dans `AnalyticsRollup` (date × pays × type d'abonnement ×
+provider × statut × segment), puis reconstruit les lignes journalières des
+jours touchés à partir des lignes horaires.
+
+Le traitement est incrémental : chaque source avance depuis son filigrane
+(`RollupWatermark`). Les dernières heures (`ROLLUP_RESTATE_HOURS`) sont
+recalculées à chaque passage pour absorber les changements tardifs
+(paiement confirmé après sa création, session terminée…) ; l'heure en cours
+est agrégée telle quelle puis remplacée au passage suivant. Les corrections
+plus anciennes passent par les commandes `backfill_rollups` et
+`reaggregate_rollups`.
+
+Les instantanés (`user_base`, `book_catalog`) décrivent l'état courant
+d'une table (répartition des utilisateurs par pays et abonnement…) et sont
+réécrits pour le jour en cours.
+
+Les lectures combinent lignes journalières pour les jours complets et
+lignes horaires pour les bords de la période, en une requête.
+"""
+import logging
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Max, Min, Q, Sum
+from django.db.models.functions import ExtractHour, Trunc, TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import AnalyticsRollup, RollupWatermark
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_RESTATE_HOURS = getattr(settings, 'ROLLUP_RESTATE_HOURS', 3)
+ROLLUP_WINDOW_HOURS = getattr(settings, 'ROLLUP_WINDOW_HOURS', 24)
+ROLLUP_MAX_WINDOWS = getattr(settings, 'ROLLUP_MAX_WINDOWS', 60)
+
+DIMENSIONS = ('country', 'subscription_type', 'provider', 'status', 'segment')
+MEASURES = ('count', 'amount', 'fees', 'duration_seconds')
+
+PREMIUM_SUBSCRIPTIONS = ('premium', 'creator', 'institutional')
+
+
+def floor_hour(value):
+    """Début (heure locale) de l'heure contenant `value`, comme `TruncHour`"""
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(value):
+    floored = floor_hour(value)
+    return floored if floored == value else floored + timedelta(hours=1)
+
+
+def floor_day(value):
+    """Minuit (heure locale) du jour contenant `value`"""
+    return timezone.localtime(value).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _measure(value) -> Any:
+    if value is None:
+        return 0
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return value
+
+
+class RollupSource:
+    """
+    Source de faits horodatés
+
+    `dimensions` associe une dimension du rollup à un champ de la source ;
+    `measures` associe une mesure à une expression d'agrégation.
+    """
+
+    def __init__(self, name: str, model: str, time_field: str,
+                 dimensions: Optional[Dict[str, str]] = None,
+                 measures: Optional[Callable[[], Dict[str, Any]]] = None,
+                 filters: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.model_label = model
+        self.time_field = time_field
+        self.dimensions = dimensions or {}
+        self.measures = measures or (lambda: {'count': Count('pk')})
+        self.filters = filters or {}
+
+    @property
+    def model(self):
+        label = settings.AUTH_USER_MODEL if self.model_label == 'user' else self.model_label
+        return apps.get_model(label)
+
+    def queryset(self):
+        return self.model._default_manager.filter(**self.filters)
+
+    def earliest(self):
+        return self.queryset().aggregate(first=Min(self.time_field))['first']
+
+    def aggregate(self, start, end) -> List[Dict[str, Any]]:
+        """Lignes horaires `[start, end)` : une par heure et combinaison de dimensions"""
+        rows = (
+            self.queryset()
+            .filter(**{f'{self.time_field}__gte': start, f'{self.time_field}__lt': end})
+            .annotate(rollup_bucket=TruncHour(self.time_field))
+            .values('rollup_bucket', *self.dimensions.values())
+            .annotate(**self.measures())
+            .order_by()
+        )
+        return [self._row(row, row['rollup_bucket']) for row in rows]
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Répartition actuelle de la table selon les dimensions"""
+        rows = self.queryset().values(*self.dimensions.values()).annotate(**self.measures()).order_by()
+        return [self._row(row, None) for row in rows]
+
+    def _row(self, row, bucket_start) -> Dict[str, Any]:
+        return {
+            'bucket_start': bucket_start,
+            **{dimension: row[field] or '' for dimension, field in self.dimensions.items()},
+            **{measure: _measure(row.get(measure)) for measure in MEASURES if measure in row},
+        }
+
+
+def _payment_measures():
+    return {
+        'count': Count('pk'),
+        'amount': Sum('net_amount'),
+        'fees': Sum('fees'),
+        'duration_seconds': Sum(ExpressionWrapper(
+            F('completed_at') - F('created_at'), output_field=DurationField()
+        )),
+    }
+
+
+def _reading_measures():
+    return {'count': Count('pk'), 'duration_seconds': Sum('total_reading_time')}
+
+
+ROLLUP_SOURCES = {
+    source.name: source for source in (
+        RollupSource('signups', 'user', 'date_joined', {
+            'country': 'country', 'subscription_type': 'subscription_type',
+        }),
+        RollupSource('books', 'catalog_service.Book', 'created_at', {
+            'status': 'status', 'segment': 'language',
+        }),
+        RollupSource('reading_sessions', 'reading_service.ReadingSession', 'created_at', {
+            'status': 'status',
+        }),
+        RollupSource('reading_completions', 'reading_service.ReadingSession', 'end_time',
+                     measures=_reading_measures, filters={'status': 'completed'}),
+        RollupSource('payments', 'shared_models.PaymentTransaction', 'created_at', {
+            'country': 'country_code', 'provider': 'payment_provider',
+            'status': 'status', 'segment': 'transaction_type',
+        }, measures=_payment_measures),
+    )
+}
+
+SNAPSHOT_SOURCES = {
+    source.name: source for source in (
+        RollupSource('user_base', 'user', 'date_joined', {
+            'country': 'country', 'subscription_type': 'subscription_type',
+        }),
+        RollupSource('book_catalog', 'catalog_service.Book', 'created_at', {
+            'status': 'status', 'segment': 'language',
+        }),
+    )
+}
+
+
+class RollupEngine:
+    """Alimentation incrémentale des agrégats à partir des filigranes"""
+
+    def __init__(self, sources: Optional[Dict[str, RollupSource]] = None,
+                 snapshots: Optional[Dict[str, RollupSource]] = None,
+                 restate_hours: int = ROLLUP_RESTATE_HOURS,
+                 window_hours: int = ROLLUP_WINDOW_HOURS,
+                 max_windows: int = ROLLUP_MAX_WINDOWS):
+        self.sources = ROLLUP_SOURCES if sources is None else sources
+        self.snapshots = SNAPSHOT_SOURCES if snapshots is None else snapshots
+        self.restate_hours = restate_hours
+        self.window_hours = window_hours
+        self.max_windows = max_windows
+        self.using = router.db_for_write(AnalyticsRollup)
+
+    def run(self, now=None) -> Dict[str, Any]:
+        """Avancer chaque source depuis son filigrane et réécrire les instantanés du jour"""
+        now = now or timezone.now()
+        stats = {}
+        for name, source in {**self.sources, **self.snapshots}.items():
+            try:
+                if name in self.snapshots:
+                    stats[name] = self.capture(source, now)
+                else:
+                    stats[name] = self.advance(source, now)
+            except Exception as e:
+                logger.error(f"Erreur lors de l'agrégation de {name}: {str(e)}")
+                stats[name] = {'error': str(e)}
+        return stats
+
+    def advance(self, source: RollupSource, now=None) -> Dict[str, Any]:
+        now = now or timezone.now()
+        watermark = RollupWatermark.objects.using(self.using).filter(source=source.name).first()
+        if watermark is not None:
+            start = watermark.position - timedelta(hours=self.restate_hours)
+        else:
+            # Premier passage : reprise de l'historique, par fenêtres bornées
+            start = source.earliest() or now
+        return self.rebuild(source, start, now, max_windows=self.max_windows)
+
+    def rebuild(self, source: RollupSource, start, end, max_windows: Optional[int] = None) -> Dict[str, Any]:
+        """Recalculer les lignes horaires et journalières de `[start, end)`"""
+        # L'heure en cours reste à recalculer : le filigrane s'arrête avant
+        settled = floor_hour(end)
+        position, end = floor_hour(start), ceil_hour(end)
+        windows = rows_written = 0
+        while position < end and (max_windows is None or windows < max_windows):
+            window_end = min(position + timedelta(hours=self.window_hours), end)
+            rows = source.aggregate(position, window_end)
+            with transaction.atomic(using=self.using):
+                self._replace(source.name, 'hour', position, window_end, rows)
+                self._rebuild_days(source.name, position, window_end)
+                self._set_watermark(source.name, min(window_end, settled))
+            rows_written += len(rows)
+            position = window_end
+            windows += 1
+        return {'windows': windows, 'rows': rows_written, 'position': position.isoformat()}
+
+    def capture(self, source: RollupSource, now=None) -> Dict[str, Any]:
+        """Réécrire l'instantané du jour"""
+        day = floor_day(now or timezone.now())
+        rows = [{**row, 'bucket_start': day} for row in source.snapshot()]
+        with transaction.atomic(using=self.using):
+            self._replace(source.name, 'day', day, day + timedelta(days=1), rows)
+        return {'rows': len(rows), 'day': day.date().isoformat()}
+
+    def _replace(self, metric: str, granularity: str, start, end, rows: Iterable[Dict[str, Any]]):
+        AnalyticsRollup.objects.using(self.using).filter(
+            metric=metric, granularity=granularity,
+            bucket_start__gte=start, bucket_start__lt=end
+        ).delete()
+        AnalyticsRollup.objects.using(self.using).bulk_create(
+            [AnalyticsRollup(metric=metric, granularity=granularity, **row) for row in rows],
+            batch_size=1000
+        )
+
+    def _rebuild_days(self, metric: str, start, end):
+        """Lignes journalières des jours touchés, sommées depuis les lignes horaires"""
+        day_start = floor_day(start)
+        day_end = floor_day(end - timedelta(microseconds=1)) + timedelta(days=1)
+        days = (
+            AnalyticsRollup.objects.using(self.using)
+            .filter(metric=metric, granularity='hour', bucket_start__gte=day_start, bucket_start__lt=day_end)
+            .annotate(day=TruncDay('bucket_start'))
+            .values('day', *DIMENSIONS)
+            .annotate(**{measure: Sum(measure) for measure in MEASURES})
+            .order_by()
+        )
+        rows = [
+            {
+                'bucket_start': row['day'],
+                **{dimension: row[dimension] for dimension in DIMENSIONS},
+                **{measure: row[measure] for measure in MEASURES},
+            }
+            for row in days
+        ]
+        self._replace(metric, 'day', day_start, day_end, rows)
+
+    def _set_watermark(self, source_name: str, position):
+        watermark, created = RollupWatermark.objects.using(self.using).get_or_create(
+            source=source_name, defaults={'position': position}
+        )
+        # Une correction d'une période passée ne fait pas reculer le filigrane
+        if not created and position > watermark.position:
+            watermark.position = position
+            watermark.save(using=self.using, update_fields=['position', 'updated_at'])
+
+    def freshness(self) -> Optional[str]:
+        """Position du filigrane le moins avancé (fraîcheur des agrégats)"""
+        position = RollupWatermark.objects.using(self.using).filter(
+            source__in=list(self.sources)
+        ).aggregate(oldest=Min('position'))['oldest']
+        return position.isoformat() if position else None
+
+
+class RollupQuery:
+    """Lectures des agrégats sur une période"""
+
+    def __init__(self, start, end):
+        self.start = floor_hour(start)
+        self.end = ceil_hour(end)
+        self.using = router.db_for_read(AnalyticsRollup)
+
+    def _range(self) -> Q:
+        """Jours complets en lignes journalières, bords de période en lignes horaires"""
+        first_day = floor_day(self.start)
+        if first_day < self.start:
+            first_day += timedelta(days=1)
+        last_day = floor_day(self.end)
+        if first_day >= last_day:
+            return Q(granularity='hour', bucket_start__gte=self.start, bucket_start__lt=self.end)
+        return (
+            Q(granularity='day', bucket_start__gte=first_day, bucket_start__lt=last_day)
+            | Q(granularity='hour', bucket_start__gte=self.start, bucket_start__lt=first_day)
+            | Q(granularity='hour', bucket_start__gte=last_day, bucket_start__lt=self.end)
+        )
+
+    def _rows(self, metric: str, **filters):
+        return AnalyticsRollup.objects.using(self.using).filter(
+            self._range(), metric=metric, **filters
+        )
+
+    def totals(self, metric: str, group_by: Iterable[str], **filters) -> List[Dict[str, Any]]:
+        """Mesures sommées par combinaison de `group_by`"""
+        return list(
+            self._rows(metric, **filters)
+            .values(*group_by)
+            .annotate(**{measure: Sum(measure) for measure in MEASURES})
+            .order_by(*group_by)
+        )
+
+    def total(self, metric: str, **filters) -> Dict[str, Any]:
+        """Mesures sommées sur toute la période"""
+        totals = self._rows(metric, **filters).aggregate(**{measure: Sum(measure) for measure in MEASURES})
+        return {measure: value or 0 for measure, value in totals.items()}
+
+    def series(self, metric: str, period: str = 'day', **filters) -> List[Dict[str, Any]]:
+        """Mesures par jour, semaine ou mois"""
+        return list(
+            self._rows(metric, **filters)
+            .annotate(period=Trunc('bucket_start', period))
+            .values('period')
+            .annotate(**{measure: Sum(measure) for measure in MEASURES})
+            .order_by('period')
+        )
+
+    def hour_of_day(self, metric: str, **filters) -> Dict[int, int]:
+        """Nombre de faits par heure de la journée (lignes horaires uniquement)"""
+        counts = dict(
+            AnalyticsRollup.objects.using(self.using).filter(
+                metric=metric, granularity='hour',
+                bucket_start__gte=self.start, bucket_start__lt=self.end, **filters
+            ).annotate(hour=ExtractHour('bucket_start'))
+            .values('hour').annotate(total=Sum('count'))
+            .values_list('hour', 'total')
+        )
+        return {hour: counts.get(hour, 0) for hour in range(24)}
+
+
+def lifetime_total(metric: str, **filters) -> int:
+    """Nombre de faits depuis l'origine (les lignes journalières couvrent tout l'historique)"""
+    using = router.db_for_read(AnalyticsRollup)
+    return AnalyticsRollup.objects.using(using).filter(
+        metric=metric, granularity='day', **filters
+    ).aggregate(total=Sum('count'))['total'] or 0
+
+
+def _latest_snapshot_rows(metric: str, **filters):
+    using = router.db_for_read(AnalyticsRollup)
+    rows = AnalyticsRollup.objects.using(using).filter(metric=metric, granularity='day')
+    day = rows.aggregate(latest=Max('bucket_start'))['latest']
+    if day is None:
+        return rows.none()
+    return rows.filter(bucket_start=day, **filters)
+
+
+def latest_snapshot(metric: str, group_by: Iterable[str], **filters) -> Dict[Any, int]:
+    """Dernier instantané d'une table : nombre de lignes par valeur de `group_by`"""
+    rows = _latest_snapshot_rows(metric, **filters).values(*group_by).annotate(total=Sum('count'))
+    if len(group_by) == 1:
+        return {row[group_by[0]]: row['total'] for row in rows}
+    return {tuple(row[field] for field in group_by): row['total'] for row in rows}
+
+
+def snapshot_total(metric: str, **filters) -> int:
+    """Dernier instantané d'une table : nombre total de lignes"""
+    return _latest_snapshot_rows(metric, **filters).aggregate(total=Sum('count'))['total'] or 0
+
+
+rollup_engine = RollupEngine()
@@ -3,6 +3,7 @@ Services pour la gestion des références partagées et communication inter-serv
 """
 
 from typing import Dict, List, Optional, Any
+from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist
@@ -222,6 +223,9 @@ class ServiceCommunicationService:
         """
         Émet un événement inter-services.
         
+        L'événement est ajouté à la boîte d'envoi durable ; il est traité par
+        le worker `dispatch_event_outbox`, dans l'ordre de son objet.
+        
         Args:
             event_type: Type d'événement
             source_service: Service émetteur
@@ -232,67 +236,43 @@ class ServiceCommunicationService:
         Returns:
             CrossServiceEvent: Événement créé
         """
+        from .event_outbox import append
+        
         try:
-            event = CrossServiceEvent.objects.create(
+            object_uuid = (event_data or {}).get('uuid')
+            event = append(
                 event_type=event_type,
                 source_service=source_service,
-                target_services=target_services or [],
                 event_data=event_data,
+                aggregate_key=f"{event_type.split('.')[0]}:{object_uuid}" if object_uuid else '',
+                target_services=target_services,
                 correlation_id=correlation_id
             )
             
             logger.info(f"Event emitted: {event_type} from {source_service}")
             
-            # Traitement asynchrone de l'événement
-            self._process_event_async(event)
-            
             return event
             
         except Exception as e:
             logger.error(f"Error emitting event: {e}")
             raise
     
-    def _process_event_async(self, event: CrossServiceEvent):
-        """
-        Traite un événement de manière asynchrone.
-        Cette méthode devrait idéalement utiliser Celery ou similar.
-        """
-        try:
-            event.status = 'processing'
-            event.save(update_fields=['status'])
-            
-            # Traitement selon le type d'événement
-            if event.event_type.startswith('book.'):
-                self._handle_book_event(event)
-            elif event.event_type.startswith('author.'):
-                self._handle_author_event(event)
-            elif event.event_type.startswith('category.'):
-                self._handle_category_event(event)
-            elif event.event_type.startswith('user.'):
-                self._handle_user_event(event)
-            else:
-                logger.warning(f"Unknown event type: {event.event_type}")
-            
-            event.status = 'processed'
-            event.processed_at = timezone.now()
-            event.save(update_fields=['status', 'processed_at'])
-            
-        except Exception as e:
-            event.status = 'failed'
-            event.error_message = str(e)
-            event.retry_count += 1
-            
-            # Programmer une nouvelle tentative si possible
-            if event.can_retry:
-                event.next_retry_at = timezone.now() + timezone.timedelta(
-                    minutes=2 ** event.retry_count  # Backoff exponentiel
-                )
-            
-            event.save(update_fields=[
-                'status', 'error_message', 'retry_count', 'next_retry_at'
-            ])
-            
-            logger.error(f"Error processing event {event.event_id}: {e}")
+    def process_event(self, event: CrossServiceEvent):
+        """
+        Traite un événement réclamé dans la boîte d'envoi.
+        Les erreurs remontent : le dispatcher gère statut, reprises et lettre morte.
+        """
+        # Traitement selon le type d'événement
+        if event.event_type.startswith('book.'):
+            self._handle_book_event(event)
+        elif event.event_type.startswith('author.'):
+            self._handle_author_event(event)
+        elif event.event_type.startswith('category.'):
+            self._handle_category_event(event)
+        elif event.event_type.startswith('user.'):
+            self._handle_user_event(event)
+        else:
+            logger.warning(f"Unknown event type: {event.event_type}")
     
     def _handle_book_event(self, event: CrossServiceEvent):
         """
@@ -380,83 +360,23 @@ class ServiceCommunicationService:
             logger.error(f"Error creating sync task: {e}")
             raise
     
-    def process_pending_syncs(self, limit: int = 100):
+    def process_pending_syncs(self, limit: Optional[int] = None, workers: Optional[int] = None) -> Dict[str, Any]:
         """
         Traite les synchronisations en attente.
-        """
-        pending_syncs = ServiceSync.objects.filter(
-            status='pending'
-        )[:limit]
         
-        for sync_task in pending_syncs:
-            try:
-                self._process_sync_task(sync_task)
-            except Exception as e:
-                logger.error(f"Error processing sync {sync_task.sync_id}: {e}")
-    
-    def _process_sync_task(self, sync_task: ServiceSync):
-        """
-        Traite une tâche de synchronisation.
-        """
-        try:
-            sync_task.status = 'in_progress'
-            sync_task.started_at = timezone.now()
-            sync_task.save(update_fields=['status', 'started_at'])
-            
-            # Logique de synchronisation selon le type
-            if sync_task.object_type == 'Book':
-                self._sync_book(sync_task)
-            elif sync_task.object_type == 'Author':
-                self._sync_author(sync_task)
-            elif sync_task.object_type == 'Category':
-                self._sync_category(sync_task)
-            elif sync_task.object_type == 'User':
-                self._sync_user(sync_task)
-            
-            sync_task.status = 'completed'
-            sync_task.completed_at = timezone.now()
-            sync_task.save(update_fields=['status', 'completed_at'])
-            
-        except Exception as e:
-            sync_task.status = 'failed'
-            sync_task.error_message = str(e)
-            sync_task.save(update_fields=['status', 'error_message'])
-            raise
-    
-    def _sync_book(self, sync_task: ServiceSync):
-        """
-        Synchronise un livre entre services.
-        """
-        if sync_task.sync_type == 'create':
-            self.reference_manager.create_book_reference(sync_task.sync_data)
-        elif sync_task.sync_type == 'update':
-            self.reference_manager.create_book_reference(sync_task.sync_data)
-        elif sync_task.sync_type == 'delete':
-            self.reference_manager.deactivate_reference(
-                BookReference, 
-                sync_task.object_uuid
-            )
-    
-    def _sync_author(self, sync_task: ServiceSync):
-        """
-        Synchronise un auteur entre services.
-        """
-        if sync_task.sync_type in ['create', 'update']:
-            self.reference_manager.create_author_reference(sync_task.sync_data)
-    
-    def _sync_category(self, sync_task: ServiceSync):
-        """
-        Synchronise une catégorie entre services.
-        """
-        if sync_task.sync_type in ['create', 'update']:
-            self.reference_manager.create_category_reference(sync_task.sync_data)
-    
-    def _sync_user(self, sync_task: ServiceSync):
-        """
-        Synchronise un utilisateur entre services.
+        Les tâches sont réclamées par lots (SKIP LOCKED), appliquées par
+        upserts groupés et réparties entre plusieurs workers : voir
+        `shared_models.sync_engine`. `limit` borne la taille d'un lot par
+        worker ; sans limite, tout l'arriéré est traité.
+        
+        Returns:
+            Dict: mesures de l'exécution (débit, retard, arriéré)
         """
-        if sync_task.sync_type in ['create', 'update']:
-            self.reference_manager.create_user_reference(sync_task.sync_data)
+        from .sync_engine import ServiceSyncEngine, sync_engine
+        
+        if limit:
+            return ServiceSyncEngine(batch_size=limit).run(max_batches=1, workers=workers)
+        return sync_engine.run(workers=workers)
 
 
 class ServiceRegistryService:
@@ -468,14 +388,14 @@ class ServiceRegistryService:
     def __init__(self):
         self.services = {
             'auth_service': {
-                'base_url': '/api/auth/',
+                'base_url': '/api/v1/auth/',
                 'endpoints': {
                     'users': 'users/',
                     'profiles': 'profiles/',
                 }
             },
             'catalog_service': {
-                'base_url': '/api/catalog/',
+                'base_url': '/api/v1/catalog/',
                 'endpoints': {
                     'books': 'books/',
                     'authors': 'authors/',
@@ -483,7 +403,7 @@ class ServiceRegistryService:
                 }
             },
             'reading_service': {
-                'base_url': '/api/reading/',
+                'base_url': '/api/v1/reading/',
                 'endpoints': {
                     'sessions': 'sessions/',
                     'bookmarks': 'bookmarks/',
@@ -491,7 +411,7 @@ class ServiceRegistryService:
                 }
             },
             'recommendation_service': {
-                'base_url': '/api/recommendations/',
+                'base_url': '/api/v1/recommendations/',
                 'endpoints': {
                     'recommendations': 'recommendations/',
                     'interactions': 'interactions/',
@@ -514,6 +434,24 @@ class ServiceRegistryService:
         
         return f"{service_config['base_url']}{endpoint_path}"
     
+    def get_service_base_url(self, service_name: str) -> str:
+        """
+        Récupère l'URL absolue de base d'un service.
+        
+        `INTER_SERVICE_URLS` permet de pointer un service vers son propre
+        hôte ; sinon son préfixe est servi par `INTER_SERVICE_BASE_URL`.
+        """
+        service_config = self.services.get(service_name)
+        if not service_config:
+            raise ValueError(f"Unknown service: {service_name}")
+        
+        service_urls = getattr(settings, 'INTER_SERVICE_URLS', {})
+        if service_name in service_urls:
+            return service_urls[service_name]
+        
+        host = getattr(settings, 'INTER_SERVICE_BASE_URL', 'http://localhost:8000')
+        return f"{host.rstrip('/')}{service_config['base_url']}"
+    
     def get_all_services(self) -> Dict[str, Any]:
         """
         Récupère la configuration de tous les services.
@@ -0,0 +1,320 @@
+"""
+Traitement groupé et parallèle des synchronisations (`ServiceSync`)
+
+Chaque worker réclame un lot de tâches avec `SELECT … FOR UPDATE SKIP
+LOCKED` (plusieurs workers, ou plusieurs exécutions de la tâche Celery, ne
+traitent jamais la même tâche), puis les regroupe par `object_type`.
+Dans un groupe, les tâches sont rejouées dans l'ordre sur un état par uuid
+(une suppression suivie d'une recréation reste active), puis :
+
+- créations et mises à jour deviennent un seul upsert groupé par type
+  (`INSERT … ON CONFLICT (uuid) DO UPDATE`) dans la table de références ;
+- suppressions restantes deviennent un seul `UPDATE … SET is_active = false` ;
+- les statuts des tâches sont écrits en une requête par lot.
+
+Si un upsert groupé échoue (slug en conflit, par exemple), le groupe est
+rejoué tâche par tâche afin de n'échouer que les tâches fautives.
+
+Les mesures (débit, retard des tâches, arriéré) de la dernière exécution
+sont conservées en cache pour la supervision.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    BookReference, AuthorReference, CategoryReference, UserReference, ServiceSync
+)
+
+logger = logging.getLogger(__name__)
+
+SERVICE_SYNC_BATCH_SIZE = getattr(settings, 'SERVICE_SYNC_BATCH_SIZE', 500)
+SERVICE_SYNC_WORKERS = getattr(settings, 'SERVICE_SYNC_WORKERS', 4)
+SERVICE_SYNC_LEASE_SECONDS = getattr(settings, 'SERVICE_SYNC_LEASE_SECONDS', 600)
+SERVICE_SYNC_METRICS_KEY = 'service_sync:metrics'
+
+UPSERT_SYNC_TYPES = ('create', 'update', 'full_sync')
+
+# object_type -> (modèle, champ uuid, {champ: (clé dans les données, défaut)})
+REFERENCE_SPECS = {
+    'Book': (BookReference, 'book_uuid', {
+        'title': ('title', ''),
+        'slug': ('slug', ''),
+        'isbn': ('isbn', ''),
+        'is_active': ('is_active', True),
+    }),
+    'Author': (AuthorReference, 'author_uuid', {
+        'name': ('name', ''),
+        'slug': ('slug', ''),
+        'is_active': ('is_active', True),
+    }),
+    'Category': (CategoryReference, 'category_uuid', {
+        'name': ('name', ''),
+        'slug': ('slug', ''),
+        'parent_uuid': ('parent_uuid', None),
+        'is_active': ('is_active', True),
+    }),
+    'User': (UserReference, 'user_uuid', {
+        'username': ('username', ''),
+        'display_name': ('display_name', ''),
+        'is_active': ('is_active', True),
+    }),
+}
+
+
+def upsert_references(object_type: str, rows: Iterable[Dict[str, Any]]) -> int:
+    """
+    Créer ou mettre à jour des références en une requête
+
+    Chaque ligne porte `uuid` et les champs de la référence ; pour un même
+    uuid, la dernière ligne l'emporte.
+    """
+    model, uuid_field, fields = REFERENCE_SPECS[object_type]
+    latest: Dict[str, Dict[str, Any]] = OrderedDict()
+    for row in rows:
+        latest[str(row['uuid'])] = row
+    if not latest:
+        return 0
+
+    instances = [
+        model(**{uuid_field: row['uuid']}, **{
+            field: row.get(key, default) for field, (key, default) in fields.items()
+        })
+        for row in latest.values()
+    ]
+    update_fields = list(fields) + ['last_sync', 'updated_at']
+    model.objects.bulk_create(
+        instances,
+        update_conflicts=True,
+        unique_fields=[uuid_field],
+        update_fields=update_fields,
+    )
+    return len(instances)
+
+
+def deactivate_references(object_type: str, object_uuids: Iterable) -> int:
+    """Désactiver des références en une requête (suppression logique)"""
+    model, uuid_field, _ = REFERENCE_SPECS[object_type]
+    return model.objects.filter(**{f"{uuid_field}__in": list(object_uuids)}).update(is_active=False)
+
+
+class SyncMetrics:
+    """Compteurs d'une exécution, partagés entre workers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.values = {'batches': 0, 'claimed': 0, 'completed': 0, 'failed': 0, 'skipped': 0}
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+
+    def record_claim(self, tasks: List[ServiceSync]):
+        now = timezone.now()
+        lags = [(now - task.created_at).total_seconds() for task in tasks]
+        with self._lock:
+            self.values['batches'] += 1
+            self.values['claimed'] += len(tasks)
+            self.total_lag += sum(lags)
+            self.max_lag = max([self.max_lag] + lags)
+
+    def add(self, name: str, count: int):
+        with self._lock:
+            self.values[name] += count
+
+    def snapshot(self) -> Dict[str, Any]:
+        duration = time.monotonic() - self.started
+        claimed = self.values['claimed']
+        return {
+            **self.values,
+            'duration_seconds': round(duration, 3),
+            'throughput_per_second': round(claimed / duration, 2) if duration > 0 else 0.0,
+            'max_lag_seconds': round(self.max_lag, 3),
+            'avg_lag_seconds': round(self.total_lag / claimed, 3) if claimed else 0.0,
+        }
+
+
+class ServiceSyncEngine:
+    """Réclamation par lots, application groupée et workers parallèles"""
+
+    def __init__(self, batch_size: int = SERVICE_SYNC_BATCH_SIZE,
+                 workers: int = SERVICE_SYNC_WORKERS,
+                 lease_seconds: int = SERVICE_SYNC_LEASE_SECONDS):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.using = router.db_for_write(ServiceSync)
+
+    def claim(self, limit: Optional[int] = None) -> List[ServiceSync]:
+        """Réclamer des tâches en attente (ou dont le bail a expiré)"""
+        limit = limit or self.batch_size
+        now = timezone.now()
+        stale = now - timezone.timedelta(seconds=self.lease_seconds)
+        due = Q(status='pending') | Q(status='in_progress', started_at__lt=stale)
+
+        with transaction.atomic(using=self.using):
+            tasks = list(
+                ServiceSync.objects.using(self.using)
+                .select_for_update(skip_locked=True)
+                .filter(due)
+                .order_by('created_at')[:limit]
+            )
+            if tasks:
+                ServiceSync.objects.using(self.using).filter(
+                    sync_id__in=[task.sync_id for task in tasks]
+                ).update(status='in_progress', started_at=now)
+        return tasks
+
+    def run(self, max_batches: Optional[int] = None, workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Traiter l'arriéré avec `workers` workers en parallèle
+
+        `max_batches` borne le nombre de lots par worker (None : jusqu'à épuisement).
+        """
+        workers = workers or self.workers
+        metrics = SyncMetrics()
+        if workers <= 1:
+            self._worker_loop(metrics, max_batches)
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='service-sync') as executor:
+                futures = [executor.submit(self._worker_thread, metrics, max_batches) for _ in range(workers)]
+                for future in futures:
+                    future.result()
+
+        stats = {**metrics.snapshot(), **self.backlog()}
+        cache.set(SERVICE_SYNC_METRICS_KEY, {**stats, 'finished_at': timezone.now().isoformat()}, 3600)
+        if stats['claimed']:
+            logger.info(
+                f"Synchronisations: {stats['completed']} terminées, {stats['failed']} échouées, "
+                f"{stats['throughput_per_second']}/s, retard max {stats['max_lag_seconds']}s, "
+                f"arriéré {stats['backlog']}"
+            )
+        return stats
+
+    def _worker_thread(self, metrics: SyncMetrics, max_batches: Optional[int]):
+        try:
+            self._worker_loop(metrics, max_batches)
+        finally:
+            close_old_connections()
+
+    def _worker_loop(self, metrics: SyncMetrics, max_batches: Optional[int]):
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            tasks = self.claim()
+            if not tasks:
+                break
+            batches += 1
+            metrics.record_claim(tasks)
+            self.process_batch(tasks, metrics)
+            if len(tasks) < self.batch_size:
+                break
+
+    def process_batch(self, tasks: List[ServiceSync], metrics: Optional[SyncMetrics] = None):
+        """Appliquer un lot de tâches réclamées, un groupe par type d'objet"""
+        metrics = metrics or SyncMetrics()
+        done, failed = [], []
+        skipped = [task for task in tasks if not self._supported(task)]
+        if skipped:
+            logger.warning(f"Synchronisations non gérées ignorées: {len(skipped)} tâches")
+
+        for object_type, group in self._group([task for task in tasks if self._supported(task)]).items():
+            try:
+                with transaction.atomic(using=self.using):
+                    self._apply(object_type, group)
+                done.extend(group)
+            except Exception as e:
+                logger.warning(f"Application groupée impossible pour {object_type} "
+                               f"({len(group)} tâches), reprise une par une: {str(e)}")
+                group_done, group_failed = self._apply_one_by_one(object_type, group)
+                done.extend(group_done)
+                failed.extend(group_failed)
+
+        self._finish(done + skipped, 'completed')
+        self._finish(failed, 'failed')
+        metrics.add('completed', len(done))
+        metrics.add('skipped', len(skipped))
+        metrics.add('failed', len(failed))
+
+    def _supported(self, task: ServiceSync) -> bool:
+        return task.object_type in REFERENCE_SPECS and task.sync_type in UPSERT_SYNC_TYPES + ('delete',)
+
+    def _group(self, tasks: List[ServiceSync]) -> Dict[str, List[ServiceSync]]:
+        groups: Dict[str, List[ServiceSync]] = OrderedDict()
+        for task in tasks:
+            groups.setdefault(task.object_type, []).append(task)
+        return groups
+
+    def _apply(self, object_type: str, tasks: List[ServiceSync]):
+        """
+        Rejouer les tâches dans l'ordre sur un état par uuid, puis écrire cet
+        état final : un upsert et une désactivation au plus
+        """
+        rows: Dict[str, Dict[str, Any]] = OrderedDict()
+        deactivated = OrderedDict()
+        for task in tasks:
+            key = str(task.object_uuid)
+            if task.sync_type == 'delete':
+                if key in rows:
+                    rows[key]['is_active'] = False
+                else:
+                    deactivated[key] = task.object_uuid
+            else:
+                deactivated.pop(key, None)
+                rows[key] = self._row(task)
+
+        if rows:
+            upsert_references(object_type, rows.values())
+        if deactivated:
+            deactivate_references(object_type, deactivated.values())
+
+    def _apply_one_by_one(self, object_type: str,
+                          tasks: List[ServiceSync]) -> Tuple[List[ServiceSync], List[ServiceSync]]:
+        done, failed = [], []
+        for task in tasks:
+            try:
+                with transaction.atomic(using=self.using):
+                    self._apply(object_type, [task])
+                done.append(task)
+            except Exception as e:
+                task.error_message = str(e)
+                failed.append(task)
+                logger.error(f"Error processing sync {task.sync_id}: {e}")
+        return done, failed
+
+    def _row(self, task: ServiceSync) -> Dict[str, Any]:
+        return {**(task.sync_data or {}), 'uuid': task.object_uuid}
+
+    def _finish(self, tasks: List[ServiceSync], status: str):
+        if not tasks:
+            return
+        if status == 'completed':
+            ServiceSync.objects.using(self.using).filter(
+                sync_id__in=[task.sync_id for task in tasks]
+            ).update(status='completed', completed_at=timezone.now(), error_message='')
+            return
+        for task in tasks:
+            task.status = status
+        ServiceSync.objects.using(self.using).bulk_update(tasks, ['status', 'error_message'])
+
+    def backlog(self) -> Dict[str, Any]:
+        """Arriéré actuel et retard de la plus ancienne tâche en attente"""
+        pending = ServiceSync.objects.using(self.using).filter(status='pending')
+        oldest = pending.order_by('created_at').values_list('created_at', flat=True).first()
+        return {
+            'backlog': pending.count(),
+            'oldest_pending_lag_seconds': round((timezone.now() - oldest).total_seconds(), 3) if oldest else 0.0,
+        }
+
+    def last_metrics(self) -> Optional[Dict[str, Any]]:
+        return cache.get(SERVICE_SYNC_METRICS_KEY)
+
+
+sync_engine = ServiceSyncEngine()
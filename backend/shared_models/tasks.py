@@ -0,0 +1,127 @@
+"""
+Tâches Celery des modèles partagés
+"""
+from celery import shared_task
+import logging
+
+from .event_outbox import event_outbox
+from .export_streaming import export_jobs, iter_zip
+from .rollups import rollup_engine
+from .sync_engine import sync_engine
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def dispatch_event_outbox(max_rounds: int = 10):
+    """
+    Traiter les événements de la boîte d'envoi par lots : ordre par clé
+    d'agrégat, reprises avec backoff et lettre morte
+    """
+    try:
+        stats = event_outbox.dispatch_pending(max_rounds=max_rounds)
+        if stats['claimed']:
+            logger.info(
+                f"Boîte d'envoi: {stats['processed']} événements traités, "
+                f"{stats['failed']} reprogrammés, {stats['dead_letter']} en lettre morte"
+            )
+        return {'success': True, **stats}
+    except Exception as e:
+        logger.error(f"Erreur lors du traitement de la boîte d'envoi: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
+@shared_task
+def process_service_syncs(max_batches: int = 20):
+    """
+    Appliquer les synchronisations en attente par lots, avec plusieurs
+    workers en parallèle ; les mesures sont conservées en cache
+    """
+    try:
+        stats = sync_engine.run(max_batches=max_batches)
+        return {'success': True, **stats}
+    except Exception as e:
+        logger.error(f"Erreur lors du traitement des synchronisations: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
+@shared_task
+def build_export_package(job_id: str, user_id: str):
+    """
+    Construire en arrière-plan un export complet trop volumineux pour être
+    servi dans la requête ; l'archive est déposée dans le stockage
+    """
+    from django.contrib.auth import get_user_model
+    from .export_apis import package_entries
+
+    job = None
+    try:
+        job = export_jobs.get(job_id)
+        if job is None:
+            return {'success': False, 'error': 'Export expiré'}
+        user = get_user_model().objects.get(pk=user_id)
+        job = export_jobs.build(job, iter_zip(package_entries(user)))
+        return {'success': job['status'] == 'ready', 'job_id': job_id, 'path': job['path']}
+    except Exception as e:
+        logger.error(f"Erreur lors de l'export complet {job_id}: {str(e)}")
+        return {'success': False, 'error': str(e)}
+    finally:
+        if job is not None:
+            export_jobs.release(job)
+
+
+@shared_task
+def purge_export_artifacts():
+    """Supprimer les archives d'export expirées"""
+    try:
+        removed = export_jobs.purge()
+        return {'success': True, 'removed': removed}
+    except Exception as e:
+        logger.error(f"Erreur lors de la purge des exports: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
+@shared_task
+def refresh_analytics_rollups():
+    """
+    Avancer les agrégats du dashboard depuis leurs filigranes (dernières
+    heures recalculées) et réécrire les instantanés du jour
+    """
+    try:
+        stats = rollup_engine.run()
+        return {'success': True, 'sources': stats, 'data_as_of': rollup_engine.freshness()}
+    except Exception as e:
+        logger.error(f"Erreur lors de l'actualisation des agrégats: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
+@shared_task
+def enrich_ip_location(ip_address: str):
+    """
+    Géolocaliser auprès des services distants une adresse absente de la
+    base locale ; le résultat est mis en cache pour les requêtes suivantes
+    """
+    from coko.african_geolocation import geo_service
+
+    try:
+        location = geo_service.fetch_remote_location(ip_address)
+        return {'success': location is not None, 'source': location['source'] if location else None}
+    except Exception as e:
+        logger.error(f"Erreur lors de la géolocalisation distante de {ip_address}: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
+@shared_task
+def precompress_response_body(digest: str):
+    """
+    Recompresser au niveau maximal (Brotli 11, gzip 9) un corps de réponse
+    fréquemment servi et publier les artefacts pour tous les workers
+    """
+    from coko.compression import compression_store
+
+    try:
+        sizes = compression_store.precompress(digest)
+        return {'success': bool(sizes), 'sizes': sizes}
+    except Exception as e:
+        logger.error(f"Erreur lors de la précompression de {digest}: {str(e)}")
+        return {'success': False, 'error': str(e)}
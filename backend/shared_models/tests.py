@@ -2,17 +2,41 @@
 Tests pour le système de références partagées et communication inter-services.
 """
 
-from django.test import TestCase, override_settings
+from django.test import RequestFactory, TestCase, override_settings
+from django.core.cache import cache
+from django.urls import reverse
 from django.utils import timezone
 from unittest.mock import patch, MagicMock
+from decimal import Decimal
+import io
+import json
+import requests
+import shutil
+import tempfile
+import threading
+import time
 import uuid
+import zipfile
+from urllib3 import Timeout
+from urllib3.exceptions import EmptyPoolError
 
 from .models import (
     BookReference, AuthorReference, CategoryReference, UserReference,
-    ServiceSync, CrossServiceEvent
+    ServiceSync, CrossServiceEvent, AnalyticsRollup, RollupWatermark, PaymentTransaction
 )
+from .financial_reports import FinancialReport
 from .services import ReferenceManagerService, ServiceCommunicationService
-from .api_client import ServiceAPIError, CatalogServiceClient
+from .event_outbox import EventOutboxDispatcher
+from .sync_engine import ServiceSyncEngine, SERVICE_SYNC_METRICS_KEY
+from .export_apis import AuthorExportAPI
+from .export_streaming import export_jobs, iter_csv, iter_ndjson, iter_zip
+from .tasks import build_export_package
+from .rollups import RollupEngine, RollupQuery, floor_hour, latest_snapshot
+from .api_client import ServiceAPIError, CatalogServiceClient, ServiceAPIClient
+from .transport import (
+    CircuitOpenError, DeadlineExceeded, DeadlineMiddleware, ServiceTransport, DEFAULT_HTTP_OPTIONS,
+    deadline, endpoint_template, gather, remaining_time
+)
 
 
 class BookReferenceTestCase(TestCase):
@@ -181,7 +205,7 @@ class ServiceCommunicationServiceTestCase(TestCase):
             'title': 'Test Event Book',
         }
         
-        with patch.object(self.service, '_process_event_async') as mock_process:
+        with patch.object(self.service, 'process_event') as mock_process:
             event = self.service.emit_event(
                 event_type='book.created',
                 source_service='catalog_service',
@@ -193,8 +217,10 @@ class ServiceCommunicationServiceTestCase(TestCase):
             self.assertEqual(event.source_service, 'catalog_service')
             self.assertEqual(event.event_data, event_data)
             self.assertEqual(event.status, 'pending')
+            self.assertEqual(event.aggregate_key, f"book:{event_data['uuid']}")
             
-            mock_process.assert_called_once_with(event)
+            # Le traitement est différé au worker de la boîte d'envoi
+            mock_process.assert_not_called()
     
     def test_create_sync_task(self):
         """Test de création d'une tâche de synchronisation"""
@@ -259,6 +285,121 @@ class CrossServiceEventTestCase(TestCase):
         self.assertFalse(event.can_retry)
 
 
+class EventOutboxTestCase(TestCase):
+    """Tests pour la boîte d'envoi des événements"""
+    
+    def setUp(self):
+        self.dispatcher = EventOutboxDispatcher(batch_size=50, workers=1)
+        self.service = ServiceCommunicationService()
+    
+    def emit(self, event_type, book_uuid, title='Livre'):
+        return self.service.emit_event(
+            event_type=event_type,
+            source_service='catalog_service',
+            event_data={'uuid': str(book_uuid), 'title': title, 'slug': f"livre-{book_uuid}"}
+        )
+    
+    def test_dispatch_processes_pending_events(self):
+        """Les événements en attente sont traités par le worker"""
+        book_uuid = uuid.uuid4()
+        event = self.emit('book.created', book_uuid, title='Outbox Book')
+        
+        stats = self.dispatcher.dispatch_pending()
+        
+        event.refresh_from_db()
+        self.assertEqual(stats['processed'], 1)
+        self.assertEqual(event.status, 'processed')
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(BookReference.objects.get(book_uuid=book_uuid).title, 'Outbox Book')
+    
+    def test_events_of_same_aggregate_are_ordered(self):
+        """Une mise à jour n'est jamais livrée avant l'événement qui la précède"""
+        book_uuid = uuid.uuid4()
+        first = self.emit('book.created', book_uuid, title='Version 1')
+        second = self.emit('book.updated', book_uuid, title='Version 2')
+        other = self.emit('book.created', uuid.uuid4())
+        
+        # Le premier événement est en cours ailleurs : le second attend
+        CrossServiceEvent.objects.filter(pk=first.pk).update(
+            status='processing', next_retry_at=timezone.now() + timezone.timedelta(minutes=5)
+        )
+        claimed = self.dispatcher.claim()
+        self.assertEqual([event.pk for event in claimed], [other.pk])
+        
+        # Une fois le premier terminé, le second devient livrable
+        CrossServiceEvent.objects.filter(pk=first.pk).update(status='processed')
+        claimed = self.dispatcher.claim()
+        self.assertEqual([event.pk for event in claimed], [second.pk])
+    
+    def test_failure_is_retried_then_dead_lettered(self):
+        """Un handler en échec est reprogrammé, puis abandonné en lettre morte"""
+        book_uuid = uuid.uuid4()
+        event = self.emit('book.created', book_uuid)
+        follower = self.emit('book.updated', book_uuid)
+        
+        original = ServiceCommunicationService.process_event
+        
+        def failing_first(service, record):
+            if record.pk == event.pk:
+                raise Exception('boom')
+            return original(service, record)
+        
+        with patch.object(ServiceCommunicationService, 'process_event', autospec=True, side_effect=failing_first):
+            self.dispatcher.dispatch_pending()
+            event.refresh_from_db()
+            follower.refresh_from_db()
+            self.assertEqual(event.status, 'failed')
+            self.assertEqual(event.retry_count, 1)
+            self.assertGreater(event.next_retry_at, timezone.now())
+            self.assertEqual(event.processing_log[-1]['status'], 'error')
+            # L'événement suivant de la même clé reste en file, derrière l'échec
+            self.assertEqual(follower.status, 'pending')
+            self.assertEqual(self.dispatcher.claim(), [])
+            
+            for _ in range(event.max_retries - 1):
+                CrossServiceEvent.objects.filter(pk=event.pk).update(next_retry_at=timezone.now())
+                self.dispatcher.dispatch_pending(max_rounds=1)
+        
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'dead_letter')
+        self.assertEqual(event.retry_count, event.max_retries)
+        
+        # La lettre morte ne bloque plus la clé
+        self.dispatcher.dispatch_pending()
+        follower.refresh_from_db()
+        self.assertEqual(follower.status, 'processed')
+    
+    def test_succeeded_handlers_are_not_replayed(self):
+        """Une reprise ne rejoue que les handlers en échec"""
+        calls = []
+        handlers = [
+            ('first', lambda event: calls.append('first')),
+            ('second', MagicMock(side_effect=[Exception('boom'), None])),
+        ]
+        event = self.emit('book.created', uuid.uuid4())
+        
+        with patch('shared_models.event_outbox.resolve_handlers', return_value=handlers):
+            self.dispatcher.dispatch_pending()
+            CrossServiceEvent.objects.filter(pk=event.pk).update(next_retry_at=timezone.now())
+            self.dispatcher.dispatch_pending()
+        
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'processed')
+        self.assertEqual(calls, ['first'])
+        self.assertEqual(handlers[1][1].call_count, 2)
+    
+    def test_requeue_dead_letters(self):
+        """Les lettres mortes peuvent être remises en file"""
+        event = self.emit('book.created', uuid.uuid4())
+        CrossServiceEvent.objects.filter(pk=event.pk).update(status='dead_letter', retry_count=3)
+        
+        self.assertEqual(self.dispatcher.requeue_dead_letters(), 1)
+        
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'pending')
+        self.assertEqual(event.retry_count, 0)
+
+
 class ServiceSyncTestCase(TestCase):
     """Tests pour le modèle ServiceSync"""
     
@@ -285,6 +426,79 @@ class ServiceSyncTestCase(TestCase):
         self.assertEqual(sync_task.status, 'pending')
 
 
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+})
+class ServiceSyncEngineTestCase(TestCase):
+    """Tests pour le traitement groupé des synchronisations"""
+    
+    def setUp(self):
+        self.engine = ServiceSyncEngine(batch_size=50, workers=1)
+    
+    def create_sync(self, object_type, object_uuid, sync_type='create', **data):
+        return ServiceSync.objects.create(
+            source_service='catalog_service',
+            target_service='recommendation_service',
+            sync_type=sync_type,
+            object_type=object_type,
+            object_uuid=object_uuid,
+            sync_data=data
+        )
+    
+    def test_bulk_upsert_and_deactivate(self):
+        """Créations, mises à jour et suppressions sont appliquées par groupe"""
+        book_uuid = uuid.uuid4()
+        deleted_uuid = uuid.uuid4()
+        BookReference.objects.create(book_uuid=deleted_uuid, title='Ancien', slug='ancien')
+        author_uuid = uuid.uuid4()
+        
+        self.create_sync('Book', book_uuid, title='Premier titre', slug='premier-titre')
+        self.create_sync('Book', book_uuid, sync_type='update', title='Titre final', slug='titre-final')
+        self.create_sync('Book', deleted_uuid, sync_type='delete')
+        self.create_sync('Author', author_uuid, name='Mariama Bâ', slug='mariama-ba')
+        
+        with self.assertNumQueries(14):
+            stats = self.engine.run()
+        
+        self.assertEqual(stats['claimed'], 4)
+        self.assertEqual(stats['completed'], 4)
+        self.assertEqual(stats['backlog'], 0)
+        self.assertEqual(BookReference.objects.get(book_uuid=book_uuid).title, 'Titre final')
+        self.assertFalse(BookReference.objects.get(book_uuid=deleted_uuid).is_active)
+        self.assertEqual(AuthorReference.objects.get(author_uuid=author_uuid).name, 'Mariama Bâ')
+        self.assertFalse(ServiceSync.objects.exclude(status='completed').exists())
+        self.assertEqual(cache.get(SERVICE_SYNC_METRICS_KEY)['completed'], 4)
+    
+    def test_conflicting_task_fails_alone(self):
+        """Un slug en conflit n'échoue que la tâche fautive"""
+        BookReference.objects.create(book_uuid=uuid.uuid4(), title='Existant', slug='pris')
+        good = self.create_sync('Book', uuid.uuid4(), title='Libre', slug='libre')
+        bad = self.create_sync('Book', uuid.uuid4(), title='Doublon', slug='pris')
+        
+        stats = self.engine.run()
+        
+        good.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(good.status, 'completed')
+        self.assertEqual(bad.status, 'failed')
+        self.assertTrue(bad.error_message)
+    
+    def test_claimed_tasks_are_not_reclaimed(self):
+        """Une tâche réclamée n'est plus proposée aux autres workers"""
+        self.create_sync('Book', uuid.uuid4(), title='Livre', slug='livre')
+        
+        self.assertEqual(len(self.engine.claim()), 1)
+        self.assertEqual(self.engine.claim(), [])
+        
+        # Bail expiré : la tâche redevient réclamable
+        ServiceSync.objects.update(started_at=timezone.now() - timezone.timedelta(hours=1))
+        self.assertEqual(len(self.engine.claim()), 1)
+
+
 class CatalogServiceClientTestCase(TestCase):
     """Tests pour CatalogServiceClient"""
     
@@ -292,7 +506,7 @@ class CatalogServiceClientTestCase(TestCase):
         self.client = CatalogServiceClient()
         self.book_uuid = uuid.uuid4()
     
-    @patch('shared_models.api_client.requests.Session.get')
+    @patch('shared_models.transport.requests.Session.get')
     def test_get_book_success(self, mock_get):
         """Test de récupération réussie d'un livre"""
         mock_response = MagicMock()
@@ -310,7 +524,7 @@ class CatalogServiceClientTestCase(TestCase):
         self.assertEqual(book_data['title'], 'Test Book')
         mock_get.assert_called_once()
     
-    @patch('shared_models.api_client.requests.Session.get')
+    @patch('shared_models.transport.requests.Session.get')
     def test_get_book_error(self, mock_get):
         """Test de gestion d'erreur lors de la récupération d'un livre"""
         mock_get.side_effect = Exception('Network error')
@@ -319,7 +533,7 @@ class CatalogServiceClientTestCase(TestCase):
         
         self.assertIsNone(book_data)
     
-    @patch('shared_models.api_client.requests.Session.post')
+    @patch('shared_models.transport.requests.Session.post')
     def test_get_books_batch(self, mock_post):
         """Test de récupération en lot de livres"""
         book_uuids = [uuid.uuid4(), uuid.uuid4()]
@@ -341,6 +555,181 @@ class CatalogServiceClientTestCase(TestCase):
         self.assertEqual(books_data[str(book_uuids[1])]['title'], 'Book 2')
 
 
+def make_response(status_code=200, body=b'{}'):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    return response
+
+
+class ServiceTransportTestCase(TestCase):
+    """Tests pour le transport HTTP inter-services"""
+    
+    def setUp(self):
+        options = dict(DEFAULT_HTTP_OPTIONS, backoff_base=0, breaker_failure_threshold=2)
+        self.transport = ServiceTransport('test_service', 'http://service.test/api/', options)
+        self.transport.session.get = MagicMock()
+        self.transport.session.post = MagicMock()
+    
+    def test_retries_idempotent_requests(self):
+        """Un GET est retenté sur erreur transitoire, pas un POST"""
+        self.transport.session.get.side_effect = [make_response(503), make_response(200, b'{"ok": true}')]
+        
+        response = self.transport.request('GET', 'books/')
+        
+        self.assertEqual(response.json(), {'ok': True})
+        self.assertEqual(self.transport.session.get.call_count, 2)
+        
+        self.transport.session.post.return_value = make_response(503)
+        with self.assertRaises(ServiceAPIError) as context:
+            self.transport.request('POST', 'books/', json={})
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(self.transport.session.post.call_count, 1)
+    
+    def test_client_errors_are_not_retried(self):
+        """Une erreur 4xx n'est ni retentée ni comptée par le disjoncteur"""
+        self.transport.session.get.return_value = make_response(404)
+        
+        for _ in range(3):
+            with self.assertRaises(ServiceAPIError):
+                self.transport.request('GET', 'books/missing/')
+        
+        self.assertEqual(self.transport.session.get.call_count, 3)
+        self.assertEqual(self.transport.breaker.state, 'closed')
+    
+    def test_circuit_breaker_opens_and_recovers(self):
+        """Le disjoncteur coupe les appels après des échecs puis laisse passer un essai"""
+        self.transport.session.get.side_effect = requests.exceptions.ConnectionError('down')
+        self.transport.options['max_attempts'] = 1
+        
+        for _ in range(2):
+            with self.assertRaises(ServiceAPIError):
+                self.transport.request('GET', 'books/')
+        with self.assertRaises(CircuitOpenError):
+            self.transport.request('GET', 'books/')
+        self.assertEqual(self.transport.session.get.call_count, 2)
+        
+        self.transport.breaker.reset_timeout = 0
+        self.transport.session.get.side_effect = None
+        self.transport.session.get.return_value = make_response(200)
+        self.transport.request('GET', 'books/')
+        self.assertEqual(self.transport.breaker.state, 'closed')
+
+    def test_expired_deadline_does_not_hold_the_probe(self):
+        """Une échéance dépassée n'immobilise pas l'appel d'essai du disjoncteur"""
+        self.transport.session.get.side_effect = requests.exceptions.ConnectionError('down')
+        self.transport.options['max_attempts'] = 1
+        for _ in range(2):
+            with self.assertRaises(ServiceAPIError):
+                self.transport.request('GET', 'books/')
+
+        self.transport.breaker.reset_timeout = 0
+        with deadline(0):
+            with self.assertRaises(DeadlineExceeded):
+                self.transport.request('GET', 'books/')
+
+        self.transport.session.get.side_effect = None
+        self.transport.session.get.return_value = make_response(200)
+        self.transport.request('GET', 'books/')
+        self.assertEqual(self.transport.breaker.state, 'closed')
+
+    def test_deadline_is_propagated(self):
+        """L'échéance borne le délai d'attente et est transmise au service appelé"""
+        self.transport.session.get.return_value = make_response(200)
+        
+        with deadline(1.5):
+            self.transport.request('GET', 'books/')
+        
+        kwargs = self.transport.session.get.call_args.kwargs
+        self.assertLessEqual(kwargs['timeout'][1], 1.5)
+        self.assertLessEqual(int(kwargs['headers']['X-Request-Deadline']), 1500)
+        
+        with deadline(0):
+            with self.assertRaises(DeadlineExceeded):
+                self.transport.request('GET', 'books/')
+    
+    @override_settings(INTER_SERVICE_TOKEN='secret', INTER_SERVICE_TRUSTED_NETWORKS=['10.0.0.0/8'])
+    def test_deadline_header_is_honoured_only_from_trusted_callers(self):
+        """Un client externe ne peut pas imposer l'échéance des appels sortants"""
+        middleware = DeadlineMiddleware(lambda request: remaining_time())
+        factory = RequestFactory()
+
+        external = factory.get('/', HTTP_X_REQUEST_DEADLINE='0', REMOTE_ADDR='203.0.113.7')
+        forged = factory.get('/', HTTP_X_REQUEST_DEADLINE='0', HTTP_X_SERVICE_TOKEN='guess',
+                             REMOTE_ADDR='203.0.113.7')
+        with_token = factory.get('/', HTTP_X_REQUEST_DEADLINE='500', HTTP_X_SERVICE_TOKEN='secret',
+                                 REMOTE_ADDR='203.0.113.7')
+        internal = factory.get('/', HTTP_X_REQUEST_DEADLINE='500', REMOTE_ADDR='10.1.2.3')
+
+        self.assertIsNone(middleware(external))
+        self.assertIsNone(middleware(forged))
+        self.assertLessEqual(middleware(with_token), 0.5)
+        self.assertLessEqual(middleware(internal), 0.5)
+        self.assertEqual(
+            ServiceTransport('test_service', 'http://service.test/').session.headers['X-Service-Token'],
+            'secret'
+        )
+
+    def test_pool_wait_is_bounded_by_connect_timeout(self):
+        """Un pool saturé n'attend pas au-delà du délai de connexion"""
+        transport = ServiceTransport('test_service', 'http://service.test/', dict(DEFAULT_HTTP_OPTIONS, pool_maxsize=1))
+        pool = transport.session.get_adapter('http://service.test/').poolmanager.connection_from_url('http://service.test/')
+        pool._get_conn()
+        
+        started = time.monotonic()
+        with self.assertRaises(EmptyPoolError):
+            pool.urlopen('GET', '/', timeout=Timeout(connect=0.05, read=1))
+        self.assertLess(time.monotonic() - started, 1)
+    
+    def test_pool_exhaustion_is_counted_without_tripping_breaker(self):
+        """Une saturation du pool est comptée mais n'ouvre pas le disjoncteur"""
+        self.transport.session.get.side_effect = EmptyPoolError(None, 'pool full')
+        
+        for _ in range(3):
+            with self.assertRaises(ServiceAPIError):
+                self.transport.request('GET', 'books/')
+        
+        self.assertEqual(self.transport.session.get.call_count, 3)
+        self.assertEqual(self.transport.pool_exhausted, 3)
+        self.assertEqual(self.transport.breaker.state, 'closed')
+
+    def test_latency_histogram_per_endpoint(self):
+        """Les latences sont regroupées par endpoint paramétré"""
+        self.transport.session.get.return_value = make_response(200)
+        
+        self.transport.request('GET', f'books/{uuid.uuid4()}/')
+        self.transport.request('GET', f'books/{uuid.uuid4()}/')
+        
+        stats = self.transport.latency_stats()
+        self.assertEqual(stats['GET /books/{id}/']['count'], 2)
+        self.assertIsNotNone(stats['GET /books/{id}/']['p95_ms'])
+        self.assertEqual(endpoint_template('get', 'sessions/42/'), 'get /sessions/{id}/')
+    
+    def test_gather_runs_calls_concurrently(self):
+        """`gather` exécute les appels en parallèle et conserve leur ordre"""
+        client = ServiceAPIClient('test_service', base_url='http://service.test/api/')
+        client.transport = self.transport
+        barrier = threading.Barrier(3, timeout=2)
+        
+        def respond(url, **kwargs):
+            barrier.wait()
+            return make_response(200, ('{"url": "%s"}' % url).encode())
+        
+        self.transport.session.get.side_effect = respond
+        
+        results = gather([client.call('GET', f'books/{i}/') for i in range(3)])
+        
+        self.assertEqual(
+            [result['url'] for result in results],
+            [f'http://service.test/api/books/{i}/' for i in range(3)]
+        )
+        
+        self.transport.session.get.side_effect = None
+        self.transport.session.get.return_value = make_response(404)
+        results = gather([client.call('GET', 'books/1/')], return_exceptions=True)
+        self.assertIsInstance(results[0], ServiceAPIError)
+
+
 class IntegrationTestCase(TestCase):
     """Tests d'intégration pour le système complet"""
     
@@ -397,7 +786,7 @@ class CacheTestCase(TestCase):
         self.client = CatalogServiceClient()
         self.book_uuid = uuid.uuid4()
     
-    @patch('shared_models.api_client.requests.Session.get')
+    @patch('shared_models.transport.requests.Session.get')
     def test_cache_behavior(self, mock_get):
         """Test du comportement du cache"""
         mock_response = MagicMock()
@@ -417,4 +806,294 @@ class CacheTestCase(TestCase):
         self.assertEqual(mock_get.call_count, 1)  # Pas d'appel supplémentaire
         
         # Vérifier que les données sont identiques
-        self.assertEqual(book_data1, book_data2)
\ No newline at end of file
+        self.assertEqual(book_data1, book_data2)    
+    @patch('shared_models.transport.requests.Session.post')
+    def test_books_batch_cache_behavior(self, mock_post):
+        """Test du cache des lectures groupées (un seul aller-retour cache)"""
+        cached_uuid, missing_uuid = uuid.uuid4(), uuid.uuid4()
+        cache.set(f"book_summary_{cached_uuid}", {'title': 'Cached Book'})
+        
+        mock_response = MagicMock()
+        mock_response.json.return_value = {'books': {str(missing_uuid): {'title': 'Fetched Book'}}}
+        mock_response.raise_for_status.return_value = None
+        mock_post.return_value = mock_response
+        
+        with patch('shared_models.api_client.cache.get_many', wraps=cache.get_many) as get_many:
+            books = self.client.get_books_batch([cached_uuid, missing_uuid, missing_uuid])
+        
+        get_many.assert_called_once()
+        self.assertEqual(books[str(cached_uuid)]['title'], 'Cached Book')
+        self.assertEqual(books[str(missing_uuid)]['title'], 'Fetched Book')
+        self.assertEqual(mock_post.call_args.kwargs['json'], {'book_uuids': [str(missing_uuid)]})
+        
+        # Deuxième appel - tout vient du cache
+        self.client.get_books_batch([cached_uuid, missing_uuid])
+        self.assertEqual(mock_post.call_count, 1)
+
+
+class ExportStreamingTestCase(TestCase):
+    """Tests pour les exports en flux (CSV, NDJSON, ZIP, exports en arrière-plan)"""
+    
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from auth_service.models import Role, UserRole
+        from catalog_service.models import Author, Book, Category
+        
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage'
+        )
+        self.settings_override.enable()
+        
+        self.user = get_user_model().objects.create_user(
+            username='chinua',
+            email='chinua@example.com',
+            password='testpass123',
+            first_name='Chinua',
+            last_name='Achebe'
+        )
+        UserRole.objects.create(user=self.user, role=Role.objects.create(name='author'))
+        
+        author = Author.objects.create(first_name='Chinua', last_name='Achebe', user=self.user)
+        co_author = Author.objects.create(first_name='Wole', last_name='Soyinka')
+        category = Category.objects.create(name='Roman')
+        for index in range(3):
+            book = Book.objects.create(
+                title=f'Livre {index}',
+                description='Description',
+                rating_sum=9,
+                rating_count=2,
+                rating_average=4.5,
+                rating_histogram={'1': 0, '2': 0, '3': 0, '4': 1, '5': 1},
+            )
+            book.authors.add(author, co_author)
+            book.categories.add(category)
+        
+        self.client.force_login(self.user)
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+    
+    def _read_zip(self, content):
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            return {name: archive.read(name).decode('utf-8') for name in archive.namelist()}
+    
+    def test_zip_stream_yields_entries_incrementally(self):
+        """L'archive est produite par morceaux et reste lisible"""
+        rows = ({'index': index, 'payload': uuid.uuid4().hex} for index in range(2000))
+        chunks = list(iter_zip([('lignes.ndjson', iter_ndjson(rows)), ('README.txt', [b'ok'])]))
+        
+        self.assertGreater(len(chunks), 2)
+        files = self._read_zip(b''.join(chunks))
+        lines = files['lignes.ndjson'].splitlines()
+        self.assertEqual(len(lines), 2000)
+        self.assertEqual(json.loads(lines[-1])['index'], 1999)
+        self.assertEqual(files['README.txt'], 'ok')
+    
+    def test_iter_csv(self):
+        """En-tête puis une ligne CSV par élément, listes jointes"""
+        content = b''.join(iter_csv(
+            [('title', 'Titre'), ('categories', 'Catégories')],
+            [{'title': 'Le monde s\'effondre', 'categories': ['Roman', 'Classique']}]
+        )).decode('utf-8')
+        
+        self.assertEqual(content.splitlines(), ['Titre,Catégories', 'Le monde s\'effondre,"Roman, Classique"'])
+    
+    def test_books_export_query_count(self):
+        """Les livres sont lus par curseur sans requête par livre"""
+        exporter = AuthorExportAPI(self.user)
+        
+        # Livres, catégories et auteurs préchargés
+        with self.assertNumQueries(3):
+            rows = list(exporter.iter_books())
+        
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['co_authors'], ['Wole Soyinka'])
+        self.assertEqual(rows[0]['categories'], ['Roman'])
+        self.assertEqual(rows[0]['average_rating'], 4.5)
+        self.assertEqual(rows[0]['rating_distribution']['5_stars'], 1)
+    
+    def test_books_csv_is_streamed(self):
+        """Le format CSV est servi en flux"""
+        response = self.client.get(reverse('dashboard:export_author_books'), {'format': 'csv'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('ID,Titre'))
+    
+    def test_complete_package_is_streamed(self):
+        """L'export complet est une archive ZIP servie en flux"""
+        response = self.client.get(reverse('dashboard:export_complete_package'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        files = self._read_zip(b''.join(response.streaming_content))
+        self.assertIn('README.txt', files)
+        self.assertEqual(len(files['auteur_livres.ndjson'].splitlines()), 3)
+        self.assertEqual(len(files['auteur_revenus.ndjson'].splitlines()), 3)
+    
+    @patch('shared_models.tasks.build_export_package.delay')
+    def test_large_package_runs_in_background(self, mock_delay):
+        """Au-delà du seuil, l'export est construit en arrière-plan puis téléchargé"""
+        with patch('shared_models.export_apis.EXPORT_ASYNC_THRESHOLD', 2):
+            response = self.client.get(reverse('dashboard:export_complete_package'))
+        
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        mock_delay.assert_called_once_with(job_id, str(self.user.pk))
+        
+        job_url = reverse('dashboard:export_package_job', kwargs={'job_id': job_id})
+        self.assertEqual(self.client.get(job_url).status_code, 202)
+        
+        result = build_export_package(job_id, str(self.user.pk))
+        self.assertTrue(result['success'])
+        
+        response = self.client.get(job_url)
+        self.assertEqual(response.status_code, 200)
+        files = self._read_zip(b''.join(response.streaming_content))
+        self.assertEqual(len(files['auteur_livres.ndjson'].splitlines()), 3)
+        self.assertEqual(export_jobs.purge(older_than_seconds=-60), 1)
+    
+    def test_author_name_does_not_grant_access(self):
+        """Un compte renommé comme un auteur n'exporte pas ses livres"""
+        from django.contrib.auth import get_user_model
+        from auth_service.models import Role, UserRole
+        
+        impostor = get_user_model().objects.create_user(
+            username='impostor',
+            email='impostor@example.com',
+            password='testpass123',
+            first_name='Chinua',
+            last_name='Achebe'
+        )
+        UserRole.objects.create(user=impostor, role=Role.objects.get(name='author'))
+        exporter = AuthorExportAPI(impostor)
+        
+        self.assertFalse(exporter.is_author)
+        self.assertEqual(exporter.author_books().count(), 0)
+        self.assertEqual(exporter.get_author_books_data(), {'error': 'Permissions insuffisantes'})
+    
+    @patch('shared_models.tasks.build_export_package.delay')
+    def test_repeated_async_requests_queue_one_job(self, mock_delay):
+        """Les demandes répétées renvoient l'export déjà en cours"""
+        url = reverse('dashboard:export_complete_package')
+        first = self.client.get(url, {'async': '1'})
+        second = self.client.get(url, {'async': '1'})
+        
+        self.assertEqual(second.status_code, 202)
+        self.assertEqual(first.json()['job_id'], second.json()['job_id'])
+        mock_delay.assert_called_once()
+        
+        # Une fois l'export terminé, une nouvelle demande est acceptée
+        build_export_package(first.json()['job_id'], str(self.user.pk))
+        self.assertNotEqual(self.client.get(url, {'async': '1'}).json()['job_id'], first.json()['job_id'])
+
+
+class AnalyticsRollupTestCase(TestCase):
+    """Tests pour les agrégats analytiques (rollups) du dashboard"""
+    
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        
+        self.user = get_user_model().objects.create_user(
+            username='aminata',
+            email='aminata@example.com',
+            password='testpass123',
+            country='SN'
+        )
+        self.now = floor_hour(timezone.now()) + timezone.timedelta(minutes=30)
+        self.engine = RollupEngine(restate_hours=3)
+    
+    def _payment(self, hours_ago, status='completed', provider='orange_money', amount='1000.00'):
+        payment = PaymentTransaction.objects.create(
+            user=self.user,
+            amount=Decimal(amount),
+            transaction_type='subscription',
+            status=status,
+            payment_provider=provider,
+            country_code='SN',
+            fees=Decimal('10.00'),
+            net_amount=Decimal(amount) - Decimal('10.00'),
+        )
+        created_at = self.now - timezone.timedelta(hours=hours_ago)
+        PaymentTransaction.objects.filter(pk=payment.pk).update(
+            created_at=created_at,
+            completed_at=created_at + timezone.timedelta(minutes=2) if status == 'completed' else None
+        )
+        return payment
+    
+    def test_run_builds_hour_and_day_rows(self):
+        """Un passage agrège par heure puis reconstruit les jours à partir des heures"""
+        self._payment(50)
+        self._payment(50, provider='wave')
+        self._payment(49, status='failed')
+        
+        self.engine.run(now=self.now)
+        
+        hours = AnalyticsRollup.objects.filter(metric='payments', granularity='hour')
+        days = AnalyticsRollup.objects.filter(metric='payments', granularity='day')
+        self.assertEqual(sum(hours.values_list('count', flat=True)), 3)
+        self.assertEqual(sum(days.values_list('count', flat=True)), 3)
+        self.assertEqual(
+            hours.get(provider='wave').amount, Decimal('990.00')
+        )
+        watermark = RollupWatermark.objects.get(source='payments')
+        self.assertEqual(watermark.position, floor_hour(self.now))
+    
+    def test_restate_window_absorbs_late_changes(self):
+        """Les dernières heures sont recalculées ; le filigrane ne recule jamais"""
+        payment = self._payment(1, status='pending')
+        self.engine.run(now=self.now)
+        
+        PaymentTransaction.objects.filter(pk=payment.pk).update(status='completed')
+        self.engine.run(now=self.now)
+        
+        rows = AnalyticsRollup.objects.filter(metric='payments', granularity='hour')
+        self.assertEqual(list(rows.values_list('status', 'count')), [('completed', 1)])
+        
+        self.engine.rebuild(self.engine.sources['payments'], self.now - timezone.timedelta(days=5), self.now - timezone.timedelta(days=4))
+        self.assertEqual(RollupWatermark.objects.get(source='payments').position, floor_hour(self.now))
+    
+    def test_query_combines_days_and_edge_hours(self):
+        """Jours complets et heures des bords sont comptés une seule fois"""
+        for hours_ago in (1, 30, 60, 90):
+            self._payment(hours_ago)
+        self.engine.run(now=self.now)
+        
+        query = RollupQuery(self.now - timezone.timedelta(hours=75), self.now)
+        self.assertEqual(query.total('payments')['count'], 3)
+        self.assertEqual(sum(row['count'] for row in query.series('payments')), 3)
+        self.assertEqual(sum(query.hour_of_day('payments').values()), 3)
+    
+    def test_snapshot_counts_current_state(self):
+        """L'instantané du jour répartit les utilisateurs par pays"""
+        self.engine.run(now=self.now)
+        
+        self.assertEqual(latest_snapshot('user_base', ['country']), {'SN': 1})
+    
+    def test_financial_report_reads_rollups(self):
+        """Le rapport financier lit les agrégats et non la table des transactions"""
+        self._payment(30)
+        self._payment(30, provider='wave')
+        self._payment(29, status='failed', provider='wave')
+        self.engine.run(now=self.now)
+        
+        report = FinancialReport(self.now - timezone.timedelta(days=7), self.now)
+        overview = report.get_revenue_overview()
+        self.assertEqual(overview['transaction_count'], 2)
+        self.assertEqual(overview['total_revenue'], 1980.0)
+        self.assertEqual(overview['revenue_by_country'], {'SN': 1980.0})
+        
+        performance = report.get_provider_performance()
+        self.assertEqual(performance['Wave']['total_transactions'], 2)
+        self.assertEqual(performance['Wave']['success_rate'], 50.0)
+        self.assertAlmostEqual(performance['Wave']['avg_processing_time_minutes'], 2.0)
+        
+        # Les nouvelles transactions n'apparaissent qu'après le passage suivant
+        self._payment(20)
+        self.assertEqual(report.get_revenue_overview()['transaction_count'], 2)
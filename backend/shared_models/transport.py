@@ -0,0 +1,584 @@
+"""
+Transport HTTP inter-services.
+
+Couche sous `ServiceAPIClient` :
+
+- un pool de connexions keep-alive par service, partagé par tous les clients
+  du processus et borné (`pool_maxsize`) ; l'attente d'une connexion libre
+  est bornée par le délai de connexion, lui-même borné par l'échéance ;
+- une échéance (`deadline`) propagée aux appels sortants et aux services
+  appelés via l'en-tête `X-Request-Deadline` (millisecondes restantes),
+  accompagné du jeton `X-Service-Token` qui l'authentifie ;
+- des nouvelles tentatives avec attente exponentielle à gigue complète,
+  limitées par un budget (une fraction des requêtes réussies) pour ne pas
+  amplifier une panne ;
+- un disjoncteur par service qui échoue immédiatement tant que le service
+  est considéré indisponible ;
+- `gather` pour lancer plusieurs appels en parallèle sur un pool de threads ;
+- un histogramme de latence par service et par endpoint.
+
+Configuration : `INTER_SERVICE_HTTP = {'default': {...}, '<service>': {...}}`.
+"""
+import contextvars
+import hmac
+import ipaddress
+import logging
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = 'X-Request-Deadline'
+SERVICE_TOKEN_HEADER = 'X-Service-Token'
+
+DEFAULT_HTTP_OPTIONS = {
+    'pool_connections': 4,
+    'pool_maxsize': 20,
+    'connect_timeout': 2.0,
+    'read_timeout': getattr(settings, 'INTER_SERVICE_TIMEOUT', 10),
+    'max_attempts': 3,
+    'backoff_base': 0.05,
+    'backoff_cap': 1.0,
+    'retry_budget_ratio': 0.2,
+    'retry_budget_min': 10,
+    'breaker_failure_threshold': 5,
+    'breaker_reset_timeout': 30.0,
+}
+
+GATHER_MAX_WORKERS = getattr(settings, 'INTER_SERVICE_GATHER_WORKERS', 16)
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_ID_SEGMENT_RE = re.compile(
+    r'(?<=/)([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d+)(?=/|$)',
+    re.IGNORECASE
+)
+
+
+class ServiceAPIError(Exception):
+    """
+    Exception pour les erreurs d'API inter-services.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(ServiceAPIError):
+    """Le disjoncteur du service est ouvert : appel refusé sans réseau"""
+
+
+class DeadlineExceeded(ServiceAPIError):
+    """L'échéance de la requête en cours est dépassée"""
+
+
+def http_options(service_name: str) -> Dict[str, Any]:
+    """Options du service, complétées par les valeurs `default` puis intégrées"""
+    configured = getattr(settings, 'INTER_SERVICE_HTTP', {})
+    options = dict(DEFAULT_HTTP_OPTIONS)
+    options.update(configured.get('default', {}))
+    options.update(configured.get(service_name, {}))
+    return options
+
+
+# Échéances
+
+_deadline = contextvars.ContextVar('inter_service_deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    Borner la durée des appels inter-services du bloc.
+
+    Une échéance imbriquée ne peut pas repousser l'échéance englobante.
+    """
+    expires_at = time.monotonic() + max(seconds, 0)
+    current = _deadline.get()
+    if current is not None:
+        expires_at = min(expires_at, current)
+    token = _deadline.set(expires_at)
+    try:
+        yield expires_at
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Secondes restantes avant l'échéance courante (None sans échéance)"""
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return expires_at - time.monotonic()
+
+
+def _trusted_networks():
+    networks = []
+    for network in getattr(settings, 'INTER_SERVICE_TRUSTED_NETWORKS', []):
+        try:
+            networks.append(ipaddress.ip_network(network, strict=False))
+        except ValueError:
+            logger.warning(f"Réseau inter-services invalide ignoré: {network}")
+    return tuple(networks)
+
+
+class DeadlineMiddleware:
+    """
+    Adopter l'échéance transmise par le service appelant
+
+    L'en-tête n'est pris en compte que pour un appelant de confiance (jeton
+    `INTER_SERVICE_TOKEN` ou adresse dans `INTER_SERVICE_TRUSTED_NETWORKS`) :
+    un client externe ne peut pas imposer une échéance nulle à chaque appel.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.trusted_networks = _trusted_networks()
+
+    def __call__(self, request):
+        header = request.META.get('HTTP_X_REQUEST_DEADLINE')
+        try:
+            budget_ms = int(header) if header else None
+        except ValueError:
+            budget_ms = None
+
+        if budget_ms is None or not self.is_trusted(request):
+            return self.get_response(request)
+        with deadline(budget_ms / 1000):
+            return self.get_response(request)
+
+    def is_trusted(self, request) -> bool:
+        token = getattr(settings, 'INTER_SERVICE_TOKEN', '')
+        presented = request.META.get('HTTP_X_SERVICE_TOKEN', '')
+        if token and presented and hmac.compare_digest(presented.encode(), token.encode()):
+            return True
+        if not self.trusted_networks:
+            return False
+        try:
+            address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_networks)
+
+
+# Résilience
+
+class RetryBudget:
+    """
+    Budget de nouvelles tentatives (seau à jetons)
+
+    Chaque requête dépose `ratio` jeton, chaque nouvelle tentative en retire
+    un : en régime dégradé, les tentatives restent une fraction du trafic.
+    """
+
+    def __init__(self, ratio: float, minimum: int):
+        self.ratio = ratio
+        self.capacity = float(minimum)
+        self._tokens = float(minimum)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.capacity)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur à trois états
+
+    Fermé : les appels passent. Ouvert après `failure_threshold` échecs
+    consécutifs : les appels échouent sans réseau. Après `reset_timeout`,
+    un seul appel d'essai passe (semi-ouvert) et décide de la suite.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """Rendre l'appel d'essai réservé sans juger le service (échec local)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Disjoncteur ouvert après {self._failures} échec(s)")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+# Mesures
+
+class LatencyHistogram:
+    """Histogramme de latence à seaux fixes (millisecondes)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.errors = 0
+
+    def observe(self, duration_ms: float, error: bool = False):
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if duration_ms <= bound:
+                index = position
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        if error:
+            self.errors += 1
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        """Borne supérieure du seau contenant le quantile demandé"""
+        if not self.count:
+            return None
+        rank = quantile * self.count
+        seen = 0
+        for position, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return float(self.buckets[position]) if position < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.count, 2) if self.count else None,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], self.counts)),
+        }
+
+
+def endpoint_template(method: str, endpoint: str) -> str:
+    """Regrouper les endpoints paramétrés (`books/{id}/`) dans les mesures"""
+    path = '/' + endpoint.lstrip('/')
+    return f"{method} {_ID_SEGMENT_RE.sub('{id}', path)}"
+
+
+# Transport
+
+class _BoundedPoolMixin:
+    """
+    Pool bloquant dont l'attente d'une connexion libre est bornée
+
+    `requests` ne transmet pas de `pool_timeout` : sans lui, un appel attend
+    indéfiniment qu'une connexion se libère, au-delà de l'échéance. L'attente
+    reprend le délai de connexion de la requête, déjà borné par l'échéance.
+    """
+
+    def urlopen(self, method, url, *args, **kwargs):
+        if kwargs.get('pool_timeout') is None:
+            connect_timeout = getattr(kwargs.get('timeout'), 'connect_timeout', None)
+            if isinstance(connect_timeout, (int, float)):
+                kwargs['pool_timeout'] = connect_timeout
+        return super().urlopen(method, url, *args, **kwargs)
+
+
+class _BoundedHTTPConnectionPool(_BoundedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _BoundedHTTPSConnectionPool(_BoundedPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class BoundedPoolAdapter(HTTPAdapter):
+    """Adaptateur HTTP dont les pools bornent l'attente d'une connexion"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _BoundedHTTPConnectionPool,
+            'https': _BoundedHTTPSConnectionPool,
+        }
+
+
+class ServiceTransport:
+    """
+    Transport HTTP d'un service : pool, échéance, tentatives, disjoncteur
+    """
+
+    def __init__(self, service_name: str, base_url: str, options: Optional[Dict[str, Any]] = None):
+        self.service_name = service_name
+        self.base_url = base_url
+        self.options = options or http_options(service_name)
+
+        self.session = requests.Session()
+        adapter = BoundedPoolAdapter(
+            pool_connections=self.options['pool_connections'],
+            pool_maxsize=self.options['pool_maxsize'],
+            pool_block=True,
+            max_retries=0
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+        })
+        service_token = getattr(settings, 'INTER_SERVICE_TOKEN', '')
+        if service_token:
+            self.session.headers[SERVICE_TOKEN_HEADER] = service_token
+
+        self.breaker = CircuitBreaker(
+            self.options['breaker_failure_threshold'],
+            self.options['breaker_reset_timeout']
+        )
+        self.retry_budget = RetryBudget(
+            self.options['retry_budget_ratio'],
+            self.options['retry_budget_min']
+        )
+        self._latencies: Dict[str, LatencyHistogram] = {}
+        self._latency_lock = threading.Lock()
+        # Appels abandonnés faute de connexion libre dans le pool
+        self.pool_exhausted = 0
+
+    def request(self, method: str, endpoint: str, idempotent: Optional[bool] = None,
+                **kwargs) -> requests.Response:
+        """
+        Envoyer une requête et retourner la réponse (statut 2xx).
+
+        `idempotent` autorise les nouvelles tentatives pour un POST qui ne
+        modifie rien (lecture groupée par exemple).
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
+        template = endpoint_template(method, endpoint)
+        max_attempts = self.options['max_attempts'] if idempotent else 1
+        extra_headers = kwargs.pop('headers', None)
+
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            # Échéance vérifiée avant `allow()` : un appel d'essai réservé doit
+            # toujours aboutir à record_success/record_failure
+            timeout, headers = self._timeout_and_headers(extra_headers)
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {self.service_name}")
+
+            started = time.monotonic()
+            try:
+                response = getattr(self.session, method.lower())(
+                    url, timeout=timeout, headers=headers, **kwargs
+                )
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                status_code = getattr(getattr(e, 'response', None), 'status_code', None)
+                retryable = status_code is None or status_code in RETRY_STATUSES
+                server_failure = status_code is None or status_code >= 500
+                self._observe(template, started, error=True)
+                if server_failure:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+
+                if retryable and attempt < max_attempts and self._backoff(attempt):
+                    logger.info(f"Nouvelle tentative {self.service_name} {template} ({attempt}): {e}")
+                    continue
+                logger.error(f"Error calling {self.service_name} {template}: {e}")
+                raise ServiceAPIError(f"Failed to call {self.service_name}: {e}", status_code) from e
+            except EmptyPoolError as e:
+                # Pool saturé localement : ni nouvelle tentative ni échec du service
+                self._observe(template, started, error=True)
+                self.breaker.release()
+                with self._latency_lock:
+                    self.pool_exhausted += 1
+                logger.warning(f"Pool de connexions saturé pour {self.service_name} {template}")
+                raise ServiceAPIError(f"Connection pool exhausted for {self.service_name}") from e
+            except Exception as e:
+                # Erreur inattendue : libérer un éventuel appel d'essai du disjoncteur
+                self._observe(template, started, error=True)
+                self.breaker.record_failure()
+                logger.error(f"Error calling {self.service_name} {template}: {e}")
+                raise ServiceAPIError(f"Failed to call {self.service_name}: {e}") from e
+
+            self._observe(template, started)
+            self.breaker.record_success()
+            return response
+
+    def latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._latency_lock:
+            return {template: histogram.snapshot() for template, histogram in self._latencies.items()}
+
+    def _timeout_and_headers(self, headers: Optional[Dict[str, str]]):
+        headers = dict(headers or {})
+        connect_timeout = self.options['connect_timeout']
+        read_timeout = self.options['read_timeout']
+
+        remaining = remaining_time()
+        if remaining is not None:
+            if remaining <= 0:
+                raise DeadlineExceeded(f"Deadline exceeded before calling {self.service_name}")
+            connect_timeout = min(connect_timeout, remaining)
+            read_timeout = min(read_timeout, remaining)
+            headers[DEADLINE_HEADER] = str(int(remaining * 1000))
+        return (connect_timeout, read_timeout), headers
+
+    def _backoff(self, attempt: int) -> bool:
+        """Attendre avant une nouvelle tentative ; False si budget ou échéance épuisés"""
+        delay = random.uniform(0, min(self.options['backoff_cap'], self.options['backoff_base'] * 2 ** attempt))
+        remaining = remaining_time()
+        if remaining is not None and remaining <= delay:
+            return False
+        if not self.retry_budget.withdraw():
+            logger.warning(f"Budget de nouvelles tentatives épuisé pour {self.service_name}")
+            return False
+        time.sleep(delay)
+        return True
+
+    def _observe(self, template: str, started: float, error: bool = False):
+        duration_ms = (time.monotonic() - started) * 1000
+        with self._latency_lock:
+            histogram = self._latencies.get(template)
+            if histogram is None:
+                histogram = self._latencies[template] = LatencyHistogram()
+            histogram.observe(duration_ms, error)
+
+
+_transports: Dict[str, ServiceTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(service_name: str, base_url: str) -> ServiceTransport:
+    """Transport partagé du service (un pool par service et par URL)"""
+    key = f"{service_name}|{base_url}"
+    transport = _transports.get(key)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.get(key)
+            if transport is None:
+                transport = _transports[key] = ServiceTransport(service_name, base_url)
+    return transport
+
+
+def latency_stats() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Histogrammes de latence de tous les transports, par service puis endpoint"""
+    stats = {}
+    for transport in list(_transports.values()):
+        stats.setdefault(transport.service_name, {}).update(transport.latency_stats())
+    return stats
+
+
+# Appels parallèles
+
+@dataclass
+class ServiceCall:
+    """Appel différé, exécuté par `gather`"""
+
+    client: Any
+    method: str
+    endpoint: str
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+    def run(self):
+        return self.client.request(self.method, self.endpoint, **self.kwargs)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=GATHER_MAX_WORKERS,
+                    thread_name_prefix='inter-service'
+                )
+    return _executor
+
+
+def gather(calls: List[ServiceCall], return_exceptions: bool = False) -> List[Any]:
+    """
+    Exécuter des appels en parallèle et retourner leurs résultats dans l'ordre.
+
+    Les appels héritent de l'échéance courante ; s'ils la dépassent, les
+    résultats manquants valent `DeadlineExceeded`. Avec
+    `return_exceptions=False`, la première erreur est relevée.
+    """
+    if not calls:
+        return []
+
+    executor = _get_executor()
+    futures = [executor.submit(contextvars.copy_context().run, call.run) for call in calls]
+    wait(futures, timeout=remaining_time())
+
+    results = []
+    for future in futures:
+        if not future.done():
+            future.cancel()
+            result = DeadlineExceeded("Deadline exceeded while gathering service calls")
+        elif future.exception() is not None:
+            result = future.exception()
+        else:
+            result = future.result()
+
+        if isinstance(result, BaseException) and not return_exceptions:
+            raise result
+        results.append(result)
+    return results
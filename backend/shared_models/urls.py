@@ -12,7 +12,8 @@ from .dashboard_views import (
 )
 from .export_apis import (
     export_author_books, export_author_analytics, export_author_revenue,
-    export_publisher_catalog, export_publisher_authors, export_complete_package
+    export_publisher_catalog, export_publisher_authors, export_complete_package,
+    export_package_job
 )
 
 app_name = 'dashboard'
@@ -47,6 +48,7 @@ export_patterns = [
     
     # Export complet
     path('complete-package/', export_complete_package, name='export_complete_package'),
+    path('complete-package/jobs/<uuid:job_id>/', export_package_job, name='export_package_job'),
 ]
 
 # URLs principales
@@ -0,0 +1,93 @@
+"""
+Tests pour la résolution de langue précalculée
+"""
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from coko.african_languages import (
+    AfricanLanguageMiddleware, language_css_view, language_manager, parse_accept_language
+)
+
+
+class TestLanguageResolution(SimpleTestCase):
+    """Tests pour les tables de langues et les caches de résolution"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        language_manager._resolve_cached.cache_clear()
+
+    def request(self, country_code=None, accept_language='', session=None):
+        request = self.factory.get('/', HTTP_ACCEPT_LANGUAGE=accept_language)
+        request.session = session or {}
+        location = patch('coko.african_geolocation.get_user_location', return_value={'country_code': country_code})
+        location.start()
+        self.addCleanup(location.stop)
+        return request
+
+    def test_parse_accept_language_is_memoized(self):
+        parse_accept_language.cache_clear()
+        self.assertEqual(parse_accept_language('en-US,en;q=0.9,fr;q=0.8'), ('en', 'fr'))
+        parse_accept_language('en-US,en;q=0.9,fr;q=0.8')
+        self.assertEqual(parse_accept_language.cache_info().hits, 1)
+
+    def test_resolution_order(self):
+        self.assertEqual(language_manager.resolve_language(self.request('NG', 'fr')), 'en')
+        self.assertEqual(language_manager.resolve_language(self.request(None, 'de, en;q=0.5')), 'en')
+        self.assertEqual(language_manager.resolve_language(self.request(None, 'de')), 'fr')
+        self.assertEqual(
+            language_manager.resolve_language(self.request('NG', session={'language': 'fr'})), 'fr'
+        )
+
+    def test_resolution_is_cached_per_country_and_header(self):
+        for _ in range(3):
+            language_manager.resolve_language(self.request('SN', 'fr-FR'))
+        info = language_manager._resolve_cached.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 2))
+
+    def test_tables_are_read_only(self):
+        with self.assertRaises(TypeError):
+            language_manager.language_configs['fr']['direction'] = 'rtl'
+        with self.assertRaises(TypeError):
+            language_manager.get_localization_data('fr')['number_format']['decimal'] = '.'
+
+    def test_preferences_remain_a_plain_dict(self):
+        preferences = language_manager.get_user_language_preferences(self.request('SN'))
+        preferences['code'] = 'xx'
+        self.assertEqual(language_manager.language_configs['fr']['code'], 'fr')
+
+    def test_middleware_sets_compiled_locale(self):
+        request = self.request('GH')
+        response = AfricanLanguageMiddleware(lambda request: HttpResponse())(request)
+
+        self.assertEqual(response['Content-Language'], 'en')
+        self.assertEqual(request.LOCALIZATION_DATA['number_format']['decimal'], '.')
+        self.assertIs(request.LANGUAGE_CONFIG, language_manager.language_configs['en'])
+
+
+class TestLanguageCss(SimpleTestCase):
+    """Tests pour le CSS par langue à empreinte"""
+
+    def test_css_url_is_fingerprinted(self):
+        url = language_manager.language_configs['fr']['css_url']
+        fingerprint = language_manager.language_css_fingerprints['fr']
+        self.assertTrue(url.endswith(f'css/languages/fr.{fingerprint}.css'))
+
+    def test_write_language_css(self):
+        with tempfile.TemporaryDirectory() as root:
+            written = language_manager.write_language_css(root)
+            again = language_manager.write_language_css(root)
+
+            self.assertEqual(len(written), len(language_manager.language_css))
+            self.assertEqual(again, [])
+            with open(os.path.join(root, language_manager.get_language_css_filename('en'))) as handle:
+                self.assertEqual(handle.read(), language_manager.get_language_css('en'))
+
+    def test_css_view_revalidates_with_fingerprint(self):
+        factory = RequestFactory()
+        etag = language_css_view(factory.get('/'), 'fr')['ETag']
+        response = language_css_view(factory.get('/', HTTP_IF_NONE_MATCH=etag), 'fr')
+        self.assertEqual(response.status_code, 304)
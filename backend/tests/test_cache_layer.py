@@ -0,0 +1,132 @@
+"""
+Tests pour le cache protégé contre les ruées (single-flight, valeurs périmées)
+"""
+import threading
+import time
+from unittest.mock import Mock, patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from coko.cache_layer import CoalescingCache
+from coko.cache_tags import tagged_cache, CATALOG_TAG
+from coko.service_adapters import BookServiceAdapter
+
+
+class TestCoalescingCache(TestCase):
+    """Tests pour CoalescingCache"""
+    
+    def setUp(self):
+        cache.clear()
+        self.layer = CoalescingCache(background_refresh=False, beta=0)
+    
+    def test_fresh_value_is_served_from_cache(self):
+        """Une valeur fraîche n'est calculée qu'une fois"""
+        fetch = Mock(return_value=['livre'])
+        
+        self.assertEqual(self.layer.get_or_compute('popular', fetch, 60), ['livre'])
+        self.assertEqual(self.layer.get_or_compute('popular', fetch, 60), ['livre'])
+        self.assertEqual(fetch.call_count, 1)
+    
+    def test_stale_value_is_served_while_one_caller_refreshes(self):
+        """Après l'échéance douce, la valeur périmée est servie et recalculée une fois"""
+        self.layer.get_or_compute('popular', Mock(return_value='ancienne'), 60)
+        
+        fetch = Mock(return_value='nouvelle')
+        with patch('coko.cache_layer.time.time', return_value=time.time() + 61):
+            # Le bail d'un autre worker empêche tout recalcul
+            cache.add('popular:lease', True, 30)
+            self.assertEqual(self.layer.get_or_compute('popular', fetch, 60), 'ancienne')
+            self.assertEqual(fetch.call_count, 0)
+            cache.delete('popular:lease')
+            
+            self.assertEqual(self.layer.get_or_compute('popular', fetch, 60), 'ancienne')
+        
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(self.layer.get_or_compute('popular', fetch, 60), 'nouvelle')
+        self.assertIsNone(cache.get('popular:lease'))
+    
+    def test_concurrent_misses_are_coalesced(self):
+        """Des appels simultanés sur une clé absente ne calculent qu'une fois"""
+        started = threading.Event()
+        calls = []
+        
+        def slow_fetch():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return 'valeur'
+        
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.layer.get_or_compute('hot', slow_fetch, 60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(results, ['valeur'] * 5)
+        self.assertEqual(len(calls), 1)
+    
+    def test_other_process_lease_is_awaited(self):
+        """Sans valeur, un appelant attend le calcul du détenteur du bail"""
+        cache.add('hot:lease', True, 30)
+        other_worker = threading.Timer(0.05, lambda: CoalescingCache()._store('hot', lambda: 'calculée', 60, 120))
+        other_worker.start()
+        fetch = Mock(return_value='locale')
+        
+        self.assertEqual(self.layer.get_or_compute('hot', fetch, 60), 'calculée')
+        fetch.assert_not_called()
+        other_worker.join()
+    
+    def test_failed_refresh_releases_lease(self):
+        """Un calcul en échec libère le bail pour le prochain appelant"""
+        with self.assertRaises(RuntimeError):
+            self.layer.get_or_compute('hot', Mock(side_effect=RuntimeError('service indisponible')), 60)
+        
+        self.assertIsNone(cache.get('hot:lease'))
+        self.assertEqual(self.layer.get_or_compute('hot', Mock(return_value=1), 60), 1)
+    
+    def test_lease_taken_over_after_expiry_is_kept(self):
+        """Un bail expiré puis repris par un autre worker n'est pas supprimé"""
+        def slow_fetch():
+            # Le bail a expiré pendant le calcul et un autre worker l'a repris
+            cache.set('hot:lease', 'autre-worker', 30)
+            return 'valeur'
+        
+        self.assertEqual(self.layer.get_or_compute('hot', slow_fetch, 60), 'valeur')
+        self.assertEqual(cache.get('hot:lease'), 'autre-worker')
+    
+    def test_local_lock_is_not_held_during_fetch(self):
+        """Le verrou local réparti n'est pas tenu pendant le calcul"""
+        held = []
+        
+        def fetch():
+            held.append(self.layer._local_lock('hot').locked())
+            return 'valeur'
+        
+        self.assertEqual(self.layer.get_or_compute('hot', fetch, 60), 'valeur')
+        self.assertEqual(held, [False])
+
+
+class TestServiceAdapterCaching(TestCase):
+    """Tests pour l'adoption du cache par les adaptateurs de service"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_popular_books_use_coalescing_cache(self):
+        """Les livres populaires sont servis depuis l'enveloppe du cache"""
+        book_service = Mock()
+        book_service.get_popular_books.return_value = [{'id': 1}]
+        adapter = BookServiceAdapter(book_service)
+        
+        adapter.get_popular_books_by_context('home', 5)
+        books = adapter.get_popular_books_by_context('home', 5)
+        
+        self.assertEqual(books, [{'id': 1, 'recommendation_context': 'home'}])
+        self.assertEqual(book_service.get_popular_books.call_count, 1)
+        versioned_key = tagged_cache.versioned_key('popular_books_home_5', [CATALOG_TAG])
+        self.assertEqual(cache.get(versioned_key)['value'], books)
@@ -0,0 +1,87 @@
+"""
+Tests pour l'invalidation du cache par étiquettes
+"""
+from unittest.mock import Mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from coko.cache_tags import tagged_cache, user_tag, book_tag, CATALOG_TAG
+from coko.service_adapters import RecommendationServiceAdapter
+from catalog_service.models import Book
+
+
+class TestTaggedCache(TestCase):
+    """Tests pour TaggedCache"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_invalidating_a_tag_hides_dependent_entries(self):
+        """Seules les entrées rattachées à l'étiquette invalidée disparaissent"""
+        tagged_cache.set('recommendations_1_hybrid', ['a'], 60, [user_tag(1)])
+        tagged_cache.set('recommendations_1_content', ['b'], 60, [user_tag(1), 'recommendations'])
+        tagged_cache.set('recommendations_2_hybrid', ['c'], 60, [user_tag(2)])
+        
+        tagged_cache.invalidate(user_tag(1))
+        
+        self.assertIsNone(tagged_cache.get('recommendations_1_hybrid', [user_tag(1)]))
+        self.assertIsNone(tagged_cache.get('recommendations_1_content', [user_tag(1), 'recommendations']))
+        self.assertEqual(tagged_cache.get('recommendations_2_hybrid', [user_tag(2)]), ['c'])
+    
+    def test_tag_order_does_not_matter(self):
+        """La clé versionnée ne dépend pas de l'ordre des étiquettes"""
+        tagged_cache.set('stats', 1, 60, [user_tag(1), book_tag('x')])
+        self.assertEqual(tagged_cache.get('stats', [book_tag('x'), user_tag(1)]), 1)
+    
+    def test_evicted_generation_does_not_resurrect_entries(self):
+        """Une génération évincée ne redonne pas accès aux anciennes entrées"""
+        tagged_cache.set('stats', 'ancienne', 60, [user_tag(1)])
+        tagged_cache.invalidate(user_tag(1))
+        cache.delete('cache_tag:user:1')
+        
+        self.assertIsNone(tagged_cache.get('stats', [user_tag(1)]))
+    
+    def test_get_or_set(self):
+        """`get_or_set` ne recalcule qu'après invalidation"""
+        fetch = Mock(return_value={'total': 3})
+        
+        tagged_cache.get_or_set('book_stats', fetch, 60, [CATALOG_TAG])
+        tagged_cache.get_or_set('book_stats', fetch, 60, [CATALOG_TAG])
+        tagged_cache.invalidate(CATALOG_TAG)
+        tagged_cache.get_or_set('book_stats', fetch, 60, [CATALOG_TAG])
+        
+        self.assertEqual(fetch.call_count, 2)
+
+
+class TestCacheTagWiring(TestCase):
+    """Tests pour le branchement des étiquettes sur les adaptateurs et signaux"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_adapter_recommendations_are_invalidated_per_user(self):
+        """Une interaction n'invalide que les recommandations de l'utilisateur"""
+        recommendation_service = Mock()
+        recommendation_service.get_personalized_recommendations.return_value = {'books': []}
+        adapter = RecommendationServiceAdapter(recommendation_service)
+        
+        adapter.get_personalized_recommendations_with_context(1, count=5, context='home')
+        adapter.get_personalized_recommendations_with_context(2, count=5, context='home')
+        adapter.record_recommendation_interaction(1, 10, 'click')
+        adapter.get_personalized_recommendations_with_context(1, count=5, context='home')
+        adapter.get_personalized_recommendations_with_context(2, count=5, context='home')
+        
+        self.assertEqual(recommendation_service.get_personalized_recommendations.call_count, 3)
+    
+    def test_book_save_invalidates_catalog_caches(self):
+        """La sauvegarde d'un livre invalide les statistiques et le cache du livre"""
+        book = Book.objects.create(title="Étiquettes", status="published")
+        tagged_cache.set('book_stats', {'total_books': 1}, 60, [CATALOG_TAG])
+        tagged_cache.set('similar_books', [], 60, [book_tag(book.id)])
+        
+        book.title = "Étiquettes modifiées"
+        book.save()
+        
+        self.assertIsNone(tagged_cache.get('book_stats', [CATALOG_TAG]))
+        self.assertIsNone(tagged_cache.get('similar_books', [book_tag(book.id)]))
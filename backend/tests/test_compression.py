@@ -0,0 +1,157 @@
+"""
+Tests pour la compression des réponses et les variantes précompressées
+"""
+import gzip
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+import brotli
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from coko import compression
+from coko.african_performance import AfricanCompressionMiddleware, performance_optimizer
+from coko.compression import CompressionStore, negotiate_encoding, precompress_directory
+
+
+class TestCompressionStore(SimpleTestCase):
+    """Tests pour les variantes indexées par hachage de contenu"""
+
+    def setUp(self):
+        cache.clear()
+        self.store = CompressionStore(max_load=float('inf'))
+        self.body = json.dumps({'books': [{'title': 'Une si longue lettre'}] * 200}).encode()
+
+    def test_identical_bodies_are_compressed_once(self):
+        with patch.object(compression, 'compress', wraps=compression.compress) as compress:
+            first = self.store.get_variant(self.body, 'br', 6)
+            second = self.store.get_variant(self.body, 'br', 6)
+
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(brotli.decompress(first), self.body)
+
+    def test_frequent_bodies_are_precompressed_at_maximum_quality(self):
+        with patch('shared_models.tasks.precompress_response_body.delay',
+                   side_effect=lambda digest: self.store.precompress(digest)) as delay:
+            for _ in range(compression.COMPRESSION_PROMOTE_AFTER + 1):
+                self.store.get_variant(self.body, 'gzip', 3)
+
+        delay.assert_called_once()
+        digest = compression.content_hash(self.body)
+        artifact, _ = cache.get(f'compression:artifact:{digest}:gzip')
+        self.assertEqual(gzip.decompress(artifact), self.body)
+        # Les workers servent désormais l'artefact au niveau maximal
+        self.assertEqual(self.store.get_variant(self.body, 'gzip', 3), artifact)
+
+    def test_artifact_hit_saves_on_the_fly_cost(self):
+        """Une variante au niveau maximal n'économise que la compression à la volée"""
+        self.store.get_variant(self.body, 'br', 4)
+        digest = compression.content_hash(self.body)
+        cache.set(f'compression:artifact:{digest}:br', (brotli.compress(self.body, quality=11), 60.0))
+
+        with patch.object(compression, 'COMPRESSION_PROMOTE_AFTER', 0), \
+                patch.object(compression, 'ARTIFACT_RECHECK_INTERVAL', 0):
+            self.store.get_variant(self.body, 'br', 4, digest=digest)
+
+        self.assertEqual(self.store._stats['hits'], 1)
+        self.assertLess(self.store._stats['cpu_us_saved'], 60 * 1_000_000)
+
+    def test_expired_source_releases_precompression_marker(self):
+        """Une source expirée avant la tâche permet de replanifier la précompression"""
+        digest = compression.content_hash(self.body)
+        with patch('shared_models.tasks.precompress_response_body.delay'):
+            self.store.schedule_precompression(digest, self.body)
+        cache.delete(f'compression:source:{digest}')
+
+        self.assertEqual(self.store.precompress(digest), {})
+        self.assertIsNone(cache.get(f'compression:queued:{digest}'))
+
+    def test_no_new_compression_without_cpu_headroom(self):
+        busy = CompressionStore(max_load=0.5)
+        with patch.object(compression, 'cpu_load', return_value=0.95):
+            self.assertIsNone(busy.get_variant(self.body, 'gzip', 6))
+
+    @patch.object(compression, 'cpu_load', return_value=0.0)
+    def test_stats_report_cpu_and_bytes_saved(self, cpu_load):
+        compression.compression_store.flush_stats()
+        cache.clear()
+        compression.compression_store.get_variant(self.body, 'gzip', 6)
+        compression.compression_store.get_variant(self.body, 'gzip', 6)
+        stats = compression.compression_store.stats()
+
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertGreater(stats['bytes_saved'], len(self.body))
+        self.assertIn('cpu_seconds_saved', stats)
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding('gzip, deflate, br'), 'br')
+        self.assertEqual(negotiate_encoding('gzip'), 'gzip')
+        self.assertEqual(negotiate_encoding('br;q=0, gzip;q=0.5'), 'gzip')
+        self.assertIsNone(negotiate_encoding('identity'))
+
+    def test_precompress_directory(self):
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, 'main.css'), 'w') as handle:
+                handle.write('body { margin: 0; }\n' * 200)
+            with open(os.path.join(root, 'logo.png'), 'wb') as handle:
+                handle.write(b'\x89PNG')
+
+            written = precompress_directory(root)
+            again = precompress_directory(root)
+
+            self.assertEqual(written['written'], 2)
+            self.assertEqual(again['up_to_date'], 2)
+            self.assertTrue(os.path.exists(os.path.join(root, 'main.css.br')))
+            self.assertFalse(os.path.exists(os.path.join(root, 'logo.png.gz')))
+
+
+class TestCompressionMiddleware(SimpleTestCase):
+    """Tests pour le middleware de compression"""
+
+    def setUp(self):
+        cache.clear()
+        # Compression à la volée quelle que soit la charge de la machine de test
+        cpu_load = patch.object(compression, 'cpu_load', return_value=0.0)
+        cpu_load.start()
+        self.addCleanup(cpu_load.stop)
+        self.factory = RequestFactory()
+        self.body = {'books': [{'title': 'Sous l\'orage'}] * 200}
+
+    def process(self, response, accept_encoding):
+        request = self.factory.get('/api/v1/catalog/books/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        with patch.object(performance_optimizer, 'get_compression_strategy', return_value='balanced'):
+            return AfricanCompressionMiddleware(lambda request: response)(request)
+
+    def test_only_accepted_encodings_are_used(self):
+        response = self.process(JsonResponse(self.body), 'gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), self.body)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_streaming_responses_are_compressed_incrementally(self):
+        rows = (f'{i},Livre {i}\n'.encode() for i in range(5000))
+        response = self.process(StreamingHttpResponse(rows, content_type='text/plain'), 'br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        body = brotli.decompress(b''.join(response.streaming_content))
+        self.assertTrue(body.startswith(b'0,Livre 0\n'))
+
+    def test_large_bodies_are_streamed(self):
+        content = b'Livre,' * (compression.COMPRESSION_STREAM_THRESHOLD // 6 + 1)
+        response = self.process(HttpResponse(content, content_type='text/plain'), 'gzip')
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), content)
+
+    def test_precompressed_responses_are_left_alone(self):
+        original = HttpResponse(gzip.compress(b'x' * 2000), content_type='text/plain')
+        original['Content-Encoding'] = 'gzip'
+        response = self.process(original, 'br')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
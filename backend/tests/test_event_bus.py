@@ -0,0 +1,141 @@
+"""
+Tests pour la publication asynchrone du bus d'événements
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from coko.events import EventType, event_bus, publish_event
+from shared_models.event_outbox import EventOutboxDispatcher
+from shared_models.models import CrossServiceEvent
+
+User = get_user_model()
+
+
+@override_settings(EVENT_BUS_ASYNC=True)
+class TestAsyncEventBus(TestCase):
+    """Tests pour EventBus adossé à la boîte d'envoi"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='outboxuser',
+            email='outbox@example.com',
+            password='testpass123'
+        )
+        self.dispatcher = EventOutboxDispatcher(workers=1)
+
+    def test_publish_defers_handlers_to_worker(self):
+        """Publier n'exécute aucun handler ; le worker les exécute ensuite"""
+        received = []
+
+        def converted_handler(event):
+            received.append(event)
+
+        event_bus.subscribe(EventType.RECOMMENDATION_CONVERTED, converted_handler)
+        self.addCleanup(event_bus.unsubscribe, EventType.RECOMMENDATION_CONVERTED, converted_handler)
+        publish_event(
+            EventType.RECOMMENDATION_CONVERTED,
+            {'recommendation_id': 7, 'book_id': 'abc'},
+            user_id=self.user.id,
+            source_service='recommendation_service'
+        )
+
+        self.assertEqual(received, [])
+        record = CrossServiceEvent.objects.get(event_type=EventType.RECOMMENDATION_CONVERTED.value)
+        self.assertEqual(record.status, 'pending')
+        self.assertEqual(record.aggregate_key, f"user:{self.user.id}")
+
+        self.dispatcher.dispatch_pending()
+
+        record.refresh_from_db()
+        self.assertEqual(record.status, 'processed')
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0].type, EventType.RECOMMENDATION_CONVERTED)
+        self.assertEqual(received[0].data['recommendation_id'], 7)
+        self.assertEqual(received[0].user_id, self.user.id)
+
+    def test_saturated_handler_is_retried(self):
+        """Un handler sans place libre fait reprogrammer l'événement sans consommer de tentative"""
+        calls = []
+
+        def limited_handler(event):
+            calls.append(event)
+
+        event_bus.subscribe(EventType.BOOKMARK_CREATED, limited_handler, max_concurrency=1)
+        self.addCleanup(event_bus.unsubscribe, EventType.BOOKMARK_CREATED, limited_handler)
+        publish_event(EventType.BOOKMARK_CREATED, {'book_id': 'abc'}, user_id=self.user.id)
+
+        slot = event_bus._limits[limited_handler]
+        slot.acquire()
+        try:
+            with patch('coko.events.EVENT_HANDLER_SLOT_TIMEOUT', 0.01):
+                stats = self.dispatcher.dispatch_pending()
+        finally:
+            slot.release()
+
+        record = CrossServiceEvent.objects.get(event_type=EventType.BOOKMARK_CREATED.value)
+        self.assertEqual(stats['busy'], 1)
+        self.assertEqual(record.status, 'failed')
+        self.assertEqual(record.retry_count, 0)
+        self.assertIsNotNone(record.next_retry_at)
+        self.assertEqual(calls, [])
+
+        # Une fois la place libérée, la reprise exécute le handler
+        CrossServiceEvent.objects.filter(pk=record.pk).update(next_retry_at=timezone.now())
+        self.dispatcher.dispatch_pending()
+        record.refresh_from_db()
+        self.assertEqual(record.status, 'processed')
+        self.assertEqual(len(calls), 1)
+
+    @override_settings(EVENT_BUS_ASYNC=False)
+    def test_synchronous_dispatch_defers_saturated_handler(self):
+        """En mode synchrone, un handler saturé est confié à la boîte d'envoi"""
+        free_calls, limited_calls = [], []
+
+        def free_handler(event):
+            free_calls.append(event)
+
+        def limited_handler(event):
+            limited_calls.append(event)
+
+        event_bus.subscribe(EventType.BOOKMARK_CREATED, free_handler)
+        self.addCleanup(event_bus.unsubscribe, EventType.BOOKMARK_CREATED, free_handler)
+        event_bus.subscribe(EventType.BOOKMARK_CREATED, limited_handler, max_concurrency=1)
+        self.addCleanup(event_bus.unsubscribe, EventType.BOOKMARK_CREATED, limited_handler)
+
+        slot = event_bus._limits[limited_handler]
+        slot.acquire()
+        try:
+            with patch('coko.events.EVENT_HANDLER_SLOT_TIMEOUT', 0.01):
+                publish_event(EventType.BOOKMARK_CREATED, {'book_id': 'abc'}, user_id=self.user.id)
+        finally:
+            slot.release()
+
+        self.assertEqual(len(free_calls), 1)
+        self.assertEqual(limited_calls, [])
+        record = CrossServiceEvent.objects.get(event_type=EventType.BOOKMARK_CREATED.value)
+        self.assertEqual(record.status, 'pending')
+
+        # Le worker n'exécute que le handler reporté
+        self.dispatcher.dispatch_pending()
+        record.refresh_from_db()
+        self.assertEqual(record.status, 'processed')
+        self.assertEqual(len(free_calls), 1)
+        self.assertEqual(len(limited_calls), 1)
+
+    def test_unsubscribed_handler_is_not_called(self):
+        """Un handler retiré du bus n'est plus exécuté"""
+        calls = []
+
+        def handler(event):
+            calls.append(event)
+
+        event_bus.subscribe(EventType.BOOKMARK_CREATED, handler, max_concurrency=1)
+        event_bus.unsubscribe(EventType.BOOKMARK_CREATED, handler)
+        publish_event(EventType.BOOKMARK_CREATED, {'book_id': 'abc'}, user_id=self.user.id)
+        self.dispatcher.dispatch_pending()
+
+        self.assertEqual(calls, [])
+        self.assertNotIn(handler, event_bus._limits)
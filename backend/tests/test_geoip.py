@@ -0,0 +1,128 @@
+"""
+Tests pour la base locale de géolocalisation IP
+"""
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from coko.african_geolocation import AfricanGeoLocation
+from coko.geoip import GeoIPDatabase, GeoIPStore, build_database, read_csv_ranges
+
+
+DBIP_CSV = [
+    'ip_start,ip_end,continent,country,stateprov,city,latitude,longitude\n',
+    '41.82.0.0,41.82.255.255,AF,SN,Dakar,Dakar,14.6928,-17.4467\n',
+    '41.202.192.0,41.202.223.255,AF,CI,Abidjan,Abidjan,5.3600,-4.0083\n',
+    '105.112.0.0,105.112.255.255,AF,NG,Lagos,Lagos,6.4550,3.3841\n',
+    '2c0f:f248::,2c0f:f248:ffff:ffff:ffff:ffff:ffff:ffff,AF,SN,Dakar,Dakar,14.6928,-17.4467\n',
+]
+
+
+class TestGeoIPDatabase(TestCase):
+    """Tests pour la construction et la lecture du fichier de plages"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'geoip.bin')
+        self.stats = build_database(read_csv_ranges(DBIP_CSV), self.path)
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def test_lookup_ipv4_and_ipv6(self):
+        """Recherche dichotomique dans les plages IPv4 et IPv6"""
+        self.assertEqual(self.stats['ipv4'], 3)
+        self.assertEqual(self.stats['ipv6'], 1)
+        
+        database = GeoIPDatabase(self.path)
+        self.assertEqual(database.lookup('41.82.10.20')['city'], 'Dakar')
+        self.assertEqual(database.lookup('41.202.192.0')['country_code'], 'CI')
+        self.assertEqual(database.lookup('105.112.255.255')['country_code'], 'NG')
+        self.assertEqual(database.lookup('2c0f:f248::1')['country_code'], 'SN')
+        self.assertEqual(database.lookup('::ffff:105.112.1.1')['country_code'], 'NG')
+        self.assertIsNone(database.lookup('41.83.0.1'))
+        self.assertIsNone(database.lookup('8.8.8.8'))
+        self.assertIsNone(database.lookup('pas-une-ip'))
+        database.close()
+    
+    def test_overlapping_ranges_are_skipped(self):
+        """Une plage qui chevauche la précédente est ignorée"""
+        stats = build_database(
+            read_csv_ranges(DBIP_CSV + ['41.82.128.0,41.83.0.255,AF,GH,,,,\n']), self.path
+        )
+        self.assertEqual(stats['overlapping'], 1)
+        self.assertIsNone(GeoIPDatabase(self.path).lookup('41.83.0.1'))
+    
+    def test_store_reloads_replaced_file(self):
+        """Le fichier remplacé est rechargé sans redémarrage"""
+        store = GeoIPStore(self.path, reload_interval=0)
+        self.assertEqual(store.lookup('41.82.0.1')['country_code'], 'SN')
+        
+        build_database(read_csv_ranges(['41.82.0.0/16,ML,Bamako,Bamako,12.65,-8.0\n'], 'cidr'), self.path)
+        self.assertEqual(store.lookup('41.82.0.1')['country_code'], 'ML')
+        
+        os.remove(self.path)
+        self.assertIsNone(store.lookup('41.82.0.1'))
+
+
+class TestAfricanGeoLocation(TestCase):
+    """Tests pour la géolocalisation sans appel réseau sur le chemin des requêtes"""
+    
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.store = GeoIPStore(os.path.join(self.directory, 'geoip.bin'), reload_interval=0)
+        build_database(read_csv_ranges(DBIP_CSV), self.store.path)
+        self.patcher = patch('coko.african_geolocation.geoip_database', self.store)
+        self.patcher.start()
+        self.service = AfricanGeoLocation()
+        self.service.remote_enrichment = True
+    
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    @patch('coko.african_geolocation.requests.get')
+    def test_local_lookup_is_enriched(self, mock_get):
+        """Une adresse connue est résolue localement et enrichie"""
+        location = self.service.get_location_from_ip('105.112.4.4')
+        
+        self.assertEqual(location['source'], 'local')
+        self.assertEqual(location['country_name'], 'Nigeria')
+        self.assertTrue(location['is_african'])
+        self.assertEqual(location['currency'], 'NGN')
+        mock_get.assert_not_called()
+    
+    @patch('shared_models.tasks.enrich_ip_location.delay')
+    @patch('coko.african_geolocation.requests.get')
+    def test_unknown_address_schedules_enrichment_once(self, mock_get, mock_delay):
+        """Une adresse inconnue reçoit la localisation par défaut et un seul enrichissement"""
+        location = self.service.get_location_from_ip('8.8.8.8')
+        self.service.get_location_from_ip('8.8.8.8')
+        
+        self.assertEqual(location['source'], 'default')
+        mock_get.assert_not_called()
+        mock_delay.assert_called_once_with('8.8.8.8')
+    
+    @patch('coko.african_geolocation.requests.get')
+    def test_remote_enrichment_is_cached(self, mock_get):
+        """Le résultat de l'enrichissement distant sert les requêtes suivantes"""
+        mock_get.return_value.json.return_value = {
+            'status': 'success', 'countryCode': 'US', 'country': 'United States',
+            'region': 'CA', 'city': 'Mountain View', 'lat': 37.4, 'lon': -122.1,
+        }
+        self.service.fetch_remote_location('8.8.8.8')
+        
+        location = self.service.get_location_from_ip('8.8.8.8')
+        self.assertEqual(location['source'], 'ipapi')
+        self.assertFalse(location['is_african'])
+    
+    def test_private_addresses_are_not_looked_up(self):
+        """Les adresses privées et IPv6 sont reconnues"""
+        self.assertEqual(self.service.get_location_from_ip('10.0.0.1')['source'], 'default')
+        self.assertTrue(self.service._is_valid_ip('2c0f:f248::1'))
+        self.assertFalse(self.service._is_valid_ip('999.1.1.1'))
@@ -0,0 +1,130 @@
+"""
+Tests pour le pipeline de métriques de requêtes
+"""
+import random
+import threading
+from unittest.mock import Mock
+
+from django.test import SimpleTestCase
+
+from coko.request_metrics import (
+    LocalMetricsStore, RedisMetricsStore, RequestMetrics, latency_bucket, percentiles
+)
+
+
+class TestLatencyHistogram(SimpleTestCase):
+    """Tests pour l'histogramme de latence à classes logarithmiques"""
+    
+    def test_percentiles_are_within_bucket_precision(self):
+        """Les percentiles restent à ±2,5 % des valeurs exactes"""
+        rng = random.Random(42)
+        values = sorted(rng.lognormvariate(5, 1) for _ in range(20000))
+        histogram = {}
+        for value in values:
+            bucket = latency_bucket(value)
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        
+        result = percentiles(histogram)
+        for q in (50, 95, 99):
+            exact = values[int(len(values) * q / 100) - 1]
+            self.assertAlmostEqual(result[f'p{q}'] / exact, 1, delta=0.03)
+    
+    def test_empty_histogram(self):
+        self.assertEqual(percentiles({}), {'p50': 0.0, 'p95': 0.0, 'p99': 0.0})
+
+
+class TestRequestMetrics(SimpleTestCase):
+    """Tests pour l'enregistrement par processus et le vidage périodique"""
+    
+    def setUp(self):
+        self.metrics = RequestMetrics(flush_interval=3600)
+        self.metrics._store = LocalMetricsStore()
+    
+    def test_record_does_not_touch_the_store_until_flush(self):
+        """Les échantillons restent dans le tampon jusqu'au vidage"""
+        self.metrics.record(120, 2048, 200, is_african=True, country_code='SN', network_quality='3g_dominant')
+        self.assertEqual(self.metrics.minutes(1, flush=False)[0][1], {})
+        
+        self.assertEqual(self.metrics.flush(), 1)
+        fields = self.metrics.minutes(1, flush=False)[0][1]
+        self.assertEqual(fields['requests'], 1)
+        self.assertEqual(fields['country:SN'], 1)
+        self.assertEqual(fields['bytes'], 2048)
+    
+    def test_summary_reports_percentiles_per_country_and_network(self):
+        """Percentiles globaux, africains, par pays et par qualité réseau"""
+        for value in range(1, 101):
+            self.metrics.record(value * 10, is_african=True, country_code='NG', network_quality='4g_dominant')
+        for _ in range(50):
+            self.metrics.record(50, status_code=500, country_code='FR')
+        
+        summary = self.metrics.summary(5)
+        
+        self.assertEqual(summary['total_requests'], 150)
+        self.assertEqual(summary['african_requests'], 100)
+        self.assertEqual(summary['errors'], 50)
+        self.assertEqual(summary['slow_requests'], 50)  # > 500 ms pour NG
+        self.assertAlmostEqual(summary['latency']['african']['p50'], 500, delta=15)
+        self.assertAlmostEqual(summary['latency_by_country']['NG']['p95'], 950, delta=25)
+        self.assertAlmostEqual(summary['latency_by_country']['FR']['p99'], 50, delta=2)
+        self.assertEqual(summary['latency_by_network_quality']['4g_dominant']['count'], 100)
+        self.assertAlmostEqual(summary['african_response_time_ms'], 50500, delta=1)
+    
+    def test_concurrent_records_are_not_lost(self):
+        """Aucune perte de mise à jour entre threads qui enregistrent et vident"""
+        # Un petit tampon force des vidages concurrents à pleine capacité
+        self.metrics = RequestMetrics(buffer_size=100, flush_interval=3600)
+        self.metrics._store = LocalMetricsStore()
+        
+        def worker():
+            for index in range(2000):
+                self.metrics.record(10, country_code='CI')
+                if index % 500 == 0:
+                    self.metrics.flush()
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(self.metrics.summary(5)['by_country']['CI'], 16000)
+        self.assertEqual(self.metrics.dropped_samples, 0)
+    
+    def test_full_buffer_is_flushed_instead_of_dropped(self):
+        """Un tampon plein est vidé avant d'accepter de nouveaux échantillons"""
+        metrics = RequestMetrics(buffer_size=10, flush_interval=3600)
+        metrics._store = LocalMetricsStore()
+        for _ in range(25):
+            metrics.record(10, country_code='KE')
+        
+        self.assertEqual(len(metrics._samples), 5)
+        self.assertEqual(metrics.minutes(1, flush=False)[0][1]['requests'], 20)
+    
+    def test_failed_flush_counts_dropped_samples(self):
+        """Les échantillons d'un vidage en échec sont comptés"""
+        self.metrics._store = Mock()
+        self.metrics._store.add.side_effect = ConnectionError('redis down')
+        self.metrics.record(10)
+        self.metrics.record(20)
+        
+        self.assertEqual(self.metrics.flush(), 0)
+        self.assertEqual(self.metrics.dropped_samples, 2)
+    
+    def test_redis_store_flushes_with_one_pipeline(self):
+        """Le vidage envoie des HINCRBY et un EXPIRE par minute dans un seul pipeline"""
+        store = RedisMetricsStore.__new__(RedisMetricsStore)
+        store.redis = Mock()
+        pipeline = store.redis.pipeline.return_value
+        self.metrics._store = store
+        
+        self.metrics.record(80, country_code='GH')
+        self.metrics.record(90, country_code='GH')
+        self.metrics.flush()
+        
+        store.redis.pipeline.assert_called_once_with(transaction=False)
+        increments = {call.args[1]: call.args[2] for call in pipeline.hincrby.call_args_list}
+        self.assertEqual(increments['requests'], 2)
+        self.assertEqual(increments['country:GH'], 2)
+        pipeline.expire.assert_called_once()
+        pipeline.execute.assert_called_once()
@@ -0,0 +1,172 @@
+"""
+Tests pour le cache de réponses complètes
+"""
+import gzip
+import json
+from unittest.mock import Mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+
+from coko.african_performance import AfricanCacheMiddleware
+from coko.cache_tags import CATALOG_TAG, tagged_cache
+from coko.response_cache import cache_response, response_cache
+from catalog_service.models import Author
+
+
+class TestResponseCache(SimpleTestCase):
+    """Tests pour le middleware et le moteur du cache de réponses"""
+
+    def setUp(self):
+        # Compteurs en attente des tests précédents
+        response_cache.flush_stats()
+        cache.clear()
+        self.factory = RequestFactory()
+        self.middleware = AfricanCacheMiddleware(lambda request: HttpResponse())
+        self.calls = 0
+
+        def view(request, **kwargs):
+            self.calls += 1
+            return JsonResponse({'items': ['Sembène'] * 100, 'calls': self.calls})
+        self.view = view
+
+    def get(self, view, path='/api/catalog/authors/', user=None, **headers):
+        request = self.factory.get(path, **headers)
+        request.user = user or AnonymousUser()
+        # Chemin de Django : la vue n'est appelée que si process_view renvoie None
+        response = self.middleware.process_view(request, view, (), {})
+        if response is None:
+            response = view(request)
+        return self.middleware.process_response(request, response)
+
+    def test_views_without_policy_are_not_cached(self):
+        request = self.factory.get('/api/catalog/books/')
+        self.assertIsNone(self.middleware.process_view(request, self.view, (), {}))
+
+    def test_misses_and_writes_are_left_to_the_view(self):
+        view = cache_response(timeout=60, scope='public')(self.view)
+        post = self.factory.post('/api/catalog/authors/')
+        post.user = AnonymousUser()
+        get = self.factory.get('/api/catalog/authors/')
+        get.user = AnonymousUser()
+
+        self.assertIsNone(self.middleware.process_view(post, view, (), {}))
+        self.assertIsNone(self.middleware.process_view(get, view, (), {}))
+        self.assertEqual(self.calls, 0)
+
+    def test_second_request_is_served_from_cache(self):
+        view = cache_response(timeout=60, scope='public')(self.view)
+
+        first = self.get(view)
+        second = self.get(view)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(json.loads(second.content), json.loads(first.content))
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second['Content-Type'], 'application/json')
+
+    def test_if_none_match_returns_304(self):
+        view = cache_response(timeout=60, scope='public')(self.view)
+        etag = self.get(view)['ETag']
+
+        revalidated = self.get(view, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b'')
+        self.assertEqual(revalidated['ETag'], etag)
+
+    def test_body_is_sent_gzipped_only_to_clients_accepting_it(self):
+        view = cache_response(timeout=60, scope='public')(self.view)
+        plain = self.get(view)
+        compressed = self.get(view, HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+
+    def test_user_scope_separates_users_and_tokens(self):
+        view = cache_response(timeout=60)(self.view)
+        alice = Mock(is_authenticated=True, pk=1)
+        bob = Mock(is_authenticated=True, pk=2)
+
+        self.get(view, user=alice)
+        self.get(view, user=bob)
+        self.get(view, HTTP_AUTHORIZATION='Bearer a')
+        self.get(view, HTTP_AUTHORIZATION='Bearer b')
+        hit = self.get(view, user=alice)
+
+        self.assertEqual(self.calls, 4)
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertIn('private', hit['Cache-Control'])
+
+    def test_response_vary_headers_are_part_of_the_key(self):
+        def view(request):
+            self.calls += 1
+            response = HttpResponse(request.META.get('HTTP_ACCEPT', ''))
+            response['Vary'] = 'Accept'
+            return response
+        view = cache_response(timeout=60, scope='public')(view)
+
+        self.get(view, HTTP_ACCEPT='application/json')
+        html = self.get(view, HTTP_ACCEPT='text/html')
+        self.get(view, HTTP_ACCEPT='application/json')
+
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(html.content, b'text/html')
+
+    def test_tag_invalidation_purges_responses(self):
+        view = cache_response(timeout=60, tags=[CATALOG_TAG], scope='public')(self.view)
+
+        self.get(view)
+        tagged_cache.invalidate(CATALOG_TAG)
+        response = self.get(view)
+
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_uncacheable_responses_are_bypassed(self):
+        def view(request):
+            self.calls += 1
+            response = HttpResponse('profil')
+            response.set_cookie('session', 'x')
+            return response
+        view = cache_response(timeout=60, scope='public')(view)
+
+        self.get(view)
+        response = self.get(view)
+
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(response['X-Cache'], 'BYPASS')
+
+    def test_stats_count_hits_and_saved_bytes(self):
+        view = cache_response(timeout=60, scope='public')(self.view)
+
+        self.get(view)
+        self.get(view, HTTP_ACCEPT_ENCODING='gzip')
+        etag = self.get(view)['ETag']
+        self.get(view, HTTP_IF_NONE_MATCH=etag)
+        stats = response_cache.stats()
+
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['not_modified'], 1)
+        self.assertEqual(stats['hit_rate'], 75.0)
+        self.assertGreater(stats['bytes_saved'], 0)
+
+
+class TestResponseCacheSignals(TestCase):
+    """Tests pour la purge des réponses du catalogue par les signaux"""
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_author_save_purges_catalog_responses(self):
+        tagged_cache.set('authors', ['Ngugi'], 60, [CATALOG_TAG])
+        Author.objects.create(first_name='Mariama', last_name='Bâ')
+        self.assertIsNone(tagged_cache.get('authors', [CATALOG_TAG]))
@@ -2,7 +2,7 @@
 Tests pour valider la refactorisation des dépendances inter-services
 """
 import pytest
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from unittest.mock import Mock, patch
@@ -82,6 +82,7 @@ class TestServiceInterfaces(TestCase):
         self.assertIs(reading_service, get_reading_service())
 
 
+@override_settings(EVENT_BUS_ASYNC=False)
 class TestEventSystem(TestCase):
     """Tests pour valider le système d'événements"""
     
@@ -329,6 +330,7 @@ class TestServiceDecoupling(TestCase):
         self.assertIsInstance(adapter.book_service, BookServiceInterface)
         self.assertIsInstance(adapter.reading_service, ReadingServiceInterface)
     
+    @override_settings(EVENT_BUS_ASYNC=False)
     def test_event_system_integration(self):
         """Tester l'intégration du système d'événements"""
         events_received = []